@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Benchmark ``collect_read_stats`` against the former line-based reader.
+
+Generates a synthetic Nanopore-like FASTQ, runs both implementations on it,
+checks that their TSV outputs are identical and reports reads per second.
+
+Usage:
+    python benchmarks/bench_collect_read_stats.py [--reads 200000] [--length 700]
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import filecmp
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from collect_read_stats import collect_read_stats  # noqa: E402
+
+
+def legacy_collect_read_stats(fastq_path: str, out_tsv: str) -> None:
+    """Line-by-line implementation replaced by the block engine."""
+    with open(fastq_path) as fh_fastq, open(out_tsv, "w", newline="") as out_fh:
+        writer = csv.writer(out_fh, delimiter="\t")
+        writer.writerow(["read_id", "length", "mean_quality"])
+
+        while True:
+            header = fh_fastq.readline().rstrip()
+            if not header:
+                break
+            seq = fh_fastq.readline().rstrip()
+            fh_fastq.readline()
+            qual = fh_fastq.readline().rstrip()
+
+            read_id = header[1:].split()[0]
+            length = len(seq)
+            mean_q = sum(ord(c) - 33 for c in qual) / length if length else 0
+            writer.writerow([read_id, length, f"{mean_q:.2f}"])
+
+
+def write_fastq(path: Path, n_reads: int, mean_length: int, seed: int = 1) -> None:
+    """Write ``n_reads`` random reads with lengths around ``mean_length``."""
+    rng = random.Random(seed)
+    quals = "".join(chr(33 + q) for q in range(5, 41))
+    with path.open("w") as fh:
+        for i in range(n_reads):
+            length = max(1, int(rng.gauss(mean_length, mean_length * 0.1)))
+            seq = "".join(rng.choices("ACGT", k=length))
+            qual = "".join(rng.choices(quals, k=length))
+            fh.write(f"@read{i} runid=bench ch={i % 512}\n{seq}\n+\n{qual}\n")
+
+
+def time_call(func, fastq: Path, out_tsv: Path) -> float:
+    start = time.perf_counter()
+    func(str(fastq), str(out_tsv))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reads", type=int, default=200_000)
+    parser.add_argument("--length", type=int, default=700)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        fastq = tmp_dir / "bench.fastq"
+        write_fastq(fastq, args.reads, args.length)
+
+        legacy_out = tmp_dir / "legacy.tsv"
+        block_out = tmp_dir / "block.tsv"
+        legacy_time = time_call(legacy_collect_read_stats, fastq, legacy_out)
+        block_time = time_call(collect_read_stats, fastq, block_out)
+
+        if not filecmp.cmp(legacy_out, block_out, shallow=False):
+            sys.exit("Outputs differ between implementations")
+
+    print("implementation\tseconds\treads_per_sec")
+    print(f"legacy\t{legacy_time:.2f}\t{args.reads / legacy_time:.0f}")
+    print(f"block\t{block_time:.2f}\t{args.reads / block_time:.0f}")
+    print(f"speedup\t{legacy_time / block_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
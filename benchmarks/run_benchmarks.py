@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""Throughput and peak memory of the Python hot paths at several scales.
+
+Each case runs one function on synthetic data from ``synthetic_data.py``
+with ``records`` input records (reads, stats rows, taxonomy rows or lineage
+strings). Timings are the best of ``--repeat`` runs; peak memory is the
+``tracemalloc`` peak of one extra run, which includes NumPy buffers.
+
+Results can be saved as a baseline and compared on a later commit::
+
+    python benchmarks/run_benchmarks.py --scales 1e3 1e4 1e5 --output baseline.json
+    python benchmarks/run_benchmarks.py --scales 1e3 1e4 1e5 --compare baseline.json
+
+``--compare`` exits with status 1 when a case is slower than the baseline by
+more than ``--tolerance`` (default 0.25, i.e. 25 %); cases under
+``--min-seconds`` in both runs are ignored. Generated inputs are
+kept in ``--data-dir`` and reused between runs. FASTQ cases stop at
+``--max-fastq-records`` (default 10**6) to bound disk use.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--cases collect_read_stats ...] \
+        [--scales 1e3 1e4 1e5 1e6 1e7] [--repeat 3] [--data-dir DIR]
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import add_reads_and_sample  # noqa: E402
+import synthetic_data  # noqa: E402
+from collapse_reads_by_species import collapse_by_species, format_taxon  # noqa: E402
+from collect_read_stats import collect_read_stats  # noqa: E402
+from plot_taxon_bar import read_collapsed_table  # noqa: E402
+from summarize_read_counts import CACHE_NAME, summarize_counts  # noqa: E402
+from taxonomy import parse_lineage  # noqa: E402
+
+STATS_SAMPLES = 4
+
+
+@dataclass
+class Case:
+    """A benchmarked function: ``prepare`` builds inputs, ``run`` is timed."""
+
+    name: str
+    prepare: Callable[[Path, int], object]
+    run: Callable[[object, Path], None]
+    fastq: bool = False
+
+
+def _cached(data_dir: Path, name: str, records: int, write) -> Path:
+    path = data_dir / f"{name}_{records}"
+    if not path.exists():
+        tmp = data_dir / f".{name}_{records}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        if tmp.exists():
+            tmp.unlink()
+        write(tmp, records)
+        tmp.rename(path)
+    return path
+
+
+def _prepare_fastq(data_dir: Path, records: int) -> Path:
+    return _cached(data_dir, "reads.fastq", records, synthetic_data.write_fastq)
+
+
+def _run_collect(fastq: Path, work: Path) -> None:
+    collect_read_stats(str(fastq), str(work / "stats.tsv"))
+
+
+def _prepare_stats(data_dir: Path, records: int) -> Path:
+    def write(path: Path, n: int) -> None:
+        synthetic_data.write_stats_tree(path, STATS_SAMPLES, n // STATS_SAMPLES)
+
+    return _cached(data_dir, "stats", records, write)
+
+
+def _run_summarize(directory: Path, work: Path) -> None:
+    cache = directory / CACHE_NAME
+    if cache.exists():
+        cache.unlink()
+    summarize_counts(str(directory), {})
+
+
+def _prepare_lineages(data_dir: Path, records: int) -> list[str]:
+    path = _cached(data_dir, "taxonomy_with_sample.tsv", records,
+                   synthetic_data.write_taxonomy_with_sample)
+    with path.open() as fh:
+        next(fh)
+        return [line.split("\t")[1] for line in fh]
+
+
+def _run_format_taxon(taxa: list[str], work: Path) -> None:
+    parse_lineage.cache_clear()  # time the cold cache of a fresh process
+    for taxon in taxa:
+        format_taxon(taxon)
+
+
+def _prepare_with_sample(data_dir: Path, records: int) -> Path:
+    return _cached(data_dir, "taxonomy_with_sample.tsv", records,
+                   synthetic_data.write_taxonomy_with_sample)
+
+
+def _run_collapse(path: Path, work: Path) -> None:
+    parse_lineage.cache_clear()
+    collapse_by_species(path)
+
+
+def _prepare_taxonomy(data_dir: Path, records: int) -> Path:
+    return _cached(data_dir, "taxonomy.tsv", records, synthetic_data.write_taxonomy)
+
+
+def _run_add_reads(path: Path, work: Path) -> None:
+    taxonomy = work / "taxonomy.tsv"
+    if not taxonomy.exists():
+        os.symlink(path, taxonomy)
+    argv = sys.argv
+    sys.argv = ["add_reads_and_sample.py", str(taxonomy)]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            add_reads_and_sample.main()
+    finally:
+        sys.argv = argv
+
+
+def _prepare_collapsed(data_dir: Path, records: int) -> Path:
+    return _cached(data_dir, "collapsed.tsv", records, synthetic_data.write_collapsed_table)
+
+
+def _run_read_collapsed(path: Path, work: Path) -> None:
+    read_collapsed_table(path)
+
+
+CASES = {
+    case.name: case
+    for case in (
+        Case("collect_read_stats", _prepare_fastq, _run_collect, fastq=True),
+        Case("summarize_counts", _prepare_stats, _run_summarize),
+        Case("format_taxon", _prepare_lineages, _run_format_taxon),
+        Case("collapse_by_species", _prepare_with_sample, _run_collapse),
+        Case("add_reads_and_sample", _prepare_taxonomy, _run_add_reads),
+        Case("read_collapsed_table", _prepare_collapsed, _run_read_collapsed),
+    )
+}
+
+
+def measure(case: Case, data, work: Path, repeat: int) -> tuple[float, float]:
+    """Return the best wall time in seconds and the peak traced memory in MB."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        case.run(data, work)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        case.run(data, work)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak / 1e6
+
+
+def _commit() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def run_suite(
+    cases: list[str],
+    scales: list[int],
+    data_dir: Path,
+    repeat: int = 3,
+    max_fastq_records: int = 10**6,
+) -> dict:
+    """Run every case at every scale and return the results document."""
+    data_dir.mkdir(parents=True, exist_ok=True)
+    results = []
+    for name in cases:
+        case = CASES[name]
+        for records in scales:
+            if case.fastq and records > max_fastq_records:
+                print(f"{name}\t{records}\tskipped (--max-fastq-records)", file=sys.stderr)
+                continue
+            data = case.prepare(data_dir, records)
+            with tempfile.TemporaryDirectory() as tmp:
+                seconds, peak_mb = measure(case, data, Path(tmp), repeat)
+            result = {
+                "case": name,
+                "records": records,
+                "seconds": round(seconds, 6),
+                "records_per_s": round(records / seconds, 1) if seconds else None,
+                "peak_mb": round(peak_mb, 3),
+            }
+            results.append(result)
+            print(
+                f"{name}\t{records}\t{seconds:.4f}\t{result['records_per_s']}\t{peak_mb:.1f}",
+                file=sys.stderr,
+            )
+    return {
+        "commit": _commit(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(
+    current: dict, baseline: dict, tolerance: float = 0.25, min_seconds: float = 0.01
+) -> list[str]:
+    """Return a line per case and scale slower than ``baseline`` beyond ``tolerance``.
+
+    Runs shorter than ``min_seconds`` in both documents are too noisy to
+    compare and are ignored.
+    """
+    reference = {(r["case"], r["records"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = reference.get((result["case"], result["records"]))
+        if not old or not old["seconds"]:
+            continue
+        if max(old["seconds"], result["seconds"]) < min_seconds:
+            continue
+        ratio = result["seconds"] / old["seconds"]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{result['case']} @ {result['records']}: {old['seconds']:.4f}s -> "
+                f"{result['seconds']:.4f}s ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def _scale(value: str) -> int:
+    return int(float(value))
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--scales", nargs="+", type=_scale, default=[1000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-fastq-records", type=_scale, default=10**6)
+    parser.add_argument(
+        "--data-dir", type=Path,
+        default=Path(tempfile.gettempdir()) / "clipon_bench_data",
+        help="Where generated inputs are kept between runs (default: %(default)s)",
+    )
+    parser.add_argument("--output", type=Path, help="Write the results as JSON here")
+    parser.add_argument("--compare", type=Path, help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument(
+        "--min-seconds", type=float, default=0.01,
+        help="Ignore cases faster than this in both runs when comparing",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    print("case\trecords\tseconds\trecords_per_s\tpeak_mb", file=sys.stderr)
+    document = run_suite(
+        args.cases, args.scales, args.data_dir, args.repeat, args.max_fastq_records
+    )
+    if args.output:
+        args.output.write_text(json.dumps(document, indent=2) + "\n")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        regressions = compare(document, baseline, args.tolerance, args.min_seconds)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (baseline {baseline.get('commit')})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Seeded synthetic inputs for the ClipON benchmarks.
+
+Every generator takes a ``seed`` and gives identical files for the same
+arguments, so timings are comparable across commits:
+
+* :func:`write_fastq`: Nanopore-like amplicon reads. Most reads are full
+  amplicons (normal around ``mean_length``), the rest are fragments with
+  exponentially distributed lengths. Each read has a mean Phred quality
+  drawn around ``mean_quality`` and per-base noise around it.
+* :func:`write_stats_tree`: ``*_raw_stats.tsv``, ``*_processed_stats.tsv``
+  and ``cleaned_*_trimmed_filtered_stats.tsv`` files as written by
+  ``collect_read_stats.py``.
+* :func:`write_taxonomy`: a QIIME ``taxonomy.tsv`` whose ``Feature ID``
+  values follow NGSpeciesID (``consensus_cl_id_<n>_total_supporting_reads_<N>
+  _<sample>``) and whose ``Taxon`` values are 7-rank QIIME lineages, some
+  unresolved below genus or family. Species abundances follow a Zipf law.
+* :func:`write_taxonomy_with_sample` and :func:`write_collapsed_table`: the
+  outputs of ``add_reads_and_sample.py`` and ``collapse_reads_by_species.py``
+  for the same data.
+
+Usage:
+    python benchmarks/synthetic_data.py fastq reads.fastq --records 100000
+    python benchmarks/synthetic_data.py taxonomy taxonomy.tsv --records 100000
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+from pathlib import Path
+
+import numpy as np
+
+RANK_CODES = ("k", "p", "c", "o", "f", "g", "s")
+_BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+_BATCH = 20_000
+
+
+def read_lengths(
+    rng: np.random.Generator, n: int, mean_length: int = 700, fragment_rate: float = 0.15
+) -> np.ndarray:
+    """Amplicon-sized reads plus a fraction of short fragments."""
+    lengths = rng.normal(mean_length, mean_length * 0.05, n)
+    fragments = rng.random(n) < fragment_rate
+    lengths[fragments] = rng.exponential(mean_length / 3, fragments.sum())
+    return np.clip(lengths, 20, None).astype(np.int64)
+
+
+def write_fastq(
+    path: Path,
+    records: int,
+    seed: int = 1,
+    mean_length: int = 700,
+    mean_quality: float = 14.0,
+) -> None:
+    """Write ``records`` Nanopore-like reads to ``path``."""
+    rng = np.random.default_rng(seed)
+    with open(path, "wb") as fh:
+        for first in range(0, records, _BATCH):
+            n = min(_BATCH, records - first)
+            lengths = read_lengths(rng, n, mean_length)
+            read_q = np.clip(rng.normal(mean_quality, 3.0, n), 4, 40)
+            total = int(lengths.sum())
+            seq = _BASES[rng.integers(0, 4, total)]
+            base_q = np.repeat(read_q, lengths) + rng.normal(0, 4.0, total)
+            qual = (np.clip(base_q, 0, 50) + 33).astype(np.uint8)
+            ends = np.cumsum(lengths)
+            starts = ends - lengths
+            seq_bytes, qual_bytes = seq.tobytes(), qual.tobytes()
+            chunk = []
+            for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+                read = first + i
+                chunk.append(
+                    b"@%d-%08x runid=bench read=%d ch=%d\n%s\n+\n%s\n"
+                    % (read, seed, read, read % 512 + 1, seq_bytes[start:end],
+                       qual_bytes[start:end])
+                )
+            fh.write(b"".join(chunk))
+
+
+def write_stats_tree(directory: Path, samples: int, reads: int, seed: int = 1) -> None:
+    """Write per-read stats files for ``samples`` samples of ``reads`` rows each."""
+    rng = np.random.default_rng(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    for s in range(samples):
+        name = f"barcode{s + 1:02d}"
+        kept = {"raw": reads, "processed": int(reads * 0.98), "filtered": int(reads * 0.7)}
+        files = {
+            "raw": directory / f"{name}_raw_stats.tsv",
+            "processed": directory / f"{name}_processed_stats.tsv",
+            "filtered": directory / f"cleaned_{name}_trimmed_filtered_stats.tsv",
+        }
+        for stage, path in files.items():
+            lengths = read_lengths(rng, kept[stage])
+            quals = rng.normal(14, 3, kept[stage])
+            with path.open("w") as fh:
+                fh.write("read_id\tlength\tmean_quality\n")
+                fh.writelines(
+                    f"r{i}\t{length}\t{q:.2f}\n"
+                    for i, (length, q) in enumerate(zip(lengths.tolist(), quals.tolist()))
+                )
+
+
+def lineages(species: int, seed: int = 1) -> list[str]:
+    """``species`` QIIME lineages on a random tree, some left unresolved."""
+    rng = np.random.default_rng(seed)
+    fan_out = (1, 3, 6, 12, 4, 3, 3)
+    result = []
+    for i in range(species):
+        names = []
+        node = i
+        for depth, width in reversed(list(enumerate(fan_out))):
+            names.append(f"{RANK_CODES[depth]}__T{depth}x{node}")
+            node //= width
+        names.reverse()
+        names[0] = "k__Animalia"
+        names[5] = "g__" + names[5][3:].capitalize()
+        names[6] = "s__" + names[6][3:].lower()
+        resolved = 7 - int(rng.choice([0, 0, 0, 0, 1, 2]))
+        result.append("; ".join(names[:resolved]))
+    return result
+
+
+def _features(records: int, samples: int, seed: int):
+    rng = np.random.default_rng(seed)
+    taxa = lineages(max(10, records // 20), seed)
+    weights = 1.0 / np.arange(1, len(taxa) + 1)
+    picks = rng.choice(len(taxa), records, p=weights / weights.sum())
+    reads = rng.zipf(1.6, records).clip(max=50_000) + 9
+    sample_ids = rng.integers(0, samples, records)
+    for i in range(records):
+        sample = f"cleaned_barcode{sample_ids[i] + 1:02d}_trimmed"
+        fid = f"consensus_cl_id_{i}_total_supporting_reads_{reads[i]}_{sample}"
+        confidence = f"{rng.uniform(0.5, 1):.4f}"
+        yield fid, taxa[picks[i]], confidence, int(reads[i]), sample
+
+
+def write_taxonomy(path: Path, records: int, samples: int = 12, seed: int = 1) -> None:
+    """QIIME ``taxonomy.tsv`` with NGSpeciesID feature ids."""
+    with path.open("w", newline="") as fh:
+        writer = csv.writer(fh, delimiter="\t", lineterminator="\n")
+        writer.writerow(["Feature ID", "Taxon", "Consensus"])
+        writer.writerows(row[:3] for row in _features(records, samples, seed))
+
+
+def write_taxonomy_with_sample(
+    path: Path, records: int, samples: int = 12, seed: int = 1
+) -> None:
+    """``taxonomy_with_sample.tsv`` as written by ``add_reads_and_sample.py``."""
+    with path.open("w", newline="") as fh:
+        writer = csv.writer(fh, delimiter="\t", lineterminator="\n")
+        writer.writerow(["Feature ID", "Taxon", "Consensus", "Reads", "Sample"])
+        for fid, taxon, confidence, reads, sample in _features(records, samples, seed):
+            base = fid.split("_total_supporting_reads_")[0]
+            writer.writerow([base, taxon, confidence, reads, sample])
+
+
+def write_collapsed_table(path: Path, records: int, samples: int = 12, seed: int = 1) -> None:
+    """Text block table of ``collapse_reads_by_species.py`` with ``records`` rows."""
+    rng = np.random.default_rng(seed)
+    per_sample = -(-records // samples)
+    with path.open("w") as fh:
+        written = 0
+        for s in range(samples):
+            n = min(per_sample, records - written)
+            if n <= 0:
+                break
+            counts = np.sort(rng.zipf(1.6, n).clip(max=50_000))[::-1]
+            total = counts.sum()
+            fh.write(f"Sample: barcode{s + 1:02d}\nSpecies\tReads\tProportion\n")
+            fh.writelines(
+                f"*Genus{s} species{j}*\t{c}\t{c / total * 100:.2f}\n"
+                for j, c in enumerate(counts.tolist())
+            )
+            fh.write("\n")
+            written += n
+
+
+GENERATORS = {
+    "fastq": write_fastq,
+    "taxonomy": write_taxonomy,
+    "taxonomy-with-sample": write_taxonomy_with_sample,
+    "collapsed": write_collapsed_table,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("kind", choices=sorted(GENERATORS))
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    GENERATORS[args.kind](args.output, args.records, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
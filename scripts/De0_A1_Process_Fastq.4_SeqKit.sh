@@ -37,35 +37,74 @@ fi
 # Crear o vaciar archivo de log
 printf "Log de De0_A1_Process_Fastq.4_SeqKit.sh - %s\n" "$(date)" > "$LOG_FILE"
 
-# Procesar cada archivo FASTQ en el directorio de entrada
+# Modo de estadísticas: "reads" (una fila por lectura) o "summary"
+# (histograma longitud x calidad con totales y N50)
+STATS_MODE="${STATS_MODE:-reads}"
+if [ "$STATS_MODE" = "summary" ]; then
+    stats_suffix="summary"
+    stats_flag="--summary"
+else
+    stats_suffix="stats"
+    stats_flag=""
+fi
+# STATS_JSON=1 agrega cuantiles de longitud/calidad, N50 y probabilidad de
+# error media en <archivo de estadísticas>.json
+if [ "${STATS_JSON:-0}" -eq 1 ]; then
+    stats_flag="$stats_flag --summary-json {output}.json"
+fi
+
+# fastq_ext, fastq_base, measure, measure_to y has_reads para FASTQ planos o
+# comprimidos
+source "$(dirname "$0")/fastq_helpers.sh"
+
+# Pares FASTQ -> TSV de estadísticas; se procesan juntos al final
+STATS_PAIRS="$OUTPUT_DIR/.read_stats_pairs.tsv"
+> "$STATS_PAIRS"
+
+# Procesar cada archivo FASTQ (plano o comprimido con gzip/bgzip) del
+# directorio de entrada
 files_processed=0
-for file in "$INPUT_DIR"/*.fastq; do
+for file in "$INPUT_DIR"/*.fastq "$INPUT_DIR"/*.fq \
+    "$INPUT_DIR"/*.fastq.gz "$INPUT_DIR"/*.fq.gz; do
     if [ -f "$file" ]; then
         files_processed=$((files_processed + 1))
         {
             echo "Procesando archivo: $file"
+            base_name="$(fastq_base "$file")"
 
             # Filtrar secuencias mal formateadas con seqkit sana
-            CLEANED_FILE="${OUTPUT_DIR}/cleaned_$(basename "$file")"
+            CLEANED_FILE="${OUTPUT_DIR}/cleaned_${base_name}${fastq_ext}"
             echo "Filtrando secuencias mal formateadas con seqkit sana: $CLEANED_FILE"
 
             # Filtrar las secuencias mal formateadas
-            seqkit sana "$file" -o "$CLEANED_FILE"
+            if [[ "$CLEANED_FILE" == *.gz ]]; then
+                measure_to sana "$base_name" "$file" "$CLEANED_FILE" seqkit sana "$file"
+            else
+                measure sana "$base_name" "$file" "$CLEANED_FILE" \
+                    seqkit sana "$file" -o "$CLEANED_FILE"
+            fi
 
             # Verificar si el archivo tiene contenido después del filtrado
-            if [ ! -s "$CLEANED_FILE" ]; then
+            if ! has_reads "$CLEANED_FILE"; then
                 echo "Advertencia: El archivo $file no tiene secuencias válidas después del filtrado. Se omite."
                 continue
             fi
 
             echo "Archivo limpio guardado en: $CLEANED_FILE"
 
-            # Generar estadísticas de lecturas para archivos crudos y procesados
-            base_name="$(basename "$file" .fastq)"
-            python3 scripts/collect_read_stats.py "$file" "$OUTPUT_DIR/${base_name}_raw_stats.tsv"
-            python3 scripts/collect_read_stats.py "$CLEANED_FILE" "$OUTPUT_DIR/${base_name}_processed_stats.tsv"
+            # Registrar estadísticas pendientes para archivos crudos y procesados
+            printf "%s\t%s\n" "$file" "$OUTPUT_DIR/${base_name}_raw_${stats_suffix}.tsv" >> "$STATS_PAIRS"
+            printf "%s\t%s\n" "$CLEANED_FILE" "$OUTPUT_DIR/${base_name}_processed_${stats_suffix}.tsv" >> "$STATS_PAIRS"
         } >> "$LOG_FILE" 2>&1
     fi
 done
 
+# Generar todas las estadísticas de lecturas en paralelo con una sola llamada
+if [ -s "$STATS_PAIRS" ]; then
+    echo "Generando estadísticas de lecturas" >> "$LOG_FILE"
+    python3 scripts/collect_read_stats.py --pairs "$STATS_PAIRS" $stats_flag \
+        ${STATS_WORKERS:+--workers "$STATS_WORKERS"} >> "$LOG_FILE" 2>&1
+fi
+rm -f "$STATS_PAIRS"
+
 echo "Proceso completado. Se procesaron $files_processed archivos. Detalles en $LOG_FILE. Los archivos filtrados están en: $OUTPUT_DIR"
@@ -36,23 +36,63 @@ mkdir -p "$output_dir"
 # Limpiar el archivo de log antes de comenzar
 echo "Proceso de filtrado comenzado a las $(date)" > "$log_file"
 
-# Filtrar todos los archivos FASTQ en la carpeta de entrada
-for file in "$input_dir"/*.fastq; do
+# Modo de estadísticas: "reads" (una fila por lectura) o "summary"
+# (histograma longitud x calidad con totales y N50)
+STATS_MODE="${STATS_MODE:-reads}"
+if [ "$STATS_MODE" = "summary" ]; then
+    stats_suffix="summary"
+    stats_flag="--summary"
+else
+    stats_suffix="stats"
+    stats_flag=""
+fi
+# STATS_JSON=1 agrega cuantiles de longitud/calidad, N50 y probabilidad de
+# error media en <archivo de estadísticas>.json
+if [ "${STATS_JSON:-0}" -eq 1 ]; then
+    stats_flag="$stats_flag --summary-json {output}.json"
+fi
+
+# fastq_ext, fastq_base, read_fastq y write_fastq para FASTQ planos o comprimidos
+source "$(dirname "$0")/fastq_helpers.sh"
+
+# Pares FASTQ -> TSV de estadísticas; se procesan juntos al final
+stats_pairs="$output_dir/.read_stats_pairs.tsv"
+> "$stats_pairs"
+
+# Filtrar todos los archivos FASTQ (planos o comprimidos) en la carpeta de entrada
+for file in "$input_dir"/*.fastq "$input_dir"/*.fq "$input_dir"/*.fastq.gz "$input_dir"/*.fq.gz; do
+    [ -f "$file" ] || continue
     # Obtener el nombre del archivo sin la extensión
-    base_name="$(basename "$file" .fastq)"
+    base_name="$(fastq_base "$file")"
 
     # Ejecutar NanoFilt y guardar en formato FASTQ
     echo "Filtrando $file..." >> "$log_file"
-    output_file="$output_dir/${base_name}_Filt${MIN_LEN}_${MAX_LEN}_Q${MIN_QUAL}.fastq"
-    cat "$file" | NanoFilt -l "$MIN_LEN" --maxlength "$MAX_LEN" -q "$MIN_QUAL" > "$output_file" 2>> "$log_file"
+    output_file="$output_dir/${base_name}_Filt${MIN_LEN}_${MAX_LEN}_Q${MIN_QUAL}${fastq_ext}"
+    if [ -n "${CLIPON_METRICS:-}" ]; then
+        # Registrar tiempo, CPU, memoria y lecturas de la muestra
+        python3 scripts/clipon_metrics.py run --stage filter --sample "$base_name" \
+            --inputs "$file" --outputs "$output_file" \
+            --stdin "$file" --stdout "$output_file" -- \
+            NanoFilt -l "$MIN_LEN" --maxlength "$MAX_LEN" -q "$MIN_QUAL" 2>> "$log_file"
+    else
+        read_fastq "$file" | NanoFilt -l "$MIN_LEN" --maxlength "$MAX_LEN" -q "$MIN_QUAL" \
+            2>> "$log_file" | write_fastq "$output_file"
+    fi
 
     # Verificar si el proceso fue exitoso
     if [ $? -eq 0 ]; then
         echo "Filtrado completado para $file" >> "$log_file"
-        python3 scripts/collect_read_stats.py "$output_file" "$output_dir/${base_name}_filtered_stats.tsv" >> "$log_file" 2>&1
+        printf "%s\t%s\n" "$output_file" "$output_dir/${base_name}_filtered_${stats_suffix}.tsv" >> "$stats_pairs"
     else
         echo "Hubo un error al filtrar $file" >> "$log_file"
     fi
 done
 
+# Generar las estadísticas de todos los archivos filtrados en paralelo
+if [ -s "$stats_pairs" ]; then
+    python3 scripts/collect_read_stats.py --pairs "$stats_pairs" $stats_flag \
+        ${STATS_WORKERS:+--workers "$STATS_WORKERS"} >> "$log_file" 2>&1
+fi
+rm -f "$stats_pairs"
+
 echo "Filtrado completado a las $(date)" >> "$log_file"
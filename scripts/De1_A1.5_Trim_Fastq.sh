@@ -33,14 +33,27 @@ mkdir -p "$OUTPUT_DIR"
 TRIM_FRONT="${TRIM_FRONT:0}"
 TRIM_BACK="${TRIM_BACK:-0}"
 
-# RECORRER ARCHIVOS FASTQ EN EL DIRECTORIO DE ENTRADA
-for file in "$INPUT_DIR"/*.fastq; do
+# fastq_ext, fastq_base, measure y measure_to para FASTQ planos o comprimidos
+source "$(dirname "$0")/fastq_helpers.sh"
+
+# RECORRER ARCHIVOS FASTQ (PLANOS O COMPRIMIDOS) EN EL DIRECTORIO DE ENTRADA
+for file in "$INPUT_DIR"/*.fastq "$INPUT_DIR"/*.fq "$INPUT_DIR"/*.fastq.gz "$INPUT_DIR"/*.fq.gz; do
+    [ -f "$file" ] || continue
     filename=$(basename "$file")
+    base_name="$(fastq_base "$file")"
     echo "Archivo: $filename"
     # Mostrar solo el resumen de cutadapt
-    cutadapt -u "$TRIM_FRONT" -u "-${TRIM_BACK#-}" \
-        -o "$OUTPUT_DIR/${filename%.fastq}_trimmed.fastq" "$file" 2>&1 \
-        | grep -A 5 '=== Summary ==='
+    trimmed_file="$OUTPUT_DIR/${base_name}_trimmed${fastq_ext}"
+    if [[ "$trimmed_file" == *.gz ]]; then
+        # cutadapt escribe las lecturas en la salida estándar y el resumen en stderr
+        measure_to trim "$base_name" "$file" "$trimmed_file" \
+            cutadapt -u "$TRIM_FRONT" -u "-${TRIM_BACK#-}" "$file" 2>&1 \
+            | grep -A 5 '=== Summary ==='
+    else
+        measure trim "$base_name" "$file" "$trimmed_file" \
+            cutadapt -u "$TRIM_FRONT" -u "-${TRIM_BACK#-}" -o "$trimmed_file" "$file" 2>&1 \
+            | grep -A 5 '=== Summary ==='
+    fi
 done
 
 # INFORMAR FINALIZACIÓN
@@ -17,6 +17,19 @@ qual="${QUAL:-10}"
 rc_id="${RC_ID:-0.98}"
 abund_ratio="${ABUND_RATIO:-0.01}"
 
+# MAX_READS=N limita cada muestra a N lecturas elegidas al azar
+# (scripts/subsample_reads.py; semilla SUBSAMPLE_SEED, estratificado por
+# longitud y calidad con SUBSAMPLE_STRATIFY=1). Las fracciones conservadas se
+# guardan en subsample_fractions.tsv para reescalar las lecturas de soporte
+MAX_READS="${MAX_READS:-0}"
+subsample_dir="${SUBSAMPLE_DIR:-$input_dir/subsampled}"
+
+# DEREPLICATE=1 agrupa lecturas idénticas antes de NGSpeciesID
+# (scripts/dereplicate_reads.py) y luego restaura el número de lecturas de
+# soporte de cada consenso
+DEREPLICATE="${DEREPLICATE:-0}"
+derep_dir="${DEREP_DIR:-$input_dir/dereplicated}"
+
 if [ -z "$input_dir" ] || [ -z "$output_dir" ]; then
     echo "Uso: INPUT_DIR=<dir entrada> OUTPUT_DIR=<dir salida> $0"
     echo "   o: $0 <dir entrada> <dir salida>"
@@ -26,27 +39,80 @@ fi
 # Crear el directorio de salida si no existe
 mkdir -p "$output_dir"
 
-# Iterar sobre todos los archivos .fastq en el directorio
-for fastq_file in "$input_dir"/*.fastq; do
+# fastq_base, measure y read_fastq para FASTQ planos o comprimidos
+source "$(dirname "$0")/fastq_helpers.sh"
+
+# Iterar sobre todos los archivos .fastq (o .fastq.gz) en el directorio
+for fastq_file in "$input_dir"/*.fastq "$input_dir"/*.fastq.gz; do
+    [ -f "$fastq_file" ] || continue
     # Extraer el nombre base del archivo (sin la ruta ni la extensión)
-    base_name=$(basename "$fastq_file" .fastq)
+    base_name=$(fastq_base "$fastq_file")
     
     # Mostrar mensaje indicando el archivo que se está procesando
     echo "Procesando archivo: $base_name.fastq"
     
+    cluster_input="$fastq_file"
+    cluster_support="$support"
+    if [ "$MAX_READS" -gt 0 ]; then
+        measure subsample "$base_name" "$fastq_file" "$subsample_dir/$base_name.fastq" \
+            python3 "$(dirname "$0")/subsample_reads.py" sample "$fastq_file" \
+            --output-dir "$subsample_dir" --max-reads "$MAX_READS"
+        cluster_input="$subsample_dir/$base_name.fastq"
+        # El soporte mínimo se escala a la fracción de lecturas conservada
+        cluster_support=$(python3 "$(dirname "$0")/subsample_reads.py" support \
+            "$subsample_dir/subsample_fractions.tsv" "$base_name" "$support")
+    fi
+    min_support="$cluster_support"
+    if [ "$DEREPLICATE" -eq 1 ]; then
+        measure derep "$base_name" "$cluster_input" "$derep_dir/$base_name.fastq" \
+            python3 "$(dirname "$0")/dereplicate_reads.py" derep "$cluster_input" \
+            --output-dir "$derep_dir"
+        cluster_input="$derep_dir/$base_name.fastq"
+        # El soporte mínimo se escala a la reducción obtenida; tras el
+        # clustering se aplica el umbral original sobre las lecturas reales
+        cluster_support=$(python3 "$(dirname "$0")/dereplicate_reads.py" support \
+            "$derep_dir/$base_name.abundance.tsv" "$cluster_support")
+    fi
+
+    # NGSpeciesID solo lee FASTQ sin comprimir: se descomprime a un archivo
+    # temporal que se borra tras el clustering
+    plain_input=""
+    if [[ "$cluster_input" == *.gz ]]; then
+        plain_input="$output_dir/.${base_name}.fastq"
+        read_fastq "$cluster_input" > "$plain_input"
+        cluster_input="$plain_input"
+    fi
+
     # Ejecutar el comando para cada archivo .fastq
-    NGSpeciesID --ont --consensus \
-                --m "$m_len" --s "$support" --medaka \
+    measure cluster "$base_name" "$cluster_input" "$output_dir/$base_name" \
+        NGSpeciesID --ont --consensus \
+                --m "$m_len" --s "$cluster_support" --medaka \
                 --t "$threads" --q "$qual" \
                 --rc_identity_threshold "$rc_id" \
                 --abundance_ratio "$abund_ratio" \
-                --fastq "$fastq_file" --outfolder "$output_dir/$base_name"
+                --fastq "$cluster_input" --outfolder "$output_dir/$base_name"
     
     # Verificar si el comando fue exitoso
     if [ $? -ne 0 ]; then
         echo "Error al procesar el archivo: $base_name.fastq. Saliendo."
         exit 1
     fi
+    [ -z "$plain_input" ] || rm -f "$plain_input"
+
+    if [ "$DEREPLICATE" -eq 1 ]; then
+        python3 "$(dirname "$0")/dereplicate_reads.py" rescale "$output_dir/$base_name" \
+            "$derep_dir/$base_name.abundance.tsv" --min-support "$min_support"
+    fi
 done
 
+if [ "$MAX_READS" -gt 0 ] && [ -f "$subsample_dir/subsample_fractions.tsv" ]; then
+    echo "Fracción de lecturas conservada ($subsample_dir/subsample_fractions.tsv):"
+    cat "$subsample_dir/subsample_fractions.tsv"
+fi
+
+if [ "$DEREPLICATE" -eq 1 ] && [ -f "$derep_dir/dereplication_report.tsv" ]; then
+    echo "Reducción por desreplicación ($derep_dir/dereplication_report.tsv):"
+    cat "$derep_dir/dereplication_report.tsv"
+fi
+
 echo "Procesamiento completado para todos los archivos .fastq."
@@ -1,40 +1,60 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
-# Parámetros pasados por variables de entorno o argumentos
+# Ejecuta el flujo de VSearch para varias combinaciones de parámetros con
+# scripts/vsearch_sweep.py: la importación y la desreplicación se hacen una
+# sola vez, el clustering una vez por identidad y la clasificación una vez por
+# combinación, en paralelo según los núcleos disponibles (CLIPON_CPUS).
+# Al final se muestra una tabla comparativa (sweep_comparison.tsv).
+#
+# Uso:
+#   BLAST_DB=<blast.qza> TAXONOMY_DB=<tax.qza> \
+#       ./scripts/De2_A4_VSearch_ejecutador_combinaciones1.1.sh <manifest_file> <dir_salida>
+# O defina las variables de entorno MANIFEST_FILE y PREFIX. Con EMAIL definido
+# y msmtp disponible se envía un aviso al terminar.
+
 manifest_file="${MANIFEST_FILE:-${1-}}"
 prefix="${PREFIX:-${2-}}"
-dirDB="${DIRDB:-${3-}}"
-email="${EMAIL:-${4-}}"
+email="${EMAIL:-}"
 
 # Mostrar mensaje de uso si faltan argumentos
-if [[ -z "$manifest_file" || -z "$prefix" || -z "$dirDB" || -z "$email" ]]; then
-    echo "Uso: $0 <manifest_file> <prefijo> <dirDB> <email>" >&2
-    echo "O defina las variables de entorno MANIFEST_FILE, PREFIX, DIRDB y EMAIL" >&2
+if [[ -z "$manifest_file" || -z "$prefix" ]]; then
+    echo "Uso: $0 <manifest_file> <dir_salida>" >&2
+    echo "O defina las variables de entorno MANIFEST_FILE y PREFIX" >&2
+    exit 1
+fi
+
+if [[ -z "${BLAST_DB:-}" || -z "${TAXONOMY_DB:-}" ]]; then
+    echo "Defina BLAST_DB y TAXONOMY_DB con los artefactos de referencia." >&2
     exit 1
 fi
 
-# Combinaciones de cluster_identity y blast_identity y maxaccepts
+# Combinaciones de cluster_identity, blast_identity y maxaccepts
 combinaciones=("0.98 0.5 5")
 
-# Recorrer las combinaciones y ejecutar el script con cada par de valores
+sweep_args=()
+for combinacion in "${combinaciones[@]}"; do
+    read -r cluster_identity blast_identity maxaccepts <<<"$combinacion"
+    echo "Combinación: cluster_identity=${cluster_identity}; blast_identity=${blast_identity} y maxaccepts=${maxaccepts}"
+    sweep_args+=(--combination "$cluster_identity" "$blast_identity" "$maxaccepts")
+done
+
 script_dir="$(dirname "$0")"
+status=0
+python3 "$script_dir/vsearch_sweep.py" "$manifest_file" "$prefix" "${sweep_args[@]}" || status=$?
 
-for combinacion in "${combinaciones[@]}"; do
-    cluster_identity=$(echo $combinacion | cut -d ' ' -f 1)
-    blast_identity=$(echo $combinacion | cut -d ' ' -f 2)
-	maxaccepts=$(echo $combinacion | cut -d ' ' -f 3)
-
-    echo "Ejecutando con cluster_identity=${cluster_identity}; blast_identity=${blast_identity} y maxaccepts=${maxaccepts}..."
-    
-    # Ejecutar el script con los parámetros correspondientes
-    "$script_dir/De2_A4__VSearch_Procesonuevo2.6.1.sh" "$manifest_file" "$prefix" "$dirDB" "$email" "$cluster_identity" "$blast_identity" "$maxaccepts"
-    
-    # Verificar si hubo un error
-    if [ $? -ne 0 ]; then
-        echo "Error en la ejecución con cluster_identity=${cluster_identity} y blast_identity=${blast_identity}."
-        exit 1
+if [[ -n "$email" ]] && command -v msmtp >/dev/null; then
+    if [[ $status -eq 0 ]]; then
+        asunto="Combinaciones completadas"
+    else
+        asunto="Combinaciones fallidas (código $status)"
     fi
-done
+    echo -e "Subject: $asunto\n\nResultados en $prefix/sweep_comparison.tsv" | msmtp -a gmail "$email"
+fi
+
+if [[ $status -ne 0 ]]; then
+    echo "Error en la ejecución de las combinaciones. Revise $prefix/logs" >&2
+    exit "$status"
+fi
 
 echo "Todos los procesos han sido completados exitosamente."
@@ -8,6 +8,9 @@ set -euo pipefail
 #   TAXONOMY_DB - path to the reference taxonomy artifact (.qza)
 # Optional environment variables:
 #   EMAIL - address used when notifications are enabled with --notify
+#   VSEARCH_THREADS - threads for de novo clustering (default 19)
+#   BLAST_THREADS - cores for the sharded BLAST classification (default: all)
+#   CLASSIFY_SHARDS, CLASSIFY_SHARD_THREADS - override the shard layout
 #
 # Usage:
 #   ./scripts/De2_A4__VSearch_Procesonuevo2.6.1.sh \
@@ -173,21 +176,23 @@ qiime vsearch cluster-features-de-novo \
     --p-perc-identity "$cluster_id" \
     --o-clustered-table "$output_dir/table_clust.qza" \
     --o-clustered-sequences "$output_dir/rep_seqs_clust.qza" \
-    --p-threads 19 \
+    --p-threads "${VSEARCH_THREADS:-19}" \
     --verbose
 
-# Classify sequences with BLAST
-qiime feature-classifier classify-consensus-blast \
-    --i-query "$output_dir/rep_seqs_clust.qza" \
-    --i-blastdb "$BLAST_DB" \
-    --i-reference-taxonomy "$TAXONOMY_DB" \
-    --p-perc-identity "$blast_id" \
-    --p-query-cov 0.8 \
-    --p-maxaccepts "$maxaccepts" \
-    --p-min-consensus 0.51 \
-    --p-num-threads 25 \
-    --o-classification "$output_dir/taxonomy.qza" \
-    --o-search-results "$output_dir/search_results.qza" \
-    --verbose
+# Classify sequences with BLAST in parallel shards (scripts/classify_sharded.py);
+# BLAST_THREADS is the total number of cores shared by the shards
+shard_dir="$output_dir/classify_shards"
+rm -rf "$shard_dir"
+python3 "$(dirname "$0")/classify_sharded.py" \
+    "$output_dir/rep_seqs_clust.qza" "$shard_dir" \
+    --blast-db "$BLAST_DB" \
+    --taxonomy-db "$TAXONOMY_DB" \
+    --perc-identity "$blast_id" \
+    --query-cov 0.8 \
+    --maxaccepts "$maxaccepts" \
+    --min-consensus 0.51 \
+    --cpus "${BLAST_THREADS:-$(nproc 2>/dev/null || echo 25)}" \
+    --import-qza
+mv "$shard_dir/taxonomy.qza" "$shard_dir/search_results.qza" "$output_dir/"
 
 echo "Clasificación completada. Resultados en $output_dir"
@@ -28,7 +28,7 @@ if [[ ! -f "$taxonomy_db" ]]; then
 fi
 
 # Parámetros de clasificación con valores por defecto
-NUM_THREADS="${NUM_THREADS:-5}"
+NUM_THREADS="${NUM_THREADS:-$(nproc 2>/dev/null || echo 5)}"
 PERC_ID="${PERC_ID:-0.8}"
 QUERY_COV="${QUERY_COV:-0.8}"
 MAX_ACCEPTS="${MAX_ACCEPTS:-1}"
@@ -48,38 +48,88 @@ if command -v conda >/dev/null; then
     conda activate clipon-qiime
 fi
 
-# Importar secuencias y redirigir salida a un archivo de log
-if qiime tools import \
-    --input-path "$input_fasta" \
-    --type 'FeatureData[Sequence]' \
-    --output-path "$output_dir/consensus_sequences.qza" \
-    >>"$log_file" 2>&1; then
-    echo "Importación completada: $output_dir/consensus_sequences.qza"
-else
-    echo "Error en la importación. Revise $log_file" >&2
-    exit 1
+# Caché persistente de clasificaciones (scripts/classification_cache.py): las
+# secuencias ya clasificadas con las mismas bases de datos y parámetros no se
+# vuelven a enviar a BLAST. CLASSIFY_CACHE=0 la desactiva; el tamaño máximo se
+# define con CLASSIFY_CACHE_MAX_MB (512 por defecto)
+CLASSIFY_CACHE="${CLASSIFY_CACHE:-${XDG_CACHE_HOME:-$HOME/.cache}/clipon/classifications.sqlite}"
+cache_script="$(dirname "$0")/classification_cache.py"
+query_fasta="$input_fasta"
+
+# Índice k-mer opcional (scripts/kmer_index.py): las coincidencias casi exactas
+# se asignan sin BLAST según KMER_MIN_IDENTITY, KMER_MIN_COVERAGE y KMER_MARGIN
+KMER_INDEX="${KMER_INDEX:-}"
+kmer_params=()
+if [[ -n "$KMER_INDEX" ]]; then
+    if [[ ! -f "$KMER_INDEX/meta.json" ]]; then
+        echo "El índice KMER_INDEX no existe: $KMER_INDEX" >&2
+        exit 1
+    fi
+    export KMER_INDEX
+    kmer_params=(--param "KMER_INDEX=$(sha1sum "$KMER_INDEX/meta.json" | cut -d' ' -f1)"
+        --param "KMER_MIN_IDENTITY=${KMER_MIN_IDENTITY:-0.99}"
+        --param "KMER_MIN_COVERAGE=${KMER_MIN_COVERAGE:-0.95}"
+        --param "KMER_MARGIN=${KMER_MARGIN:-0.005}")
 fi
 
-# Clasificación BLAST y redirección al log
-if qiime feature-classifier classify-consensus-blast \
-    --i-query "$output_dir/consensus_sequences.qza" \
-    --i-blastdb "$blast_db" \
-    --i-reference-taxonomy "$taxonomy_db" \
-    --p-num-threads "$NUM_THREADS" \
-    --p-perc-identity "$PERC_ID" \
-    --p-query-cov "$QUERY_COV" \
-    --p-maxaccepts "$MAX_ACCEPTS" \
-    --p-min-consensus "$MIN_CONSENSUS" \
-    --o-classification "$output_dir/taxonomy.qza" \
-    --o-search-results "$output_dir/search_results.qza" \
-    >>"$log_file" 2>&1; then
-    echo "Clasificación completada:"
+if [[ "$CLASSIFY_CACHE" != "0" ]]; then
+    python3 "$cache_script" lookup "$CLASSIFY_CACHE" "$input_fasta" "$output_dir" \
+        --blast-db "$blast_db" --taxonomy-db "$taxonomy_db" \
+        --param "PERC_ID=$PERC_ID" --param "QUERY_COV=$QUERY_COV" \
+        --param "MAX_ACCEPTS=$MAX_ACCEPTS" --param "MIN_CONSENSUS=$MIN_CONSENSUS" \
+        ${kmer_params[@]+"${kmer_params[@]}"}
+    query_fasta="$output_dir/cache/misses.fasta"
+fi
+
+# Clasificación en paralelo (scripts/classify_sharded.py): el FASTA se divide
+# en fragmentos que se clasifican a la vez, cada uno con pocos hilos de BLAST,
+# y las tablas se unen en el orden de entrada. NUM_THREADS define los núcleos
+# totales; CLASSIFY_SHARDS y CLASSIFY_SHARD_THREADS ajustan el reparto
+shard_dir="$output_dir/shards"
+rm -rf "$shard_dir"
+if [[ -s "$query_fasta" ]]; then
+    if python3 "$(dirname "$0")/classify_sharded.py" "$query_fasta" "$shard_dir" \
+        --blast-db "$blast_db" \
+        --taxonomy-db "$taxonomy_db" \
+        --cpus "$NUM_THREADS" \
+        --perc-identity "$PERC_ID" \
+        --query-cov "$QUERY_COV" \
+        --maxaccepts "$MAX_ACCEPTS" \
+        --min-consensus "$MIN_CONSENSUS" \
+        >>"$log_file" 2>&1; then
+        echo "Clasificación completada: $shard_dir"
+    else
+        echo "Error en la clasificación. Revise $log_file y $shard_dir/shard_*/classify.log" >&2
+        exit 1
+    fi
+fi
+
+results_dir="$shard_dir"
+if [[ "$CLASSIFY_CACHE" != "0" ]]; then
+    # Guardar las clasificaciones nuevas y unirlas con las encontradas en la
+    # caché; los .qza finales contienen todas las secuencias
+    store_args=()
+    if [[ -s "$query_fasta" ]]; then
+        store_args=(--taxonomy "$shard_dir/taxonomy.tsv" --search "$shard_dir/blast6.tsv")
+    fi
+    python3 "$cache_script" store "$CLASSIFY_CACHE" "$output_dir" \
+        ${store_args[@]+"${store_args[@]}"}
+    results_dir="$output_dir/cache/merged"
+fi
+
+if [[ -f "$results_dir/taxonomy.tsv" ]]; then
+    if ! qiime tools import --type 'FeatureData[Taxonomy]' \
+        --input-path "$results_dir/taxonomy.tsv" \
+        --output-path "$output_dir/taxonomy.qza" >>"$log_file" 2>&1 || \
+        ! qiime tools import --type 'FeatureData[BLAST6]' \
+        --input-path "$results_dir/blast6.tsv" \
+        --output-path "$output_dir/search_results.qza" >>"$log_file" 2>&1; then
+        echo "Error al importar los resultados de $results_dir. Revise $log_file" >&2
+        exit 1
+    fi
     echo "  Taxonomía: $output_dir/taxonomy.qza"
     echo "  Resultados de búsqueda: $output_dir/search_results.qza"
     echo "Log detallado: $log_file"
-else
-    echo "Error en la clasificación. Revise $log_file" >&2
-    exit 1
 fi
 
 echo "Clasificación finalizada. Archivos .qza disponibles en: $output_dir"
@@ -39,12 +39,27 @@ qiime tools export \
     --output-path "$export_dir" \
     >>"$log_file" 2>&1
 
+# Con SCALE_TABLE (subsample_fractions.tsv de subsample_reads.py) las lecturas
+# de soporte se llevan a la profundidad original de cada muestra
+extra_args=()
+if [[ -n "${SCALE_TABLE:-}" && -f "$SCALE_TABLE" ]]; then
+    extra_args=(--scale-table "$SCALE_TABLE")
+fi
+
+# Si se clasificaron solo las secuencias únicas (consensos_unicos.fasta),
+# consensus_map.tsv reparte cada clasificación entre las muestras
+consensus_map="${CONSENSUS_MAP:-$class_dir/consensus_map.tsv}"
+if [[ -f "$consensus_map" ]]; then
+    extra_args+=(--consensus-map "$consensus_map")
+fi
+
 # Generar tabla con columnas adicionales de lecturas y muestra
 if [[ -n "${METADATA_FILE:-}" ]]; then
-    python3 "$(dirname "$0")/add_reads_and_sample.py" \
+    python3 "$(dirname "$0")/add_reads_and_sample.py" ${extra_args[@]+"${extra_args[@]}"} \
         --metadata "$METADATA_FILE" "$export_dir/taxonomy.tsv" >>"$log_file" 2>&1
 else
-    python3 "$(dirname "$0")/add_reads_and_sample.py" "$export_dir/taxonomy.tsv" >>"$log_file" 2>&1
+    python3 "$(dirname "$0")/add_reads_and_sample.py" ${extra_args[@]+"${extra_args[@]}"} \
+        "$export_dir/taxonomy.tsv" >>"$log_file" 2>&1
 fi
 
 if [[ -f "$export_dir/taxonomy_with_sample.tsv" ]]; then
@@ -6,6 +6,14 @@ Extracts the number of supporting reads and the sample code from the
 columns ``Feature ID``, ``Taxon``, ``Consensus``, ``Reads`` and ``Sample``.
 Sample names can optionally be replaced by experiment identifiers using a
 metadata file with columns ``fastq`` and ``experiment``.
+
+When the reads were subsampled before clustering (``subsample_reads.py``),
+``--scale-table subsample_fractions.tsv`` divides the supporting reads of
+each sample by the fraction of reads kept, restoring the original depth.
+
+When only the distinct consensus sequences were classified
+(``unify_consensus.py``), ``--consensus-map consensus_map.tsv`` writes one
+row per sample and consensus for each classified sequence.
 """
 
 import argparse
@@ -13,6 +21,14 @@ import csv
 import pathlib
 import re
 
+from clipon_profiling import (
+    add_profile_argument,
+    phase,
+    profile,
+    profiling_enabled,
+    timed_iter,
+)
+from fastq_io import fastq_stem
 
 KNOWN_PREFIXES = ["cleaned_", "filtered_", "trimmed_"]
 KNOWN_SUFFIXES = ["_trimmed", "_filtered", "_cleaned"]
@@ -36,48 +52,108 @@ def load_metadata(path: str | None) -> dict[str, str]:
     with open(path) as fh:
         reader = csv.DictReader(fh, delimiter="\t")
         for row in reader:
-            fastq = pathlib.Path(row["fastq"]).stem
+            fastq = fastq_stem(row["fastq"])
             mapping[fastq] = row["experiment"]
     return mapping
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser(description=__doc__)
-    parser.add_argument("taxonomy", help="Input QIIME taxonomy.tsv file")
-    parser.add_argument("--metadata", help="TSV/CSV with fastq-experiment mapping")
-    args = parser.parse_args()
+def load_scale_table(path: str | None) -> dict[str, float]:
+    """Fraction of reads kept per FASTQ name, from ``subsample_fractions.tsv``."""
+    fractions: dict[str, float] = {}
+    if not path:
+        return fractions
+    with open(path) as fh:
+        for row in csv.DictReader(fh, delimiter="\t"):
+            fractions[row["sample"]] = float(row["fraction"])
+    return fractions
 
-    in_path = pathlib.Path(args.taxonomy)
-    out_path = in_path.with_name("taxonomy_with_sample.tsv")
-    mapping = load_metadata(args.metadata)
 
+def load_consensus_map(path: str | None) -> dict[str, list[tuple[str, str, str]]]:
+    """``(feature_id, reads, sample)`` of every consensus, by unique sequence id."""
+    consensus: dict[str, list[tuple[str, str, str]]] = {}
+    if not path:
+        return consensus
+    with open(path) as fh:
+        for row in csv.DictReader(fh, delimiter="\t"):
+            consensus.setdefault(row["unique_id"], []).append(
+                (row["feature_id"], row["reads"], row["sample"])
+            )
+    return consensus
+
+
+def parse_feature_id(fid: str) -> tuple[str, str, str]:
+    """Split an NGSpeciesID Feature ID into base id, reads and sample."""
+    m = re.search(r"_total_supporting_reads_(\d+)_(.+)$", fid)
+    if not m:
+        raise ValueError(f"Could not parse Feature ID: {fid}")
+    reads, sample = m.groups()
+    return fid[: m.start()], reads, sample
+
+
+def write_table(
+    in_path: pathlib.Path,
+    out_path: pathlib.Path,
+    mapping: dict[str, str],
+    fractions: dict[str, float],
+    consensus: dict[str, list[tuple[str, str, str]]],
+) -> None:
+    """Stream ``in_path`` into ``out_path`` with reads and sample columns."""
     with in_path.open() as fin, out_path.open("w", newline="") as fout:
         reader = csv.DictReader(fin, delimiter="\t")
         fieldnames = ["Feature ID", "Taxon", "Consensus", "Reads", "Sample"]
         writer = csv.DictWriter(fout, fieldnames=fieldnames, delimiter="\t")
         writer.writeheader()
 
-        for row in reader:
+        for row in timed_iter(reader, "load"):
             fid = row["Feature ID"]
-            m = re.search(r"_total_supporting_reads_(\d+)_(.+)$", fid)
-            if not m:
-                raise ValueError(f"Could not parse Feature ID: {fid}")
-            reads, sample = m.groups()
-            base_id = fid[: m.start()]
-            if sample in mapping:
-                sample = mapping[sample]
+            if fid in consensus:
+                entries = consensus[fid]
             else:
-                cleaned = clean_fastq_name(sample)
-                sample = mapping.get(cleaned, cleaned)
-            writer.writerow(
-                {
-                    "Feature ID": base_id,
-                    "Taxon": row["Taxon"],
-                    "Consensus": row["Consensus"],
-                    "Reads": reads,
-                    "Sample": sample,
-                }
-            )
+                entries = [parse_feature_id(fid)]
+            for base_id, reads, sample in entries:
+                fraction = fractions.get(sample)
+                if fraction and reads:
+                    reads = str(round(int(reads) / fraction))
+                if sample in mapping:
+                    sample = mapping[sample]
+                else:
+                    cleaned = clean_fastq_name(sample)
+                    sample = mapping.get(cleaned, cleaned)
+                writer.writerow(
+                    {
+                        "Feature ID": base_id,
+                        "Taxon": row["Taxon"],
+                        "Consensus": row["Consensus"],
+                        "Reads": reads,
+                        "Sample": sample,
+                    }
+                )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("taxonomy", help="Input QIIME taxonomy.tsv file")
+    parser.add_argument("--metadata", help="TSV/CSV with fastq-experiment mapping")
+    parser.add_argument(
+        "--scale-table",
+        help="subsample_fractions.tsv used to rescale reads to the original depth",
+    )
+    parser.add_argument(
+        "--consensus-map",
+        help="consensus_map.tsv linking unique consensus ids to samples",
+    )
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    in_path = pathlib.Path(args.taxonomy)
+    out_path = in_path.with_name("taxonomy_with_sample.tsv")
+    with profile(out_path, profiling_enabled(args.profile)):
+        with phase("load"):
+            mapping = load_metadata(args.metadata)
+            fractions = load_scale_table(args.scale_table)
+            consensus = load_consensus_map(args.consensus_map)
+        with phase("transform+write"):  # rows read are charged to "load"
+            write_table(in_path, out_path, mapping, fractions, consensus)
 
     print(f"Wrote {out_path}")
 
@@ -19,9 +19,9 @@ STEPS=(
 )
 
 MARKERS=(
-    "$WORK_DIR/1_processed/*.fastq"
-    "$WORK_DIR/2_trimmed/*.fastq"
-    "$WORK_DIR/3_filtered/*.fastq"
+    "$WORK_DIR/1_processed/*.fastq*"
+    "$WORK_DIR/2_trimmed/*.fastq*"
+    "$WORK_DIR/3_filtered/*.fastq*"
     "$WORK_DIR/4_clustered/*"
     "$WORK_DIR/5_unified/consensos_todos.fasta"
     "$WORK_DIR/5_unified/taxonomy.qza"
@@ -54,3 +54,4 @@ echo "export RESUME_STEP=$choice" > "$config_file"
 chmod +x "$config_file"
 echo "Configuración guardada en $config_file"
 echo "Para reanudar ejecute: source \"$config_file\" && scripts/run_clipon_pipeline.sh <dir_fastq_entrada> \"$WORK_DIR\""
+echo "Sin RESUME_STEP, run_clipon_pipeline.sh omite por sí solo los pasos cuyas entradas y parámetros no cambiaron."
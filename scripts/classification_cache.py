@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""Persistent cache of consensus classifications across runs.
+
+``classify-consensus-blast`` gives each query the same result whatever other
+queries are classified with it, so results can be reused between runs. Each
+classification is stored in an SQLite database under the SHA-256 of its
+sequence and a context made of the checksums of ``BLAST_DB`` and
+``TAXONOMY_DB`` and the classifier parameters (``PERC_ID``, ``QUERY_COV``,
+``MAX_ACCEPTS``, ``MIN_CONSENSUS``). Changing a database or a parameter
+therefore never returns stale results. Database checksums are kept in the
+cache too and only recomputed when the size or modification time of a
+``.qza`` changes.
+
+``De3_A4_Classify_NGS.sh`` uses it in three steps::
+
+    # Split the consensus FASTA into cached hits and misses
+    python scripts/classification_cache.py lookup <cache.sqlite> <consensos.fasta> \
+        <dir_clasificacion> --blast-db <blast.qza> --taxonomy-db <tax.qza> \
+        --param PERC_ID=0.8 ...
+    # ... classify <dir_clasificacion>/cache/misses.fasta with QIIME2 ...
+    # Store the new results and merge them with the hits
+    python scripts/classification_cache.py store <cache.sqlite> <dir_clasificacion> \
+        --taxonomy taxonomy.tsv --search blast6.tsv
+    # Size and hit rate of the cache
+    python scripts/classification_cache.py stats <cache.sqlite>
+
+``lookup`` writes to ``<dir_clasificacion>/cache``: ``misses.fasta``,
+``keys.tsv`` (feature id, sequence hash, context) and the cached rows. ``store``
+writes ``cache/merged/taxonomy.tsv`` and ``cache/merged/blast6.tsv`` with every
+query in input order, ready to be imported as ``taxonomy.qza`` and
+``search_results.qza``. When the cache grows beyond ``--max-mb`` the least
+recently used classifications are removed.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from unify_consensus import read_fasta
+
+_READ_SIZE = 1 << 20
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS classifications (
+    seq_hash TEXT NOT NULL,
+    context TEXT NOT NULL,
+    taxon TEXT NOT NULL,
+    consensus TEXT NOT NULL,
+    hits TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (seq_hash, context)
+);
+CREATE INDEX IF NOT EXISTS classifications_last_used ON classifications (last_used);
+CREATE TABLE IF NOT EXISTS databases (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    checksum TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def sequence_hash(sequence: str) -> str:
+    return hashlib.sha256(sequence.upper().encode()).hexdigest()
+
+
+def _file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(_READ_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ClassificationCache:
+    """Classifications by sequence hash and context in an SQLite file."""
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def database_checksum(self, path: str) -> str:
+        """SHA-256 of ``path``, recomputed only when its size or mtime change."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        row = self.db.execute(
+            "SELECT checksum FROM databases WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, st.st_size, st.st_mtime_ns),
+        ).fetchone()
+        if row:
+            return row[0]
+        checksum = _file_checksum(path)
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO databases VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, checksum),
+            )
+        return checksum
+
+    def context(self, blast_db: str, taxonomy_db: str, params: dict[str, str]) -> str:
+        """Identifier of the reference databases and classifier parameters."""
+        payload = json.dumps(
+            [self.database_checksum(blast_db), self.database_checksum(taxonomy_db),
+             sorted(params.items())]
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def lookup(self, seq_hashes, context: str) -> dict[str, tuple[str, str, list]]:
+        """Cached ``(taxon, consensus, hits)`` for the hashes found."""
+        seq_hashes = list(dict.fromkeys(seq_hashes))
+        found = {}
+        for i in range(0, len(seq_hashes), 500):
+            chunk = seq_hashes[i : i + 500]
+            rows = self.db.execute(
+                "SELECT seq_hash, taxon, consensus, hits FROM classifications "
+                f"WHERE context = ? AND seq_hash IN ({','.join('?' * len(chunk))})",
+                (context, *chunk),
+            )
+            for seq_hash, taxon, consensus, hits in rows:
+                found[seq_hash] = (taxon, consensus, json.loads(hits))
+        with self.db:
+            self.db.executemany(
+                "UPDATE classifications SET last_used = ? WHERE seq_hash = ? AND context = ?",
+                [(time.time(), seq_hash, context) for seq_hash in found],
+            )
+            self._count("lookups", len(seq_hashes))
+            self._count("hits", len(found))
+        return found
+
+    def store(self, entries: dict[str, tuple[str, str, list]], context: str) -> None:
+        """Add ``(taxon, consensus, hits)`` classifications by sequence hash."""
+        now = time.time()
+        rows = []
+        for seq_hash, (taxon, consensus, hits) in entries.items():
+            hits_json = json.dumps(hits)
+            size = len(seq_hash) + len(context) + len(taxon) + len(consensus) + len(hits_json)
+            rows.append((seq_hash, context, taxon, consensus, hits_json, size, now))
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO classifications VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def evict(self, max_bytes: int) -> int:
+        """Remove least recently used entries until the data fits ``max_bytes``."""
+        total = self.db.execute("SELECT COALESCE(SUM(bytes), 0) FROM classifications").fetchone()[0]
+        if total <= max_bytes:
+            return 0
+        removed = []
+        for rowid, size in self.db.execute(
+            "SELECT rowid, bytes FROM classifications ORDER BY last_used"
+        ):
+            if total <= max_bytes:
+                break
+            removed.append((rowid,))
+            total -= size
+        with self.db:
+            self.db.executemany("DELETE FROM classifications WHERE rowid = ?", removed)
+        return len(removed)
+
+    def _count(self, name: str, value: int) -> None:
+        self.db.execute(
+            "INSERT INTO counters VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, value),
+        )
+
+    def stats(self) -> dict[str, float]:
+        entries, size = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM classifications"
+        ).fetchone()
+        counters = dict(self.db.execute("SELECT name, value FROM counters"))
+        lookups, hits = counters.get("lookups", 0), counters.get("hits", 0)
+        return {
+            "entries": entries,
+            "mb": size / 1024**2,
+            "lookups": lookups,
+            "hits": hits,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+def _cache_dir(work_dir: str) -> str:
+    return os.path.join(work_dir, "cache")
+
+
+def _write_table(path: str, header: list[str] | None, rows) -> None:
+    with open(path, "w", newline="") as fh:
+        writer = csv.writer(fh, delimiter="\t", lineterminator="\n")
+        if header:
+            writer.writerow(header)
+        writer.writerows(rows)
+
+
+def lookup_fasta(
+    cache: ClassificationCache, fasta: str, work_dir: str, context: str
+) -> tuple[int, int]:
+    """Split ``fasta`` into cached results and misses; return queries and hits."""
+    out = _cache_dir(work_dir)
+    os.makedirs(out, exist_ok=True)
+    records = [(header.split()[0], seq) for header, seq in read_fasta(fasta)]
+    hashes = [sequence_hash(seq) for _fid, seq in records]
+    found = cache.lookup(hashes, context)
+
+    with open(os.path.join(out, "misses.fasta"), "w") as fh:
+        for (fid, seq), seq_hash in zip(records, hashes):
+            if seq_hash not in found:
+                fh.write(f">{fid}\n{seq}\n")
+    _write_table(
+        os.path.join(out, "keys.tsv"),
+        ["feature_id", "seq_hash", "context"],
+        [(fid, seq_hash, context) for (fid, _seq), seq_hash in zip(records, hashes)],
+    )
+    hits = [(fid, seq_hash) for (fid, _seq), seq_hash in zip(records, hashes) if seq_hash in found]
+    _write_table(
+        os.path.join(out, "hits_taxonomy.tsv"),
+        ["Feature ID", "Taxon", "Consensus"],
+        [(fid, *found[seq_hash][:2]) for fid, seq_hash in hits],
+    )
+    _write_table(
+        os.path.join(out, "hits_blast6.tsv"),
+        None,
+        [(fid, *row) for fid, seq_hash in hits for row in found[seq_hash][2]],
+    )
+    return len(records), sum(1 for seq_hash in hashes if seq_hash in found)
+
+
+def _read_rows(path: str | None) -> list[list[str]]:
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, newline="") as fh:
+        return [row for row in csv.reader(fh, delimiter="\t") if row]
+
+
+def store_results(
+    cache: ClassificationCache,
+    work_dir: str,
+    taxonomy: str | None = None,
+    search: str | None = None,
+) -> int:
+    """Cache new results and write ``merged/`` tables; return entries stored."""
+    out = _cache_dir(work_dir)
+    keys = [(row[0], row[1], row[2]) for row in _read_rows(os.path.join(out, "keys.tsv"))[1:]]
+    taxa = {row[0]: row[1:3] for row in _read_rows(taxonomy)[1:]}
+    taxa.update({row[0]: row[1:3] for row in _read_rows(os.path.join(out, "hits_taxonomy.tsv"))[1:]})
+    hits: dict[str, list] = {}
+    for path in (search, os.path.join(out, "hits_blast6.tsv")):
+        for row in _read_rows(path):
+            hits.setdefault(row[0], []).append(row[1:])
+
+    new: dict[str, dict] = {}
+    new_ids = {row[0] for row in _read_rows(taxonomy)[1:]}
+    for fid, seq_hash, context in keys:
+        if fid in new_ids:
+            taxon, consensus = (taxa[fid] + ["", ""])[:2]
+            new.setdefault(context, {})[seq_hash] = (taxon, consensus, hits.get(fid, []))
+    for context, entries in new.items():
+        cache.store(entries, context)
+
+    merged = os.path.join(out, "merged")
+    os.makedirs(merged, exist_ok=True)
+    _write_table(
+        os.path.join(merged, "taxonomy.tsv"),
+        ["Feature ID", "Taxon", "Consensus"],
+        [(fid, *taxa[fid]) for fid, _h, _c in keys if fid in taxa],
+    )
+    _write_table(
+        os.path.join(merged, "blast6.tsv"),
+        None,
+        [(fid, *row) for fid, _h, _c in keys for row in hits.get(fid, [])],
+    )
+    return sum(len(entries) for entries in new.values())
+
+
+def parse_params(values: list[str]) -> dict[str, str]:
+    return dict(value.partition("=")[::2] for value in values)
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    lookup = sub.add_parser("lookup", help="Split a FASTA into cached hits and misses.")
+    lookup.add_argument("cache", help="SQLite cache file.")
+    lookup.add_argument("fasta", help="Consensus sequences to classify.")
+    lookup.add_argument("work_dir", help="Classification output directory.")
+    lookup.add_argument("--blast-db", required=True)
+    lookup.add_argument("--taxonomy-db", required=True)
+    lookup.add_argument(
+        "--param", action="append", default=[], help="NAME=VALUE classifier setting."
+    )
+    store = sub.add_parser("store", help="Cache new results and merge them with the hits.")
+    store.add_argument("cache", help="SQLite cache file.")
+    store.add_argument("work_dir", help="Classification output directory.")
+    store.add_argument("--taxonomy", help="taxonomy.tsv exported for the misses.")
+    store.add_argument("--search", help="blast6.tsv exported for the misses.")
+    store.add_argument(
+        "--max-mb",
+        type=float,
+        default=float(os.environ.get("CLASSIFY_CACHE_MAX_MB", 512)),
+        help="Size limit of the cached data (default: $CLASSIFY_CACHE_MAX_MB or 512).",
+    )
+    stats = sub.add_parser("stats", help="Print the size and hit rate of the cache.")
+    stats.add_argument("cache", help="SQLite cache file.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Entry point for command-line execution."""
+    args = parse_args()
+    cache = ClassificationCache(args.cache)
+    try:
+        if args.command == "lookup":
+            context = cache.context(args.blast_db, args.taxonomy_db, parse_params(args.param))
+            queries, hits = lookup_fasta(cache, args.fasta, args.work_dir, context)
+            rate = hits / queries if queries else 0.0
+            print(f"Caché de clasificación: {hits}/{queries} secuencias encontradas ({rate:.1%}); "
+                  f"{queries - hits} se envían a QIIME2")
+        elif args.command == "store":
+            stored = store_results(cache, args.work_dir, args.taxonomy, args.search)
+            evicted = cache.evict(int(args.max_mb * 1024**2))
+            print(f"Caché de clasificación: {stored} clasificaciones nuevas, {evicted} eliminadas")
+        else:
+            s = cache.stats()
+            print(f"entries\t{s['entries']}\nsize_mb\t{s['mb']:.2f}\nlookups\t{s['lookups']}"
+                  f"\nhits\t{s['hits']}\nhit_rate\t{s['hit_rate']:.4f}")
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
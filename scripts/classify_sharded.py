@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""Classify consensus sequences in parallel shards.
+
+``classify-consensus-blast`` gains little from more BLAST threads, so a
+single job leaves most cores idle. This driver splits the query FASTA into
+shards of similar total length, classifies every shard in its own process at
+the same time and merges the results::
+
+    <output_dir>/taxonomy.tsv      Feature ID, Taxon, Consensus
+    <output_dir>/blast6.tsv        BLAST6 search results
+    <output_dir>/shard_<i>/        shard FASTA, classifier outputs and log
+
+Rows are merged in the order of the input FASTA, so the tables do not depend
+on the number of shards or on which shard finishes first. Each query is
+classified independently by ``classify-consensus-blast``, so sharding does not
+change the results.
+
+By default every shard is imported into QIIME2, classified with
+``classify-consensus-blast`` and exported again. ``--classifier-cmd`` runs
+another command per shard; ``{fasta}``, ``{taxonomy}``, ``{search}``,
+``{threads}`` and ``{shard_dir}`` are replaced by the shard paths and threads,
+and the command must write the two tables. A ``FeatureData[Sequence]``
+``.qza`` (such as ``rep_seqs_clust.qza``) is exported to FASTA first.
+
+With ``--kmer-index`` (``$KMER_INDEX``) the near-exact matches are assigned
+from the index of ``kmer_index.py`` (see that script for the thresholds) and
+only the remaining sequences are sharded; both sets are merged in input order.
+
+Shards and threads come from ``--cpus`` (default: ``$CLIPON_CPUS`` or all
+cores): ``--threads-per-shard`` (2 by default) threads for each of
+``cpus / threads`` shards, never more shards than sequences.
+
+Usage:
+    python scripts/classify_sharded.py <consensos.fasta|rep_seqs.qza> <dir_salida> \
+        --blast-db <blast.qza> --taxonomy-db <tax.qza> [--cpus N] [--import-qza]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from kmer_index import KmerIndex, add_threshold_args, classify_fasta, thresholds
+from unify_consensus import read_fasta
+
+
+def plan_shards(
+    cpus: int, sequences: int, threads: int = 2, shards: int | None = None
+) -> tuple[int, int]:
+    """Number of shards and threads per shard for ``cpus`` cores."""
+    threads = max(1, min(threads, cpus))
+    if shards is None:
+        shards = max(1, cpus // threads)
+    shards = max(1, min(shards, sequences))
+    return shards, max(1, cpus // shards)
+
+
+def split_fasta(records: list[tuple[str, str]], shards: int) -> list[list[int]]:
+    """Indices of ``records`` per shard, balancing the total sequence length.
+
+    Longer sequences are placed first, each in the shard with the fewest
+    bases; every shard keeps its sequences in input order.
+    """
+    loads = [0] * shards
+    assigned: list[list[int]] = [[] for _ in range(shards)]
+    for i in sorted(range(len(records)), key=lambda i: (-len(records[i][1]), i)):
+        shard = min(range(shards), key=lambda s: (loads[s], s))
+        loads[shard] += len(records[i][1])
+        assigned[shard].append(i)
+    return [sorted(indices) for indices in assigned if indices]
+
+
+def qiime_commands(shard_dir: Path, threads: int, args: argparse.Namespace) -> list[list[str]]:
+    """``classify-consensus-blast`` of one shard, exported to TSV."""
+    return [
+        ["qiime", "tools", "import", "--type", "FeatureData[Sequence]",
+         "--input-path", str(shard_dir / "query.fasta"),
+         "--output-path", str(shard_dir / "query.qza")],
+        ["qiime", "feature-classifier", "classify-consensus-blast",
+         "--i-query", str(shard_dir / "query.qza"),
+         "--i-blastdb", args.blast_db,
+         "--i-reference-taxonomy", args.taxonomy_db,
+         "--p-num-threads", str(threads),
+         "--p-perc-identity", args.perc_identity,
+         "--p-query-cov", args.query_cov,
+         "--p-maxaccepts", args.maxaccepts,
+         "--p-min-consensus", args.min_consensus,
+         "--o-classification", str(shard_dir / "taxonomy.qza"),
+         "--o-search-results", str(shard_dir / "search_results.qza")],
+        ["qiime", "tools", "export", "--input-path", str(shard_dir / "taxonomy.qza"),
+         "--output-path", str(shard_dir / "taxonomy")],
+        ["qiime", "tools", "export", "--input-path", str(shard_dir / "search_results.qza"),
+         "--output-path", str(shard_dir / "search")],
+    ]
+
+
+def _shard_outputs(shard_dir: Path, custom: bool) -> tuple[Path, Path]:
+    if custom:
+        return shard_dir / "taxonomy.tsv", shard_dir / "blast6.tsv"
+    search = sorted((shard_dir / "search").glob("*.tsv"))
+    taxonomy = shard_dir / "taxonomy" / "taxonomy.tsv"
+    return taxonomy, search[0] if search else shard_dir / "blast6.tsv"
+
+
+def run_shard(shard_dir: Path, commands: list[list[str]]) -> int:
+    """Run ``commands`` one after the other; return the first failing code."""
+    with open(shard_dir / "classify.log", "w") as log:
+        for cmd in commands:
+            code = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT).returncode
+            if code:
+                return code
+    return 0
+
+
+def _read_tsv(path: Path) -> list[list[str]]:
+    with open(path) as fh:
+        return [line.rstrip("\n").split("\t") for line in fh if line.strip()]
+
+
+def merge_results(order: list[str], outputs: list[tuple[Path, Path]], output_dir: Path) -> None:
+    """Write ``taxonomy.tsv`` and ``blast6.tsv`` with queries in ``order``."""
+    header = ["Feature ID", "Taxon", "Consensus"]
+    taxa: dict[str, list[str]] = {}
+    hits: dict[str, list[list[str]]] = {}
+    for taxonomy, search in outputs:
+        rows = _read_tsv(taxonomy)
+        if rows and rows[0][0] == "Feature ID":
+            header, rows = rows[0], rows[1:]
+        for row in rows:
+            taxa[row[0]] = row
+        if search.exists():
+            for row in _read_tsv(search):
+                hits.setdefault(row[0], []).append(row)
+    missing = [fid for fid in order if fid not in taxa]
+    if missing:
+        raise ValueError(f"Sin clasificación para {len(missing)} secuencias: {missing[:5]}")
+    with open(output_dir / "taxonomy.tsv", "w") as fh:
+        fh.write("\t".join(header) + "\n")
+        fh.writelines("\t".join(taxa[fid]) + "\n" for fid in order)
+    with open(output_dir / "blast6.tsv", "w") as fh:
+        fh.writelines("\t".join(row) + "\n" for fid in order for row in hits.get(fid, []))
+
+
+def _export_qza(path: str, output_dir: Path) -> str:
+    export_dir = output_dir / "query"
+    subprocess.run(
+        ["qiime", "tools", "export", "--input-path", path, "--output-path", str(export_dir)],
+        check=True,
+    )
+    return str(export_dir / "dna-sequences.fasta")
+
+
+def import_results(output_dir: Path) -> None:
+    """Import the merged tables as ``taxonomy.qza`` and ``search_results.qza``."""
+    for kind, table, artifact in (
+        ("FeatureData[Taxonomy]", "taxonomy.tsv", "taxonomy.qza"),
+        ("FeatureData[BLAST6]", "blast6.tsv", "search_results.qza"),
+    ):
+        subprocess.run(
+            ["qiime", "tools", "import", "--type", kind,
+             "--input-path", str(output_dir / table),
+             "--output-path", str(output_dir / artifact)],
+            check=True,
+        )
+
+
+def classify(args: argparse.Namespace) -> int:
+    """Classify ``args.query`` in shards; return the number of failed shards."""
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    query = args.query
+    if query.endswith(".qza"):
+        query = _export_qza(query, output_dir)
+    order = [header.split()[0] for header, _seq in read_fasta(query)]
+    fast: list[tuple[Path, Path]] = []
+    if args.kmer_index:
+        kmer_dir = output_dir / "kmer"
+        total, assigned = classify_fasta(
+            KmerIndex(args.kmer_index), query, str(kmer_dir), **thresholds(args)
+        )
+        print(f"Índice k-mer: {assigned} de {total} secuencias asignadas sin BLAST")
+        fast.append((kmer_dir / "taxonomy.tsv", kmer_dir / "blast6.tsv"))
+        query = str(kmer_dir / "unassigned.fasta")
+    records = [(header.split()[0], seq) for header, seq in read_fasta(query)]
+    if not records:
+        print(f"No hay secuencias para clasificar con BLAST en {args.query}")
+        merge_results(order, fast, output_dir)
+        if args.import_qza:
+            import_results(output_dir)
+        return 0
+
+    shards, threads = plan_shards(args.cpus, len(records), args.threads_per_shard, args.shards)
+    groups = split_fasta(records, shards)
+    jobs = []
+    for i, indices in enumerate(groups):
+        shard_dir = output_dir / f"shard_{i}"
+        if shard_dir.exists():
+            shutil.rmtree(shard_dir)
+        shard_dir.mkdir()
+        with open(shard_dir / "query.fasta", "w") as fh:
+            fh.writelines(f">{records[j][0]}\n{records[j][1]}\n" for j in indices)
+        if args.classifier_cmd:
+            outputs = _shard_outputs(shard_dir, True)
+            commands = [[
+                part.format(
+                    fasta=shard_dir / "query.fasta", taxonomy=outputs[0], search=outputs[1],
+                    threads=threads, shard_dir=shard_dir,
+                )
+                for part in shlex.split(args.classifier_cmd)
+            ]]
+        else:
+            commands = qiime_commands(shard_dir, threads, args)
+        jobs.append((shard_dir, commands))
+
+    print(f"Clasificando {len(records)} secuencias en {len(jobs)} fragmentos "
+          f"de {threads} hilos")
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        codes = list(pool.map(lambda job: run_shard(*job), jobs))
+    failed = [shard_dir for (shard_dir, _), code in zip(jobs, codes) if code]
+    for shard_dir in failed:
+        print(f"Falló la clasificación de {shard_dir}; revise {shard_dir / 'classify.log'}",
+              file=sys.stderr)
+    if failed:
+        return len(failed)
+
+    merge_results(
+        order,
+        fast + [_shard_outputs(shard_dir, bool(args.classifier_cmd)) for shard_dir, _ in jobs],
+        output_dir,
+    )
+    if args.import_qza:
+        import_results(output_dir)
+    return 0
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("query", help="Consensus FASTA or FeatureData[Sequence] .qza.")
+    parser.add_argument("output_dir", help="Directory for shards and merged tables.")
+    parser.add_argument("--blast-db", default=os.environ.get("BLAST_DB"))
+    parser.add_argument("--taxonomy-db", default=os.environ.get("TAXONOMY_DB"))
+    parser.add_argument("--perc-identity", default=os.environ.get("PERC_ID") or "0.8")
+    parser.add_argument("--query-cov", default=os.environ.get("QUERY_COV") or "0.8")
+    parser.add_argument("--maxaccepts", default=os.environ.get("MAX_ACCEPTS") or "1")
+    parser.add_argument("--min-consensus", default=os.environ.get("MIN_CONSENSUS") or "0.51")
+    parser.add_argument(
+        "--cpus",
+        type=int,
+        default=int(os.environ.get("CLIPON_CPUS", 0)) or os.cpu_count() or 1,
+        help="Cores shared by all shards (default: $CLIPON_CPUS or all).",
+    )
+    parser.add_argument(
+        "--threads-per-shard",
+        type=int,
+        default=int(os.environ.get("CLASSIFY_SHARD_THREADS", 2)),
+        help="BLAST threads of each shard ($CLASSIFY_SHARD_THREADS, default 2).",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=int(os.environ.get("CLASSIFY_SHARDS", 0)) or None,
+        help="Number of shards (default: cpus / threads per shard).",
+    )
+    parser.add_argument(
+        "--classifier-cmd",
+        help="Command run per shard instead of QIIME2 (see the placeholders above).",
+    )
+    parser.add_argument(
+        "--kmer-index",
+        default=os.environ.get("KMER_INDEX") or None,
+        help="Index of kmer_index.py for near-exact matches ($KMER_INDEX).",
+    )
+    add_threshold_args(parser)
+    parser.add_argument(
+        "--import-qza",
+        action="store_true",
+        help="Also write taxonomy.qza and search_results.qza.",
+    )
+    args = parser.parse_args(argv)
+    if not args.classifier_cmd and not (args.blast_db and args.taxonomy_db):
+        parser.error("--blast-db y --taxonomy-db (o BLAST_DB y TAXONOMY_DB) son obligatorios")
+    return args
+
+
+def main(argv=None) -> None:
+    """Entry point for command-line execution."""
+    sys.exit(1 if classify(parse_args(argv)) else 0)
+
+
+if __name__ == "__main__":
+    main()
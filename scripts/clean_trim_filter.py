@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""Clean, trim and filter FASTQ files in a single streaming pass.
+
+Replaces the ``seqkit sana`` (``De0_A1_Process_Fastq.4_SeqKit.sh``),
+``cutadapt -u/-u`` (``De1_A1.5_Trim_Fastq.sh``) and
+``NanoFilt -l/--maxlength/-q`` (``De1.5_A2_Filtrado_NanoFilt_1.1.sh``) stages
+and their statistics passes. Every FASTQ is read once and each block of reads
+goes through the same steps:
+
+1. records whose header does not start with ``@``, whose separator does not
+   start with ``+`` or whose sequence and quality differ in length are
+   dropped;
+2. ``TRIM_FRONT`` bases are removed from the start and ``TRIM_BACK`` from the
+   end of each read (skipped with ``SKIP_TRIM=1``); reads shorter than that
+   become empty, as with cutadapt;
+3. reads are kept when ``MIN_LEN <= length <= MAX_LEN`` and their average
+   quality, derived from the mean per-base error probability as NanoFilt
+   does, is above ``MIN_QUAL``.
+
+Raw, processed and filtered statistics are collected on the way, following
+``STATS_MODE`` and ``STATS_JSON`` like the shell stages. Output names match
+those stages::
+
+    1_processed/<name>_raw_stats.tsv
+    1_processed/<name>_processed_stats.tsv
+    3_filtered/cleaned_<name>_trimmed_Filt<MIN_LEN>_<MAX_LEN>_Q<MIN_QUAL>.fastq
+    3_filtered/cleaned_<name>_trimmed_filtered_stats.tsv
+
+Input files may be gzip or bgzip compressed (``<name>.fastq.gz``). With
+``CLIPON_COMPRESS=bgzip`` the FASTQ outputs are written as ``.fastq.gz`` at
+``CLIPON_COMPRESS_LEVEL`` (see ``fastq_io.py``).
+
+``1_processed/cleaned_<name>.fastq`` and
+``2_trimmed/cleaned_<name>_trimmed.fastq`` are only written with
+``--keep-intermediates`` (or ``KEEP_INTERMEDIATES=1``).
+
+Files are processed in parallel. With a single FASTQ, a file larger than
+``fastq_index.INDEX_CHUNK`` is split into record-aligned slices processed by
+``--workers`` processes instead.
+
+Usage:
+    python scripts/clean_trim_filter.py <dir_fastq_entrada> <dir_trabajo>
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+
+from collect_read_stats import (
+    CHUNK_SIZE,
+    FASTQ_SUFFIXES,
+    PHRED_OFFSET,
+    FastqBlock,
+    StatsPart,
+    StatsWriter,
+    iter_fastq_blocks,
+    segment_sums,
+)
+from fastq_index import INDEX_CHUNK, chunk_ranges, open_slice
+from fastq_io import compression_settings, fastq_stem, is_gzip, open_fastq, open_output
+
+# float64 error probabilities so the quality cut matches NanoFilt closely
+_ERROR_PROB_LUT64 = 10 ** (-np.clip(np.arange(256) - PHRED_OFFSET, 0, None) / 10)
+
+
+@dataclass(frozen=True)
+class PrepSettings:
+    """Trimming and filtering parameters of the preprocessing stages."""
+
+    trim_front: int = 0
+    trim_back: int = 0
+    skip_trim: bool = False
+    min_len: int = 650
+    max_len: int = 750
+    min_qual: float = 10.0
+
+    @classmethod
+    def from_env(cls, env=os.environ) -> "PrepSettings":
+        """Read the variables used by the trimming and NanoFilt scripts."""
+        return cls(
+            trim_front=int(env.get("TRIM_FRONT", 0)),
+            trim_back=abs(int(env.get("TRIM_BACK", 0))),
+            skip_trim=env.get("SKIP_TRIM", "0") == "1",
+            min_len=int(env.get("MIN_LEN", 650)),
+            max_len=int(env.get("MAX_LEN", 750)),
+            min_qual=float(env.get("MIN_QUAL", 10)),
+        )
+
+    def trimmed_stem(self, name: str) -> str:
+        return f"cleaned_{name}" if self.skip_trim else f"cleaned_{name}_trimmed"
+
+    def filtered_name(self, name: str, ext: str = ".fastq") -> str:
+        return (
+            f"{self.trimmed_stem(name)}_Filt{self.min_len}_{self.max_len}"
+            f"_Q{self.min_qual:g}{ext}"
+        )
+
+
+def _subset(block: FastqBlock, keep: np.ndarray) -> FastqBlock:
+    return FastqBlock(block.raw, block.view, block.starts[keep], block.ends[keep])
+
+
+def sanitize(block: FastqBlock) -> FastqBlock:
+    """Drop malformed records, like ``seqkit sana``."""
+    view, starts = block.view, block.starts
+    keep = (
+        (view[starts[:, 0]] == ord("@"))
+        & (view[starts[:, 2]] == ord("+"))
+        & (block.lengths == block.quality_lengths)
+    )
+    return _subset(block, keep)
+
+
+def trim(block: FastqBlock, front: int, back: int) -> FastqBlock:
+    """Remove ``front`` and ``back`` bases from sequence and quality lines."""
+    if not front and not back:
+        return block
+    starts, ends = block.starts.copy(), block.ends.copy()
+    for col in (1, 3):
+        starts[:, col] = np.minimum(starts[:, col] + front, ends[:, col])
+        ends[:, col] = np.maximum(ends[:, col] - back, starts[:, col])
+    return FastqBlock(block.raw, block.view, starts, ends)
+
+
+def average_qualities(block: FastqBlock) -> np.ndarray:
+    """NanoFilt average quality: Phred of the mean per-base error probability."""
+    errors = segment_sums(
+        _ERROR_PROB_LUT64[block.view], block.starts[:, 3], block.ends[:, 3], np.float64
+    )
+    lengths = block.quality_lengths
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return -10 * np.log10(errors / lengths)
+
+
+def length_quality_filter(block: FastqBlock, settings: PrepSettings) -> FastqBlock:
+    """Keep reads passing the NanoFilt length and quality thresholds."""
+    lengths = block.lengths
+    keep = (lengths >= settings.min_len) & (lengths <= settings.max_len) & (lengths > 0)
+    keep[keep] = average_qualities(_subset(block, keep)) > settings.min_qual
+    return _subset(block, keep)
+
+
+def format_records(block: FastqBlock) -> bytes:
+    """Serialise ``block`` as FASTQ with a bare ``+`` separator line."""
+    if not len(block):
+        return b""
+    newline = len(block.view)
+    buffer = np.append(block.view, np.uint8(ord("\n")))
+    s, e = block.starts, block.ends
+    n = len(block)
+    nl = np.full(n, newline)
+    range_starts = np.column_stack((s[:, 0], nl, s[:, 1], nl, s[:, 2], nl, s[:, 3], nl))
+    range_ends = np.column_stack(
+        (e[:, 0], nl + 1, e[:, 1], nl + 1, s[:, 2] + 1, nl + 1, e[:, 3], nl + 1)
+    )
+    range_starts, range_ends = range_starts.ravel(), range_ends.ravel()
+    lengths = range_ends - range_starts
+    offsets = np.cumsum(lengths) - lengths
+    index = np.arange(lengths.sum()) - np.repeat(offsets - range_starts, lengths)
+    return buffer[index].tobytes()
+
+
+def run_stages(
+    block: FastqBlock, settings: PrepSettings
+) -> tuple[FastqBlock, FastqBlock, FastqBlock]:
+    """Return the cleaned, trimmed and filtered reads of ``block``."""
+    cleaned = sanitize(block)
+    trimmed = cleaned
+    if not settings.skip_trim:
+        trimmed = trim(cleaned, settings.trim_front, settings.trim_back)
+    return cleaned, trimmed, length_quality_filter(trimmed, settings)
+
+
+def _process_slice(job) -> tuple[list[StatsPart], dict[str, int]]:
+    """Run the stages on one slice, writing FASTQ parts to the given paths."""
+    fastq, start, end, settings, parts, outputs, chunk_size = job
+    counts = {"raw": 0, "processed": 0, "filtered": 0}
+    with ExitStack() as stack:
+        for part in parts:
+            part.open()
+            stack.callback(part.close)
+        raw_stats, processed_stats, filtered_stats = parts
+        files = [stack.enter_context(open(path, "wb")) for path in outputs]
+        fh = stack.enter_context(open_slice(fastq, start, end))
+        for block in iter_fastq_blocks(fh, chunk_size):
+            cleaned, trimmed, filtered = run_stages(block, settings)
+            raw_stats.add(block)
+            processed_stats.add(cleaned)
+            filtered_stats.add(filtered)
+            for out, records in zip(files, (filtered, cleaned, trimmed)):
+                out.write(format_records(records))
+            counts["raw"] += len(block)
+            counts["processed"] += len(cleaned)
+            counts["filtered"] += len(filtered)
+    return parts, counts
+
+
+def process_fastq(
+    fastq: Path,
+    processed_dir: Path,
+    trimmed_dir: Path,
+    filtered_dir: Path,
+    settings: PrepSettings,
+    summary: dict | None = None,
+    summary_json: str | None = None,
+    keep_intermediates: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+    workers: int = 1,
+    index_chunk: int = INDEX_CHUNK,
+) -> dict[str, int]:
+    """Run the fused stage on one FASTQ and return read counts per stage.
+
+    With ``workers > 1`` a FASTQ larger than ``index_chunk`` bytes is split
+    into record-aligned slices (``fastq_index.py``) processed in a pool; the
+    outputs are concatenated in read order. Compressed input is read in one
+    pass. FASTQ outputs are written as bgzip with ``CLIPON_COMPRESS=bgzip``.
+    """
+    name = fastq_stem(fastq)
+    ext = compression_settings()[0]
+    suffix = "stats" if summary is None else "summary"
+    trimmed_stem = settings.trimmed_stem(name)
+    counts = {"raw": 0, "processed": 0, "filtered": 0}
+    ranges = chunk_ranges(fastq, index_chunk) if workers > 1 and not is_gzip(fastq) else []
+
+    with ExitStack() as stack:
+        def stats(directory: Path, stem: str, stage: str) -> StatsWriter:
+            path = str(directory / f"{stem}_{stage}_{suffix}.tsv")
+            return stack.enter_context(StatsWriter(path, summary, summary_json))
+
+        raw_stats = stats(processed_dir, name, "raw")
+        processed_stats = stats(processed_dir, name, "processed")
+        filtered_stats = stats(filtered_dir, trimmed_stem, "filtered")
+        writers = (raw_stats, processed_stats, filtered_stats)
+        outputs = [filtered_dir / settings.filtered_name(name, ext)]
+        if keep_intermediates:
+            outputs.append(processed_dir / f"cleaned_{name}{ext}")
+            outputs.append(trimmed_dir / f"{trimmed_stem}{ext}")
+        files = [stack.enter_context(open_output(path)) for path in outputs]
+
+        if len(ranges) > 1:
+            tmp_dir = Path(tempfile.mkdtemp(prefix=f".{name}_", dir=filtered_dir))
+            stack.callback(shutil.rmtree, tmp_dir, True)
+            jobs = []
+            for i, (start, end) in enumerate(ranges):
+                parts = [w.part(str(tmp_dir / f"{i}.{j}.tsv")) for j, w in enumerate(writers)]
+                slices = [tmp_dir / f"{i}.{j}.fastq" for j in range(len(files))]
+                jobs.append((fastq, start, end, settings, parts, slices, chunk_size))
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+                for job, (parts, slice_counts) in zip(jobs, pool.map(_process_slice, jobs)):
+                    for writer, part in zip(writers, parts):
+                        writer.merge(part)
+                    for out, path in zip(files, job[5]):
+                        with open(path, "rb") as src:
+                            shutil.copyfileobj(src, out)
+                        path.unlink()
+                    for stage, value in slice_counts.items():
+                        counts[stage] += value
+            return counts
+
+        fh_fastq = stack.enter_context(open_fastq(fastq))
+        for block in iter_fastq_blocks(fh_fastq, chunk_size):
+            cleaned, trimmed, filtered = run_stages(block, settings)
+            raw_stats.add(block)
+            processed_stats.add(cleaned)
+            filtered_stats.add(filtered)
+            for out, records in zip(files, (filtered, cleaned, trimmed)):
+                out.write(format_records(records))
+
+            counts["raw"] += len(block)
+            counts["processed"] += len(cleaned)
+            counts["filtered"] += len(filtered)
+    return counts
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "input_dir", nargs="?", default=os.environ.get("INPUT_DIR"),
+        help="Directory with the raw FASTQ files (default: $INPUT_DIR).",
+    )
+    parser.add_argument(
+        "work_dir", nargs="?", default=os.environ.get("WORK_DIR"),
+        help="Pipeline work directory (default: $WORK_DIR).",
+    )
+    parser.add_argument("--processed-dir", help="Default: <work_dir>/1_processed")
+    parser.add_argument("--trimmed-dir", help="Default: <work_dir>/2_trimmed")
+    parser.add_argument("--filtered-dir", help="Default: <work_dir>/3_filtered")
+    parser.add_argument(
+        "--keep-intermediates",
+        action="store_true",
+        default=os.environ.get("KEEP_INTERMEDIATES", "0") == "1",
+        help="Also write the cleaned and trimmed FASTQ files.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("STATS_WORKERS", 0)) or None,
+        help="Files processed in parallel (default: $STATS_WORKERS or CPUs).",
+    )
+    args = parser.parse_args()
+    if not args.input_dir or not args.work_dir:
+        parser.error("input_dir and work_dir are required")
+    return args
+
+
+def main() -> None:
+    """Entry point for command-line execution."""
+    args = parse_args()
+    work_dir = Path(args.work_dir)
+    processed_dir = Path(args.processed_dir or work_dir / "1_processed")
+    trimmed_dir = Path(args.trimmed_dir or work_dir / "2_trimmed")
+    filtered_dir = Path(args.filtered_dir or work_dir / "3_filtered")
+    for directory in (processed_dir, trimmed_dir, filtered_dir):
+        directory.mkdir(parents=True, exist_ok=True)
+
+    input_dir = Path(args.input_dir)
+    if not input_dir.is_dir():
+        print(f"El directorio de entrada no existe: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+    fastqs = sorted(
+        p for p in input_dir.iterdir() if p.is_file() and p.name.endswith(FASTQ_SUFFIXES)
+    )
+
+    summary = {} if os.environ.get("STATS_MODE") == "summary" else None
+    summary_json = "{output}.json" if os.environ.get("STATS_JSON") == "1" else None
+    run = partial(
+        process_fastq,
+        processed_dir=processed_dir,
+        trimmed_dir=trimmed_dir,
+        filtered_dir=filtered_dir,
+        settings=PrepSettings.from_env(),
+        summary=summary,
+        summary_json=summary_json,
+        keep_intermediates=args.keep_intermediates,
+    )
+    cpus = args.workers or os.cpu_count() or 1
+    workers = min(cpus, len(fastqs) or 1)
+    if workers == 1:
+        # One file (or one CPU): split large files into slices instead
+        results = [run(fastq, workers=cpus) for fastq in fastqs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run, fastqs))
+
+    print("sample\traw\tprocessed\tfiltered")
+    for fastq, counts in zip(fastqs, results):
+        print(f"{fastq_stem(fastq)}\t{counts['raw']}\t{counts['processed']}\t{counts['filtered']}")
+
+
+if __name__ == "__main__":
+    main()
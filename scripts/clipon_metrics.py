@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""Per-stage, per-sample performance metrics as JSON Lines.
+
+Each record describes one command run for one sample (or one whole stage)::
+
+    {"run": "20260101T120000", "stage": "filter", "sample": "s1",
+     "status": "ok", "wall_s": 12.3, "cpu_s": 11.9, "max_rss_mb": 85.2,
+     "bytes_in": 734003200, "bytes_out": 512000000,
+     "reads_in": 250000, "reads_out": 180000, "reads_per_s": 20325.2}
+
+CPU time and peak RSS come from ``wait4`` on the child process, so they are
+exact for the command even when other commands run at the same time. Bytes
+are the sizes of the given input and output files (directories are summed).
+Counting reads means reading (and inflating) every FASTQ among them once
+more, so ``reads_*`` are only filled in with ``--count-reads`` or
+``CLIPON_COUNT_READS=1``. Fields that are not measured are ``null``.
+
+Usage:
+    # Run a command and append its metrics
+    python scripts/clipon_metrics.py run --metrics metrics.jsonl --stage sana \
+        --sample s1 --inputs s1.fastq --outputs cleaned_s1.fastq [--count-reads] \
+        -- seqkit sana ...
+    # Record a step measured elsewhere (wall time only; or --since <epoch>)
+    python scripts/clipon_metrics.py record --metrics metrics.jsonl --stage step3 \
+        --wall 81.2 --inputs 2_trimmed --outputs 3_filtered --param MIN_QUAL=10
+    # Slowest stages and samples
+    python scripts/clipon_metrics.py summary metrics.jsonl [--top 10] [--all-runs]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from fastq_io import FASTQ_SUFFIXES, input_pipe, open_fastq, output_pipe
+
+COUNT_READS_ENV = "CLIPON_COUNT_READS"
+_READ_SIZE = 1 << 22
+# Prefixes and suffixes the stages add to the FASTQ names
+_STAGE_AFFIXES = re.compile(r"^cleaned_|(_trimmed)?(_Filt\d+_\d+_Q[\d.]+)?$")
+
+
+def sample_name(name: str) -> str:
+    """Strip stage prefixes/suffixes (``cleaned_``, ``_trimmed``, ``_Filt...``)."""
+    return _STAGE_AFFIXES.sub("", name)
+
+
+def count_reads_enabled(flag: bool = False) -> bool:
+    """True when ``flag`` is set or ``CLIPON_COUNT_READS`` is neither empty nor ``0``."""
+    return flag or os.environ.get(COUNT_READS_ENV, "0") not in ("", "0")
+
+
+def _files(path: str) -> list[str]:
+    if not os.path.isdir(path):
+        return [path] if os.path.isfile(path) else []
+    return [os.path.join(root, name) for root, _d, files in os.walk(path) for name in files]
+
+
+def count_fastq_reads(path: str) -> int:
+    """Number of records in a plain or compressed FASTQ, from its line count."""
+    lines = 0
+    with open_fastq(path) as fh:
+        for chunk in iter(lambda: fh.read(_READ_SIZE), b""):
+            lines += chunk.count(b"\n")
+    return lines // 4
+
+
+def io_metrics(paths, prefix: str, count_reads: bool = False) -> dict:
+    """``bytes_<prefix>`` and, with ``count_reads``, ``reads_<prefix>`` for ``paths``."""
+    files = [name for path in paths for name in _files(path)]
+    fastqs = [name for name in files if name.endswith(FASTQ_SUFFIXES)] if count_reads else []
+    return {
+        f"bytes_{prefix}": sum(os.path.getsize(name) for name in files),
+        f"reads_{prefix}": sum(count_fastq_reads(name) for name in fastqs) if fastqs else None,
+    }
+
+
+def run_measured(cmd: list[str], **popen_kwargs) -> tuple[int, dict]:
+    """Run ``cmd`` and return its exit code with wall/CPU time and peak RSS."""
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, **popen_kwargs)
+    _pid, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, {
+        "wall_s": time.perf_counter() - start,
+        "cpu_s": usage.ru_utime + usage.ru_stime,
+        "max_rss_mb": usage.ru_maxrss / 1024,  # kilobytes on Linux
+    }
+
+
+def build_record(
+    stage: str,
+    sample: str | None,
+    status: str,
+    usage: dict,
+    inputs=(),
+    outputs=(),
+    run: str | None = None,
+    params: dict | None = None,
+    count_reads: bool = False,
+) -> dict:
+    """Combine ``usage`` with I/O sizes (and read counts) into one record."""
+    record = {
+        "run": run or os.environ.get("CLIPON_RUN_ID"),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "stage": stage,
+        "sample": sample_name(sample) if sample else None,
+        "status": status,
+        "wall_s": None,
+        "cpu_s": None,
+        "max_rss_mb": None,
+        **usage,
+        **io_metrics(inputs, "in", count_reads),
+        **io_metrics(outputs, "out", count_reads),
+    }
+    reads = record["reads_in"]
+    wall = record["wall_s"]
+    record["reads_per_s"] = reads / wall if reads and wall else None
+    if params:
+        record["params"] = params
+    return record
+
+
+class MetricsLog:
+    """Append-only JSON Lines file shared by threads and processes."""
+
+    def __init__(self, path: str) -> None:
+        self.path = str(path)
+        self._lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(record) + "\n"
+        with self._lock, open(self.path, "a") as fh:
+            fh.write(line)
+
+
+def read_metrics(path: str) -> list[dict]:
+    with open(path) as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def summarize(records: list[dict], top: int = 10) -> str:
+    """Text report with the slowest stages and sample/stage pairs."""
+    by_stage: dict[str, list[dict]] = defaultdict(list)
+    for record in records:
+        by_stage[record["stage"]].append(record)
+
+    lines = ["stage\truns\twall_s\tcpu_s\tmax_rss_mb\treads_per_s"]
+    stage_rows = []
+    for stage, rows in by_stage.items():
+        wall = sum(r["wall_s"] or 0 for r in rows)
+        cpu = sum(r["cpu_s"] or 0 for r in rows)
+        rss = max((r["max_rss_mb"] or 0 for r in rows), default=0)
+        reads = sum(r["reads_in"] or 0 for r in rows)
+        rate = reads / wall if reads and wall else None
+        stage_rows.append((wall, stage, len(rows), cpu, rss, rate))
+    for wall, stage, n, cpu, rss, rate in sorted(stage_rows, reverse=True)[:top]:
+        rate_text = f"{rate:.0f}" if rate else "NA"
+        lines.append(f"{stage}\t{n}\t{wall:.1f}\t{cpu:.1f}\t{rss:.0f}\t{rate_text}")
+
+    lines += ["", "sample\tstage\tstatus\twall_s\tcpu_s\tmax_rss_mb\treads_per_s"]
+    slowest = sorted(records, key=lambda r: r["wall_s"] or 0, reverse=True)[:top]
+    for r in slowest:
+        rate_text = f"{r['reads_per_s']:.0f}" if r.get("reads_per_s") else "NA"
+        cpu = f"{r['cpu_s']:.1f}" if r["cpu_s"] is not None else "NA"
+        rss = f"{r['max_rss_mb']:.0f}" if r["max_rss_mb"] is not None else "NA"
+        lines.append(
+            f"{r['sample'] or '-'}\t{r['stage']}\t{r['status']}\t{r['wall_s'] or 0:.1f}"
+            f"\t{cpu}\t{rss}\t{rate_text}"
+        )
+    return "\n".join(lines)
+
+
+def parse_params(values: list[str]) -> dict[str, str]:
+    return dict(value.partition("=")[::2] for value in values)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("run", "record"):
+        cmd = sub.add_parser(name)
+        cmd.add_argument(
+            "--metrics",
+            default=os.environ.get("CLIPON_METRICS"),
+            help="JSON Lines file (default: $CLIPON_METRICS).",
+        )
+        cmd.add_argument("--stage", required=True)
+        cmd.add_argument("--sample")
+        cmd.add_argument("--inputs", nargs="*", default=[], help="Input files or directories.")
+        cmd.add_argument("--outputs", nargs="*", default=[], help="Output files or directories.")
+        cmd.add_argument(
+            "--param", action="append", default=[], help="NAME=VALUE stored with the record."
+        )
+        cmd.add_argument(
+            "--count-reads",
+            action="store_true",
+            help=f"Count the reads of the FASTQ inputs and outputs (also {COUNT_READS_ENV}=1).",
+        )
+    run = sub.choices["run"]
+    run.add_argument(
+        "--stdin", help="File connected to the command's standard input (gzip is inflated)."
+    )
+    run.add_argument(
+        "--stdout",
+        help="File receiving the command's standard output (bgzip if it ends in .gz).",
+    )
+    run.add_argument("cmd", nargs=argparse.REMAINDER, help="Command after '--'.")
+    when = sub.choices["record"].add_mutually_exclusive_group(required=True)
+    when.add_argument("--wall", type=float, help="Wall time in seconds.")
+    when.add_argument("--since", type=float, help="Start time in seconds since the epoch.")
+    sub.choices["record"].add_argument("--status", default="ok")
+
+    summary = sub.add_parser("summary", help="Print the slowest stages and samples.")
+    summary.add_argument("metrics", help="JSON Lines file.")
+    summary.add_argument("--top", type=int, default=10)
+    summary.add_argument(
+        "--all-runs", action="store_true", help="Include every run, not only the last one."
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    """Entry point for command-line execution."""
+    args = parse_args(argv)
+    if args.command == "summary":
+        records = read_metrics(args.metrics)
+        if records and not args.all_runs:
+            last = records[-1].get("run")
+            records = [r for r in records if r.get("run") == last]
+        print(summarize(records, args.top))
+        return
+
+    if args.command == "record":
+        wall = args.wall if args.wall is not None else time.time() - args.since
+        record = build_record(
+            args.stage, args.sample, args.status, {"wall_s": wall},
+            args.inputs, args.outputs, params=parse_params(args.param),
+            count_reads=count_reads_enabled(args.count_reads),
+        )
+        if args.metrics:
+            MetricsLog(args.metrics).write(record)
+        return
+
+    cmd = args.cmd[1:] if args.cmd[:1] == ["--"] else args.cmd
+    if not cmd:
+        sys.exit("clipon_metrics.py run: missing command")
+    with ExitStack() as stack:
+        stdin = stack.enter_context(input_pipe(args.stdin)) if args.stdin else None
+        stdout = stack.enter_context(output_pipe(args.stdout)) if args.stdout else None
+        code, usage = run_measured(cmd, stdin=stdin, stdout=stdout)
+    if args.metrics:
+        record = build_record(
+            args.stage, args.sample, "ok" if code == 0 else "failed", usage,
+            args.inputs, args.outputs, params=parse_params(args.param),
+            count_reads=count_reads_enabled(args.count_reads),
+        )
+        MetricsLog(args.metrics).write(record)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,814 @@
+#!/usr/bin/env python3
+"""Run the ClipON pipeline as a per-sample task graph.
+
+``run_clipon_pipeline.sh`` runs each stage over every sample before the next
+stage starts, and the stage scripts loop over the FASTQ files one at a time.
+This orchestrator builds, for every FASTQ in the input directory, the chain::
+
+    sana -> trim -> filter -> stats [-> subsample] [-> derep] -> cluster [-> rescale]
+
+and then a barrier followed by ``unify -> classify -> export``. Tasks whose
+dependencies have finished are started as soon as they fit in a global CPU
+and memory budget, so independent samples are processed at the same time.
+
+The threads given to ``NGSpeciesID`` are the CPU budget divided among the
+clustering jobs that can run together (limited by the number of samples and
+by ``--cluster-memory-gb``). With ``--cluster-method vsearch`` the per-sample
+chain stops after ``stats`` and a single QIIME2/VSearch job receives all
+CPUs. With ``--cluster-method kmer`` each sample is clustered by
+``kmer_cluster.py`` in a single-CPU task instead of ``NGSpeciesID``.
+
+Output names and directories are the same as with ``run_clipon_pipeline.sh``
+and the same environment variables are read (``TRIM_FRONT``, ``TRIM_BACK``,
+``SKIP_TRIM``, ``MIN_LEN``, ``MAX_LEN``, ``MIN_QUAL``, ``STATS_MODE``,
+``STATS_JSON``, ``MAX_READS``, ``DEREPLICATE``, the ``NGSpeciesID``
+parameters, ``BLAST_DB``, ``TAXONOMY_DB`` and ``CLIPON_COMPRESS``). Inputs may
+be ``.fastq`` or ``.fastq.gz``. Each task logs to
+``<work_dir>/logs/<task>.log``. A failed task only stops the tasks that
+depend on it.
+
+Completed tasks are recorded in ``<work_dir>/.clipon_step_cache.json``
+(see ``step_cache.py``) against their input files and parameters. On a rerun
+only the tasks whose inputs or settings changed are executed, so adding one
+FASTQ to a finished run processes that sample and repeats the shared steps.
+Use ``--force`` to run everything again.
+
+Wall and CPU time, peak memory and bytes processed by every task (and its
+reads with ``CLIPON_COUNT_READS=1``) are appended to
+``<work_dir>/metrics.jsonl`` (see ``clipon_metrics.py``).
+
+Usage:
+    python scripts/clipon_orchestrator.py [--metadata <archivo>] \
+        [--cluster-method <ngspecies|vsearch|kmer>] <dir_fastq_entrada> <dir_trabajo>
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shlex
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from clipon_metrics import MetricsLog, build_record, count_reads_enabled, run_measured
+from fastq_io import compression_settings, fastq_stem, input_pipe, output_pipe
+from step_cache import CACHE_NAME, StepCache
+from subsample_reads import FRACTIONS_NAME
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+ROOT_DIR = SCRIPT_DIR.parent
+STAGE_DIRS = {
+    "processed": "1_processed",
+    "trimmed": "2_trimmed",
+    "filtered": "3_filtered",
+    "clustered": "4_clustered",
+    "unified": "5_unified",
+}
+
+
+@dataclass
+class Task:
+    """One command of the pipeline and the resources it needs."""
+
+    name: str
+    cmd: list[str]
+    deps: tuple[str, ...] = ()
+    conda_env: str | None = None
+    cpus: int = 1
+    memory_gb: float = 0.5
+    env: dict[str, str] = field(default_factory=dict)
+    stdin: str | None = None
+    stdout: str | None = None
+    #: Run once at least one dependency succeeded instead of requiring all.
+    barrier: bool = False
+    #: Files the result depends on, besides ``params``; used by the step cache.
+    inputs: tuple[str, ...] = ()
+    #: Files the task creates. Tasks without outputs always run.
+    outputs: tuple[str, ...] = ()
+    params: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class TaskResult:
+    name: str
+    status: str  # "ok", "cached", "failed" or "skipped"
+    seconds: float = 0.0
+    returncode: int | None = None
+
+
+def available_memory_gb() -> float:
+    """Return the available memory of the machine in GB."""
+    try:
+        with open("/proc/meminfo") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024**2
+    except OSError:
+        pass
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024**3
+
+
+class Scheduler:
+    """Start tasks when their dependencies are done and resources allow.
+
+    Tasks asking for more than the budget are clamped to it so that they can
+    still run, alone. ``peak_cpus`` records the largest number of CPUs in use
+    at once. With a ``cache``, tasks whose inputs and parameters match a
+    previous successful run are not executed and report ``"cached"``. With
+    ``metrics``, a record with the time, memory and I/O of every executed
+    task is appended to it.
+    """
+
+    def __init__(
+        self,
+        tasks: list[Task],
+        cpus: int,
+        memory_gb: float,
+        log_dir: Path,
+        conda: bool = False,
+        cache: StepCache | None = None,
+        metrics: MetricsLog | None = None,
+    ) -> None:
+        self.tasks = {task.name: task for task in tasks}
+        self.cpus = cpus
+        self.memory_gb = memory_gb
+        self.log_dir = log_dir
+        self.conda = conda
+        self.cache = cache
+        self.metrics = metrics
+        self.run_id = time.strftime("%Y%m%dT%H%M%S")
+        self.peak_cpus = 0
+
+    def _argv(self, task: Task) -> list[str]:
+        if self.conda and task.conda_env:
+            return ["conda", "run", "--no-capture-output", "-n", task.conda_env, *task.cmd]
+        return task.cmd
+
+    def _execute(self, task: Task) -> TaskResult:
+        start = time.perf_counter()
+        digest = None
+        if self.cache is not None and task.outputs:
+            digest = self.cache.digest(task.inputs, task.params)
+            if self.cache.is_fresh(task.name, digest):
+                return TaskResult(task.name, "cached", time.perf_counter() - start, 0)
+            self.cache.forget(task.name)
+        with open(self.log_dir / f"{task.name}.log", "w") as log:
+            try:
+                with ExitStack() as stack:
+                    stdin = stack.enter_context(
+                        input_pipe(task.stdin) if task.stdin else open(os.devnull, "rb")
+                    )
+                    stdout = stack.enter_context(output_pipe(task.stdout)) if task.stdout else log
+                    code, usage = run_measured(
+                        self._argv(task),
+                        stdin=stdin,
+                        stdout=stdout,
+                        stderr=log,
+                        env={**os.environ, **task.env},
+                        cwd=ROOT_DIR,
+                    )
+            except OSError as e:
+                print(e, file=log)
+                code, usage = 127, {}
+        if code == 0 and digest is not None:
+            self.cache.record(task.name, digest, task.outputs)
+        seconds = time.perf_counter() - start
+        status = "ok" if code == 0 else "failed"
+        if self.metrics is not None:
+            sample, _, stage = task.name.rpartition(".")
+            self.metrics.write(
+                build_record(
+                    stage, sample or None, status, usage,
+                    task.inputs or ((task.stdin,) if task.stdin else ()),
+                    task.outputs, self.run_id, task.params, count_reads_enabled(),
+                )
+            )
+        return TaskResult(task.name, status, seconds, code)
+
+    def _state(self, task: Task, results: dict[str, TaskResult]) -> str:
+        """Return "ready", "waiting" or "skip" for a task not yet started."""
+        dep_results = [results.get(dep) for dep in task.deps]
+        if any(r is None for r in dep_results):
+            return "waiting"
+        ok = [r.status in ("ok", "cached") for r in dep_results]
+        if all(ok) or (task.barrier and any(ok)):
+            return "ready"
+        return "skip"
+
+    def run(self) -> dict[str, TaskResult]:
+        """Run every task and return the results by task name."""
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        results: dict[str, TaskResult] = {}
+        pending = list(self.tasks)
+        running: dict[Future, Task] = {}
+        used_cpus, used_memory = 0, 0.0
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.tasks))) as pool:
+            while pending or running:
+                progress = False
+                for name in list(pending):
+                    task = self.tasks[name]
+                    state = self._state(task, results)
+                    if state == "skip":
+                        results[name] = TaskResult(name, "skipped")
+                        pending.remove(name)
+                        print(f"[skip] {name}", flush=True)
+                        progress = True
+                        continue
+                    if state != "ready":
+                        continue
+                    cpus = min(task.cpus, self.cpus)
+                    memory = min(task.memory_gb, self.memory_gb)
+                    if running and (
+                        used_cpus + cpus > self.cpus
+                        or used_memory + memory > self.memory_gb
+                    ):
+                        continue
+                    pending.remove(name)
+                    used_cpus += cpus
+                    used_memory += memory
+                    self.peak_cpus = max(self.peak_cpus, used_cpus)
+                    print(f"[start] {name} ({cpus} CPU)", flush=True)
+                    running[pool.submit(self._execute, task)] = task
+
+                if not running:
+                    if not progress:
+                        raise ValueError(f"Unknown dependencies in tasks: {pending}")
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    result = future.result()
+                    results[task.name] = result
+                    used_cpus -= min(task.cpus, self.cpus)
+                    used_memory -= min(task.memory_gb, self.memory_gb)
+                    print(
+                        f"[{result.status}] {task.name} {result.seconds:.1f}s", flush=True
+                    )
+        return results
+
+
+@dataclass
+class PipelineConfig:
+    """Parameters of a run, mostly read from the environment."""
+
+    input_dir: Path
+    work_dir: Path
+    cluster_method: str = "ngspecies"
+    metadata: str | None = None
+    cpus: int = 1
+    memory_gb: float = 4.0
+    cluster_threads: int | None = None
+    cluster_memory_gb: float = 4.0
+    env: dict[str, str] = field(default_factory=lambda: dict(os.environ))
+
+    def dir(self, stage: str) -> Path:
+        return self.work_dir / STAGE_DIRS[stage]
+
+    def get(self, key: str, default: str) -> str:
+        return self.env.get(key) or default
+
+
+def stats_flags(config: PipelineConfig) -> tuple[str, list[str]]:
+    """Suffix and ``collect_read_stats.py`` options for ``STATS_MODE``/``STATS_JSON``."""
+    if config.get("STATS_MODE", "reads") == "summary":
+        suffix, flags = "summary", ["--summary"]
+    else:
+        suffix, flags = "stats", []
+    if config.get("STATS_JSON", "0") == "1":
+        flags += ["--summary-json", "{output}.json"]
+    return suffix, flags
+
+
+def cluster_threads(config: PipelineConfig, samples: int) -> int:
+    """Threads per clustering job so that concurrent jobs share the CPUs."""
+    if config.cluster_threads:
+        return config.cluster_threads
+    by_memory = max(1, int(config.memory_gb // config.cluster_memory_gb))
+    concurrent = max(1, min(samples, by_memory, config.cpus))
+    return max(1, config.cpus // concurrent)
+
+
+def with_shell_arg(cmd: list[str], flag: str, value: str) -> list[str]:
+    """Append ``flag`` and ``value`` to ``cmd``.
+
+    A ``value`` of the form ``"$(...)"`` is a command substitution evaluated
+    by ``bash`` when the task starts; other values are appended as they are.
+    """
+    if not value.startswith('"$('):
+        return [*cmd, flag, value]
+    return ["bash", "-c", f'exec "$@" {flag} {value}', "_", *cmd]
+
+
+def sample_tasks(config: PipelineConfig, fastq: Path, threads: int) -> list[Task]:
+    """Tasks processing one FASTQ from ``seqkit sana`` to clustering."""
+    name = fastq_stem(fastq)
+    processed, trimmed, filtered = (
+        config.dir("processed"), config.dir("trimmed"), config.dir("filtered")
+    )
+    # With CLIPON_COMPRESS=bgzip the tools write to stdout and the scheduler
+    # compresses it (fastq_io.output_pipe)
+    ext = compression_settings(config.env)[0]
+    compress = ext.endswith(".gz")
+    cleaned = processed / f"cleaned_{name}{ext}"
+    sana_cmd = ["seqkit", "sana", str(fastq)]
+    if not compress:
+        sana_cmd += ["-o", str(cleaned)]
+    skip_trim = config.get("SKIP_TRIM", "0") == "1"
+    front = config.get("TRIM_FRONT", "30")
+    back = config.get("TRIM_BACK", "30").lstrip("-")
+    if skip_trim:
+        front = back = "0"
+        trimmed_fastq = trimmed / cleaned.name
+        trim_cmd = ["cp", str(cleaned), str(trimmed_fastq)]
+    else:
+        trimmed_fastq = trimmed / f"cleaned_{name}_trimmed{ext}"
+        trim_cmd = ["cutadapt", "-u", front, "-u", f"-{back}", str(cleaned)]
+        if not compress:
+            trim_cmd[-1:-1] = ["-o", str(trimmed_fastq)]
+    trimmed_stem = fastq_stem(trimmed_fastq)
+    min_len = config.get("MIN_LEN", "650")
+    max_len = config.get("MAX_LEN", "750")
+    min_qual = config.get("MIN_QUAL", "10")
+    filtered_stem = f"{trimmed_stem}_Filt{min_len}_{max_len}_Q{min_qual}"
+    filtered_fastq = filtered / f"{filtered_stem}{ext}"
+
+    suffix, flags = stats_flags(config)
+    stats_pairs = [
+        (fastq, processed / f"{name}_raw_{suffix}.tsv"),
+        (cleaned, processed / f"{name}_processed_{suffix}.tsv"),
+        (filtered_fastq, filtered / f"{trimmed_stem}_filtered_{suffix}.tsv"),
+    ]
+    pairs = config.work_dir / "logs" / f"{name}.read_stats_pairs.tsv"
+    pairs.parent.mkdir(parents=True, exist_ok=True)
+    pairs.write_text("".join(f"{src}\t{dst}\n" for src, dst in stats_pairs))
+    cluster_dir = config.dir("clustered") / filtered_stem
+
+    tasks = [
+        Task(
+            f"{name}.sana",
+            sana_cmd,
+            conda_env="clipon-prep",
+            stdout=str(cleaned) if compress else None,
+            inputs=(str(fastq),),
+            outputs=(str(cleaned),),
+        ),
+        Task(
+            f"{name}.trim",
+            trim_cmd,
+            (f"{name}.sana",),
+            "clipon-prep",
+            stdout=str(trimmed_fastq) if compress and not skip_trim else None,
+            inputs=(str(cleaned),),
+            outputs=(str(trimmed_fastq),),
+            params={"SKIP_TRIM": skip_trim, "TRIM_FRONT": front, "TRIM_BACK": back},
+        ),
+        Task(
+            f"{name}.filter",
+            ["NanoFilt", "-l", min_len, "--maxlength", max_len, "-q", min_qual],
+            (f"{name}.trim",),
+            "clipon-prep",
+            stdin=str(trimmed_fastq),
+            stdout=str(filtered_fastq),
+            inputs=(str(trimmed_fastq),),
+            outputs=(str(filtered_fastq),),
+            params={"MIN_LEN": min_len, "MAX_LEN": max_len, "MIN_QUAL": min_qual},
+        ),
+        Task(
+            f"{name}.stats",
+            [
+                sys.executable, str(SCRIPT_DIR / "collect_read_stats.py"),
+                "--pairs", str(pairs), "--workers", "1", *flags,
+            ],
+            (f"{name}.filter",),
+            inputs=tuple(str(src) for src, _ in stats_pairs),
+            outputs=tuple(str(dst) for _, dst in stats_pairs),
+            params={"flags": " ".join(flags)},
+        ),
+    ]
+    if config.cluster_method == "kmer":
+        cluster_params = {
+            key: config.get(key, default)
+            for key, default in (
+                ("SUPPORT", "150"), ("ABUND_RATIO", "0.01"), ("KMER_CLUSTER_ID", "0.9"),
+            )
+        }
+        tasks.append(
+            Task(
+                f"{name}.cluster",
+                [
+                    sys.executable, str(SCRIPT_DIR / "kmer_cluster.py"), str(filtered_fastq),
+                    "--output-dir", str(config.dir("clustered")), "--jobs", "1",
+                    "--support", cluster_params["SUPPORT"],
+                    "--abundance-ratio", cluster_params["ABUND_RATIO"],
+                    "--identity", cluster_params["KMER_CLUSTER_ID"],
+                ],
+                (f"{name}.stats",),
+                inputs=(str(filtered_fastq),),
+                outputs=(str(cluster_dir),),
+                params=cluster_params,
+            )
+        )
+    if config.cluster_method != "ngspecies":
+        return tasks
+
+    cluster_input, cluster_deps = filtered_fastq, (f"{name}.stats",)
+    cluster_params = {
+        key: config.get(key, default)
+        for key, default in (
+            ("M_LEN", "700"), ("SUPPORT", "150"), ("QUAL", "10"),
+            ("RC_ID", "0.98"), ("ABUND_RATIO", "0.01"),
+        )
+    }
+    # Values for --s and for the support of the rescaled clusters; when reads
+    # are reduced they are computed from files written by earlier tasks
+    support = min_support = cluster_params["SUPPORT"]
+
+    max_reads = config.get("MAX_READS", "0")
+    if int(max_reads):
+        subsample_dir = filtered / "subsampled"
+        cluster_input = subsample_dir / f"{filtered_stem}.fastq"
+        subsample_params = {
+            "MAX_READS": max_reads,
+            "SUBSAMPLE_SEED": config.get("SUBSAMPLE_SEED", "42"),
+            "SUBSAMPLE_STRATIFY": config.get("SUBSAMPLE_STRATIFY", "0"),
+        }
+        tasks.append(
+            Task(
+                f"{name}.subsample",
+                [
+                    sys.executable, str(SCRIPT_DIR / "subsample_reads.py"), "sample",
+                    str(filtered_fastq), "--output-dir", str(subsample_dir),
+                    "--max-reads", max_reads, "--seed", subsample_params["SUBSAMPLE_SEED"],
+                    *(["--stratify"] if subsample_params["SUBSAMPLE_STRATIFY"] == "1" else []),
+                ],
+                cluster_deps,
+                inputs=(str(filtered_fastq),),
+                outputs=(str(cluster_input),),
+                params=subsample_params,
+            )
+        )
+        cluster_deps = (f"{name}.subsample",)
+        cluster_params.update(subsample_params)
+        support = min_support = '"$(%s)"' % shlex.join([
+            sys.executable, str(SCRIPT_DIR / "subsample_reads.py"), "support",
+            str(subsample_dir / FRACTIONS_NAME), filtered_stem, cluster_params["SUPPORT"],
+        ])
+
+    dereplicate = config.get("DEREPLICATE", "0") == "1"
+    if dereplicate:
+        derep_dir = filtered / "dereplicated"
+        derep_input, cluster_input = cluster_input, derep_dir / f"{filtered_stem}.fastq"
+        abundance = derep_dir / f"{filtered_stem}.abundance.tsv"
+        tasks.append(
+            Task(
+                f"{name}.derep",
+                [
+                    sys.executable, str(SCRIPT_DIR / "dereplicate_reads.py"), "derep",
+                    str(derep_input), "--output-dir", str(derep_dir),
+                ],
+                cluster_deps,
+                inputs=(str(derep_input),),
+                outputs=(str(cluster_input), str(abundance)),
+            )
+        )
+        cluster_deps = (f"{name}.derep",)
+        # The minimum support is scaled to the reduction of the sample once
+        # its abundance table exists
+        support = '"$(%s %s)"' % (
+            shlex.join([
+                sys.executable, str(SCRIPT_DIR / "dereplicate_reads.py"), "support",
+                str(abundance),
+            ]),
+            support if support.startswith('"$(') else shlex.quote(support),
+        )
+
+    if compress and cluster_input == filtered_fastq:
+        # NGSpeciesID only reads uncompressed FASTQ
+        plain = filtered / "uncompressed" / f"{filtered_stem}.fastq"
+        plain.parent.mkdir(parents=True, exist_ok=True)
+        tasks.append(
+            Task(
+                f"{name}.decompress",
+                [sys.executable, str(SCRIPT_DIR / "fastq_io.py"), "cat", str(filtered_fastq)],
+                cluster_deps,
+                stdout=str(plain),
+                inputs=(str(filtered_fastq),),
+                outputs=(str(plain),),
+            )
+        )
+        cluster_input, cluster_deps = plain, (f"{name}.decompress",)
+
+    cluster_cmd = with_shell_arg(
+        [
+            "NGSpeciesID", "--ont", "--consensus",
+            "--m", cluster_params["M_LEN"],
+            "--medaka", "--t", str(threads),
+            "--q", cluster_params["QUAL"],
+            "--rc_identity_threshold", cluster_params["RC_ID"],
+            "--abundance_ratio", cluster_params["ABUND_RATIO"],
+            "--fastq", str(cluster_input),
+            "--outfolder", str(cluster_dir),
+        ],
+        "--s",
+        support,
+    )
+    tasks.append(
+        Task(
+            f"{name}.cluster",
+            cluster_cmd,
+            cluster_deps,
+            "clipon-ngs",
+            cpus=threads,
+            memory_gb=config.cluster_memory_gb,
+            inputs=(str(cluster_input),),
+            outputs=(str(cluster_dir),),
+            params=cluster_params,
+        )
+    )
+    if dereplicate:
+        tasks.append(
+            Task(
+                f"{name}.rescale",
+                with_shell_arg(
+                    [
+                        sys.executable, str(SCRIPT_DIR / "dereplicate_reads.py"), "rescale",
+                        str(cluster_dir), str(abundance),
+                    ],
+                    "--min-support",
+                    min_support,
+                ),
+                (f"{name}.cluster",),
+                inputs=(str(cluster_dir / "final_clusters.tsv"), str(abundance)),
+                outputs=(str(cluster_dir),),
+                params=cluster_params,
+            )
+        )
+    return tasks
+
+
+def shared_tasks(config: PipelineConfig, chains: list[list[Task]]) -> list[Task]:
+    """Tasks run once the per-sample ``chains`` have finished."""
+    stats = [task.name for chain in chains for task in chain if task.name.endswith(".stats")]
+    sample_ends = [chain[-1].name for chain in chains]
+    filtered_fastqs = [
+        path for chain in chains for task in chain
+        if task.name.endswith(".filter") for path in task.outputs
+    ]
+    unified = config.dir("unified")
+    consensus = str(unified / "consensos_unicos.fasta")
+    consensus_map = str(unified / "consensus_map.tsv")
+    qza = (str(unified / "taxonomy.qza"), str(unified / "search_results.qza"))
+    export_inputs = qza + ((config.metadata,) if config.metadata else ())
+    export_outputs = (str(unified / "Results" / "taxonomy_with_sample.tsv"),)
+    export_env = {"METADATA_FILE": config.metadata or ""}
+    if int(config.get("MAX_READS", "0")) and config.cluster_method == "ngspecies":
+        scale_table = str(config.dir("filtered") / "subsampled" / FRACTIONS_NAME)
+        export_inputs += (scale_table,)
+        export_env["SCALE_TABLE"] = scale_table
+    dbs = (config.env.get("BLAST_DB", ""), config.env.get("TAXONOMY_DB", ""))
+    classify = bool(config.env.get("BLAST_DB") and config.env.get("TAXONOMY_DB"))
+    kmer_index = config.env.get("KMER_INDEX")
+    kmer_meta = (str(Path(kmer_index) / "meta.json"),) if kmer_index else ()
+    tasks = [
+        Task(
+            "summary",
+            [
+                sys.executable, str(SCRIPT_DIR / "summarize_read_counts.py"),
+                str(config.work_dir),
+                *(["--metadata", config.metadata] if config.metadata else []),
+            ],
+            tuple(stats),
+            stdout=str(config.work_dir / "read_counts.tsv"),
+            barrier=True,
+        )
+    ]
+    if config.cluster_method in ("ngspecies", "kmer"):
+        tasks.append(
+            Task(
+                "unify",
+                [
+                    sys.executable, str(SCRIPT_DIR / "unify_consensus.py"),
+                    str(config.dir("clustered")), str(unified),
+                ],
+                tuple(sample_ends),
+                barrier=True,
+                inputs=(str(config.dir("clustered")),),
+                outputs=(str(unified / "consensos_todos.fasta"), consensus, consensus_map),
+            )
+        )
+        if classify:
+            tasks += [
+                Task(
+                    "classify",
+                    [
+                        "bash", str(SCRIPT_DIR / "De3_A4_Classify_NGS.sh"),
+                        consensus, str(unified), *dbs,
+                    ],
+                    ("unify",),
+                    "clipon-qiime",
+                    cpus=config.cpus,
+                    env={"NUM_THREADS": str(config.cpus)},
+                    inputs=(consensus, *dbs, *kmer_meta),
+                    outputs=qza,
+                    params={
+                        key: config.get(key, default)
+                        for key, default in (
+                            ("PERC_ID", "0.8"), ("QUERY_COV", "0.8"),
+                            ("MAX_ACCEPTS", "1"), ("MIN_CONSENSUS", "0.51"),
+                            ("KMER_MIN_IDENTITY", "0.99"), ("KMER_MIN_COVERAGE", "0.95"),
+                            ("KMER_MARGIN", "0.005"),
+                        )
+                    },
+                ),
+                Task(
+                    "export",
+                    ["bash", str(SCRIPT_DIR / "De3_A4_Export_Classification.sh"), str(unified)],
+                    ("classify",),
+                    "clipon-qiime",
+                    env=export_env,
+                    inputs=(*export_inputs, consensus_map),
+                    outputs=export_outputs,
+                ),
+            ]
+    elif classify:
+        manifest = config.work_dir / "manifest_vsearch.csv"
+        tasks += [
+            Task(
+                "manifest",
+                ["bash", str(SCRIPT_DIR / "generate_manifest.sh"), "--filtered",
+                 str(config.dir("filtered"))],
+                tuple(sample_ends),
+                stdout=str(manifest),
+                barrier=True,
+            ),
+            Task(
+                "classify",
+                [
+                    "bash", str(SCRIPT_DIR / "De2_A4__VSearch_Procesonuevo2.6.1.sh"),
+                    "--manifest", str(manifest),
+                    "--output-dir", str(unified),
+                    "--cluster-id", config.get("CLUSTER_IDENTITY", "0.98"),
+                    "--blast-id", config.get("BLAST_IDENTITY", "0.5"),
+                    "--maxaccepts", config.get("MAXACCEPTS", "5"),
+                ],
+                ("manifest",),
+                "clipon-qiime",
+                cpus=config.cpus,
+                env={
+                    "VSEARCH_THREADS": str(config.cpus),
+                    "BLAST_THREADS": str(config.cpus),
+                },
+                inputs=(*filtered_fastqs, *dbs),
+                outputs=qza,
+                params={
+                    key: config.get(key, default)
+                    for key, default in (
+                        ("CLUSTER_IDENTITY", "0.98"), ("BLAST_IDENTITY", "0.5"),
+                        ("MAXACCEPTS", "5"),
+                    )
+                },
+            ),
+            Task(
+                "export",
+                ["bash", str(SCRIPT_DIR / "De3_A4_Export_Classification.sh"), str(unified)],
+                ("classify",),
+                "clipon-qiime",
+                env=export_env,
+                inputs=export_inputs,
+                outputs=export_outputs,
+            ),
+        ]
+    return tasks
+
+
+def build_tasks(config: PipelineConfig) -> list[Task]:
+    """Return the task graph for every FASTQ in ``config.input_dir``."""
+    fastqs = sorted(
+        [*config.input_dir.glob("*.fastq"), *config.input_dir.glob("*.fastq.gz")]
+    )
+    threads = cluster_threads(config, len(fastqs))
+    chains = [sample_tasks(config, fastq, threads) for fastq in fastqs]
+    tasks = [task for chain in chains for task in chain]
+    return tasks + shared_tasks(config, chains)
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("input_dir", help="Directory with the raw FASTQ files.")
+    parser.add_argument("work_dir", help="Pipeline work directory.")
+    parser.add_argument("--metadata", help="TSV with columns 'fastq' and 'experiment'.")
+    parser.add_argument(
+        "--cluster-method",
+        choices=("ngspecies", "vsearch", "kmer"),
+        default=os.environ.get("CLUSTER_METHOD") or "ngspecies",
+    )
+    parser.add_argument(
+        "--cpus",
+        type=int,
+        default=int(os.environ.get("CLIPON_CPUS", 0)) or os.cpu_count() or 1,
+        help="CPUs shared by all running tasks (default: $CLIPON_CPUS or all).",
+    )
+    parser.add_argument(
+        "--memory-gb",
+        type=float,
+        default=float(os.environ.get("CLIPON_MEMORY_GB", 0)) or None,
+        help="Memory shared by all running tasks (default: available memory).",
+    )
+    parser.add_argument(
+        "--cluster-threads",
+        type=int,
+        default=int(os.environ.get("THREADS", 0)) or None,
+        help="Threads per NGSpeciesID job (default: $THREADS or CPUs / jobs).",
+    )
+    parser.add_argument(
+        "--cluster-memory-gb",
+        type=float,
+        default=4.0,
+        help="Memory reserved for each NGSpeciesID job.",
+    )
+    parser.add_argument(
+        "--no-conda",
+        action="store_true",
+        help="Run commands in the current environment instead of 'conda run'.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        default=os.environ.get("CLIPON_FORCE", "0") == "1",
+        help="Run every task even if its inputs and parameters are unchanged.",
+    )
+    parser.add_argument(
+        "--hash-content",
+        action="store_true",
+        default=os.environ.get("CLIPON_HASH_CONTENT", "0") == "1",
+        help="Compare inputs by content instead of size and modification time.",
+    )
+    parser.add_argument(
+        "--metrics",
+        default=os.environ.get("CLIPON_METRICS"),
+        help="JSON Lines file for task metrics (default: <work_dir>/metrics.jsonl).",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Print the tasks without running them."
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Entry point for command-line execution."""
+    args = parse_args()
+    input_dir = Path(args.input_dir)
+    if not input_dir.is_dir():
+        print(f"El directorio de entrada no existe: {input_dir}", file=sys.stderr)
+        sys.exit(1)
+    config = PipelineConfig(
+        input_dir=input_dir,
+        work_dir=Path(args.work_dir),
+        cluster_method=args.cluster_method,
+        metadata=args.metadata,
+        cpus=args.cpus,
+        memory_gb=args.memory_gb or available_memory_gb(),
+        cluster_threads=args.cluster_threads,
+        cluster_memory_gb=args.cluster_memory_gb,
+    )
+    for stage in STAGE_DIRS:
+        config.dir(stage).mkdir(parents=True, exist_ok=True)
+    tasks = build_tasks(config)
+    if not config.env.get("BLAST_DB") or not config.env.get("TAXONOMY_DB"):
+        print("Advertencia: BLAST_DB o TAXONOMY_DB no están definidos. Omitiendo clasificación.")
+
+    if args.dry_run:
+        for task in tasks:
+            deps = ",".join(task.deps) or "-"
+            print(f"{task.name}\t{task.cpus}\t{deps}\t{' '.join(task.cmd)}")
+        return
+
+    conda = not args.no_conda and shutil.which("conda") is not None
+    cache = None
+    if not args.force:
+        cache = StepCache(config.work_dir / CACHE_NAME, content=args.hash_content)
+    metrics = MetricsLog(args.metrics or config.work_dir / "metrics.jsonl")
+    scheduler = Scheduler(
+        tasks, config.cpus, config.memory_gb, config.work_dir / "logs", conda, cache, metrics
+    )
+    results = scheduler.run()
+    print(f"Métricas por tarea en {metrics.path}; resumen con: "
+          f"python scripts/clipon_metrics.py summary {metrics.path}")
+
+    failed = [r.name for r in results.values() if r.status not in ("ok", "cached")]
+    if failed:
+        print(f"Tareas fallidas u omitidas: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Pipeline completado. Resultados en: {config.work_dir}")
+
+
+if __name__ == "__main__":
+    main()
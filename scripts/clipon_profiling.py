@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""Optional profiling of the Python entry points.
+
+Scripts wrap their work in :func:`profile` and mark their phases with
+:func:`phase`::
+
+    with profile(output_path, profiling_enabled(args.profile)):
+        with phase("load"):
+            ...
+        with phase("write"):
+            ...
+
+Streaming loops charge the production of each item with
+``for block in timed_iter(blocks, "load")``.
+
+When profiling is enabled (``--profile`` or ``CLIPON_PROFILE=1``) two files
+are written next to the output:
+
+``<output>.profile.txt``
+    wall-clock time per phase, peak memory and the top ``tracemalloc``
+    allocation sites, and the ``cProfile`` functions with the highest
+    cumulative time;
+``<output>.prof``
+    the raw ``cProfile`` statistics, for ``python -m pstats`` or snakeviz.
+
+When it is disabled :func:`profile` does nothing and :func:`phase` returns
+a shared no-op context manager and :func:`timed_iter` its argument, so
+there is no tracing overhead.
+"""
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+PROFILE_ENV = "CLIPON_PROFILE"
+REPORT_SUFFIX = ".profile.txt"
+STATS_SUFFIX = ".prof"
+TOP_ALLOCATIONS = 15
+TOP_FUNCTIONS = 40
+
+_NULL = nullcontext()
+_active: "Profiler | None" = None
+
+
+def profiling_enabled(flag: bool = False) -> bool:
+    """True when ``flag`` is set or ``CLIPON_PROFILE`` is neither empty nor ``0``."""
+    return flag or os.environ.get(PROFILE_ENV, "0") not in ("", "0")
+
+
+def add_profile_argument(parser) -> None:
+    """Add the common ``--profile`` flag to an ``argparse`` parser."""
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"Write cProfile, tracemalloc and per-phase timings to "
+        f"<output>{REPORT_SUFFIX} (also enabled by {PROFILE_ENV}=1).",
+    )
+
+
+class Profiler:
+    """cProfile, tracemalloc and per-phase wall-clock time of one run."""
+
+    def __init__(self) -> None:
+        self.phases: dict[str, list[float]] = {}
+        self._nested: list[float] = []
+        self._profile = cProfile.Profile()
+        self._start = 0.0
+        self.total = 0.0
+        self.peak = 0
+        self.snapshot = None
+
+    def start(self) -> None:
+        tracemalloc.start()
+        self._start = time.perf_counter()
+        self._profile.enable()
+
+    def stop(self) -> None:
+        self._profile.disable()
+        self.total = time.perf_counter() - self._start
+        self.snapshot = tracemalloc.take_snapshot()
+        self.peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the block; time spent in nested phases is charged to them only."""
+        start = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            calls = self.phases.setdefault(name, [0, 0.0])
+            calls[0] += 1
+            calls[1] += elapsed - nested
+
+    def report(self, title: str) -> str:
+        """Text report with phases, memory and cProfile sections."""
+        out = io.StringIO()
+        out.write(f"# {title}\n\n## Phases (wall-clock)\nphase\tcalls\tseconds\tpercent\n")
+        total = self.total or 1.0
+        for name, (calls, seconds) in self.phases.items():
+            out.write(f"{name}\t{calls}\t{seconds:.4f}\t{100 * seconds / total:.1f}\n")
+        accounted = sum(seconds for _, seconds in self.phases.values())
+        out.write(f"other\t-\t{self.total - accounted:.4f}\t"
+                  f"{100 * (self.total - accounted) / total:.1f}\n")
+        out.write(f"total\t-\t{self.total:.4f}\t100.0\n\n")
+
+        out.write(f"## Memory (tracemalloc)\npeak_mb\t{self.peak / 1e6:.3f}\n")
+        out.write(f"top {TOP_ALLOCATIONS} allocation sites still held at exit:\n")
+        for stat in self.snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            out.write(f"{stat}\n")
+
+        out.write(f"\n## cProfile (top {TOP_FUNCTIONS} by cumulative time)\n")
+        stats = pstats.Stats(self._profile, stream=out)
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        return out.getvalue()
+
+    def write(self, output, title: str) -> Path:
+        """Write ``<output>.profile.txt`` and ``<output>.prof``; return the report path."""
+        report = Path(f"{output}{REPORT_SUFFIX}")
+        report.parent.mkdir(parents=True, exist_ok=True)
+        report.write_text(self.report(title))
+        self._profile.dump_stats(f"{output}{STATS_SUFFIX}")
+        return report
+
+
+def phase(name: str):
+    """Time a phase of the active profiler; a shared no-op when disabled."""
+    if _active is None:
+        return _NULL
+    return _active.phase(name)
+
+
+def timed_iter(iterable, name: str = "load"):
+    """Charge the time spent producing each item of ``iterable`` to ``name``.
+
+    Returns ``iterable`` unchanged when profiling is disabled.
+    """
+    if _active is None:
+        return iterable
+    return _timed(iter(iterable), _active, name)
+
+
+def _timed(iterator, profiler: Profiler, name: str):
+    while True:
+        with profiler.phase(name):
+            item = next(iterator, _NULL)
+        if item is _NULL:
+            return
+        yield item
+
+
+@contextmanager
+def profile(output, enabled: bool):
+    """Profile the enclosed block and write the report next to ``output``."""
+    global _active
+    if not enabled or _active is not None:
+        yield
+        return
+    profiler = Profiler()
+    _active = profiler
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        _active = None
+        title = " ".join([Path(sys.argv[0]).name, *sys.argv[1:]])
+        path = profiler.write(output, title)
+        print(f"Profile written to {path}", file=sys.stderr)
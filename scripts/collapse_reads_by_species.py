@@ -4,18 +4,34 @@
 Reads the ``taxonomy_with_sample.tsv`` table produced by
 ``add_reads_and_sample.py`` and outputs, for cada muestra, una tabla con las
 columnas ``Species``, ``Reads`` y ``Proportion`` (0-100). Las especies se
-ordenan por número de lecturas de forma descendente.
+ordenan por número de lecturas de forma descendente. ``--rank`` agrega las
+lecturas a otro rango (``kingdom`` ... ``species``) usando la tabla de linajes
+de ``taxonomy.py``.
+
+With ``--output-prefix PREFIX`` the counts are also written in structured
+form, without rounding, for ``plot_taxon_bar.py`` and other tools::
+
+    PREFIX.long.tsv       Sample, Taxon, Reads, Fraction (0-1)
+    PREFIX.long.parquet   the same table (only when pyarrow is installed)
+    PREFIX.matrix.tsv     samples x taxa read counts
+    PREFIX.matrix.npz     ``counts`` (int64), ``samples`` and ``taxa`` arrays
 
 Usage:
-    python scripts/collapse_reads_by_species.py <taxonomy_with_sample.tsv>
+    python scripts/collapse_reads_by_species.py <taxonomy_with_sample.tsv> \
+        [--rank family] [--output-prefix PREFIX]
 """
 from __future__ import annotations
 
 import argparse
 import csv
 import sys
-from collections import defaultdict
 from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from clipon_profiling import add_profile_argument, phase, profile, profiling_enabled
+from taxonomy import RANKS, LineageTable, format_label, parse_lineage
 
 
 def format_taxon(taxon: str) -> str:
@@ -33,39 +49,62 @@ def format_taxon(taxon: str) -> str:
         A simplified representation using genus and species when available.
     """
 
-    parts = taxon.split(";") if ";" in taxon else taxon.split()
-    parts = [p.strip() for p in parts if p.strip()]
-    ranks: dict[str, str] = {}
-    rank_map = {
-        "k": "kingdom",
-        "p": "phylum",
-        "c": "class",
-        "o": "order",
-        "f": "family",
-        "g": "genus",
-        "s": "species",
-    }
-
-    last_name = taxon.strip()
-    last_rank = "unknown"
-    for part in parts:
-        if "__" in part:
-            rank_code, name = part.split("__", 1)
-            ranks[rank_code] = name
-            last_name = name
-            last_rank = rank_map.get(rank_code, rank_code)
-
-    genus = ranks.get("g")
-    species = ranks.get("s")
-    if genus and species:
-        return f"*{genus.capitalize()} {species.lower()}*"
-    if genus:
-        return f"*{genus.capitalize()}* (genus)"
-    return f"{last_name} ({last_rank})"
-
-
-def parse_args() -> Path:
-    """Return the path to the TSV file containing reads and taxonomic data."""
+    return format_label(parse_lineage(taxon), "species")
+
+
+class Assignments(NamedTuple):
+    """Rows of ``taxonomy_with_sample.tsv`` as integer-coded columns."""
+
+    samples: list[str]
+    sample_ids: np.ndarray
+    lineage_ids: np.ndarray
+    reads: np.ndarray
+    table: LineageTable
+
+
+def read_assignments(path: Path) -> Assignments:
+    """Read *path* once, interning samples and lineages to integer ids."""
+
+    table = LineageTable()
+    sample_index: dict[str, int] = {}
+    sample_ids: list[int] = []
+    lineage_ids: list[int] = []
+    reads: list[int] = []
+    with path.open() as fin:
+        reader = csv.DictReader(fin, delimiter="\t")
+        for row in reader:
+            sample_ids.append(sample_index.setdefault(row["Sample"], len(sample_index)))
+            lineage_ids.append(table.intern(row["Taxon"]))
+            try:
+                reads.append(int(row["Reads"]))
+            except ValueError:
+                reads.append(0)
+    return Assignments(
+        list(sample_index),
+        np.array(sample_ids, dtype=np.int64),
+        np.array(lineage_ids, dtype=np.int64),
+        np.array(reads, dtype=np.int64),
+        table,
+    )
+
+
+def collapse(assignments: Assignments, rank: str = "species") -> dict[str, dict[str, int]]:
+    """Sum reads per sample and taxon label at ``rank``."""
+
+    labels, codes = assignments.table.labels(rank)
+    keys = assignments.sample_ids * len(labels) + codes[assignments.lineage_ids]
+    size = len(assignments.samples) * len(labels)
+    totals = np.bincount(keys, weights=assignments.reads, minlength=size)
+    present = np.bincount(keys, minlength=size)
+    data: dict[str, dict[str, int]] = {}
+    for key in np.flatnonzero(present):
+        sample, label = divmod(int(key), len(labels))
+        data.setdefault(assignments.samples[sample], {})[labels[label]] = int(totals[key])
+    return data
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command-line arguments."""
 
     parser = argparse.ArgumentParser(
         description="Collapse read counts per species for each sample."
@@ -75,34 +114,35 @@ def parse_args() -> Path:
         type=Path,
         help="Path to the taxonomy_with_sample.tsv file",
     )
-    return parser.parse_args().tsv
+    parser.add_argument(
+        "--output-prefix",
+        type=Path,
+        help="Also write PREFIX.long.tsv, PREFIX.matrix.tsv/.npz and PREFIX.long.parquet",
+    )
+    parser.add_argument(
+        "--rank",
+        choices=RANKS,
+        default="species",
+        help="Rank to aggregate reads at (default: species)",
+    )
+    add_profile_argument(parser)
+    return parser.parse_args()
 
 
-def collapse_by_species(path: Path) -> dict[str, dict[str, int]]:
-    """Parse *path* and accumulate read counts per sample and species."""
+def collapse_by_species(path: Path, rank: str = "species") -> dict[str, dict[str, int]]:
+    """Parse *path* and accumulate read counts per sample and taxon at ``rank``."""
 
-    data: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
-    with path.open() as fin:
-        reader = csv.DictReader(fin, delimiter="\t")
-        for row in reader:
-            sample = row["Sample"]
-            species = format_taxon(row["Taxon"])
-            try:
-                reads = int(row["Reads"])
-            except ValueError:
-                reads = 0
-            data[sample][species] += reads
-    return data
+    return collapse(read_assignments(path), rank)
 
 
-def print_results(data: dict[str, dict[str, int]]) -> None:
+def print_results(data: dict[str, dict[str, int]], rank: str = "species") -> None:
     """Print ``data`` produced by :func:`collapse_by_species`."""
 
     for sample in sorted(data):
         species_counts = data[sample]
         total_reads = sum(species_counts.values())
         print(f"Sample: {sample}")
-        print("Species\tReads\tProportion")
+        print(f"{rank.capitalize()}\tReads\tProportion")
         for species, count in sorted(
             species_counts.items(), key=lambda kv: kv[1], reverse=True
         ):
@@ -111,16 +151,87 @@ def print_results(data: dict[str, dict[str, int]]) -> None:
         print()
 
 
+def to_matrix(
+    data: dict[str, dict[str, int]]
+) -> tuple[list[str], list[str], np.ndarray]:
+    """Return sorted samples, sorted taxa and the samples x taxa read counts."""
+
+    samples = sorted(data)
+    taxa = sorted({taxon for counts in data.values() for taxon in counts})
+    column = {taxon: j for j, taxon in enumerate(taxa)}
+    counts = np.zeros((len(samples), len(taxa)), dtype=np.int64)
+    for i, sample in enumerate(samples):
+        for taxon, reads in data[sample].items():
+            counts[i, column[taxon]] = reads
+    return samples, taxa, counts
+
+
+def write_structured(data: dict[str, dict[str, int]], prefix: Path) -> list[Path]:
+    """Write the long table and the matrix next to ``prefix``; return the paths."""
+
+    samples, taxa, counts = to_matrix(data)
+    totals = counts.sum(axis=1)
+    prefix.parent.mkdir(parents=True, exist_ok=True)
+    written = []
+
+    long_path = prefix.with_name(prefix.name + ".long.tsv")
+    rows = [
+        (samples[i], taxa[j], int(counts[i, j]), counts[i, j] / totals[i])
+        for i, j in zip(*np.nonzero(counts))
+    ]
+    with long_path.open("w", newline="") as fh:
+        writer = csv.writer(fh, delimiter="\t", lineterminator="\n")
+        writer.writerow(["Sample", "Taxon", "Reads", "Fraction"])
+        writer.writerows((s, t, r, repr(float(f))) for s, t, r, f in rows)
+    written.append(long_path)
+
+    matrix_path = prefix.with_name(prefix.name + ".matrix.tsv")
+    with matrix_path.open("w", newline="") as fh:
+        writer = csv.writer(fh, delimiter="\t", lineterminator="\n")
+        writer.writerow(["Sample", *taxa])
+        writer.writerows([sample, *row] for sample, row in zip(samples, counts.tolist()))
+    written.append(matrix_path)
+
+    npz_path = prefix.with_name(prefix.name + ".matrix.npz")
+    np.savez_compressed(
+        npz_path, counts=counts, samples=np.array(samples, dtype=str),
+        taxa=np.array(taxa, dtype=str),
+    )
+    written.append(npz_path)
+
+    try:
+        import pandas as pd
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return written
+    parquet_path = prefix.with_name(prefix.name + ".long.parquet")
+    pd.DataFrame(rows, columns=["Sample", "Taxon", "Reads", "Fraction"]).to_parquet(
+        parquet_path, index=False
+    )
+    written.append(parquet_path)
+    return written
+
+
 def main() -> None:
     """Entry point for command-line execution."""
 
-    tsv_path = parse_args()
+    args = parse_args()
+    tsv_path = args.tsv
     if not tsv_path.is_file():
         print(f"File not found: {tsv_path}", file=sys.stderr)
         sys.exit(1)
 
-    data = collapse_by_species(tsv_path)
-    print_results(data)
+    report = args.output_prefix or tsv_path.with_name("collapse_reads_by_species")
+    with profile(report, profiling_enabled(args.profile)):
+        with phase("load"):
+            assignments = read_assignments(tsv_path)
+        with phase("transform"):
+            data = collapse(assignments, args.rank)
+        with phase("write"):
+            print_results(data, args.rank)
+            written = write_structured(data, args.output_prefix) if args.output_prefix else []
+    for path in written:
+        print(f"Wrote {path}", file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -3,13 +3,241 @@
 
 Outputs a TSV with per-read length and mean quality score.
 Usage: collect_read_stats.py FASTQ OUTPUT_TSV
+
+The FASTQ may be gzip or bgzip compressed (``.fastq.gz``); it is inflated by
+a separate process or thread while the blocks are parsed (see
+``fastq_io.py``).
+
+With ``--summary`` the output is a small binned length x mean-quality
+histogram (plus read count, total bases and N50) instead of one row per read.
+``--summary-json`` additionally writes per-sample length and quality
+quantiles, N50 and mean error probability (see ``read_sketches.py``).
+
+Many files can be processed in one call with a process pool:
+    collect_read_stats.py --pairs PAIRS_TSV [--workers N]
+    collect_read_stats.py --input-dir DIR --output-dir DIR \
+        --name-template "{stem}_raw_stats.tsv" [--strip-prefix cleaned_]
+
+A single FASTQ larger than ``fastq_index.INDEX_CHUNK`` is split into
+record-aligned slices (see ``fastq_index.py``) that ``--workers`` processes
+read through ``mmap``; their rows and summaries are merged in read order.
+
+``--profile`` (or ``CLIPON_PROFILE=1``) writes ``<output>.profile.txt`` for
+every output (see ``clipon_profiling.py``).
+
+The FASTQ is read in large byte blocks. Record boundaries, read lengths and
+quality sums are computed with NumPy over the raw buffer, so there is no
+Python loop over individual quality characters.
 """
 import argparse
 import csv
+import json
+import os
+import shutil
 import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator
+
+import numpy as np
+
+from clipon_profiling import (
+    PROFILE_ENV,
+    add_profile_argument,
+    phase,
+    profile,
+    profiling_enabled,
+    timed_iter,
+)
+from fastq_index import INDEX_CHUNK, chunk_ranges, open_slice
+from fastq_io import FASTQ_SUFFIXES, fastq_stem, is_gzip, open_fastq
+from read_sketches import ExactCounter, ReadStatsSketch
+
+#: Number of bytes requested from the FASTQ file per block.
+CHUNK_SIZE = 8 * 1024 * 1024
+
+#: Offset of Sanger-encoded Phred quality characters.
+PHRED_OFFSET = 33
+
+#: Error probability ``10 ** (-Q / 10)`` of every byte value (Q clipped at 0).
+ERROR_PROB_LUT = (
+    10 ** (-np.clip(np.arange(256) - PHRED_OFFSET, 0, None) / 10)
+).astype(np.float32)
+
+# Characters removed by ``str.rstrip()`` within the ASCII range.
+_WHITESPACE_LUT = np.zeros(256, dtype=bool)
+_WHITESPACE_LUT[[9, 10, 11, 12, 13, 28, 29, 30, 31, 32]] = True
+
+_NEWLINE = ord("\n")
+
+
+@dataclass
+class FastqBlock:
+    """A run of complete FASTQ records held in a single byte buffer.
+
+    Attributes
+    ----------
+    raw: bytes
+        Buffer containing the records.
+    view: numpy.ndarray
+        ``uint8`` view over ``raw`` (no copy).
+    starts, ends: numpy.ndarray
+        Arrays of shape ``(n_reads, 4)`` with the offsets of the header,
+        sequence, plus and quality lines. ``ends`` excludes the newline and
+        any trailing whitespace, matching ``str.rstrip()``.
+    """
+
+    raw: bytes
+    view: np.ndarray
+    starts: np.ndarray
+    ends: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """Sequence length of every read."""
+        return self.ends[:, 1] - self.starts[:, 1]
+
+    def read_ids(self) -> list[str]:
+        """Return the first whitespace-delimited token of each header."""
+        raw = self.raw
+        return [
+            raw[start + 1 : end].split(None, 1)[0].decode()
+            for start, end in zip(
+                self.starts[:, 0].tolist(), self.ends[:, 0].tolist()
+            )
+        ]
+
+    def quality_sums(self) -> np.ndarray:
+        """Sum of Phred scores over the quality line of every read."""
+        starts, ends = self.starts[:, 3], self.ends[:, 3]
+        return segment_sums(self.view, starts, ends) - PHRED_OFFSET * (ends - starts)
+
+    @property
+    def quality_lengths(self) -> np.ndarray:
+        """Number of quality characters of every read."""
+        return self.ends[:, 3] - self.starts[:, 3]
+
+    def error_sums(self) -> np.ndarray:
+        """Summed per-base error probability over the quality line of every read."""
+        return segment_sums(
+            ERROR_PROB_LUT[self.view], self.starts[:, 3], self.ends[:, 3], np.float64
+        )
+
+    def update_sketch(self, sketch: ReadStatsSketch) -> None:
+        """Add the reads of this block to ``sketch``."""
+        sketch.update(
+            self.lengths, self.mean_qualities(), self.error_sums(), self.quality_lengths
+        )
+
+    def mean_qualities(self) -> np.ndarray:
+        """Quality sum divided by sequence length (0 for empty reads)."""
+        lengths = self.lengths
+        return np.divide(
+            self.quality_sums(),
+            lengths,
+            out=np.zeros(len(lengths)),
+            where=lengths > 0,
+        )
+
+
+def segment_sums(
+    values: np.ndarray, starts: np.ndarray, ends: np.ndarray, dtype=np.int64
+) -> np.ndarray:
+    """Return ``values[start:end].sum()`` for every ``(start, end)`` pair.
+
+    Every ``end`` must be smaller than ``len(values)``, which always holds for
+    FASTQ lines because each one is followed by a newline.
+    """
+    if not len(starts):
+        return np.zeros(0, dtype=dtype)
+    bounds = np.column_stack((starts, ends)).ravel()
+    sums = np.add.reduceat(values, bounds, dtype=dtype)[::2]
+    sums[starts == ends] = 0
+    return sums
 
 
-def collect_read_stats(fastq_path: str, out_tsv: str) -> None:
+def _strip_line_ends(view: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Move ``ends`` left past trailing whitespace on every line."""
+    ends = ends.copy()
+    while True:
+        candidates = ends > starts
+        last = view[np.where(candidates, ends - 1, 0)]
+        strip = candidates & _WHITESPACE_LUT[last]
+        if not strip.any():
+            return ends
+        ends[strip] -= 1
+
+
+def iter_fastq_blocks(fh: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[FastqBlock]:
+    """Yield :class:`FastqBlock` objects read from the binary handle ``fh``.
+
+    Records are framed as groups of four lines. Reading stops at the first
+    record whose header line is blank, and a truncated final record is
+    completed with empty lines.
+    """
+    carry = b""
+    while True:
+        chunk = fh.read(chunk_size)
+        eof = not chunk
+        buf = carry + chunk if carry else chunk
+        if eof:
+            if not buf:
+                return
+            if not buf.endswith(b"\n"):
+                buf += b"\n"
+            missing = -buf.count(b"\n") % 4
+            buf += b"\n" * missing
+
+        view = np.frombuffer(buf, dtype=np.uint8)
+        newlines = np.flatnonzero(view == _NEWLINE)
+        n_reads = len(newlines) // 4
+        if n_reads == 0:
+            carry = buf
+            continue
+
+        line_ends = newlines[: n_reads * 4]
+        line_starts = np.empty_like(line_ends)
+        line_starts[0] = 0
+        line_starts[1:] = line_ends[:-1] + 1
+        line_ends = _strip_line_ends(view, line_starts, line_ends)
+        starts = line_starts.reshape(n_reads, 4)
+        ends = line_ends.reshape(n_reads, 4)
+
+        blank = np.flatnonzero(ends[:, 0] == starts[:, 0])
+        if len(blank):
+            cut = blank[0]
+            if cut:
+                yield FastqBlock(buf, view, starts[:cut], ends[:cut])
+            return
+
+        yield FastqBlock(buf, view, starts, ends)
+        if eof:
+            return
+        carry = buf[newlines[n_reads * 4 - 1] + 1 :]
+
+
+def _write_rows(writer, block: FastqBlock) -> None:
+    """Write one ``read_id, length, mean_quality`` row per read of ``block``."""
+    with phase("transform"):
+        means = [f"{mean_q:.2f}" for mean_q in block.mean_qualities().tolist()]
+        rows = list(zip(block.read_ids(), block.lengths.tolist(), means))
+    with phase("write"):
+        writer.writerows(rows)
+
+
+def collect_read_stats(
+    fastq_path: str,
+    out_tsv: str,
+    chunk_size: int = CHUNK_SIZE,
+    sketch: ReadStatsSketch | None = None,
+) -> None:
     """Collect per-read length and mean quality from a FASTQ file.
 
     Parameters
@@ -18,25 +246,426 @@ def collect_read_stats(fastq_path: str, out_tsv: str) -> None:
         Path to the input FASTQ file.
     out_tsv: str
         Path to the TSV file that will store per-read statistics.
+    chunk_size: int
+        Number of bytes read from ``fastq_path`` per block.
+    sketch: ReadStatsSketch, optional
+        Streaming summary updated with every read.
     """
-    with open(fastq_path) as fh_fastq, open(out_tsv, "w", newline="") as out_fh:
-        writer = csv.writer(out_fh, delimiter="\t")
-        writer.writerow(["read_id", "length", "mean_quality"])
+    with open_fastq(fastq_path) as fh_fastq, StatsWriter(out_tsv, sketch=sketch) as stats:
+        for block in iter_fastq_blocks(fh_fastq, chunk_size):
+            stats.add(block)
 
-        while True:
-            header = fh_fastq.readline().rstrip()
-            if not header:
-                break
-            seq = fh_fastq.readline().rstrip()
-            fh_fastq.readline()  # skip plus line
-            qual = fh_fastq.readline().rstrip()
-
-            read_id = header[1:].split()[0]
-            length = len(seq)
-            mean_q = (
-                sum(ord(c) - 33 for c in qual) / length if length else 0
+
+class LengthQualityHistogram:
+    """Fixed-size 2D histogram of read length x mean quality.
+
+    Reads longer than ``max_length`` or with a mean quality above
+    ``max_quality`` are counted in the last bin of that axis. An exact count
+    per read length is kept alongside the bins so N50 is not approximated;
+    its size is bounded by the longest read, not by the number of reads.
+    """
+
+    def __init__(
+        self,
+        length_bin: int = 10,
+        max_length: int = 5000,
+        quality_bin: float = 0.5,
+        max_quality: float = 50.0,
+    ) -> None:
+        self.length_bin = length_bin
+        self.quality_bin = quality_bin
+        self.n_length_bins = -(-max_length // length_bin)
+        self.n_quality_bins = int(np.ceil(max_quality / quality_bin))
+        self.counts = np.zeros((self.n_length_bins, self.n_quality_bins), dtype=np.int64)
+        self.lengths = ExactCounter()
+
+    @property
+    def reads(self) -> int:
+        return self.lengths.total
+
+    @property
+    def bases(self) -> int:
+        return self.lengths.value_sum
+
+    def update(self, lengths: np.ndarray, mean_qualities: np.ndarray) -> None:
+        """Add reads with the given ``lengths`` and ``mean_qualities``."""
+        if not len(lengths):
+            return
+        length_idx = np.minimum(lengths // self.length_bin, self.n_length_bins - 1)
+        quality_idx = np.clip(
+            (mean_qualities // self.quality_bin).astype(np.int64),
+            0,
+            self.n_quality_bins - 1,
+        )
+        flat = length_idx * self.n_quality_bins + quality_idx
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(
+            self.counts.shape
+        )
+        self.lengths.update(lengths)
+
+    def merge(self, other: "LengthQualityHistogram") -> None:
+        """Add the counts of ``other``, which must use the same bins."""
+        if self.counts.shape != other.counts.shape or (
+            self.length_bin,
+            self.quality_bin,
+        ) != (other.length_bin, other.quality_bin):
+            raise ValueError("Cannot merge histograms with different bins")
+        self.counts += other.counts
+        self.lengths.merge(other.lengths)
+
+    def n50(self) -> int:
+        """Length such that reads at least this long hold half of all bases."""
+        return self.lengths.n50()
+
+    def write(self, path: str) -> None:
+        """Write totals as ``#`` comment lines followed by the non-empty bins."""
+        with open(path, "w", newline="") as fh:
+            fh.write(f"# reads\t{self.reads}\n")
+            fh.write(f"# bases\t{self.bases}\n")
+            fh.write(f"# n50\t{self.n50()}\n")
+            writer = csv.writer(fh, delimiter="\t", lineterminator="\n")
+            writer.writerow(
+                ["length_start", "length_end", "quality_start", "quality_end", "count"]
             )
-            writer.writerow([read_id, length, f"{mean_q:.2f}"])
+            for length_idx, quality_idx in zip(*np.nonzero(self.counts)):
+                writer.writerow(
+                    [
+                        length_idx * self.length_bin,
+                        (length_idx + 1) * self.length_bin,
+                        f"{quality_idx * self.quality_bin:g}",
+                        f"{(quality_idx + 1) * self.quality_bin:g}",
+                        self.counts[length_idx, quality_idx],
+                    ]
+                )
+
+
+def collect_read_summary(
+    fastq_path: str,
+    out_path: str,
+    chunk_size: int = CHUNK_SIZE,
+    sketch: ReadStatsSketch | None = None,
+    **bins,
+) -> LengthQualityHistogram:
+    """Write a :class:`LengthQualityHistogram` of ``fastq_path`` to ``out_path``.
+
+    Extra keyword arguments are passed to :class:`LengthQualityHistogram`.
+    Memory use depends on the number of bins, not on the number of reads.
+    When ``sketch`` is given it is updated with every read as well.
+    """
+    with open_fastq(fastq_path) as fh_fastq, StatsWriter(
+        out_path, summary=bins, sketch=sketch
+    ) as stats:
+        for block in iter_fastq_blocks(fh_fastq, chunk_size):
+            stats.add(block)
+    return stats.histogram
+
+
+#: Suffix of the read/base count file written next to every stats file.
+COUNTS_SUFFIX = ".counts.json"
+
+
+def write_counts_sidecar(stats_path: str, reads: int, bases: int) -> None:
+    """Record ``reads`` and ``bases`` for ``stats_path`` in a small JSON file.
+
+    The size of ``stats_path`` is stored too, so readers can tell when the
+    stats file was rewritten without updating the sidecar.
+    """
+    with open(stats_path + COUNTS_SUFFIX, "w") as fh:
+        json.dump(
+            {"reads": reads, "bases": bases, "size": os.path.getsize(stats_path)}, fh
+        )
+        fh.write("\n")
+
+
+class StatsWriter:
+    """Write the statistics of successive :class:`FastqBlock` objects.
+
+    Per-read rows are written to ``output`` unless ``summary`` holds
+    histogram options, in which case a :class:`LengthQualityHistogram` is
+    written on close. ``summary_json`` is a path for the
+    :class:`ReadStatsSketch` JSON; ``{output}`` in it is replaced by
+    ``output``. A caller-owned ``sketch`` may be passed instead to be updated
+    without being written.
+
+    On close a ``<output>.counts.json`` sidecar with the number of reads and
+    bases is written so that ``summarize_read_counts.py`` does not have to
+    re-read ``output``. Nothing is summarised if an exception escapes the
+    ``with`` block.
+    """
+
+    def __init__(
+        self,
+        output: str,
+        summary: dict | None = None,
+        summary_json: str | None = None,
+        sketch: ReadStatsSketch | None = None,
+    ) -> None:
+        self.output = output
+        self.histogram_options = summary
+        self.histogram = None if summary is None else LengthQualityHistogram(**summary)
+        self.sketch = ReadStatsSketch() if summary_json else sketch
+        self.summary_json = summary_json.format(output=output) if summary_json else None
+        self.reads = 0
+        self.bases = 0
+        self._fh = None
+        if self.histogram is None:
+            self._fh = open(output, "w", newline="")
+            self._writer = csv.writer(self._fh, delimiter="\t")
+            self._writer.writerow(["read_id", "length", "mean_quality"])
+
+    def add(self, block: FastqBlock) -> None:
+        self.reads += len(block)
+        self.bases += int(block.lengths.sum())
+        if self.histogram is None:
+            _write_rows(self._writer, block)
+        else:
+            with phase("transform"):
+                self.histogram.update(block.lengths, block.mean_qualities())
+        if self.sketch is not None:
+            with phase("transform"):
+                block.update_sketch(self.sketch)
+
+    def part(self, rows_path: str) -> "StatsPart":
+        """Return an empty :class:`StatsPart` matching this writer's mode."""
+        return StatsPart(
+            rows_path if self.histogram is None else None,
+            None if self.histogram is None else self.histogram_options,
+            self.sketch is not None,
+        )
+
+    def merge(self, part: "StatsPart") -> None:
+        """Append the reads of a closed ``part``; parts must come in file order."""
+        self.reads += part.reads
+        self.bases += part.bases
+        if self.histogram is None:
+            with open(part.rows_path, newline="") as src:
+                shutil.copyfileobj(src, self._fh)
+            os.remove(part.rows_path)
+        else:
+            self.histogram.merge(part.histogram)
+        if self.sketch is not None:
+            self.sketch.merge(part.sketch)
+
+    def close(self) -> None:
+        with phase("write"):
+            if self._fh is not None:
+                self._fh.close()
+            if self.histogram is not None:
+                self.histogram.write(self.output)
+            if self.summary_json:
+                self.sketch.write_json(self.summary_json)
+            write_counts_sidecar(self.output, self.reads, self.bases)
+
+    def __enter__(self) -> "StatsWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        elif self._fh is not None:
+            self._fh.close()
+
+
+class StatsPart:
+    """Statistics of one slice of a FASTQ, built in a worker process.
+
+    Rows go to ``rows_path`` without a header; histogram and sketch are kept
+    in memory and sent back to the parent, which merges the parts of a file
+    into its :class:`StatsWriter` with :meth:`StatsWriter.merge`.
+    """
+
+    def __init__(
+        self, rows_path: str | None, summary: dict | None, sketch: bool
+    ) -> None:
+        self.rows_path = rows_path
+        self.histogram = None if summary is None else LengthQualityHistogram(**summary)
+        self.sketch = ReadStatsSketch() if sketch else None
+        self.reads = 0
+        self.bases = 0
+        self._fh = None
+
+    def open(self) -> None:
+        """Create the rows file; called in the worker before the first block."""
+        if self.rows_path is not None:
+            self._fh = open(self.rows_path, "w", newline="")
+            self._writer = csv.writer(self._fh, delimiter="\t")
+
+    def add(self, block: FastqBlock) -> None:
+        self.reads += len(block)
+        self.bases += int(block.lengths.sum())
+        if self.histogram is None:
+            _write_rows(self._writer, block)
+        else:
+            with phase("transform"):
+                self.histogram.update(block.lengths, block.mean_qualities())
+        if self.sketch is not None:
+            with phase("transform"):
+                block.update_sketch(self.sketch)
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = self._writer = None
+
+
+def _collect_slice(job) -> StatsPart:
+    """Collect the statistics of one ``(fastq, start, end, part)`` slice."""
+    fastq, start, end, part = job
+    part.open()
+    with open_slice(fastq, start, end) as fh:
+        for block in iter_fastq_blocks(fh):
+            part.add(block)
+    part.close()
+    return part
+
+
+def collect_file_chunked(
+    fastq: str,
+    output: str,
+    summary: dict | None = None,
+    summary_json: str | None = None,
+    workers: int | None = None,
+    chunk_size: int = INDEX_CHUNK,
+) -> None:
+    """Like :func:`collect_file`, splitting ``fastq`` over ``workers`` processes.
+
+    Files that fit in one slice, compressed files or a single worker fall
+    back to :func:`collect_file`.
+    """
+    workers = workers or os.cpu_count() or 1
+    ranges = chunk_ranges(fastq, chunk_size) if workers > 1 and not is_gzip(fastq) else []
+    if len(ranges) < 2:
+        collect_file(fastq, output, summary, summary_json)
+        return
+    tmp_dir = tempfile.mkdtemp(prefix=".stats_", dir=os.path.dirname(output) or ".")
+    try:
+        with StatsWriter(output, summary, summary_json) as stats:
+            jobs = [
+                (fastq, start, end, stats.part(os.path.join(tmp_dir, f"{i}.tsv")))
+                for i, (start, end) in enumerate(ranges)
+            ]
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+                for part in pool.map(_collect_slice, jobs):
+                    stats.merge(part)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+@dataclass
+class BatchResult:
+    """Outcome of processing one FASTQ file in batch mode."""
+
+    fastq: str
+    output: str
+    ok: bool
+    seconds: float
+    error: str = ""
+
+
+def collect_file(
+    fastq: str,
+    output: str,
+    summary: dict | None = None,
+    summary_json: str | None = None,
+) -> None:
+    """Write the statistics of ``fastq`` to ``output`` with :class:`StatsWriter`."""
+    with open_fastq(fastq) as fh_fastq, StatsWriter(output, summary, summary_json) as stats:
+        for block in timed_iter(iter_fastq_blocks(fh_fastq), "load"):
+            stats.add(block)
+
+
+def _collect_one(
+    pair: tuple[str, str],
+    summary: dict | None = None,
+    summary_json: str | None = None,
+) -> BatchResult:
+    """Run :func:`collect_file` on one pair, capturing any error."""
+    fastq, output = pair
+    start = time.perf_counter()
+    try:
+        with profile(output, profiling_enabled()):
+            collect_file(fastq, output, summary, summary_json)
+    except Exception as e:  # report and keep going with the other files
+        return BatchResult(fastq, output, False, time.perf_counter() - start, str(e))
+    return BatchResult(fastq, output, True, time.perf_counter() - start)
+
+
+def collect_read_stats_batch(
+    pairs: Iterable[tuple[str, str]],
+    workers: int | None = None,
+    summary: dict | None = None,
+    summary_json: str | None = None,
+) -> list[BatchResult]:
+    """Process many ``(fastq, output_tsv)`` pairs in a process pool.
+
+    A failure in one file is recorded in its :class:`BatchResult` and does
+    not stop the remaining files. Results follow the order of ``pairs``.
+    ``summary`` and ``summary_json`` are forwarded to :func:`collect_file`.
+    """
+    pairs = list(pairs)
+    workers = min(workers or os.cpu_count() or 1, len(pairs) or 1)
+    collect = partial(_collect_one, summary=summary, summary_json=summary_json)
+    if workers == 1:
+        return [collect(pair) for pair in pairs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(collect, pairs))
+
+
+def read_pairs(path: str) -> list[tuple[str, str]]:
+    """Read ``fastq<TAB>output_tsv`` lines, skipping blanks and ``#`` comments."""
+    pairs = []
+    with open(path) as fh:
+        for line in fh:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.split("\t")
+            if len(fields) != 2:
+                raise ValueError(f"Expected 'fastq<TAB>output' in {path}: {line}")
+            pairs.append((fields[0], fields[1]))
+    return pairs
+
+
+def pairs_from_directory(
+    input_dir: str,
+    output_dir: str,
+    name_template: str,
+    strip_prefixes: Iterable[str] = (),
+) -> list[tuple[str, str]]:
+    """Pair every FASTQ in ``input_dir`` with an output path in ``output_dir``.
+
+    ``name_template`` is formatted with ``stem``, the file name without its
+    FASTQ and ``.gz`` extensions and without the first matching prefix from
+    ``strip_prefixes``.
+    """
+    pairs = []
+    for path in sorted(Path(input_dir).iterdir()):
+        if not path.is_file() or not path.name.endswith(FASTQ_SUFFIXES):
+            continue
+        stem = fastq_stem(path)
+        for prefix in strip_prefixes:
+            if stem.startswith(prefix):
+                stem = stem[len(prefix) :]
+                break
+        output = Path(output_dir) / name_template.format(stem=stem)
+        pairs.append((str(path), str(output)))
+    return pairs
+
+
+def write_report(results: list[BatchResult], out) -> None:
+    """Write one TSV line per processed file to ``out``."""
+    writer = csv.writer(out, delimiter="\t", lineterminator="\n")
+    writer.writerow(["fastq", "output", "status", "seconds", "error"])
+    for result in results:
+        writer.writerow(
+            [
+                result.fastq,
+                result.output,
+                "ok" if result.ok else "failed",
+                f"{result.seconds:.2f}",
+                result.error,
+            ]
+        )
 
 
 def parse_args() -> argparse.Namespace:
@@ -44,18 +673,117 @@ def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Collect basic read statistics from a FASTQ file."
     )
-    parser.add_argument("fastq", help="Path to the input FASTQ file.")
+    parser.add_argument("fastq", nargs="?", help="Path to the input FASTQ file.")
     parser.add_argument(
-        "output_tsv", help="Path to write the per-read statistics in TSV format."
+        "output_tsv",
+        nargs="?",
+        help="Path to write the per-read statistics in TSV format.",
+    )
+    summary = parser.add_argument_group("summary mode")
+    summary.add_argument(
+        "--summary",
+        action="store_true",
+        help="Write a binned length x mean-quality histogram instead of "
+        "per-read rows.",
+    )
+    summary.add_argument("--length-bin", type=int, default=10)
+    summary.add_argument("--max-length", type=int, default=5000)
+    summary.add_argument("--quality-bin", type=float, default=0.5)
+    summary.add_argument("--max-quality", type=float, default=50.0)
+    summary.add_argument(
+        "--summary-json",
+        help="Also write length/quality quantiles, N50 and mean error "
+        "probability as JSON. '{output}' is replaced by the output path, "
+        "e.g. '{output}.json' in batch mode.",
+    )
+    batch = parser.add_argument_group("batch mode")
+    batch.add_argument(
+        "--pairs", help="TSV file with one 'fastq<TAB>output_tsv' pair per line."
+    )
+    batch.add_argument("--input-dir", help="Process every FASTQ in this directory.")
+    batch.add_argument("--output-dir", help="Directory for the --input-dir outputs.")
+    batch.add_argument(
+        "--name-template",
+        default="{stem}_stats.tsv",
+        help="Output file name for --input-dir; '{stem}' is the FASTQ name "
+        "without extension (default: %(default)s).",
+    )
+    batch.add_argument(
+        "--strip-prefix",
+        action="append",
+        default=[],
+        help="Prefix removed from '{stem}' (may be repeated).",
+    )
+    batch.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("STATS_WORKERS", 0)) or None,
+        help="Worker processes (default: $STATS_WORKERS or the number of CPUs). "
+        "Outside batch mode, a large FASTQ is split over this many processes.",
     )
-    return parser.parse_args()
+    batch.add_argument(
+        "--report", help="Write a per-file status TSV here instead of stderr."
+    )
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    if args.pairs or args.input_dir:
+        if args.fastq or args.output_tsv:
+            parser.error("positional arguments cannot be combined with batch mode")
+        if args.input_dir and not args.output_dir:
+            parser.error("--input-dir requires --output-dir")
+    elif not (args.fastq and args.output_tsv):
+        parser.error("FASTQ and OUTPUT_TSV are required outside batch mode")
+    return args
+
+
+def summary_options(args: argparse.Namespace) -> dict | None:
+    """Return histogram options from ``args`` or ``None`` without --summary."""
+    if not args.summary:
+        return None
+    return {
+        "length_bin": args.length_bin,
+        "max_length": args.max_length,
+        "quality_bin": args.quality_bin,
+        "max_quality": args.max_quality,
+    }
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    """Run batch mode and return the process exit code."""
+    pairs = read_pairs(args.pairs) if args.pairs else []
+    if args.input_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        pairs += pairs_from_directory(
+            args.input_dir, args.output_dir, args.name_template, args.strip_prefix
+        )
+    results = collect_read_stats_batch(
+        pairs, args.workers, summary_options(args), args.summary_json
+    )
+    if args.report:
+        with open(args.report, "w", newline="") as fh:
+            write_report(results, fh)
+    else:
+        write_report(results, sys.stderr)
+    failed = sum(not r.ok for r in results)
+    if failed:
+        print(f"{failed} of {len(results)} FASTQ files failed", file=sys.stderr)
+        return 1
+    return 0
 
 
 def main() -> None:
     """Entry point for command-line execution."""
     args = parse_args()
+    if args.profile:
+        os.environ[PROFILE_ENV] = "1"  # inherited by the batch worker processes
+    if args.pairs or args.input_dir:
+        sys.exit(run_batch(args))
     try:
-        collect_read_stats(args.fastq, args.output_tsv)
+        with profile(args.output_tsv, profiling_enabled()):
+            collect_file_chunked(
+                args.fastq, args.output_tsv, summary_options(args), args.summary_json,
+                args.workers,
+            )
     except OSError as e:
         print(f"Could not open FASTQ file: {e}", file=sys.stderr)
         sys.exit(1)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""Collapse identical reads before clustering and keep their abundance.
+
+Amplicon runs contain many reads with exactly the same sequence. Each
+filtered FASTQ is reduced to one representative per distinct sequence, the
+read with the highest quality sum, before ``NGSpeciesID`` sees it::
+
+    <output_dir>/<name>.fastq            representatives
+    <output_dir>/<name>.abundance.tsv    read_id, size (reads it stands for)
+    <output_dir>/dereplication_report.tsv
+
+Sequences are indexed in a dictionary. When a FASTQ is larger than
+``--memory-mb`` its reads are first spread over partition files on disk by a
+hash of the sequence, so identical reads land in the same partition, and
+every partition is dereplicated on its own.
+
+``NGSpeciesID`` then only counts representatives, so after clustering
+``rescale`` rewrites the ``_total_supporting_reads_N`` headers of
+``consensus_reference_*.fasta`` with the summed abundance of the reads of each
+cluster (from ``final_clusters.tsv``) and drops consensus sequences whose
+true support is below ``--min-support``. ``support`` prints the ``--s`` value
+scaled to the reduction of a sample.
+
+Usage:
+    python scripts/dereplicate_reads.py derep <fastq>... --output-dir <dir>
+    python scripts/dereplicate_reads.py support <name>.abundance.tsv <SUPPORT>
+    python scripts/dereplicate_reads.py rescale <outfolder> <name>.abundance.tsv \
+        [--min-support N]
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import fcntl
+import glob
+import hashlib
+import math
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from collect_read_stats import FASTQ_SUFFIXES, iter_fastq_blocks
+from fastq_io import fastq_stem, is_gzip, open_fastq
+
+REPORT_NAME = "dereplication_report.tsv"
+# Bytes of dictionary per byte of FASTQ (keys, entries and record copies)
+_MEMORY_FACTOR = 3
+# Typical size ratio of a FASTQ to its gzip file, to size partitions
+_GZIP_RATIO = 4
+HEADER_RE = re.compile(r"^>(consensus_cl_id_(\S+?))_total_supporting_reads_(\d+)(.*)$")
+
+
+@dataclass
+class DerepResult:
+    """Reduction achieved for one FASTQ."""
+
+    sample: str
+    reads: int
+    unique: int
+    partitions: int
+
+    @property
+    def reduction(self) -> float:
+        return 1 - self.unique / self.reads if self.reads else 0.0
+
+
+def iter_records(path: str):
+    """Yield ``(record, read_id, sequence, quality_sum)`` for each read."""
+    with open_fastq(path) as fh:
+        for block in iter_fastq_blocks(fh):
+            raw = block.raw
+            starts, ends = block.starts.tolist(), block.ends.tolist()
+            for (s0, s1, s2, s3), (e0, e1, e2, e3), qsum in zip(
+                starts, ends, block.quality_sums().tolist()
+            ):
+                header = raw[s0:e0]
+                seq = raw[s1:e1]
+                record = b"%s\n%s\n+\n%s\n" % (header, seq, raw[s3:e3])
+                read_id = header[1:].split(None, 1)[0].decode()
+                yield record, read_id, seq, qsum
+
+
+def _dereplicate(records, out_fastq, abundance) -> tuple[int, int]:
+    """Collapse ``records`` in memory; return reads and unique sequences."""
+    index: dict[bytes, list] = {}
+    reads = 0
+    for record, read_id, seq, qsum in records:
+        reads += 1
+        entry = index.get(seq)
+        if entry is None:
+            index[seq] = [1, qsum, record, read_id]
+            continue
+        entry[0] += 1
+        if qsum > entry[1]:
+            entry[1:] = [qsum, record, read_id]
+    for size, _qsum, record, read_id in sorted(
+        index.values(), key=lambda entry: -entry[0]
+    ):
+        out_fastq.write(record)
+        abundance.writerow([read_id, size])
+    return reads, len(index)
+
+
+def dereplicate_file(
+    fastq: str, output_dir: str, memory_mb: float = 1024
+) -> DerepResult:
+    """Dereplicate ``fastq`` into ``output_dir``."""
+    name = fastq_stem(fastq)
+    out_path = Path(output_dir) / f"{name}.fastq"
+    size = os.path.getsize(fastq) * (_GZIP_RATIO if is_gzip(fastq) else 1)
+    partitions = max(1, math.ceil(size * _MEMORY_FACTOR / (memory_mb * 1024**2)))
+
+    with open(out_path, "wb") as out_fastq, open(
+        Path(output_dir) / f"{name}.abundance.tsv", "w", newline=""
+    ) as abundance_fh:
+        abundance = csv.writer(abundance_fh, delimiter="\t")
+        abundance.writerow(["read_id", "size"])
+        if partitions == 1:
+            reads, unique = _dereplicate(iter_records(fastq), out_fastq, abundance)
+            return DerepResult(name, reads, unique, 1)
+
+        tmp_dir = tempfile.mkdtemp(prefix=f".{name}.derep.", dir=output_dir)
+        try:
+            paths = [os.path.join(tmp_dir, f"part{i}.fastq") for i in range(partitions)]
+            handles = [open(p, "wb") for p in paths]
+            try:
+                for record, _read_id, seq, _qsum in iter_records(fastq):
+                    digest = hashlib.blake2b(seq, digest_size=8).digest()
+                    handles[int.from_bytes(digest, "little") % partitions].write(record)
+            finally:
+                for fh in handles:
+                    fh.close()
+            reads = unique = 0
+            for path in paths:
+                r, u = _dereplicate(iter_records(path), out_fastq, abundance)
+                reads += r
+                unique += u
+                os.remove(path)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return DerepResult(name, reads, unique, partitions)
+
+
+def read_abundance(path: str) -> dict[str, int]:
+    with open(path, newline="") as fh:
+        return {row["read_id"]: int(row["size"]) for row in csv.DictReader(fh, delimiter="\t")}
+
+
+def scaled_support(abundance_path: str, support: int) -> int:
+    """``support`` scaled by the unique/total ratio of a dereplicated sample."""
+    sizes = read_abundance(abundance_path).values()
+    total = sum(sizes)
+    if not total:
+        return support
+    return max(1, math.floor(support * len(sizes) / total))
+
+
+def rescale_consensus(outfolder: str, abundance_path: str, min_support: int = 0) -> int:
+    """Rewrite supporting read counts in ``outfolder`` with read abundances.
+
+    Returns the number of consensus files kept.
+    """
+    abundance = read_abundance(abundance_path)
+    cluster_sizes: dict[str, int] = {}
+    with open(os.path.join(outfolder, "final_clusters.tsv")) as fh:
+        for line in fh:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 2:
+                continue
+            cluster, read_id = fields[0], fields[1]
+            cluster_sizes[cluster] = cluster_sizes.get(cluster, 0) + abundance.get(read_id, 1)
+
+    kept = 0
+    for path in sorted(glob.glob(os.path.join(outfolder, "consensus_reference_*.fasta"))):
+        with open(path) as fh:
+            original = fh.read()
+        lines = original.splitlines()
+        supports = []
+        for i, line in enumerate(lines):
+            m = HEADER_RE.match(line)
+            if not m:
+                continue
+            prefix, cluster, reads, rest = m.groups()
+            reads = cluster_sizes.get(cluster, int(reads))
+            supports.append(reads)
+            lines[i] = f">{prefix}_total_supporting_reads_{reads}{rest}"
+        if supports and max(supports) < min_support:
+            os.remove(path)
+            continue
+        text = "\n".join(lines) + "\n"
+        if text != original:  # leave unchanged files untouched for the step cache
+            with open(path, "w") as fh:
+                fh.write(text)
+        kept += 1
+    return kept
+
+
+def write_report(results: list[DerepResult], path: str) -> None:
+    """Merge ``results`` into the report at ``path``, one row per sample.
+
+    The report is locked while it is updated, so samples dereplicated at the
+    same time do not lose each other's rows.
+    """
+    header = ["sample", "reads", "unique", "reduction", "partitions"]
+    with open(path, "a+", newline="") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        fh.seek(0)
+        rows = {
+            row["sample"]: [row[key] for key in header]
+            for row in csv.DictReader(fh, delimiter="\t")
+        }
+        for r in results:
+            rows[r.sample] = [r.sample, r.reads, r.unique, f"{r.reduction:.4f}", r.partitions]
+        fh.seek(0)
+        fh.truncate()
+        writer = csv.writer(fh, delimiter="\t")
+        writer.writerow(header)
+        writer.writerows(rows[sample] for sample in sorted(rows))
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    derep = sub.add_parser("derep", help="Collapse identical reads.")
+    derep.add_argument("fastq", nargs="+", help="Filtered FASTQ files.")
+    derep.add_argument("--output-dir", required=True)
+    derep.add_argument(
+        "--memory-mb",
+        type=float,
+        default=float(os.environ.get("DEREP_MEMORY_MB", 1024)),
+        help="Memory for the sequence index before spilling to partitions.",
+    )
+    support = sub.add_parser("support", help="Print SUPPORT scaled to the reduction.")
+    support.add_argument("abundance")
+    support.add_argument("support", type=int)
+    rescale = sub.add_parser("rescale", help="Restore supporting read counts.")
+    rescale.add_argument("outfolder", help="NGSpeciesID output folder.")
+    rescale.add_argument("abundance")
+    rescale.add_argument("--min-support", type=int, default=0)
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Entry point for command-line execution."""
+    args = parse_args()
+    if args.command == "support":
+        print(scaled_support(args.abundance, args.support))
+    elif args.command == "rescale":
+        kept = rescale_consensus(args.outfolder, args.abundance, args.min_support)
+        print(f"{kept} consensos conservados en {args.outfolder}")
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+        results = [
+            dereplicate_file(path, args.output_dir, args.memory_mb)
+            for path in args.fastq
+            if path.endswith(FASTQ_SUFFIXES)
+        ]
+        write_report(results, os.path.join(args.output_dir, REPORT_NAME))
+        print("sample\treads\tunique\treduction")
+        for r in results:
+            print(f"{r.sample}\t{r.reads}\t{r.unique}\t{r.reduction:.1%}")
+
+
+if __name__ == "__main__":
+    main()
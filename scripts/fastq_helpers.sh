@@ -0,0 +1,81 @@
+#!/usr/bin/env bash
+# Funciones comunes de las etapas para leer y escribir FASTQ planos o
+# comprimidos y medir sus comandos. Se cargan con:
+#   source "$(dirname "$0")/fastq_helpers.sh"
+
+fastq_helpers_dir="$(dirname "${BASH_SOURCE[0]}")"
+
+# CLIPON_COMPRESS=bgzip guarda los FASTQ de salida comprimidos con bgzip
+# (nivel CLIPON_COMPRESS_LEVEL, 6 por defecto; hilos CLIPON_COMPRESS_THREADS)
+if [ "${CLIPON_COMPRESS:-}" = "bgzip" ]; then
+    fastq_ext=".fastq.gz"
+else
+    fastq_ext=".fastq"
+fi
+
+# Nombre del archivo sin las extensiones .fastq/.fq ni .gz
+fastq_base() {
+    local name
+    name="$(basename "$1")"
+    name="${name%.gz}"
+    name="${name%.fastq}"
+    echo "${name%.fq}"
+}
+
+# Escribe la entrada estándar en $1, comprimida con bgzip si termina en .gz
+write_fastq() {
+    if [[ "$1" != *.gz ]]; then
+        cat > "$1"
+    elif command -v bgzip >/dev/null; then
+        bgzip -c -l "${CLIPON_COMPRESS_LEVEL:-6}" -@ "${CLIPON_COMPRESS_THREADS:-4}" > "$1"
+    else
+        python3 "$fastq_helpers_dir/fastq_io.py" compress "$1" \
+            --level "${CLIPON_COMPRESS_LEVEL:-6}"
+    fi
+}
+
+# Escribe $1 en la salida estándar, descomprimido si termina en .gz
+read_fastq() {
+    if [[ "$1" != *.gz ]]; then
+        cat "$1"
+    else
+        python3 "$fastq_helpers_dir/fastq_io.py" cat "$1"
+    fi
+}
+
+# Verdadero si el FASTQ (plano o comprimido) no está vacío
+has_reads() {
+    if [[ "$1" == *.gz ]]; then
+        [ -n "$(read_fastq "$1" 2>/dev/null | head -c 1)" ]
+    else
+        [ -s "$1" ]
+    fi
+}
+
+# measure <etapa> <muestra> <entrada> <salida> <comando...>: con
+# CLIPON_METRICS definido el comando se ejecuta a través de clipon_metrics.py
+# para registrar tiempo, CPU, memoria y bytes por muestra
+measure() {
+    local stage="$1" sample="$2" input="$3" output="$4"
+    shift 4
+    if [ -n "${CLIPON_METRICS:-}" ]; then
+        python3 "$fastq_helpers_dir/clipon_metrics.py" run --stage "$stage" \
+            --sample "$sample" --inputs "$input" --outputs "$output" -- "$@"
+    else
+        "$@"
+    fi
+}
+
+# Igual que measure, pero la salida estándar del comando se guarda en
+# <salida> con write_fastq
+measure_to() {
+    local stage="$1" sample="$2" input="$3" output="$4"
+    shift 4
+    if [ -n "${CLIPON_METRICS:-}" ]; then
+        python3 "$fastq_helpers_dir/clipon_metrics.py" run --stage "$stage" \
+            --sample "$sample" --inputs "$input" --outputs "$output" \
+            --stdout "$output" -- "$@"
+    else
+        "$@" | write_fastq "$output"
+    fi
+}
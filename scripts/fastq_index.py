@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Record-aligned byte ranges of a FASTQ file for parallel processing.
+
+A single large FASTQ is split into slices of about ``chunk_size`` bytes that
+start on a record header. The file is memory-mapped and only the bytes
+around each nominal boundary are inspected: a boundary moves forward to the
+first line starting with ``@`` whose second next line starts with ``+``, so
+quality lines starting with ``@`` are never mistaken for headers. The
+offsets are saved next to the file as ``<fastq>.fqidx`` (JSON) and reused
+while the size and modification time of the FASTQ do not change.
+
+Workers open their slice with :func:`open_slice`, a file-like reader over
+the memory map that can be passed to ``collect_read_stats.iter_fastq_blocks``;
+nothing is copied through the parent process. Slices are processed
+independently, so records must be well formed (blank lines are only allowed
+at the end of the file).
+
+Usage:
+    python scripts/fastq_index.py <fastq>... [--chunk-size 67108864]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import os
+from pathlib import Path
+
+INDEX_SUFFIX = ".fqidx"
+
+#: Nominal size in bytes of the slices handed to each worker.
+INDEX_CHUNK = 64 * 1024 * 1024
+
+
+def record_start(mm, pos: int) -> int:
+    """Return the offset of the first record starting at or after ``pos``."""
+    size = len(mm)
+    if pos <= 0:
+        return 0
+    line = mm.find(b"\n", pos - 1)
+    while 0 <= line < size - 1:
+        start = line + 1
+        if mm[start : start + 1] == b"@":
+            second = mm.find(b"\n", start)
+            third = mm.find(b"\n", second + 1) if second >= 0 else -1
+            if third >= 0 and mm[third + 1 : third + 2] == b"+":
+                return start
+        line = mm.find(b"\n", start)
+    return size
+
+
+def build_index(path, chunk_size: int = INDEX_CHUNK) -> list[int]:
+    """Return record-aligned offsets ``[0, ..., size]`` about ``chunk_size`` apart."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return [0, 0]
+    offsets = [0]
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        target = chunk_size
+        while target < size:
+            start = record_start(mm, max(target, offsets[-1] + 1))
+            if start >= size:
+                break
+            offsets.append(start)
+            target = start + chunk_size
+    offsets.append(size)
+    return offsets
+
+
+def load_index(path, chunk_size: int = INDEX_CHUNK, save: bool = True) -> list[int]:
+    """Return the offsets of ``path``, reading or refreshing ``<path>.fqidx``."""
+    stat = os.stat(path)
+    index_path = str(path) + INDEX_SUFFIX
+    try:
+        with open(index_path) as fh:
+            data = json.load(fh)
+        if (data["size"], data["mtime_ns"], data["chunk_size"]) == (
+            stat.st_size, stat.st_mtime_ns, chunk_size
+        ):
+            return data["offsets"]
+    except (OSError, ValueError, KeyError):
+        pass
+    offsets = build_index(path, chunk_size)
+    if save:
+        data = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "chunk_size": chunk_size,
+            "offsets": offsets,
+        }
+        try:
+            with open(index_path, "w") as fh:
+                json.dump(data, fh)
+                fh.write("\n")
+        except OSError:  # read-only input directory: the index is only a cache
+            pass
+    return offsets
+
+
+def chunk_ranges(path, chunk_size: int = INDEX_CHUNK) -> list[tuple[int, int]]:
+    """Return the ``(start, end)`` byte range of every slice of ``path``."""
+    offsets = load_index(path, chunk_size)
+    return [(a, b) for a, b in zip(offsets, offsets[1:]) if b > a]
+
+
+class _SliceReader:
+    """Binary reader over ``[start, end)`` of a memory-mapped file."""
+
+    def __init__(self, path, start: int, end: int) -> None:
+        self._fh = open(path, "rb")
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._pos = start
+        self._end = end
+
+    def read(self, size: int = -1) -> bytes:
+        stop = self._end if size < 0 else min(self._pos + size, self._end)
+        data = self._mm[self._pos : stop]
+        self._pos = stop
+        return data
+
+    def close(self) -> None:
+        self._mm.close()
+        self._fh.close()
+
+    def __enter__(self) -> "_SliceReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def open_slice(path, start: int, end: int) -> _SliceReader:
+    """Open bytes ``[start, end)`` of ``path`` for reading through ``mmap``."""
+    return _SliceReader(path, start, end)
+
+
+def main(argv=None) -> None:
+    """Build or refresh the index of each FASTQ and print its slices."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("fastq", nargs="+", type=Path)
+    parser.add_argument("--chunk-size", type=int, default=INDEX_CHUNK)
+    args = parser.parse_args(argv)
+    print("fastq\tchunks\tbytes")
+    for path in args.fastq:
+        ranges = chunk_ranges(path, args.chunk_size)
+        print(f"{path}\t{len(ranges)}\t{os.path.getsize(path)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""Read and write plain or gzip/bgzip-compressed FASTQ files.
+
+:func:`open_fastq` returns a binary reader for ``.fastq``/``.fq`` files and
+their ``.gz`` versions; compression is detected from the gzip magic bytes,
+not the name. Compressed input is inflated outside the parsing thread, so
+parsing never waits on inflate:
+
+* by a multi-threaded ``bgzip -@`` (BGZF files) or ``pigz`` subprocess when
+  one is on ``PATH``;
+* otherwise by a background thread that keeps a few blocks ready in a
+  queue. ``zlib`` releases the GIL while it inflates, and it is faster than
+  a ``gzip -dc`` subprocess, which is therefore not used.
+
+:func:`open_output` writes plain FASTQ, or BGZF (the ``bgzip`` format, also
+valid gzip) when the path ends in ``.gz``: through ``bgzip`` when available,
+otherwise with the built-in :class:`BgzfWriter`. :func:`input_pipe` and
+:func:`output_pipe` do the same for the standard input and output of
+external commands such as ``NanoFilt``.
+
+Intermediate compression is configured with the same environment variables
+as the stage scripts:
+
+``CLIPON_COMPRESS``
+    ``bgzip`` writes intermediate FASTQ files as ``.fastq.gz`` (default:
+    uncompressed).
+``CLIPON_COMPRESS_LEVEL``
+    compression level from 1 to 9 (default 6).
+``CLIPON_COMPRESS_THREADS``
+    threads of the ``bgzip``/``pigz`` subprocesses (default 4).
+
+Usage (for shell pipelines without bgzip or pigz):
+    python scripts/fastq_io.py compress <salida.fastq.gz> [--level 6] < lecturas.fastq
+    python scripts/fastq_io.py cat <entrada.fastq.gz>... > lecturas.fastq
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+
+FASTQ_SUFFIXES = (".fastq", ".fq", ".fastq.gz", ".fq.gz")
+GZIP_MAGIC = b"\x1f\x8b"
+COMPRESS_ENV = "CLIPON_COMPRESS"
+LEVEL_ENV = "CLIPON_COMPRESS_LEVEL"
+THREADS_ENV = "CLIPON_COMPRESS_THREADS"
+DEFAULT_LEVEL = 6
+
+#: Uncompressed bytes per BGZF block, as written by ``bgzip``.
+BGZF_BLOCK = 0xFF00
+#: Empty BGZF block that marks the end of a bgzip file.
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+#: Bytes inflated per step by the background thread.
+INFLATE_CHUNK = 1024 * 1024
+_QUEUE_BLOCKS = 16
+
+
+def fastq_stem(path) -> str:
+    """File name of ``path`` without its FASTQ and compression extensions."""
+    name = Path(path).name
+    for suffix in sorted(FASTQ_SUFFIXES, key=len, reverse=True):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return Path(name).stem
+
+
+def is_gzip(path) -> bool:
+    """True when ``path`` starts with the gzip magic bytes."""
+    with open(path, "rb") as fh:
+        return fh.read(2) == GZIP_MAGIC
+
+
+def is_bgzf(path) -> bool:
+    """True when ``path`` starts with a BGZF (bgzip) block header."""
+    with open(path, "rb") as fh:
+        header = fh.read(16)
+    return header[:4] == b"\x1f\x8b\x08\x04" and header[12:14] == b"BC"
+
+
+def compression_settings(env=os.environ) -> tuple[str, int, int]:
+    """Return the FASTQ extension, level and threads for intermediate files."""
+    compress = env.get(COMPRESS_ENV, "").lower() == "bgzip"
+    level = int(env.get(LEVEL_ENV, DEFAULT_LEVEL))
+    threads = int(env.get(THREADS_ENV, 4))
+    return (".fastq.gz" if compress else ".fastq"), level, threads
+
+
+def _threads(threads: int | None) -> int:
+    return threads or compression_settings()[2]
+
+
+def _decompressor(path, threads: int | None = None) -> list[str] | None:
+    """Command that writes the inflated ``path`` to stdout, if a tool exists."""
+    threads = str(_threads(threads))
+    candidates = [("pigz", ["-dc", "-p", threads])]
+    if is_bgzf(path):
+        candidates.insert(0, ("bgzip", ["-dc", "-@", threads]))
+    for tool, args in candidates:
+        executable = shutil.which(tool)
+        if executable:
+            return [executable, *args, str(path)]
+    return None
+
+
+class _ProcessReader:
+    """Binary reader over the stdout of a decompression subprocess."""
+
+    def __init__(self, command: list[str]) -> None:
+        self._command = command
+        self._process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        self._eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._process.stdout.read(size)
+        if not data or size < 0:
+            self._eof = True
+        return data
+
+    def close(self) -> None:
+        process = self._process
+        if process.poll() is None and not self._eof:
+            process.kill()  # the reader stopped early; do not wait for the tool
+        process.stdout.close()
+        error = process.stderr.read().decode(errors="replace").strip()
+        process.stderr.close()
+        returncode = process.wait()
+        if self._eof and returncode:
+            raise OSError(f"{Path(self._command[0]).name} failed ({returncode}): {error}")
+
+    def __enter__(self) -> "_ProcessReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class _ThreadReader:
+    """Binary reader whose data is inflated by a background thread."""
+
+    def __init__(self, path) -> None:
+        self._queue: queue.Queue = queue.Queue(maxsize=_QUEUE_BLOCKS)
+        self._stop = threading.Event()
+        self._pending = b""
+        self._eof = False
+        self._thread = threading.Thread(target=self._inflate, args=(path,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _inflate(self, path) -> None:
+        try:
+            with gzip.open(path, "rb") as fh:
+                while True:
+                    data = fh.read(INFLATE_CHUNK)
+                    if not self._put(data) or not data:
+                        return
+        except Exception as e:  # re-raised in the reading thread
+            self._put(e)
+
+    def _next(self) -> bytes:
+        if self._eof:
+            return b""
+        item = self._queue.get()
+        if isinstance(item, Exception):
+            self._eof = True
+            raise item
+        if not item:
+            self._eof = True
+        return item
+
+    def read(self, size: int = -1) -> bytes:
+        pieces = [self._pending]
+        have = len(self._pending)
+        while size < 0 or have < size:
+            data = self._next()
+            if not data:
+                break
+            pieces.append(data)
+            have += len(data)
+        data = b"".join(pieces)
+        if size >= 0:
+            data, self._pending = data[:size], data[size:]
+        else:
+            self._pending = b""
+        return data
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self) -> "_ThreadReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def open_fastq(path, threads: int | None = None):
+    """Open a plain or gzip/bgzip FASTQ file for binary reading.
+
+    Compressed files are inflated by a ``bgzip`` or ``pigz`` subprocess when
+    one is on ``PATH`` and by a background thread otherwise.
+    """
+    if not is_gzip(path):
+        return open(path, "rb")
+    command = _decompressor(path, threads)
+    if command:
+        return _ProcessReader(command)
+    return _ThreadReader(path)
+
+
+def _bgzf_block(data: bytes, level: int) -> bytes:
+    deflate = zlib.compressobj(level, zlib.DEFLATED, -15)
+    payload = deflate.compress(data) + deflate.flush()
+    header = struct.pack(
+        "<4BI2BH2BHH", 0x1F, 0x8B, 8, 4, 0, 0, 0xFF, 6, ord("B"), ord("C"), 2,
+        len(payload) + 25,
+    )
+    return header + payload + struct.pack("<II", zlib.crc32(data), len(data))
+
+
+class BgzfWriter:
+    """Write BGZF (bgzip) blocks to ``path`` without the ``bgzip`` binary."""
+
+    def __init__(self, path, level: int = DEFAULT_LEVEL) -> None:
+        self._fh = open(path, "wb")
+        self._level = level
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        if len(self._buffer) >= BGZF_BLOCK:
+            full = len(self._buffer) - len(self._buffer) % BGZF_BLOCK
+            view = memoryview(self._buffer)
+            self._fh.write(b"".join(
+                _bgzf_block(view[i : i + BGZF_BLOCK], self._level)
+                for i in range(0, full, BGZF_BLOCK)
+            ))
+            view.release()
+            del self._buffer[:full]
+        return len(data)
+
+    def close(self) -> None:
+        if self._fh.closed:
+            return
+        if self._buffer:
+            self._fh.write(_bgzf_block(bytes(self._buffer), self._level))
+            self._buffer.clear()
+        self._fh.write(BGZF_EOF)
+        self._fh.close()
+
+    def __enter__(self) -> "BgzfWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class _ProcessWriter:
+    """Binary writer feeding ``bgzip -c`` whose output goes to ``path``."""
+
+    def __init__(self, command: list[str], path) -> None:
+        self._name = Path(command[0]).name
+        with open(path, "wb") as out:
+            self._process = subprocess.Popen(
+                command, stdin=subprocess.PIPE, stdout=out, stderr=subprocess.PIPE
+            )
+
+    def write(self, data: bytes) -> int:
+        self._process.stdin.write(data)
+        return len(data)
+
+    def close(self) -> None:
+        if self._process.stdin.closed:
+            return
+        self._process.stdin.close()
+        error = self._process.stderr.read().decode(errors="replace").strip()
+        self._process.stderr.close()
+        if self._process.wait():
+            raise OSError(f"{self._name} failed ({self._process.returncode}): {error}")
+
+    def __enter__(self) -> "_ProcessWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def open_output(path, level: int | None = None, threads: int | None = None):
+    """Open ``path`` for binary writing, as BGZF when it ends in ``.gz``."""
+    if not str(path).endswith(".gz"):
+        return open(path, "wb")
+    _, default_level, _ = compression_settings()
+    level = default_level if level is None else level
+    bgzip = shutil.which("bgzip")
+    if bgzip:
+        command = [bgzip, "-c", "-l", str(level), "-@", str(_threads(threads))]
+        return _ProcessWriter(command, path)
+    return BgzfWriter(path, level)
+
+
+@contextmanager
+def input_pipe(path, threads: int | None = None):
+    """Yield a file with the uncompressed contents of ``path`` for ``stdin=``.
+
+    Unlike :func:`open_fastq` the object has a real file descriptor, so it
+    can be handed to ``subprocess``. A failed decompression raises
+    :class:`OSError` on exit.
+    """
+    if not is_gzip(path):
+        with open(path, "rb") as fh:
+            yield fh
+        return
+    command = _decompressor(path, threads) or [sys.executable, __file__, "cat", str(path)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    try:
+        yield process.stdout
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode > 0:  # a reader that stopped early only causes SIGPIPE
+        raise OSError(f"{Path(command[0]).name} failed ({returncode}) on {path}")
+
+
+@contextmanager
+def output_pipe(path, level: int | None = None, threads: int | None = None):
+    """Yield a file for ``stdout=`` whose data is written to ``path``.
+
+    Paths ending in ``.gz`` are compressed as BGZF by ``bgzip`` or by this
+    module in a separate process. A failed compression raises
+    :class:`OSError` on exit.
+    """
+    if not str(path).endswith(".gz"):
+        with open(path, "wb") as fh:
+            yield fh
+        return
+    level = compression_settings()[1] if level is None else level
+    bgzip = shutil.which("bgzip")
+    with open(path, "wb") as out:
+        if bgzip:
+            command = [bgzip, "-c", "-l", str(level), "-@", str(_threads(threads))]
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=out)
+        else:
+            command = [sys.executable, __file__, "compress", str(path), "--level", str(level)]
+            process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    try:
+        yield process.stdin
+    finally:
+        process.stdin.close()
+        returncode = process.wait()
+    if returncode:
+        raise OSError(f"{Path(command[0]).name} failed ({returncode}) on {path}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    compress = commands.add_parser("compress", help="Write stdin to OUTPUT as BGZF.")
+    compress.add_argument("output", type=Path)
+    compress.add_argument("--level", type=int)
+    cat = commands.add_parser("cat", help="Write plain or compressed FASTQ to stdout.")
+    cat.add_argument("fastq", nargs="+", type=Path)
+    args = parser.parse_args(argv)
+    if args.command == "compress":
+        with open_output(args.output, args.level) as out:
+            shutil.copyfileobj(sys.stdin.buffer, out, INFLATE_CHUNK)
+    else:
+        for path in args.fastq:
+            with open_fastq(path) as fh:
+                shutil.copyfileobj(fh, sys.stdout.buffer, INFLATE_CHUNK)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ Usage: $0 (--filtered DIR | --unified DIR | --workdir DIR STEP)
 
 Generate a QIIME2 manifest from the ClipON pipeline outputs.
 
-  --filtered DIR      Directory containing filtered FASTQ files.
+  --filtered DIR      Directory containing filtered FASTQ files (plain or .gz).
   --unified DIR       Directory produced by the unification step.
   --workdir DIR STEP  Use DIR/3_filtered or DIR/5_unified depending on STEP
                       (filtered|unified).
@@ -52,9 +52,11 @@ echo "sample-id,absolute-filepath,direction"
 case "$mode" in
     --filtered)
         shopt -s nullglob
-        for f in "$input_dir"/*.fastq "$input_dir"/*.fq; do
+        for f in "$input_dir"/*.fastq "$input_dir"/*.fq \
+            "$input_dir"/*.fastq.gz "$input_dir"/*.fq.gz; do
             [ -f "$f" ] || continue
             sample=$(basename "$f")
+            sample=${sample%.gz}
             sample=${sample%.fastq}
             sample=${sample%.fq}
             abs=$(readlink -f "$f")
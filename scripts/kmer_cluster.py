@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""Greedy k-mer clustering of COI amplicon reads without external tools.
+
+A self-contained alternative to ``NGSpeciesID`` + ``medaka``
+(``--cluster-method kmer``). For every filtered FASTQ:
+
+1. identical reads are collapsed and the distinct sequences are visited by
+   abundance, then by mean quality;
+2. each sequence is compared with the existing centroids that share the
+   most minimizers with it on either strand (``kmer_index.minimizers``), so
+   most read-vs-centroid comparisons are never made;
+3. the candidates are aligned exactly (Myers' edit distance) in that order
+   and the sequence joins the first one within ``--identity``; otherwise it
+   becomes a new centroid;
+4. the consensus of every cluster is built by aligning up to
+   ``--consensus-reads`` members to the centroid and taking the majority base,
+   deletion or insertion at each position, twice.
+
+The output has the ``NGSpeciesID`` layout, so unification and
+``add_reads_and_sample.py`` work unchanged::
+
+    <output_dir>/<sample>/consensus_reference_<i>.fasta
+        >consensus_cl_id_<i>_total_supporting_reads_<N>
+    <output_dir>/<sample>/final_clusters.tsv    cluster id, read id
+
+Only clusters with at least ``--support`` reads and ``--abundance-ratio`` of
+the sample get a consensus. Samples are clustered in parallel processes
+(``--jobs``).
+
+Usage:
+    python scripts/kmer_cluster.py <fastq>... --output-dir <dir> \
+        [--identity 0.9] [--support 150] [--jobs N]
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import math
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from collect_read_stats import FASTQ_SUFFIXES
+from dereplicate_reads import iter_records
+from fastq_io import fastq_stem
+from kmer_index import edit_distance, minimizers
+
+_COMPLEMENT = str.maketrans("ACGTacgt", "TGCAtgca")
+# Clusters of the first pass that seed the second one, and the identity
+# above which two seeds are considered the same sequence
+_SEED_SIZE = 3
+_SEED_IDENTITY = 0.98
+
+
+def revcomp(seq: str) -> str:
+    return seq.translate(_COMPLEMENT)[::-1]
+
+
+@dataclass
+class Cluster:
+    """A centroid and the distinct sequences assigned to it."""
+
+    centroid: str
+    members: list[tuple[str, int]] = field(default_factory=list)
+    read_ids: list[str] = field(default_factory=list)
+    size: int = 0
+
+
+def _identity(a: str, b: str) -> tuple[float, float]:
+    """Identity of the shorter sequence inside the longer and its coverage."""
+    pattern, text = sorted((a, b), key=len)
+    if not pattern:
+        return 0.0, 0.0
+    return 1 - edit_distance(pattern, text) / len(pattern), len(pattern) / len(text)
+
+
+def align_columns(reference: str, read: str) -> tuple[list[str], list[str]]:
+    """Global alignment of ``read`` against ``reference``.
+
+    Returns the read base (or ``"-"``) at every reference position and the
+    bases inserted before each position (``len(reference) + 1`` slots). Rows
+    of the edit-distance matrix are filled with numpy: the horizontal term is
+    a running minimum of ``min(diagonal, up) - j`` plus ``j``.
+    """
+    ref = np.frombuffer(reference.encode(), dtype=np.uint8)
+    n, m = len(reference), len(read)
+    cols = np.arange(n + 1)
+    matrix = np.empty((m + 1, n + 1), dtype=np.int32)
+    matrix[0] = cols
+    for i, base in enumerate(read.encode(), 1):
+        prev = matrix[i - 1]
+        best = np.empty(n + 1, dtype=np.int32)
+        best[0] = i
+        best[1:] = np.minimum(prev[:-1] + (ref != base), prev[1:] + 1)
+        matrix[i] = np.minimum.accumulate(best - cols) + cols
+
+    columns = ["-"] * n
+    inserts = [""] * (n + 1)
+    i, j = m, n
+    while i or j:
+        here = matrix[i, j]
+        if i and j and here == matrix[i - 1, j - 1] + (read[i - 1] != reference[j - 1]):
+            columns[j - 1] = read[i - 1]
+            i, j = i - 1, j - 1
+        elif i and here == matrix[i - 1, j] + 1:
+            inserts[j] = read[i - 1] + inserts[j]
+            i -= 1
+        else:
+            j -= 1
+    return columns, inserts
+
+
+def consensus(reference: str, reads: list[str], rounds: int = 2) -> str:
+    """Majority consensus of ``reads`` aligned to ``reference``."""
+    if len(reads) < 2:
+        return reference
+    for _ in range(rounds):
+        aligned = [align_columns(reference, read) for read in reads]
+        half = len(reads) / 2
+        out = []
+        for j in range(len(reference) + 1):
+            inserted = [inserts[j] for _, inserts in aligned if inserts[j]]
+            if len(inserted) > half:
+                out.append(Counter(inserted).most_common(1)[0][0])
+            if j < len(reference):
+                base = Counter(columns[j] for columns, _ in aligned).most_common(1)[0][0]
+                if base != "-":
+                    out.append(base)
+        updated = "".join(out)
+        if updated == reference:
+            break
+        reference = updated
+    return reference
+
+
+def greedy_clusters(
+    uniques: list[tuple[str, int, list[str]]],
+    identity: float = 0.9,
+    min_coverage: float = 0.9,
+    k: int = 13,
+    w: int = 8,
+    candidates: int = 5,
+    min_shared: float = 0.05,
+    seeds: list[str] = (),
+) -> list[Cluster]:
+    """Cluster ``(sequence, count, read_ids)`` in the given order.
+
+    ``seeds`` are centroids created before the first sequence is visited.
+    """
+    clusters: list[Cluster] = []
+    postings: dict[int, list[int]] = {}
+    for seed in seeds:
+        for key in minimizers(seed, k, w).tolist():
+            postings.setdefault(key, []).append(len(clusters))
+        clusters.append(Cluster(seed))
+    for seq, count, read_ids in uniques:
+        shared: Counter = Counter()
+        for strand, oriented in ((1, seq), (-1, revcomp(seq))):
+            found = minimizers(oriented, k, w).tolist()
+            needed = max(1, math.ceil(min_shared * len(found)))
+            counts = Counter(c for key in found for c in postings.get(key, ()))
+            for centroid, hits in counts.items():
+                if hits >= needed and hits > shared[(centroid, -strand)]:
+                    shared[(centroid, strand)] = hits
+                    shared.pop((centroid, -strand), None)
+        target = None
+        for (centroid, strand), _hits in shared.most_common(candidates):
+            oriented = seq if strand == 1 else revcomp(seq)
+            ident, coverage = _identity(clusters[centroid].centroid, oriented)
+            if ident >= identity and coverage >= min_coverage:
+                target = (centroid, oriented)
+                break
+        if target is None:
+            target = (len(clusters), seq)
+            clusters.append(Cluster(seq))
+            for key in minimizers(seq, k, w).tolist():
+                postings.setdefault(key, []).append(target[0])
+        cluster = clusters[target[0]]
+        cluster.members.append((target[1], count))
+        cluster.read_ids.extend(read_ids)
+        cluster.size += count
+    return clusters
+
+
+def read_uniques(fastq: str) -> tuple[int, list[tuple[str, int, list[str]]]]:
+    """Total reads and distinct sequences by abundance, then mean quality."""
+    index: dict[bytes, list] = {}
+    reads = 0
+    for _record, read_id, seq, qsum in iter_records(fastq):
+        reads += 1
+        entry = index.setdefault(seq, [0, 0.0, []])
+        entry[0] += 1
+        entry[1] = max(entry[1], qsum / len(seq) if seq else 0.0)
+        entry[2].append(read_id)
+    ordered = sorted(index.items(), key=lambda item: (-item[1][0], -item[1][1], item[0]))
+    return reads, [(seq.decode().upper(), count, ids) for seq, (count, _q, ids) in ordered]
+
+
+def _consensus_sample(cluster: Cluster, limit: int) -> list[str]:
+    """First ``limit`` member reads of ``cluster``, oriented as the centroid."""
+    sample: list[str] = []
+    for seq, count in cluster.members:
+        sample.extend([seq] * min(count, limit - len(sample)))
+        if len(sample) >= limit:
+            break
+    return sample
+
+
+def cluster_file(
+    fastq: str,
+    output_dir: str,
+    support: int = 150,
+    abundance_ratio: float = 0.01,
+    consensus_reads: int = 50,
+    **options,
+) -> tuple[str, int, int, int]:
+    """Cluster one FASTQ; return (sample, reads, clusters, consensus written)."""
+    name = fastq_stem(fastq)
+    outfolder = os.path.join(output_dir, name)
+    os.makedirs(outfolder, exist_ok=True)
+    for stale in glob.glob(os.path.join(outfolder, "consensus_reference_*.fasta")):
+        os.remove(stale)
+
+    reads, uniques = read_uniques(fastq)
+    # The first pass has noisy reads as centroids and splits some clusters;
+    # the consensus of its clusters seed a second pass over all sequences
+    seeds: list[str] = []
+    for cluster in sorted(greedy_clusters(uniques, **options), key=lambda c: -c.size):
+        if cluster.size < _SEED_SIZE:
+            break
+        sample = _consensus_sample(cluster, consensus_reads)
+        seed = consensus(cluster.centroid, sample, rounds=1)
+        if all(_identity(seed, other)[0] < _SEED_IDENTITY
+               and _identity(revcomp(seed), other)[0] < _SEED_IDENTITY for other in seeds):
+            seeds.append(seed)
+    clusters = [c for c in greedy_clusters(uniques, seeds=seeds, **options) if c.size]
+    min_size = max(support, math.ceil(abundance_ratio * reads))
+    written = 0
+    with open(os.path.join(outfolder, "final_clusters.tsv"), "w") as fh:
+        for cid, cluster in enumerate(clusters):
+            fh.writelines(f"{cid}\t{read_id}\n" for read_id in cluster.read_ids)
+            if cluster.size < min_size:
+                continue
+            sample = _consensus_sample(cluster, consensus_reads)
+            with open(os.path.join(outfolder, f"consensus_reference_{cid}.fasta"), "w") as out:
+                out.write(f">consensus_cl_id_{cid}_total_supporting_reads_{cluster.size}\n"
+                          f"{consensus(cluster.centroid, sample)}\n")
+            written += 1
+    return name, reads, len(clusters), written
+
+
+def _cluster_job(job: tuple[str, str, dict]) -> tuple[str, int, int, int]:
+    fastq, output_dir, options = job
+    return cluster_file(fastq, output_dir, **options)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("fastq", nargs="+", help="Filtered FASTQ files or directories.")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument(
+        "--identity",
+        type=float,
+        default=float(os.environ.get("KMER_CLUSTER_ID") or 0.9),
+        help="Read-to-centroid identity to join a cluster ($KMER_CLUSTER_ID, default 0.9).",
+    )
+    parser.add_argument(
+        "--support",
+        type=int,
+        default=int(os.environ.get("SUPPORT") or 150),
+        help="Minimum reads of a cluster with consensus ($SUPPORT, default 150).",
+    )
+    parser.add_argument(
+        "--abundance-ratio",
+        type=float,
+        default=float(os.environ.get("ABUND_RATIO") or 0.01),
+        help="Minimum fraction of the sample's reads ($ABUND_RATIO, default 0.01).",
+    )
+    parser.add_argument("--k", type=int, default=13, help="k-mer length of the sketches.")
+    parser.add_argument("--w", type=int, default=8, help="Minimizer window in k-mers.")
+    parser.add_argument(
+        "--candidates", type=int, default=5, help="Centroids aligned per sequence."
+    )
+    parser.add_argument(
+        "--consensus-reads", type=int, default=50, help="Reads aligned for each consensus."
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=int(os.environ.get("THREADS", 0)) or os.cpu_count() or 1,
+        help="Samples clustered at the same time ($THREADS or all cores).",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    """Entry point for command-line execution."""
+    args = parse_args(argv)
+    files = []
+    for path in args.fastq:
+        if os.path.isdir(path):
+            files += sorted(
+                f for f in glob.glob(os.path.join(path, "*")) if f.endswith(FASTQ_SUFFIXES)
+            )
+        elif path.endswith(FASTQ_SUFFIXES):
+            files.append(path)
+    options = {
+        "support": args.support,
+        "abundance_ratio": args.abundance_ratio,
+        "consensus_reads": args.consensus_reads,
+        "identity": args.identity,
+        "k": args.k,
+        "w": args.w,
+        "candidates": args.candidates,
+    }
+    jobs = [(path, args.output_dir, options) for path in files]
+    os.makedirs(args.output_dir, exist_ok=True)
+    if len(jobs) > 1 and args.jobs > 1:
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(jobs))) as pool:
+            results = list(pool.map(_cluster_job, jobs))
+    else:
+        results = [_cluster_job(job) for job in jobs]
+    print("sample\treads\tclusters\tconsensus")
+    for sample, reads, clusters, written in results:
+        print(f"{sample}\t{reads}\t{clusters}\t{written}")
+
+
+if __name__ == "__main__":
+    main()
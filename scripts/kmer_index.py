@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""Minimizer index of the reference database for fast taxonomy assignment.
+
+Most consensus sequences match a reference exactly or almost exactly, and
+BLAST is only needed for the rest. ``build`` writes an on-disk index of the
+reference sequences and their taxonomy once per database version::
+
+    <index_dir>/meta.json         k, w, checksums of the sources
+    <index_dir>/sequences.npy     concatenated reference sequences (ASCII)
+    <index_dir>/offsets.npy       start of each reference, plus the total
+    <index_dir>/keys.npy          sorted minimizer hashes
+    <index_dir>/refs.npy          reference of each entry of keys.npy
+    <index_dir>/ids.txt           reference IDs
+    <index_dir>/lineages.txt      distinct taxonomy strings
+    <index_dir>/lineage.npy       lineage of each reference
+
+The arrays are memory-mapped, so loading the index is immediate and several
+processes share the same pages. ``build`` does nothing when ``meta.json``
+already describes the same sources and parameters.
+
+``classify`` looks up the minimizers of each query (both strands), aligns
+the references that share the most of them and computes the edit distance
+of the shorter sequence against the longer one with Myers' bit-parallel
+algorithm. Identity is ``1 - distance / aligned length`` and coverage is the
+aligned fraction of the query. A query is assigned when its best reference
+clears ``--min-identity`` and ``--min-coverage`` and no reference with
+another lineage is within ``--margin`` of it; all other queries are ambiguous
+and go to ``unassigned.fasta`` for BLAST::
+
+    <output_dir>/taxonomy.tsv       Feature ID, Taxon, Consensus
+    <output_dir>/blast6.tsv         best hit of each assigned query
+    <output_dir>/unassigned.fasta   queries left for De3_A4_Classify_NGS.sh
+
+The reference sequences are read from a FASTA or a ``FeatureData[Sequence]``
+``.qza`` and the taxonomy from a TSV or a ``FeatureData[Taxonomy]`` ``.qza``.
+
+Usage:
+    python scripts/kmer_index.py build <ref_seqs.fasta|.qza> <taxonomy.tsv|.qza> <index_dir>
+    python scripts/kmer_index.py classify <index_dir> <consensos.fasta> <dir_salida>
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+from unify_consensus import read_fasta
+
+INDEX_VERSION = 1
+_CODES = np.full(256, 4, dtype=np.uint8)
+for _i, _base in enumerate(b"ACGT"):
+    _CODES[_base] = _i
+    _CODES[_base + 32] = _i
+_COMPLEMENT = str.maketrans("ACGTacgt", "TGCAtgca")
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _open_text(path: str, member: str) -> io.TextIOBase:
+    """Open ``path`` or, for a ``.qza``, its ``data/<member>``."""
+    if not path.endswith(".qza"):
+        return open(path)
+    archive = zipfile.ZipFile(path)
+    names = [name for name in archive.namelist() if name.endswith(f"/data/{member}")]
+    if not names:
+        raise ValueError(f"{path} no contiene data/{member}")
+    return io.TextIOWrapper(archive.open(names[0]), encoding="utf-8")
+
+
+def read_taxonomy(path: str) -> dict[str, str]:
+    """Feature ID to taxon from a taxonomy TSV or ``.qza``."""
+    with _open_text(path, "taxonomy.tsv") as fh:
+        return {row[0]: row[1] for row in csv.reader(fh, delimiter="\t")
+                if len(row) > 1 and row[0] != "Feature ID"}
+
+
+def _read_sequences(path: str) -> Iterator[tuple[str, str]]:
+    with _open_text(path, "dna-sequences.fasta") as fh:
+        name, chunks = None, []
+        for line in fh:
+            line = line.strip()
+            if line.startswith(">"):
+                if name is not None:
+                    yield name, "".join(chunks)
+                name, chunks = line[1:].split()[0], []
+            elif line:
+                chunks.append(line)
+        if name is not None:
+            yield name, "".join(chunks)
+
+
+def _checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def minimizers(seq: str, k: int, w: int) -> np.ndarray:
+    """Distinct (w, k)-minimizer hashes of ``seq``; k-mers with N are skipped."""
+    codes = _CODES[np.frombuffer(seq.encode(), dtype=np.uint8)]
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    kmers = np.zeros(n, dtype=np.uint64)
+    invalid = np.zeros(n, dtype=bool)
+    for j in range(k):
+        window = codes[j:j + n]
+        kmers = (kmers << np.uint64(2)) | (window & 3).astype(np.uint64)
+        invalid |= window == 4
+    hashes = kmers * _HASH_MULTIPLIER
+    hashes ^= hashes >> np.uint64(29)
+    hashes[invalid] = np.iinfo(np.uint64).max
+    if n > w:
+        hashes = np.lib.stride_tricks.sliding_window_view(hashes, w).min(axis=1)
+    else:
+        hashes = hashes[[hashes.argmin()]]
+    return np.unique(hashes[hashes != np.iinfo(np.uint64).max])
+
+
+def edit_distance(pattern: str, text: str) -> int:
+    """Fewest edits turning ``pattern`` into any substring of ``text``.
+
+    Myers' bit-parallel algorithm: one pass over ``text`` with the columns of
+    the dynamic-programming matrix packed in integers of ``len(pattern)``
+    bits.
+    """
+    m = len(pattern)
+    if not m:
+        return 0
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    peq: dict[str, int] = {}
+    for i, base in enumerate(pattern):
+        peq[base] = peq.get(base, 0) | (1 << i)
+    pv, mv, score = full, 0, m
+    best = m
+    for base in text:
+        eq = peq.get(base, 0)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & full) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = (ph << 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+        if score < best:
+            best = score
+    return best
+
+
+def build_index(
+    sequences: str,
+    taxonomy: str,
+    index_dir: str,
+    k: int = 15,
+    w: int = 10,
+    force: bool = False,
+) -> bool:
+    """Write the index of ``sequences``; return ``False`` if it was current."""
+    out = Path(index_dir)
+    meta = {
+        "version": INDEX_VERSION,
+        "k": k,
+        "w": w,
+        "sequences": _checksum(sequences),
+        "taxonomy": _checksum(taxonomy),
+    }
+    meta_path = out / "meta.json"
+    if not force and meta_path.exists():
+        current = json.loads(meta_path.read_text())
+        if {key: current.get(key) for key in meta} == meta:
+            return False
+    out.mkdir(parents=True, exist_ok=True)
+    meta_path.unlink(missing_ok=True)
+
+    taxa = read_taxonomy(taxonomy)
+    lineages: dict[str, int] = {}
+    ids, lineage, chunks, offsets = [], [], [], [0]
+    keys, refs = [], []
+    for name, seq in _read_sequences(sequences):
+        seq = seq.upper()
+        ref = len(ids)
+        ids.append(name)
+        lineage.append(lineages.setdefault(taxa.get(name, "Unassigned"), len(lineages)))
+        chunks.append(seq.encode())
+        offsets.append(offsets[-1] + len(seq))
+        found = minimizers(seq, k, w)
+        keys.append(found)
+        refs.append(np.full(len(found), ref, dtype=np.int32))
+    all_keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.uint64)
+    all_refs = np.concatenate(refs) if refs else np.zeros(0, dtype=np.int32)
+    order = np.argsort(all_keys, kind="stable")
+
+    np.save(out / "sequences.npy", np.frombuffer(b"".join(chunks), dtype=np.uint8))
+    np.save(out / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+    np.save(out / "keys.npy", all_keys[order])
+    np.save(out / "refs.npy", all_refs[order])
+    np.save(out / "lineage.npy", np.asarray(lineage, dtype=np.int32))
+    (out / "ids.txt").write_text("".join(f"{name}\n" for name in ids))
+    (out / "lineages.txt").write_text("".join(f"{taxon}\n" for taxon in lineages))
+    meta["references"] = len(ids)
+    meta_path.write_text(json.dumps(meta, indent=2) + "\n")
+    return True
+
+
+@dataclass
+class Assignment:
+    """Best reference of a query."""
+
+    reference: str
+    taxon: str
+    identity: float
+    coverage: float
+    length: int
+    edits: int
+
+
+class KmerIndex:
+    """Memory-mapped index written by :func:`build_index`."""
+
+    def __init__(self, index_dir: str) -> None:
+        path = Path(index_dir)
+        meta_path = path / "meta.json"
+        if not meta_path.exists():
+            raise FileNotFoundError(f"No existe el índice: {meta_path}")
+        self.meta = json.loads(meta_path.read_text())
+        self.k, self.w = self.meta["k"], self.meta["w"]
+        load = lambda name: np.load(path / name, mmap_mode="r")  # noqa: E731
+        self.sequences = load("sequences.npy")
+        self.offsets = load("offsets.npy")
+        self.keys = load("keys.npy")
+        self.refs = load("refs.npy")
+        self.lineage = load("lineage.npy")
+        self.ids = (path / "ids.txt").read_text().splitlines()
+        self.lineages = (path / "lineages.txt").read_text().splitlines()
+
+    def reference(self, ref: int) -> str:
+        return self.sequences[self.offsets[ref]:self.offsets[ref + 1]].tobytes().decode()
+
+    def shared(self, seq: str) -> tuple[np.ndarray, np.ndarray]:
+        """References sharing minimizers with ``seq`` and how many they share."""
+        found = minimizers(seq, self.k, self.w)
+        lo = np.searchsorted(self.keys, found, side="left")
+        hi = np.searchsorted(self.keys, found, side="right")
+        sizes = hi - lo
+        if not sizes.sum():
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+        starts = np.repeat(lo - np.cumsum(sizes) + sizes, sizes)
+        positions = starts + np.arange(sizes.sum())
+        return np.unique(self.refs[positions], return_counts=True)
+
+    def assign(
+        self,
+        seq: str,
+        min_identity: float = 0.99,
+        min_coverage: float = 0.95,
+        margin: float = 0.005,
+        candidates: int = 8,
+    ) -> Assignment | None:
+        """Assignment of ``seq`` or ``None`` if it needs BLAST."""
+        seq = seq.upper()
+        strands = []
+        for query in (seq, seq.translate(_COMPLEMENT)[::-1]):
+            refs, counts = self.shared(query)
+            strands.append((int(counts.max()) if len(counts) else 0, query, refs, counts))
+        _, query, refs, counts = max(strands, key=lambda strand: strand[0])
+        if not len(refs):
+            return None
+        top = refs[np.argsort(-counts, kind="stable")[:candidates]]
+        hits = []
+        for ref in top.tolist():
+            reference = self.reference(ref)
+            pattern, text = sorted((query, reference), key=len)
+            edits = edit_distance(pattern, text)
+            identity = 1 - edits / len(pattern)
+            hits.append((identity, len(pattern) / len(query), ref, len(pattern), edits))
+        hits.sort(key=lambda hit: (-hit[0], -hit[1], hit[2]))
+        identity, coverage, ref, length, edits = hits[0]
+        if identity < min_identity or coverage < min_coverage:
+            return None
+        lineage = self.lineage[ref]
+        if any(self.lineage[other] != lineage and other_identity >= identity - margin
+               for other_identity, _cov, other, _len, _ed in hits[1:]):
+            return None
+        return Assignment(self.ids[ref], self.lineages[lineage], identity, coverage, length, edits)
+
+
+def classify_fasta(
+    index: KmerIndex,
+    fasta: str,
+    output_dir: str,
+    **thresholds,
+) -> tuple[int, int]:
+    """Assign the sequences of ``fasta``; return (sequences, assigned)."""
+    out = Path(output_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    total = assigned = 0
+    with open(out / "taxonomy.tsv", "w") as taxonomy, \
+            open(out / "blast6.tsv", "w") as search, \
+            open(out / "unassigned.fasta", "w") as unassigned:
+        taxonomy.write("Feature ID\tTaxon\tConsensus\n")
+        for header, seq in read_fasta(fasta):
+            total += 1
+            fid = header.split()[0]
+            hit = index.assign(seq, **thresholds)
+            if hit is None:
+                unassigned.write(f">{header}\n{seq}\n")
+                continue
+            assigned += 1
+            taxonomy.write(f"{fid}\t{hit.taxon}\t1.0\n")
+            # BLAST6 columns; the alignment is summarised by its edits
+            search.write(
+                f"{fid}\t{hit.reference}\t{hit.identity * 100:.3f}\t{hit.length}\t"
+                f"{hit.edits}\t0\t1\t{hit.length}\t1\t{hit.length}\t0.0\t0.0\n"
+            )
+    return total, assigned
+
+
+def add_threshold_args(parser: argparse.ArgumentParser) -> None:
+    """Options for :meth:`KmerIndex.assign`, shared with ``classify_sharded``."""
+    parser.add_argument(
+        "--min-identity",
+        type=float,
+        default=float(os.environ.get("KMER_MIN_IDENTITY") or 0.99),
+        help="Identity needed to assign without BLAST ($KMER_MIN_IDENTITY, default 0.99).",
+    )
+    parser.add_argument(
+        "--min-coverage",
+        type=float,
+        default=float(os.environ.get("KMER_MIN_COVERAGE") or 0.95),
+        help="Query coverage needed ($KMER_MIN_COVERAGE, default 0.95).",
+    )
+    parser.add_argument(
+        "--margin",
+        type=float,
+        default=float(os.environ.get("KMER_MARGIN") or 0.005),
+        help="Identity gap to the best hit of another lineage ($KMER_MARGIN, default 0.005).",
+    )
+
+
+def thresholds(args: argparse.Namespace) -> dict:
+    """Keyword arguments of :meth:`KmerIndex.assign` from parsed options."""
+    return {"min_identity": args.min_identity, "min_coverage": args.min_coverage,
+            "margin": args.margin}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Build the index of a reference database.")
+    build.add_argument("sequences", help="Reference FASTA or FeatureData[Sequence] .qza.")
+    build.add_argument("taxonomy", help="Reference taxonomy TSV or .qza.")
+    build.add_argument("index_dir")
+    build.add_argument("--k", type=int, default=15, help="k-mer length (max 32).")
+    build.add_argument("--w", type=int, default=10, help="Minimizer window in k-mers.")
+    build.add_argument("--force", action="store_true", help="Rebuild even if current.")
+
+    classify = sub.add_parser("classify", help="Assign near-exact matches.")
+    classify.add_argument("index_dir")
+    classify.add_argument("fasta")
+    classify.add_argument("output_dir")
+    add_threshold_args(classify)
+    args = parser.parse_args(argv)
+    if args.command == "build" and not 0 < args.k <= 32:
+        parser.error("--k debe estar entre 1 y 32")
+    return args
+
+
+def main(argv=None) -> None:
+    """Entry point for command-line execution."""
+    args = parse_args(argv)
+    if args.command == "build":
+        if build_index(args.sequences, args.taxonomy, args.index_dir, args.k, args.w, args.force):
+            print(f"Índice creado en {args.index_dir}")
+        else:
+            print(f"El índice {args.index_dir} ya está actualizado")
+    else:
+        total, assigned = classify_fasta(
+            KmerIndex(args.index_dir), args.fasta, args.output_dir, **thresholds(args)
+        )
+        print(f"Asignadas {assigned} de {total} secuencias; "
+              f"{total - assigned} pendientes en {Path(args.output_dir) / 'unassigned.fasta'}")
+
+
+if __name__ == "__main__":
+    main()
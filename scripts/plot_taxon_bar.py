@@ -5,9 +5,11 @@ Usage:
     python scripts/plot_taxon_bar.py <collapsed.tsv> <output.png>
     python scripts/plot_taxon_bar.py <collapsed.tsv> <output.png> --code-samples
 
-The input file must be the table produced by ``collapse_reads_by_species.py``.
-This table contains blocks starting with ``Sample: <name>`` followed by lines
-``Species<TAB>Reads<TAB>Proportion``. When ``--code-samples`` is provided,
+The input file must be produced by ``collapse_reads_by_species.py``: either
+the text table with blocks starting with ``Sample: <name>`` followed by lines
+``Species<TAB>Reads<TAB>Proportion``, or one of its ``--output-prefix`` files
+(``.matrix.npz``, ``.matrix.tsv``, ``.long.tsv`` or ``.long.parquet``), which
+are loaded directly as a sample x taxon matrix. When ``--code-samples`` is provided,
 samples are replaced by sequential codes (M1, M2, ...) and the mapping is
 written to ``<output>.sample_map.tsv``. Taxa are preserved as they appear in the
 collapsed table and a mapping to codes (T1, T2, ...) is saved to
@@ -20,8 +22,12 @@ import argparse
 from pathlib import Path
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 
+from clipon_profiling import add_profile_argument, phase, profile, profiling_enabled
+from fastq_io import fastq_stem
+
 
 KNOWN_PREFIXES = ["cleaned_", "filtered_", "trimmed_"]
 KNOWN_SUFFIXES = ["_trimmed", "_filtered", "_cleaned"]
@@ -54,8 +60,8 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "input",
         help=(
-            "Table generated by collapse_reads_by_species.py with blocks "
-            "per sample"
+            "Table generated by collapse_reads_by_species.py (text blocks "
+            "or a .matrix/.long output)"
         ),
     )
     parser.add_argument("output", help="Path for the generated PNG plot")
@@ -71,6 +77,7 @@ def parse_args() -> argparse.Namespace:
         "--metadata",
         help="TSV/CSV with columns 'fastq' and 'experiment' to rename samples",
     )
+    add_profile_argument(parser)
     return parser.parse_args()
 
 
@@ -86,10 +93,8 @@ def read_collapsed_table(path: Path) -> pd.DataFrame:
             if line.startswith("Sample:"):
                 sample = line.split("Sample:", 1)[1].strip()
                 continue
-            if line.startswith("Species"):
-                continue
             parts = line.split("\t")
-            if len(parts) != 3 or sample is None:
+            if len(parts) != 3 or sample is None or parts[1] == "Reads":
                 continue
             species, reads, proportion = parts
             try:
@@ -111,50 +116,95 @@ def read_collapsed_table(path: Path) -> pd.DataFrame:
     return pd.DataFrame(rows)
 
 
+def _long_to_matrix(long: pd.DataFrame) -> pd.DataFrame:
+    """Return the Sample x Taxon read matrix of a long Sample/Taxon/Reads table."""
+    matrix = long.pivot_table(
+        index="Sample", columns="Taxon", values="Reads", aggfunc="sum", fill_value=0
+    )
+    matrix.columns.name = None
+    return matrix
+
+
+def read_counts(path: Path) -> pd.DataFrame:
+    """Return read counts as a DataFrame indexed by sample with one column per taxon.
+
+    Structured outputs of ``collapse_reads_by_species.py --output-prefix`` are
+    loaded as they are; any other file is parsed as the text block table.
+    """
+    if path.suffix == ".npz":
+        with np.load(path) as npz:
+            return pd.DataFrame(
+                npz["counts"],
+                index=pd.Index(npz["samples"].tolist(), name="Sample"),
+                columns=npz["taxa"].tolist(),
+            )
+    if path.suffix == ".parquet":
+        return _long_to_matrix(pd.read_parquet(path))
+    with path.open() as fh:
+        header = fh.readline().rstrip("\n").split("\t")
+    if header[:3] == ["Sample", "Taxon", "Reads"]:
+        return _long_to_matrix(pd.read_csv(path, sep="\t", dtype={"Sample": str}))
+    if header[0] == "Sample" and len(header) > 1:
+        return pd.read_csv(path, sep="\t", index_col="Sample", dtype={"Sample": str})
+    data = read_collapsed_table(path)
+    if data.empty:
+        return pd.DataFrame()
+    return _long_to_matrix(data)
+
+
 def main() -> None:
     args = parse_args()
     in_path = Path(args.input)
     out_path = Path(args.output)
 
-    data = read_collapsed_table(in_path)
-
-    mapping: dict[str, str] = {}
-    if args.metadata:
-        meta = pd.read_csv(args.metadata, sep="\t", dtype=str)
-        meta["fastq"] = meta["fastq"].apply(lambda x: Path(x).stem)
-        mapping = dict(zip(meta["fastq"], meta["experiment"]))
-    data["Sample"] = data["Sample"].map(lambda s: rename_sample(s, mapping))
-
-    if data.empty:
-        raise ValueError("No valid reads found in input file")
-
-    if args.code_samples:
-        samples = sorted(data["Sample"].unique())
-        sample_map = {sample: f"M{i+1}" for i, sample in enumerate(samples)}
-        map_df = pd.DataFrame(
-            {"code": list(sample_map.values()), "sample": samples}
-        )
-        map_path = out_path.with_suffix(out_path.suffix + ".sample_map.tsv")
-        map_df.to_csv(map_path, sep="\t", index=False)
-        data["Sample"] = data["Sample"].map(sample_map)
-
-    taxa = sorted(data["Taxon"].unique())
-    taxon_map = {taxon: f"T{i+1}" for i, taxon in enumerate(taxa)}
-    map_df = pd.DataFrame({"code": list(taxon_map.values()), "taxon": taxa})
-    map_path = out_path.with_suffix(out_path.suffix + ".taxon_map.tsv")
-    map_df.to_csv(map_path, sep="\t", index=False)
-
-    pivot = data.pivot(index="Sample", columns="Taxon", values="Percent")
-    pivot = pivot.fillna(0)
-
-    ax = pivot.plot(kind="bar", stacked=True, figsize=(8, 5))
-    ax.set_ylabel("Proportion of reads")
-    xlabel = "Sample code" if args.code_samples else "Sample"
-    ax.set_xlabel(xlabel)
-
-    ax.legend(title="Taxon")
-    plt.tight_layout()
-    plt.savefig(out_path, dpi=300)
+    with profile(out_path, profiling_enabled(args.profile)):
+        with phase("load"):
+            counts = read_counts(in_path)
+            mapping: dict[str, str] = {}
+            if args.metadata:
+                meta = pd.read_csv(args.metadata, sep="\t", dtype=str)
+                meta["fastq"] = meta["fastq"].apply(fastq_stem)
+                mapping = dict(zip(meta["fastq"], meta["experiment"]))
+        if counts.empty or not counts.to_numpy().any():
+            raise ValueError("No valid reads found in input file")
+
+        with phase("transform"):
+            counts.index = [rename_sample(str(s), mapping) for s in counts.index]
+            # Samples renamed to the same experiment are merged before normalising.
+            counts = counts.groupby(level=0).sum()
+            samples = list(counts.index)
+            sample_map = {sample: f"M{i+1}" for i, sample in enumerate(samples)}
+            if args.code_samples:
+                counts.index = [sample_map[s] for s in samples]
+
+            counts = counts.loc[:, counts.sum(axis=0) > 0].sort_index(axis=1)
+            taxa = list(counts.columns)
+            taxon_map = {taxon: f"T{i+1}" for i, taxon in enumerate(taxa)}
+
+            totals = counts.sum(axis=1).replace(0, 1)
+            proportions = counts.div(totals, axis=0)
+            proportions.index.name = "Sample"
+
+        with phase("write"):
+            if args.code_samples:
+                map_df = pd.DataFrame(
+                    {"code": list(sample_map.values()), "sample": samples}
+                )
+                map_path = out_path.with_suffix(out_path.suffix + ".sample_map.tsv")
+                map_df.to_csv(map_path, sep="\t", index=False)
+            map_df = pd.DataFrame({"code": list(taxon_map.values()), "taxon": taxa})
+            map_path = out_path.with_suffix(out_path.suffix + ".taxon_map.tsv")
+            map_df.to_csv(map_path, sep="\t", index=False)
+
+        with phase("render"):
+            ax = proportions.plot(kind="bar", stacked=True, figsize=(8, 5))
+            ax.set_ylabel("Proportion of reads")
+            xlabel = "Sample code" if args.code_samples else "Sample"
+            ax.set_xlabel(xlabel)
+
+            ax.legend(title="Taxon")
+            plt.tight_layout()
+            plt.savefig(out_path, dpi=300)
     print(out_path.resolve())
 
 
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Rarefaction curves and alpha diversity per sample.
+
+Reads the per-sample taxon counts of ``taxonomy_with_sample.tsv`` through
+``collapse_reads_by_species.collapse_by_species`` and, for every sample and
+every depth of a grid, draws ``--replicates`` rarefied subsamples at once
+(one multivariate hypergeometric call per depth). Richness, Shannon
+(natural log) and Gini-Simpson indices are computed over all depths and
+replicates of a sample in one vectorized pass::
+
+    <output_dir>/rarefaction.tsv    sample, depth, replicates and mean/sd per index
+    <output_dir>/rarefaction.png    one curve per sample and index
+
+Depths above the reads of a sample are omitted for that sample. The
+generator of each sample is seeded with ``--seed`` and the sample name, so
+results do not depend on ``--jobs`` or on the order of the samples.
+
+Usage:
+    python scripts/rarefaction.py taxonomy_with_sample.tsv --output-dir <dir> \
+        [--rank species] [--depths 100 500 1000 | --steps 20] [--replicates 100] \
+        [--jobs 4] [--no-plot]
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from collapse_reads_by_species import collapse_by_species
+from taxonomy import RANKS
+
+TABLE_NAME = "rarefaction.tsv"
+PLOT_NAME = "rarefaction.png"
+INDICES = ("richness", "shannon", "simpson")
+
+
+def depth_grid(totals, steps: int = 20) -> np.ndarray:
+    """Return ``steps`` evenly spaced integer depths up to the deepest sample."""
+    deepest = int(max(totals, default=0))
+    if deepest <= 0:
+        return np.zeros(0, dtype=np.int64)
+    grid = np.linspace(0, deepest, steps + 1)[1:].round().astype(np.int64)
+    return np.unique(grid[grid > 0])
+
+
+def rarefy(
+    counts: np.ndarray, depths: np.ndarray, replicates: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Return rarefied counts of shape ``(depths, replicates, taxa)``.
+
+    Depths above ``counts.sum()`` must be filtered out by the caller.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    draws = np.empty((len(depths), replicates, len(counts)), dtype=np.int64)
+    for i, depth in enumerate(depths):
+        draws[i] = rng.multivariate_hypergeometric(counts, int(depth), size=replicates)
+    return draws
+
+
+def alpha_diversity(draws: np.ndarray) -> dict[str, np.ndarray]:
+    """Richness, Shannon and Gini-Simpson of counts along the last axis."""
+    totals = draws.sum(axis=-1, keepdims=True)
+    p = draws / np.where(totals > 0, totals, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_p = np.where(p > 0, np.log(p), 0.0)
+    return {
+        "richness": (draws > 0).sum(axis=-1).astype(float),
+        "shannon": -(p * log_p).sum(axis=-1),
+        "simpson": 1.0 - (p * p).sum(axis=-1),
+    }
+
+
+def sample_curves(
+    sample: str, counts, depths, replicates: int = 100, seed: int = 42
+) -> list[dict[str, object]]:
+    """Rarefy one sample at every depth it reaches and summarize each index."""
+    counts = np.asarray(counts, dtype=np.int64)
+    depths = np.asarray(depths, dtype=np.int64)
+    depths = depths[depths <= counts.sum()]
+    if not len(depths):
+        return []
+    rng = np.random.default_rng([seed, zlib.crc32(sample.encode())])
+    indices = alpha_diversity(rarefy(counts, depths, replicates, rng))
+    means = {name: values.mean(axis=1) for name, values in indices.items()}
+    sds = {name: values.std(axis=1) for name, values in indices.items()}
+    rows = []
+    for i, depth in enumerate(depths.tolist()):
+        row: dict[str, object] = {"sample": sample, "depth": depth, "replicates": replicates}
+        for name in INDICES:
+            row[f"{name}_mean"] = float(means[name][i])
+            row[f"{name}_sd"] = float(sds[name][i])
+        rows.append(row)
+    return rows
+
+
+def _curves_job(job) -> list[dict[str, object]]:
+    return sample_curves(*job)
+
+
+def rarefaction_table(
+    data: dict[str, dict[str, int]],
+    depths,
+    replicates: int = 100,
+    seed: int = 42,
+    jobs: int = 1,
+) -> list[dict[str, object]]:
+    """Curves of every sample in ``data``, optionally in a process pool."""
+    work = [
+        (sample, list(data[sample].values()), depths, replicates, seed)
+        for sample in sorted(data)
+    ]
+    if jobs > 1 and len(work) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(work))) as pool:
+            results = list(pool.map(_curves_job, work))
+    else:
+        results = [_curves_job(job) for job in work]
+    return [row for rows in results for row in rows]
+
+
+def write_table(rows: list[dict[str, object]], path: Path) -> None:
+    """Write the curves as a TSV with six significant decimals."""
+    columns = ["sample", "depth", "replicates"]
+    columns += [f"{name}_{stat}" for name in INDICES for stat in ("mean", "sd")]
+    with path.open("w", newline="") as fh:
+        writer = csv.writer(fh, delimiter="\t", lineterminator="\n")
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(
+                f"{row[c]:.6g}" if isinstance(row[c], float) else row[c] for c in columns
+            )
+
+
+def plot_curves(rows: list[dict[str, object]], path: Path) -> None:
+    """Plot mean +/- sd of each index against depth, one line per sample."""
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(1, len(INDICES), figsize=(4 * len(INDICES), 4))
+    samples = sorted({row["sample"] for row in rows})
+    for ax, name in zip(axes, INDICES):
+        for sample in samples:
+            points = [row for row in rows if row["sample"] == sample]
+            depth = np.array([row["depth"] for row in points])
+            mean = np.array([row[f"{name}_mean"] for row in points])
+            sd = np.array([row[f"{name}_sd"] for row in points])
+            ax.plot(depth, mean, label=sample)
+            ax.fill_between(depth, mean - sd, mean + sd, alpha=0.2)
+        ax.set_xlabel("Reads")
+        ax.set_title(name.capitalize())
+    axes[0].legend(fontsize="small")
+    fig.tight_layout()
+    fig.savefig(path, dpi=300)
+    plt.close(fig)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("tsv", type=Path, help="taxonomy_with_sample.tsv table")
+    parser.add_argument("--output-dir", type=Path, required=True)
+    parser.add_argument("--rank", choices=RANKS, default="species")
+    grid = parser.add_mutually_exclusive_group()
+    grid.add_argument("--depths", type=int, nargs="+", help="Explicit depths in reads")
+    grid.add_argument(
+        "--steps", type=int, default=20,
+        help="Evenly spaced depths up to the deepest sample (default: 20)",
+    )
+    parser.add_argument("--replicates", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--jobs", type=int, default=1, help="Samples processed in parallel")
+    parser.add_argument("--no-plot", action="store_true", help="Only write the table")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    """Entry point for command-line execution."""
+    args = parse_args(argv)
+    if not args.tsv.is_file():
+        print(f"File not found: {args.tsv}", file=sys.stderr)
+        sys.exit(1)
+    data = collapse_by_species(args.tsv, args.rank)
+    if args.depths:
+        depths = np.unique(np.array(args.depths, dtype=np.int64))
+    else:
+        depths = depth_grid([sum(counts.values()) for counts in data.values()], args.steps)
+    rows = rarefaction_table(data, depths, args.replicates, args.seed, args.jobs)
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    table = args.output_dir / TABLE_NAME
+    write_table(rows, table)
+    print(table)
+    if not args.no_plot and rows:
+        plot = args.output_dir / PLOT_NAME
+        plot_curves(rows, plot)
+        print(plot)
+
+
+if __name__ == "__main__":
+    main()
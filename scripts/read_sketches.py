@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""Mergeable streaming summaries of read length and quality.
+
+The sketches in this module are filled block by block while
+``collect_read_stats.py`` scans a FASTQ and use memory that does not depend on
+the number of reads. Sketches built from different chunks of a file or by
+different worker processes can be merged:
+
+* read lengths are kept as an exact count per length, so length quantiles,
+  N50 and totals are exact after merging;
+* mean read qualities go into a fixed-bin histogram, so quality quantiles are
+  reported as bin midpoints and are within ``quality_bin / 2`` of the true
+  value;
+* per-base error probabilities are accumulated as exact sums.
+
+Usage:
+    python scripts/read_sketches.py merge OUTPUT_JSON INPUT_JSON [INPUT_JSON ...]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+
+import numpy as np
+
+QUANTILES = {"p5": 0.05, "median": 0.5, "p95": 0.95}
+
+
+def _add_counts(counts: np.ndarray, other: np.ndarray) -> np.ndarray:
+    """Return ``counts + other`` growing ``counts`` when ``other`` is longer."""
+    if len(other) > len(counts):
+        other = other.copy()
+        other[: len(counts)] += counts
+        return other
+    counts[: len(other)] += other
+    return counts
+
+
+def _rank_index(cumulative: np.ndarray, q: float) -> int:
+    """Index of the nearest-rank ``q`` quantile given cumulative counts."""
+    total = cumulative[-1]
+    rank = max(1, math.ceil(q * total))
+    return int(np.searchsorted(cumulative, rank))
+
+
+class ExactCounter:
+    """Count of reads per non-negative integer value (e.g. read length)."""
+
+    def __init__(self, counts: np.ndarray | None = None) -> None:
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else counts
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    @property
+    def value_sum(self) -> int:
+        return int(np.dot(np.arange(len(self.counts)), self.counts))
+
+    def update(self, values: np.ndarray) -> None:
+        if len(values):
+            self.counts = _add_counts(self.counts, np.bincount(values))
+
+    def merge(self, other: "ExactCounter") -> None:
+        self.counts = _add_counts(self.counts, other.counts)
+
+    def quantile(self, q: float) -> int:
+        """Nearest-rank quantile; exact."""
+        return _rank_index(np.cumsum(self.counts), q)
+
+    def n50(self) -> int:
+        """Value such that reads at least this long hold half of the sum."""
+        weighted = np.arange(len(self.counts)) * self.counts
+        total = weighted.sum()
+        if not total:
+            return 0
+        from_largest = np.cumsum(weighted[::-1])
+        return len(self.counts) - 1 - int(np.searchsorted(from_largest, total / 2))
+
+    def to_dict(self) -> dict:
+        nonzero = np.flatnonzero(self.counts)
+        return {"values": nonzero.tolist(), "counts": self.counts[nonzero].tolist()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ExactCounter":
+        values = np.asarray(data["values"], dtype=np.int64)
+        counts = np.zeros(values.max() + 1 if len(values) else 0, dtype=np.int64)
+        counts[values] = data["counts"]
+        return cls(counts)
+
+
+class FixedBinHistogram:
+    """Histogram over ``[0, upper)`` with equal-width bins.
+
+    Values below zero go to the first bin and values at or above ``upper`` to
+    the last one. Quantiles are bin midpoints, so their error is at most
+    ``bin_width / 2`` for values inside the range.
+    """
+
+    def __init__(self, bin_width: float = 0.01, upper: float = 60.0) -> None:
+        self.bin_width = bin_width
+        self.upper = upper
+        self.counts = np.zeros(int(round(upper / bin_width)), dtype=np.int64)
+
+    @property
+    def error_bound(self) -> float:
+        return self.bin_width / 2
+
+    def update(self, values: np.ndarray) -> None:
+        if not len(values):
+            return
+        idx = np.clip(
+            np.floor(values / self.bin_width).astype(np.int64), 0, len(self.counts) - 1
+        )
+        self.counts += np.bincount(idx, minlength=len(self.counts))
+
+    def merge(self, other: "FixedBinHistogram") -> None:
+        if (self.bin_width, self.upper) != (other.bin_width, other.upper):
+            raise ValueError("Cannot merge histograms with different bins")
+        self.counts += other.counts
+
+    def quantile(self, q: float) -> float:
+        idx = _rank_index(np.cumsum(self.counts), q)
+        return (idx + 0.5) * self.bin_width
+
+    def to_dict(self) -> dict:
+        nonzero = np.flatnonzero(self.counts)
+        return {
+            "bin_width": self.bin_width,
+            "upper": self.upper,
+            "bins": nonzero.tolist(),
+            "counts": self.counts[nonzero].tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FixedBinHistogram":
+        histogram = cls(data["bin_width"], data["upper"])
+        histogram.counts[np.asarray(data["bins"], dtype=np.int64)] = data["counts"]
+        return histogram
+
+
+class ReadStatsSketch:
+    """Per-sample length and quality distribution built in one pass."""
+
+    def __init__(self, quality_bin: float = 0.01, max_quality: float = 60.0) -> None:
+        self.lengths = ExactCounter()
+        self.qualities = FixedBinHistogram(quality_bin, max_quality)
+        self.quality_sum = 0.0
+        self.error_sum = 0.0
+        self.quality_bases = 0
+
+    @property
+    def reads(self) -> int:
+        return self.lengths.total
+
+    @property
+    def bases(self) -> int:
+        return self.lengths.value_sum
+
+    def update(
+        self,
+        lengths: np.ndarray,
+        mean_qualities: np.ndarray,
+        error_sums: np.ndarray,
+        quality_lengths: np.ndarray,
+    ) -> None:
+        """Add one block of reads.
+
+        ``error_sums`` holds the summed per-base error probability of each
+        read and ``quality_lengths`` the number of quality characters.
+        """
+        self.lengths.update(lengths)
+        self.qualities.update(mean_qualities)
+        self.quality_sum += float(mean_qualities.sum())
+        self.error_sum += float(error_sums.sum())
+        self.quality_bases += int(quality_lengths.sum())
+
+    def merge(self, other: "ReadStatsSketch") -> None:
+        self.lengths.merge(other.lengths)
+        self.qualities.merge(other.qualities)
+        self.quality_sum += other.quality_sum
+        self.error_sum += other.error_sum
+        self.quality_bases += other.quality_bases
+
+    def summary(self) -> dict:
+        """Return the QC statistics reported by ``--summary-json``."""
+        reads = self.reads
+        result: dict = {"reads": reads, "bases": self.bases, "n50": self.lengths.n50()}
+        if not reads:
+            return result
+        result["length"] = {
+            "min": int(np.flatnonzero(self.lengths.counts)[0]),
+            "max": len(self.lengths.counts) - 1,
+            "mean": self.bases / reads,
+            **{name: self.lengths.quantile(q) for name, q in QUANTILES.items()},
+        }
+        result["mean_quality"] = {
+            "mean": self.quality_sum / reads,
+            **{name: self.qualities.quantile(q) for name, q in QUANTILES.items()},
+            "error_bound": self.qualities.error_bound,
+        }
+        if self.quality_bases:
+            error = self.error_sum / self.quality_bases
+            result["mean_error_probability"] = error
+            result["mean_error_quality"] = -10 * math.log10(error) if error else None
+        return result
+
+    def to_dict(self) -> dict:
+        """Serialise the mergeable state, including the derived summary."""
+        return {
+            "summary": self.summary(),
+            "state": {
+                "lengths": self.lengths.to_dict(),
+                "qualities": self.qualities.to_dict(),
+                "quality_sum": self.quality_sum,
+                "error_sum": self.error_sum,
+                "quality_bases": self.quality_bases,
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ReadStatsSketch":
+        state = data["state"]
+        sketch = cls()
+        sketch.lengths = ExactCounter.from_dict(state["lengths"])
+        sketch.qualities = FixedBinHistogram.from_dict(state["qualities"])
+        sketch.quality_sum = state["quality_sum"]
+        sketch.error_sum = state["error_sum"]
+        sketch.quality_bases = state["quality_bases"]
+        return sketch
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w") as fh:
+            json.dump(self.to_dict(), fh, indent=2)
+            fh.write("\n")
+
+    @classmethod
+    def read_json(cls, path: str) -> "ReadStatsSketch":
+        with open(path) as fh:
+            return cls.from_dict(json.load(fh))
+
+
+def merge_sketch_files(paths: list[str]) -> ReadStatsSketch:
+    """Merge the sketches stored in ``paths`` into a new sketch."""
+    merged = ReadStatsSketch()
+    for path in paths:
+        merged.merge(ReadStatsSketch.read_json(path))
+    return merged
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest="command", required=True)
+    merge = sub.add_parser("merge", help="Combine several --summary-json files.")
+    merge.add_argument("output", help="Path of the merged JSON file.")
+    merge.add_argument("inputs", nargs="+", help="JSON files to merge.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Entry point for command-line execution."""
+    args = parse_args()
+    if args.command == "merge":
+        merge_sketch_files(args.inputs).write_json(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -77,8 +77,10 @@ classify_reads() {
         echo "Advertencia: BLAST_DB o TAXONOMY_DB no están definidos. Omitiendo clasificación."
         return 0
     fi
+    # Cada secuencia distinta se clasifica una sola vez; la exportación
+    # reparte el resultado entre las muestras con consensus_map.tsv
     bash scripts/De3_A4_Classify_NGS.sh \
-        "$UNIFIED_DIR/consensos_todos.fasta" \
+        "$UNIFIED_DIR/consensos_unicos.fasta" \
         "$UNIFIED_DIR" \
         "$BLAST_DB" \
         "$TAXONOMY_DB"
@@ -152,7 +154,8 @@ if [ "$MODE" = "new" ] || [ "${RESUME_STEP:-1}" -le 1 ]; then
             continue
         fi
         shopt -s nullglob
-        fastqs=("$INPUT_DIR"/*.fastq "$INPUT_DIR"/*.fq)
+        fastqs=("$INPUT_DIR"/*.fastq "$INPUT_DIR"/*.fq \
+                "$INPUT_DIR"/*.fastq.gz "$INPUT_DIR"/*.fq.gz)
         shopt -u nullglob
         if [ ${#fastqs[@]} -eq 0 ]; then
             echo "No se encontraron archivos FASTQ en '$INPUT_DIR'. Intente nuevamente."
@@ -495,9 +498,10 @@ TAX_PLOT_FILE="N/A"
 if command -v python >/dev/null 2>&1; then
     COLLAPSED_TAX="$UNIFIED_DIR/Results/species_reads.tsv"
     python scripts/collapse_reads_by_species.py \
-        "$UNIFIED_DIR/Results/taxonomy_with_sample.tsv" > "$COLLAPSED_TAX"
+        "$UNIFIED_DIR/Results/taxonomy_with_sample.tsv" \
+        --output-prefix "$UNIFIED_DIR/Results/species_reads" > "$COLLAPSED_TAX"
     TAX_PLOT_FILE=$(python scripts/plot_taxon_bar.py \
-        "$COLLAPSED_TAX" \
+        "$UNIFIED_DIR/Results/species_reads.matrix.npz" \
         "$UNIFIED_DIR/Results/taxon_stacked_bar.png" \
         ${METADATA_FILE:+--metadata "$METADATA_FILE"} --code-samples 2>&1 | \
 
@@ -2,11 +2,15 @@
 set -euo pipefail
 
 # Wrapper para ejecutar la cadena completa de procesamiento de ClipON
-# Uso: ./run_clipon_pipeline.sh [--metadata <archivo>] [--cluster-method <ngspecies|vsearch>] <dir_fastq_entrada> <dir_trabajo>
+# Uso: ./run_clipon_pipeline.sh [--metadata <archivo>] [--cluster-method <ngspecies|vsearch|kmer>] [--fused] [--parallel] <dir_fastq_entrada> <dir_trabajo>
 # El directorio de trabajo contendrá subcarpetas para cada etapa
 
 # Para un gráfico avanzado de la calidad de lectura combine los TSV generados en cada etapa (collect_read_stats.py):
 # Rscript scripts/read_quality_poster.R "ruta/etapa1.tsv,ruta/etapa2.tsv" salida.png
+# Con STATS_MODE=summary se generan histogramas (*_summary.tsv) mucho más pequeños.
+# Los FASTQ de entrada pueden estar comprimidos (.fastq.gz). Con
+# CLIPON_COMPRESS=bgzip los FASTQ intermedios de 1_processed, 2_trimmed y
+# 3_filtered se guardan con bgzip (nivel CLIPON_COMPRESS_LEVEL, 6 por defecto).
 
 
 # Determinar la raíz del repositorio y usar rutas relativas
@@ -25,6 +29,10 @@ fi
 
 CLUSTER_METHOD="${CLUSTER_METHOD:-ngspecies}"
 METADATA_FILE=""
+# Limpieza, recorte y filtrado en una sola lectura (scripts/clean_trim_filter.py)
+FUSED_PREP="${FUSED_PREP:-0}"
+# Ejecutar las muestras en paralelo con scripts/clipon_orchestrator.py
+PARALLEL="${PARALLEL:-0}"
 while [[ $# -gt 0 ]]; do
     case "$1" in
         --metadata)
@@ -35,6 +43,14 @@ while [[ $# -gt 0 ]]; do
             CLUSTER_METHOD="${2:-ngspecies}"
             shift 2
             ;;
+        --fused)
+            FUSED_PREP=1
+            shift
+            ;;
+        --parallel)
+            PARALLEL=1
+            shift
+            ;;
         *)
             break
             ;;
@@ -42,10 +58,16 @@ while [[ $# -gt 0 ]]; do
 done
 
 if [ "$#" -ne 2 ]; then
-    echo "Uso: $0 [--metadata <archivo>] [--cluster-method <ngspecies|vsearch>] <dir_fastq_entrada> <dir_trabajo>"
+    echo "Uso: $0 [--metadata <archivo>] [--cluster-method <ngspecies|vsearch|kmer>] [--fused] [--parallel] <dir_fastq_entrada> <dir_trabajo>"
     exit 1
 fi
 
+if [ "$PARALLEL" -eq 1 ]; then
+    exec python3 scripts/clipon_orchestrator.py \
+        --cluster-method "$CLUSTER_METHOD" \
+        ${METADATA_FILE:+--metadata "$METADATA_FILE"} "$1" "$2"
+fi
+
 INPUT_DIR="${1%/}"
 WORK_DIR="${2%/}"
 
@@ -55,6 +77,13 @@ TRIM_FRONT="${TRIM_FRONT:-30}"
 TRIM_BACK="${TRIM_BACK:-30}"
 RESUME_STEP="${RESUME_STEP:-1}"
 CLUSTER_METHOD="${CLUSTER_METHOD:-ngspecies}"
+# "summary" guarda histogramas longitud x calidad en lugar de TSV por lectura
+export STATS_MODE="${STATS_MODE:-reads}"
+if [ "$STATS_MODE" = "summary" ]; then
+    STATS_SUFFIX="summary"
+else
+    STATS_SUFFIX="stats"
+fi
 
 # Definir subdirectorios
 PROCESSED_DIR="$WORK_DIR/1_processed"
@@ -66,6 +95,95 @@ LOG_FILE="$FILTER_DIR/nanofilt.log"
 
 mkdir -p "$PROCESSED_DIR" "$TRIM_DIR" "$FILTER_DIR" "$CLUSTER_DIR" "$UNIFIED_DIR"
 
+# Cada paso se registra en STEP_CACHE junto con una huella de sus archivos de
+# entrada y parámetros (scripts/step_cache.py). Al volver a ejecutar el
+# pipeline se omiten los pasos cuyas entradas y parámetros no cambiaron.
+# CLIPON_FORCE=1 ejecuta todos los pasos; RESUME_STEP sigue permitiendo
+# saltar manualmente los pasos anteriores.
+STEP_CACHE="$WORK_DIR/.clipon_step_cache.json"
+# Métricas de rendimiento (JSON Lines) por etapa y por muestra; resumen con
+# python3 scripts/clipon_metrics.py summary "$WORK_DIR/metrics.jsonl"
+export CLIPON_METRICS="${CLIPON_METRICS:-$WORK_DIR/metrics.jsonl}"
+export CLIPON_RUN_ID="${CLIPON_RUN_ID:-$(date +%Y%m%dT%H%M%S)}"
+CLIPON_FORCE="${CLIPON_FORCE:-0}"
+# MAX_READS=N submuestrea cada muestra antes de NGSpeciesID; la tabla de
+# fracciones reescala las lecturas de soporte en la exportación
+SCALE_TABLE=""
+if [ "${MAX_READS:-0}" -gt 0 ] && [ "$CLUSTER_METHOD" = "ngspecies" ]; then
+    SCALE_TABLE="$FILTER_DIR/subsampled/subsample_fractions.tsv"
+fi
+
+# Define STEP_ARGS con las entradas, salidas y parámetros del paso $1
+step_signature() {
+    local step="$1"
+    shopt -s nullglob
+    case "$step:$FUSED_PREP:$CLUSTER_METHOD" in
+        1:*)
+            STEP_ARGS=(--inputs "$INPUT_DIR"/*.fastq "$INPUT_DIR"/*.fastq.gz
+                --outputs "$PROCESSED_DIR" --param "CLIPON_COMPRESS=${CLIPON_COMPRESS:-}"
+                --param "STATS_MODE=$STATS_MODE" --param "STATS_JSON=${STATS_JSON:-0}") ;;
+        2:*)
+            STEP_ARGS=(--inputs "$PROCESSED_DIR"/*.fastq "$PROCESSED_DIR"/*.fastq.gz
+                --outputs "$TRIM_DIR" --param "CLIPON_COMPRESS=${CLIPON_COMPRESS:-}"
+                --param "SKIP_TRIM=$SKIP_TRIM" --param "TRIM_FRONT=$TRIM_FRONT"
+                --param "TRIM_BACK=$TRIM_BACK") ;;
+        3:1:*)
+            STEP_ARGS=(--inputs "$INPUT_DIR"/*.fastq "$INPUT_DIR"/*.fastq.gz
+                --outputs "$FILTER_DIR" --param "CLIPON_COMPRESS=${CLIPON_COMPRESS:-}"
+                --param "SKIP_TRIM=$SKIP_TRIM" --param "TRIM_FRONT=$TRIM_FRONT"
+                --param "TRIM_BACK=$TRIM_BACK" --param "MIN_LEN=${MIN_LEN:-650}"
+                --param "MAX_LEN=${MAX_LEN:-750}" --param "MIN_QUAL=${MIN_QUAL:-10}"
+                --param "STATS_MODE=$STATS_MODE" --param "STATS_JSON=${STATS_JSON:-0}"
+                --param "KEEP_INTERMEDIATES=${KEEP_INTERMEDIATES:-0}") ;;
+        3:*)
+            STEP_ARGS=(--inputs "$TRIM_DIR"/*.fastq "$TRIM_DIR"/*.fastq.gz
+                --outputs "$FILTER_DIR" --param "CLIPON_COMPRESS=${CLIPON_COMPRESS:-}"
+                --param "MIN_LEN=${MIN_LEN:-650}" --param "MAX_LEN=${MAX_LEN:-750}"
+                --param "MIN_QUAL=${MIN_QUAL:-10}" --param "STATS_MODE=$STATS_MODE"
+                --param "STATS_JSON=${STATS_JSON:-0}") ;;
+        4:*:ngspecies)
+            STEP_ARGS=(--inputs "$FILTER_DIR"/*.fastq "$FILTER_DIR"/*.fastq.gz
+                --outputs "$CLUSTER_DIR"
+                --param "M_LEN=${M_LEN:-700}" --param "SUPPORT=${SUPPORT:-150}"
+                --param "QUAL=${QUAL:-10}" --param "RC_ID=${RC_ID:-0.98}"
+                --param "ABUND_RATIO=${ABUND_RATIO:-0.01}"
+                --param "DEREPLICATE=${DEREPLICATE:-0}" --param "MAX_READS=${MAX_READS:-0}"
+                --param "SUBSAMPLE_SEED=${SUBSAMPLE_SEED:-42}"
+                --param "SUBSAMPLE_STRATIFY=${SUBSAMPLE_STRATIFY:-0}") ;;
+        4:*:kmer)
+            STEP_ARGS=(--inputs "$FILTER_DIR"/*.fastq "$FILTER_DIR"/*.fastq.gz
+                --outputs "$CLUSTER_DIR"
+                --param "SUPPORT=${SUPPORT:-150}" --param "ABUND_RATIO=${ABUND_RATIO:-0.01}"
+                --param "KMER_CLUSTER_ID=${KMER_CLUSTER_ID:-0.9}") ;;
+        5:*:ngspecies|5:*:kmer)
+            STEP_ARGS=(--inputs "$CLUSTER_DIR" --outputs "$UNIFIED_DIR/consensos_todos.fasta"
+                "$UNIFIED_DIR/consensos_unicos.fasta" "$UNIFIED_DIR/consensus_map.tsv") ;;
+        6:*:ngspecies|6:*:kmer)
+            STEP_ARGS=(--inputs "$UNIFIED_DIR/consensos_unicos.fasta" ${BLAST_DB:+"$BLAST_DB"}
+                ${TAXONOMY_DB:+"$TAXONOMY_DB"} ${KMER_INDEX:+"$KMER_INDEX/meta.json"} --outputs "$UNIFIED_DIR/taxonomy.qza"
+                --param "PERC_ID=${PERC_ID:-0.8}" --param "QUERY_COV=${QUERY_COV:-0.8}"
+                --param "MAX_ACCEPTS=${MAX_ACCEPTS:-1}"
+                --param "MIN_CONSENSUS=${MIN_CONSENSUS:-0.51}"
+                --param "KMER_MIN_IDENTITY=${KMER_MIN_IDENTITY:-0.99}"
+                --param "KMER_MIN_COVERAGE=${KMER_MIN_COVERAGE:-0.95}"
+                --param "KMER_MARGIN=${KMER_MARGIN:-0.005}") ;;
+        4:*:vsearch)
+            STEP_ARGS=(--inputs "$FILTER_DIR"/*.fastq "$FILTER_DIR"/*.fastq.gz
+                ${BLAST_DB:+"$BLAST_DB"}
+                ${TAXONOMY_DB:+"$TAXONOMY_DB"} --outputs "$UNIFIED_DIR/taxonomy.qza"
+                --param "CLUSTER_IDENTITY=${CLUSTER_IDENTITY:-0.98}"
+                --param "BLAST_IDENTITY=${BLAST_IDENTITY:-0.5}"
+                --param "MAXACCEPTS=${MAXACCEPTS:-5}") ;;
+        *)
+            # Exportación: paso 7 con NGSpeciesID, paso 5 con VSearch
+            STEP_ARGS=(--inputs "$UNIFIED_DIR/taxonomy.qza" "$UNIFIED_DIR/search_results.qza"
+                ${METADATA_FILE:+"$METADATA_FILE"} ${SCALE_TABLE:+"$SCALE_TABLE"}
+                "$UNIFIED_DIR/consensus_map.tsv" --outputs "$UNIFIED_DIR/Results/taxonomy_with_sample.tsv") ;;
+    esac
+    shopt -u nullglob
+    STEP_ARGS+=(--param "CLUSTER_METHOD=$CLUSTER_METHOD")
+}
+
 run_step() {
     local step="$1"
     local env="$2"
@@ -77,17 +195,31 @@ run_step() {
         return 0
     fi
 
+    step_signature "$step"
+    if [ "$CLIPON_FORCE" -ne 1 ] && \
+        python3 scripts/step_cache.py check "$STEP_CACHE" "step$step" "${STEP_ARGS[@]}"; then
+        echo "Paso $step sin cambios en entradas ni parámetros; se reutilizan sus resultados."
+        return 0
+    fi
+
     if [ "$CONDA_AVAILABLE" -eq 1 ]; then
         conda activate "$env"
     fi
+    local start
+    start=$(date +%s.%N)
     eval "$cmd"
-    touch "$WORK_DIR/.step${step}_done"
+    python3 scripts/clipon_metrics.py record --stage "step$step" \
+        --since "$start" "${STEP_ARGS[@]}"
+    python3 scripts/step_cache.py record "$STEP_CACHE" "step$step" "${STEP_ARGS[@]}"
 }
 
 trim_reads() {
     if [ "$SKIP_TRIM" -eq 1 ]; then
         echo "Omitiendo recorte de secuencias."
-        cp "$PROCESSED_DIR"/*.fastq "$TRIM_DIR"/
+        shopt -s nullglob
+        local fastqs=("$PROCESSED_DIR"/*.fastq "$PROCESSED_DIR"/*.fastq.gz)
+        shopt -u nullglob
+        cp "${fastqs[@]}" "$TRIM_DIR"/
     else
         INPUT_DIR="$PROCESSED_DIR" OUTPUT_DIR="$TRIM_DIR" TRIM_FRONT="$TRIM_FRONT" TRIM_BACK="$TRIM_BACK" \
             bash scripts/De1_A1.5_Trim_Fastq.sh
@@ -99,8 +231,10 @@ classify_reads() {
         echo "Advertencia: BLAST_DB o TAXONOMY_DB no están definidos. Omitiendo clasificación."
         return 0
     fi
+    # Cada secuencia distinta se clasifica una sola vez; la exportación
+    # reparte el resultado entre las muestras con consensus_map.tsv
     bash scripts/De3_A4_Classify_NGS.sh \
-        "$UNIFIED_DIR/consensos_todos.fasta" \
+        "$UNIFIED_DIR/consensos_unicos.fasta" \
         "$UNIFIED_DIR" \
         "$BLAST_DB" \
         "$TAXONOMY_DB"
@@ -114,9 +248,17 @@ cluster_with_vsearch() {
     cp "$VSEARCH_PREFIX"/search_results.qza "$UNIFIED_DIR/search_results.qza"
 }
 
-run_step 1 clipon-prep INPUT_DIR="$INPUT_DIR" OUTPUT_DIR="$PROCESSED_DIR" bash scripts/De0_A1_Process_Fastq.4_SeqKit.sh
-run_step 2 clipon-prep trim_reads
-run_step 3 clipon-prep INPUT_DIR="$TRIM_DIR" OUTPUT_DIR="$FILTER_DIR" LOG_FILE="$LOG_FILE" bash scripts/De1.5_A2_Filtrado_NanoFilt_1.1.sh
+if [ "$FUSED_PREP" -eq 1 ]; then
+    # Pasos 1-3 en una sola pasada; se registra como paso 3 para que
+    # RESUME_STEP<=3 lo vuelva a ejecutar
+    run_step 3 clipon-prep TRIM_FRONT="$TRIM_FRONT" TRIM_BACK="$TRIM_BACK" SKIP_TRIM="$SKIP_TRIM" \
+        python3 scripts/clean_trim_filter.py "$INPUT_DIR" "$WORK_DIR" \
+        --processed-dir "$PROCESSED_DIR" --trimmed-dir "$TRIM_DIR" --filtered-dir "$FILTER_DIR"
+else
+    run_step 1 clipon-prep INPUT_DIR="$INPUT_DIR" OUTPUT_DIR="$PROCESSED_DIR" bash scripts/De0_A1_Process_Fastq.4_SeqKit.sh
+    run_step 2 clipon-prep trim_reads
+    run_step 3 clipon-prep INPUT_DIR="$TRIM_DIR" OUTPUT_DIR="$FILTER_DIR" LOG_FILE="$LOG_FILE" bash scripts/De1.5_A2_Filtrado_NanoFilt_1.1.sh
+fi
 
 echo -e "\nResumen de lecturas tras filtrado:"
 python3 scripts/summarize_read_counts.py "$WORK_DIR" ${METADATA_FILE:+--metadata "$METADATA_FILE"}
@@ -127,8 +269,8 @@ if command -v Rscript >/dev/null 2>&1; then
     PLOT_FILE=$(Rscript scripts/plot_quality_vs_length_multi.R \
         "$FILTER_DIR/read_quality_vs_length.png" \
         ${METADATA_FILE:+--metadata "$METADATA_FILE"} \
-        "$PROCESSED_DIR"/*_processed_stats.tsv \
-        "$FILTER_DIR"/*_filtered_stats.tsv 2>&1 | tee "$WORK_DIR/r_plot.log" | tail -n 1) || {
+        "$PROCESSED_DIR"/*_processed_"$STATS_SUFFIX".tsv \
+        "$FILTER_DIR"/*_filtered_"$STATS_SUFFIX".tsv 2>&1 | tee "$WORK_DIR/r_plot.log" | tail -n 1) || {
             echo "Fallo en Rscript: revisar dependencias" >> "$WORK_DIR/r_plot.log"
             PLOT_FILE="N/A"
         }
@@ -139,23 +281,29 @@ fi
 
 echo "Gráfico de calidad vs longitud: $PLOT_FILE"
 
-if [ "$CLUSTER_METHOD" = "ngspecies" ]; then
-    run_step 4 clipon-ngs INPUT_DIR="$FILTER_DIR" OUTPUT_DIR="$CLUSTER_DIR" \
-        bash scripts/De2_A2.5_NGSpecies_Clustering.sh
-    run_step 5 clipon-ngs BASE_DIR="$CLUSTER_DIR" OUTPUT_DIR="$UNIFIED_DIR" \
+if [ "$CLUSTER_METHOD" = "ngspecies" ] || [ "$CLUSTER_METHOD" = "kmer" ]; then
+    CLUSTER_ENV=clipon-ngs
+    if [ "$CLUSTER_METHOD" = "kmer" ]; then
+        # Clustering propio por k-mers (scripts/kmer_cluster.py): no requiere
+        # NGSpeciesID, medaka ni QIIME2 y genera la misma estructura de salida
+        CLUSTER_ENV=clipon-prep
+        run_step 4 "$CLUSTER_ENV" python3 scripts/kmer_cluster.py "$FILTER_DIR" \
+            --output-dir "$CLUSTER_DIR"
+    else
+        run_step 4 "$CLUSTER_ENV" INPUT_DIR="$FILTER_DIR" OUTPUT_DIR="$CLUSTER_DIR" \
+            bash scripts/De2_A2.5_NGSpecies_Clustering.sh
+    fi
+    run_step 5 "$CLUSTER_ENV" BASE_DIR="$CLUSTER_DIR" OUTPUT_DIR="$UNIFIED_DIR" \
         bash scripts/De2.5_A3_NGSpecies_Unificar_Clusters.sh
 
     if [ ! -s "$UNIFIED_DIR/consensos_todos.fasta" ]; then
         echo "No se creó el archivo maestro de consensos. Abortando pipeline."
 
         exit 1
-        ;;
-esac
-run_step 7 clipon-qiime METADATA_FILE="$METADATA_FILE" bash scripts/De3_A4_Export_Classification.sh "$UNIFIED_DIR"
-
+    fi
 
     run_step 6 clipon-qiime classify_reads
-    run_step 7 clipon-qiime METADATA_FILE="$METADATA_FILE" \
+    run_step 7 clipon-qiime METADATA_FILE="$METADATA_FILE" SCALE_TABLE="$SCALE_TABLE" \
         bash scripts/De3_A4_Export_Classification.sh "$UNIFIED_DIR"
 elif [ "$CLUSTER_METHOD" = "vsearch" ]; then
     MANIFEST_FILE="$WORK_DIR/manifest_vsearch.csv"
@@ -184,12 +332,17 @@ fi
 echo "Clasificación y exportación finalizadas. Revise $UNIFIED_DIR/Results"
 
 TAX_PLOT_FILE="N/A"
-if command -v python >/dev/null 2>&1; then
+TAX_TABLE="$UNIFIED_DIR/Results/taxonomy_with_sample.tsv"
+if [ ! -f "$TAX_TABLE" ]; then
+    echo "No se encontró $TAX_TABLE; omitiendo la generación del gráfico de taxones."
+elif command -v python >/dev/null 2>&1; then
     COLLAPSED_TAX="$UNIFIED_DIR/Results/species_reads.tsv"
-    python scripts/collapse_reads_by_species.py \
-        "$UNIFIED_DIR/Results/taxonomy_with_sample.tsv" > "$COLLAPSED_TAX"
+    # Además de la tabla de texto se guardan la tabla larga y la matriz
+    # muestra x taxón; el gráfico se genera directamente desde la matriz.
+    python scripts/collapse_reads_by_species.py "$TAX_TABLE" \
+        --output-prefix "$UNIFIED_DIR/Results/species_reads" > "$COLLAPSED_TAX"
     TAX_PLOT_FILE=$(python scripts/plot_taxon_bar.py \
-        "$COLLAPSED_TAX" \
+        "$UNIFIED_DIR/Results/species_reads.matrix.npz" \
         "$UNIFIED_DIR/Results/taxon_stacked_bar.png" \
         ${METADATA_FILE:+--metadata "$METADATA_FILE"} --code-samples 2>&1 | \
         tee -a "$WORK_DIR/taxon_plot.log" | tail -n 1) || {
@@ -206,5 +359,10 @@ else
     echo "Python no encontrado; omitiendo la generación del gráfico de taxones."
 fi
 
+if [ -s "$CLIPON_METRICS" ]; then
+    echo -e "\nEtapas y muestras más lentas:"
+    python3 scripts/clipon_metrics.py summary "$CLIPON_METRICS" --top 5 || true
+fi
+
 echo "Pipeline completado. Resultados en: $WORK_DIR"
 echo "Gráfico de calidad vs longitud: $PLOT_FILE"
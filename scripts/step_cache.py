@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Record pipeline step outputs against a fingerprint of their inputs.
+
+A step is identified by a key (``s1.filter``, ``step3``...). Its fingerprint
+is a SHA-256 over the path, size and modification time of every input file
+(or over their content with ``content=True``) and over the parameters that
+affect the result (``MIN_LEN``, ``TRIM_FRONT``...). After a step succeeds the
+fingerprint and its outputs are stored in a JSON file in the work directory;
+the step can be skipped on later runs while the fingerprint is unchanged and
+all outputs still exist. Directories given as inputs are fingerprinted by
+the files they contain.
+
+Used by ``clipon_orchestrator.py`` and, through the command line, by
+``run_clipon_pipeline.sh``::
+
+    python scripts/step_cache.py check <cache.json> <key> --inputs F... \
+        [--outputs F...] [--param NAME=VALUE ...]
+    python scripts/step_cache.py record <cache.json> <key> ...
+
+``check`` exits with 0 when the step is up to date and 1 otherwise.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+
+#: Name of the cache file inside the work directory.
+CACHE_NAME = ".clipon_step_cache.json"
+_READ_SIZE = 1 << 20
+
+
+def _files(path: str) -> list[str]:
+    """Return ``path`` or, for a directory, the files below it, sorted."""
+    if not os.path.isdir(path):
+        return [path]
+    found = []
+    for root, _dirs, files in os.walk(path):
+        found.extend(os.path.join(root, name) for name in files)
+    return sorted(found)
+
+
+def _content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(_READ_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(inputs, params: dict | None = None, content: bool = False) -> str:
+    """Return the fingerprint of ``inputs`` and ``params``.
+
+    Missing inputs are part of the fingerprint, so creating them later
+    changes it.
+    """
+    entries = []
+    for path in sorted(os.path.abspath(p) for p in inputs):
+        for name in _files(path):
+            try:
+                st = os.stat(name)
+            except OSError:
+                entries.append([name, None])
+                continue
+            stamp = _content_hash(name) if content else st.st_mtime_ns
+            entries.append([name, st.st_size, stamp])
+    params = {key: str(value) for key, value in (params or {}).items()}
+    payload = json.dumps([entries, sorted(params.items())])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _output_exists(path: str) -> bool:
+    if os.path.isdir(path):
+        return any(os.scandir(path))
+    return os.path.exists(path)
+
+
+class StepCache:
+    """Fingerprints of completed steps stored in a JSON file.
+
+    ``record`` rewrites the file atomically each time, so steps finished
+    before an interruption are kept. Safe to use from several threads.
+    """
+
+    def __init__(self, path: str, content: bool = False) -> None:
+        self.path = str(path)
+        self.content = content
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as fh:
+                self.entries: dict[str, dict] = json.load(fh)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def digest(self, inputs, params: dict | None = None) -> str:
+        return fingerprint(inputs, params, self.content)
+
+    def is_fresh(self, key: str, digest: str) -> bool:
+        """Whether ``key`` was recorded with ``digest`` and its outputs exist."""
+        entry = self.entries.get(key)
+        return (
+            entry is not None
+            and entry["digest"] == digest
+            and all(_output_exists(path) for path in entry["outputs"])
+        )
+
+    def record(self, key: str, digest: str, outputs) -> None:
+        with self._lock:
+            self.entries[key] = {
+                "digest": digest,
+                "outputs": [os.path.abspath(p) for p in outputs],
+            }
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as fh:
+                json.dump(self.entries, fh, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self.entries.pop(key, None)
+
+
+def parse_params(values: list[str]) -> dict[str, str]:
+    params = {}
+    for value in values:
+        name, _, setting = value.partition("=")
+        params[name] = setting
+    return params
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("command", choices=("check", "record"))
+    parser.add_argument("cache", help="Cache JSON file.")
+    parser.add_argument("key", help="Step identifier.")
+    parser.add_argument("--inputs", nargs="*", default=[], help="Input files or directories.")
+    parser.add_argument("--outputs", nargs="*", default=[], help="Files the step creates.")
+    parser.add_argument(
+        "--param", action="append", default=[], help="NAME=VALUE setting of the step."
+    )
+    parser.add_argument(
+        "--content",
+        action="store_true",
+        default=os.environ.get("CLIPON_HASH_CONTENT", "0") == "1",
+        help="Hash file contents instead of size and mtime ($CLIPON_HASH_CONTENT=1).",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    """Entry point for command-line execution."""
+    args = parse_args(argv)
+    cache = StepCache(args.cache, args.content)
+    digest = cache.digest(args.inputs, parse_params(args.param))
+    if args.command == "check":
+        sys.exit(0 if cache.is_fresh(args.key, digest) else 1)
+    cache.record(args.key, digest, args.outputs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""Cap the number of reads of each sample before clustering.
+
+Deep samples decide the wall time of ``NGSpeciesID``. ``sample`` keeps at
+most ``--max-reads`` reads of every filtered FASTQ, chosen uniformly at
+random in a single pass::
+
+    <output_dir>/<name>.fastq               selected reads, in input order
+    <output_dir>/subsample_fractions.tsv    sample, reads, sampled, fraction
+
+Each read receives a random key and the reads with the smallest keys are
+kept (bottom-k reservoir sampling), so at most ``2 * max_reads`` records are
+held in memory whatever the size of the file. The generator is seeded with
+``--seed`` and the sample name, so a sample gives the same subsample on every
+run and in any order.
+
+With ``--stratify`` the reads are grouped by length bin (``--length-bin``
+bp) and mean quality bin (``--quality-bin`` Phred units) and every group
+receives a share of the reads proportional to its size, so the length and
+quality distribution of the subsample matches the sample. Groups too small
+to fill their share leave it to the others.
+
+``support`` prints a ``SUPPORT`` value scaled to the fraction kept of a
+sample. ``add_reads_and_sample.py --scale-table subsample_fractions.tsv``
+brings supporting read counts back to the original depth.
+
+Usage:
+    python scripts/subsample_reads.py sample <fastq>... --output-dir <dir> \
+        --max-reads N [--seed 42] [--stratify]
+    python scripts/subsample_reads.py support subsample_fractions.tsv <name> <SUPPORT>
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import fcntl
+import math
+import os
+import sys
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from collect_read_stats import FASTQ_SUFFIXES, iter_fastq_blocks
+from fastq_io import fastq_stem, open_fastq
+
+FRACTIONS_NAME = "subsample_fractions.tsv"
+# Quality bins per length bin in the stratum identifier
+_QUALITY_BINS = 1000
+
+
+@dataclass
+class SubsampleResult:
+    """Reads before and after subsampling one FASTQ."""
+
+    sample: str
+    reads: int
+    sampled: int
+
+    @property
+    def fraction(self) -> float:
+        return self.sampled / self.reads if self.reads else 1.0
+
+
+class _Reservoir:
+    """Records with the smallest random keys seen so far.
+
+    Once more than ``2 * capacity`` records are held, only the ``capacity``
+    smallest keys are kept and later records need a key below the largest of
+    them to be stored.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.threshold = 1.0
+        self.keys: list[float] = []
+        self.strata: list[int] = []
+        self.order: list[int] = []
+        self.records: list[bytes] = []
+
+    def add(self, keys, strata, order, records) -> None:
+        self.keys += keys
+        self.strata += strata
+        self.order += order
+        self.records += records
+        if len(self.keys) > 2 * self.capacity:
+            keep = np.argpartition(self.keys, self.capacity - 1)[: self.capacity]
+            self.threshold = max(self.keys[i] for i in keep)
+            keep = keep.tolist()
+            self.keys = [self.keys[i] for i in keep]
+            self.strata = [self.strata[i] for i in keep]
+            self.order = [self.order[i] for i in keep]
+            self.records = [self.records[i] for i in keep]
+
+
+def _quotas(counts: dict[int, int], total: int, n: int) -> dict[int, int]:
+    """Split ``n`` among strata proportionally to ``counts`` (largest remainder)."""
+    exact = {stratum: n * count / total for stratum, count in counts.items()}
+    quotas = {stratum: math.floor(value) for stratum, value in exact.items()}
+    remaining = n - sum(quotas.values())
+    for stratum in sorted(exact, key=lambda s: (quotas[s] - exact[s], s))[:remaining]:
+        quotas[stratum] += 1
+    return quotas
+
+
+def _select(reservoir: _Reservoir, counts: dict[int, int], total: int, n: int) -> list[int]:
+    """Positions in ``reservoir`` of the reads to keep."""
+    ranked = sorted(range(len(reservoir.keys)), key=reservoir.keys.__getitem__)
+    if len(counts) <= 1:
+        return ranked[:n]
+    quotas = _quotas(counts, total, n)
+    selected, spare = [], []
+    for i in ranked:
+        stratum = reservoir.strata[i]
+        if quotas[stratum]:
+            quotas[stratum] -= 1
+            selected.append(i)
+        else:
+            spare.append(i)
+    return selected + spare[: n - len(selected)]
+
+
+def subsample_file(
+    fastq: str,
+    output_dir: str,
+    max_reads: int,
+    seed: int = 42,
+    stratify: bool = False,
+    length_bin: int = 50,
+    quality_bin: float = 2.0,
+) -> SubsampleResult:
+    """Write at most ``max_reads`` reads of ``fastq`` to ``output_dir``."""
+    if max_reads < 1:
+        raise ValueError("max_reads must be at least 1")
+    name = fastq_stem(fastq)
+    rng = np.random.default_rng([seed, zlib.crc32(name.encode())])
+    # Stratified quotas are taken among the 2 * max_reads smallest keys
+    reservoir = _Reservoir(2 * max_reads if stratify else max_reads)
+    counts: dict[int, int] = {}
+    total = 0
+    with open_fastq(fastq) as fh:
+        for block in iter_fastq_blocks(fh):
+            n = len(block)
+            keys = rng.random(n)
+            if stratify:
+                strata = (block.lengths // length_bin) * _QUALITY_BINS + np.minimum(
+                    (block.mean_qualities() // quality_bin).astype(np.int64),
+                    _QUALITY_BINS - 1,
+                )
+                for stratum, count in zip(*np.unique(strata, return_counts=True)):
+                    counts[int(stratum)] = counts.get(int(stratum), 0) + int(count)
+            else:
+                strata = np.zeros(n, dtype=np.int64)
+            stored = np.flatnonzero(keys < reservoir.threshold)
+            raw = block.raw
+            starts, ends = block.starts[stored].tolist(), block.ends[stored].tolist()
+            records = [
+                b"%s\n%s\n+\n%s\n" % (raw[s0:e0], raw[s1:e1], raw[s3:e3])
+                for (s0, s1, _s2, s3), (e0, e1, _e2, e3) in zip(starts, ends)
+            ]
+            reservoir.add(
+                keys[stored].tolist(), strata[stored].tolist(),
+                (stored + total).tolist(), records,
+            )
+            total += n
+
+    selected = _select(reservoir, counts, total, max_reads)
+    with open(Path(output_dir) / f"{name}.fastq", "wb") as out:
+        for i in sorted(selected, key=reservoir.order.__getitem__):
+            out.write(reservoir.records[i])
+    return SubsampleResult(name, total, len(selected))
+
+
+def read_fractions(path: str) -> dict[str, float]:
+    """Fraction of reads kept per sample in a ``subsample_fractions.tsv``."""
+    with open(path, newline="") as fh:
+        return {
+            row["sample"]: float(row["fraction"])
+            for row in csv.DictReader(fh, delimiter="\t")
+        }
+
+
+def scaled_support(fractions_path: str, sample: str, support: int) -> int:
+    """``support`` scaled by the fraction of reads kept for ``sample``."""
+    fraction = read_fractions(fractions_path).get(sample, 1.0)
+    return max(1, math.floor(support * fraction))
+
+
+def write_fractions(results: list[SubsampleResult], path: str) -> None:
+    """Merge ``results`` into the table at ``path``, one row per sample.
+
+    The table is locked while it is updated, so samples subsampled at the
+    same time do not lose each other's rows.
+    """
+    header = ["sample", "reads", "sampled", "fraction"]
+    with open(path, "a+", newline="") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        fh.seek(0)
+        rows = {
+            row["sample"]: [row[key] for key in header]
+            for row in csv.DictReader(fh, delimiter="\t")
+        }
+        for r in results:
+            rows[r.sample] = [r.sample, r.reads, r.sampled, f"{r.fraction:.6f}"]
+        fh.seek(0)
+        fh.truncate()
+        writer = csv.writer(fh, delimiter="\t")
+        writer.writerow(header)
+        writer.writerows(rows[sample] for sample in sorted(rows))
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    sample = sub.add_parser("sample", help="Keep at most --max-reads reads per FASTQ.")
+    sample.add_argument("fastq", nargs="+", help="Filtered FASTQ files.")
+    sample.add_argument("--output-dir", required=True)
+    sample.add_argument(
+        "--max-reads",
+        type=int,
+        default=int(os.environ.get("MAX_READS") or 0),
+        help="Reads kept per sample (default: $MAX_READS).",
+    )
+    sample.add_argument(
+        "--seed",
+        type=int,
+        default=int(os.environ.get("SUBSAMPLE_SEED", 42)),
+        help="Random seed (default: $SUBSAMPLE_SEED or 42).",
+    )
+    sample.add_argument(
+        "--stratify",
+        action="store_true",
+        default=os.environ.get("SUBSAMPLE_STRATIFY", "0") == "1",
+        help="Keep the length x quality distribution ($SUBSAMPLE_STRATIFY=1).",
+    )
+    sample.add_argument("--length-bin", type=int, default=50, help="Length bin width (bp).")
+    sample.add_argument(
+        "--quality-bin", type=float, default=2.0, help="Mean quality bin width."
+    )
+    support = sub.add_parser("support", help="Print SUPPORT scaled to the fraction kept.")
+    support.add_argument("fractions", help="subsample_fractions.tsv")
+    support.add_argument("sample")
+    support.add_argument("support", type=int)
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Entry point for command-line execution."""
+    args = parse_args()
+    if args.command == "support":
+        print(scaled_support(args.fractions, args.sample, args.support))
+        return
+    if args.max_reads < 1:
+        sys.exit("subsample_reads.py: --max-reads (o MAX_READS) debe ser mayor que 0")
+    os.makedirs(args.output_dir, exist_ok=True)
+    results = [
+        subsample_file(
+            path, args.output_dir, args.max_reads, args.seed,
+            args.stratify, args.length_bin, args.quality_bin,
+        )
+        for path in args.fastq
+        if path.endswith(FASTQ_SUFFIXES)
+    ]
+    write_fractions(results, os.path.join(args.output_dir, FRACTIONS_NAME))
+    print("sample\treads\tsampled\tfraction")
+    for r in results:
+        print(f"{r.sample}\t{r.reads}\t{r.sampled}\t{r.fraction:.1%}")
+
+
+if __name__ == "__main__":
+    main()
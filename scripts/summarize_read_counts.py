@@ -4,23 +4,39 @@
 Searches recursively in the provided directory for files generated by
 ``collect_read_stats.py``. These files have the suffixes
 ``*_raw_stats.tsv``, ``*_processed_stats.tsv`` and ``*_filtered_stats.tsv``.
-For each unique prefix, count the number of reads (rows) in each file and
-output a table with columns ``sample``, ``raw``, ``processed`` and
-``filtered``. Optionally, sample names can be mapped to experiment names
-through a metadata file with columns ``fastq`` and ``experiment``.
+Binned summaries written with ``collect_read_stats.py --summary``
+(``*_raw_summary.tsv`` and so on) are also accepted; their read count is
+taken from the ``# reads`` header line instead of counting rows.
+
+Read counts are taken, in order of preference, from the
+``<stats>.counts.json`` sidecar written by ``collect_read_stats.py``, from the
+summary header, or by counting rows. Counted files are remembered in
+``.read_counts_cache.json`` inside ``directory``, keyed on path, modification
+time and size, so unchanged files are not read again on later runs.
+The output table has one row per unique prefix and columns ``sample``,
+``raw``, ``processed`` and ``filtered`` with the reads of each stage.
+Optionally, sample names can be mapped to experiment names through a
+metadata file with columns ``fastq`` and ``experiment``.
 """
 from __future__ import annotations
 
 import argparse
 import csv
-import glob
+import json
 import os
-import pathlib
 import re
 import sys
 from collections import defaultdict
 from typing import Dict
 
+from clipon_profiling import add_profile_argument, phase, profile, profiling_enabled
+from fastq_io import fastq_stem
+
+STAGES = ("raw", "processed", "filtered")
+STATS_FILE_RE = re.compile(r"^(.*)_(raw|processed|filtered)_(stats|summary)\.tsv$")
+COUNTS_SUFFIX = ".counts.json"
+CACHE_NAME = ".read_counts_cache.json"
+
 
 def parse_args() -> argparse.Namespace:
     """Parse command-line arguments."""
@@ -30,6 +46,7 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--metadata", help="TSV/CSV with columns 'fastq' and 'experiment'", default=None
     )
+    add_profile_argument(parser)
     return parser.parse_args()
 
 
@@ -42,11 +59,107 @@ def load_metadata(path: str | None) -> dict[str, str]:
     with open(path) as fh:
         reader = csv.DictReader(fh, delimiter="\t")
         for row in reader:
-            fastq = pathlib.Path(row["fastq"]).stem
+            fastq = fastq_stem(row["fastq"])
             mapping[fastq] = row["experiment"]
     return mapping
 
 
+def read_summary_header(path: str) -> dict[str, int]:
+    """Return the ``# key<TAB>value`` totals at the top of a summary file."""
+
+    totals: dict[str, int] = {}
+    with open(path) as fh:
+        for line in fh:
+            if not line.startswith("#"):
+                break
+            key, value = line[1:].strip().split("\t")
+            totals[key] = int(value)
+    return totals
+
+
+def read_counts_sidecar(path: str, size: int) -> int | None:
+    """Return the reads stored in the sidecar of ``path`` if it is current.
+
+    The sidecar is ignored when missing, unreadable or written for a stats
+    file of a different ``size``.
+    """
+
+    try:
+        with open(path + COUNTS_SUFFIX) as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if data.get("size") != size:
+        return None
+    return int(data["reads"])
+
+
+def count_reads(path: str) -> int:
+    """Return the number of reads recorded in a stats or summary file."""
+
+    if path.endswith("_summary.tsv"):
+        return read_summary_header(path).get("reads", 0)
+    with open(path, "rb") as fh:
+        return sum(1 for _ in fh) - 1  # subtract header
+
+
+class CountCache:
+    """Read counts of stats files keyed on path, mtime and size."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.entries: dict[str, dict[str, int]] = {}
+        self.changed = False
+        try:
+            with open(path) as fh:
+                self.entries = json.load(fh)
+        except (OSError, ValueError):
+            pass
+
+    def count(self, path: str) -> int:
+        """Return the read count of ``path``, reading it only if needed."""
+
+        st = os.stat(path)
+        sidecar = read_counts_sidecar(path, st.st_size)
+        if sidecar is not None:
+            return sidecar
+        key = os.path.abspath(path)
+        entry = self.entries.get(key)
+        if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            return entry["reads"]
+        reads = count_reads(path)
+        self.entries[key] = {
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+            "reads": reads,
+        }
+        self.changed = True
+        return reads
+
+    def save(self) -> None:
+        """Write the cache atomically if new counts were added."""
+
+        if not self.changed:
+            return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as fh:
+                json.dump(self.entries, fh)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Warning: could not write {self.path}: {e}", file=sys.stderr)
+
+
+def find_stats_files(base_dir: str):
+    """Yield ``(path, sample, stage)`` for every stats file under ``base_dir``."""
+
+    for root, _dirs, files in os.walk(base_dir):
+        for file_name in sorted(files):
+            match = STATS_FILE_RE.match(file_name)
+            if match:
+                yield os.path.join(root, file_name), match.group(1), match.group(2)
+
+
 def summarize_counts(
     base_dir: str, metadata: dict[str, str]
 ) -> dict[str, dict[str, int]]:
@@ -68,37 +181,29 @@ def summarize_counts(
     if not os.path.isdir(base_dir):
         raise NotADirectoryError(f"Directory not found: {base_dir}")
 
-    patterns = {
-        "raw": "*_raw_stats.tsv",
-        "processed": "*_processed_stats.tsv",
-        "filtered": "*_filtered_stats.tsv",
-    }
-
     counts: Dict[str, Dict[str, int]] = defaultdict(
-        lambda: {"raw": 0, "processed": 0, "filtered": 0}
+        lambda: {stage: 0 for stage in STAGES}
     )
+    cache = CountCache(os.path.join(base_dir, CACHE_NAME))
 
-    for stage, pattern in patterns.items():
-        for path in glob.glob(os.path.join(base_dir, "**", pattern), recursive=True):
-            file_name = os.path.basename(path)
-            sample = re.sub(rf"_{stage}_stats\.tsv$", "", file_name)
-            base = re.sub(r"^cleaned_", "", sample)
-            base = re.sub(r"_trimmed$", "", base)  # unify trimmed filenames
+    for path, sample, stage in find_stats_files(base_dir):
+        base = re.sub(r"^cleaned_", "", sample)
+        base = re.sub(r"_trimmed$", "", base)  # unify trimmed filenames
 
-            # Skip duplicate "cleaned_" files for stages other than "filtered"
-            if sample.startswith("cleaned_") and stage != "filtered":
-                continue
+        # Skip duplicate "cleaned_" files for stages other than "filtered"
+        if sample.startswith("cleaned_") and stage != "filtered":
+            continue
 
-            try:
-                with open(path) as fh:
-                    num = sum(1 for _ in fh) - 1  # subtract header
-            except OSError as e:
-                print(f"Warning: could not read {path}: {e}", file=sys.stderr)
-                num = 0
+        try:
+            num = cache.count(path)
+        except OSError as e:
+            print(f"Warning: could not read {path}: {e}", file=sys.stderr)
+            num = 0
 
-            name = metadata.get(base, base)
-            counts[name][stage] += num
+        name = metadata.get(base, base)
+        counts[name][stage] += num
 
+    cache.save()
     return counts
 
 
@@ -106,13 +211,17 @@ def main() -> None:
     """CLI entry point."""
 
     args = parse_args()
-    metadata = load_metadata(args.metadata)
-    counts = summarize_counts(args.directory, metadata)
-
-    print("sample\traw\tprocessed\tfiltered")
-    for sample in sorted(counts):
-        data = counts[sample]
-        print(f"{sample}\t{data['raw']}\t{data['processed']}\t{data['filtered']}")
+    report = os.path.join(args.directory, "summarize_read_counts")
+    with profile(report, profiling_enabled(args.profile)):
+        with phase("load"):
+            metadata = load_metadata(args.metadata)
+            counts = summarize_counts(args.directory, metadata)
+
+        with phase("write"):
+            print("sample\traw\tprocessed\tfiltered")
+            for sample in sorted(counts):
+                data = counts[sample]
+                print(f"{sample}\t{data['raw']}\t{data['processed']}\t{data['filtered']}")
 
 
 if __name__ == "__main__":
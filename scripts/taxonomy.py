@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Interned taxonomic lineages and roll-up of counts to any rank.
+
+Classifier output repeats a handful of distinct lineage strings
+(``k__Bacteria; ...; g__Escherichia; s__coli``) over many rows. A
+:class:`LineageTable` stores each distinct string once under an integer id and
+parses it once (:func:`parse_lineage` is memoized), so aggregating counts at
+any rank is a group-by over integer arrays::
+
+    table = LineageTable()
+    ids = np.array([table.intern(taxon) for taxon in taxa])
+    labels, totals = table.rollup(ids, reads, "family")
+
+Ranks are encoded as ``r__name`` and separated by ``;`` or spaces. Both the
+``k__`` and ``d__`` (SILVA domain) prefixes map to ``kingdom``.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+
+RANKS = ("kingdom", "phylum", "class", "order", "family", "genus", "species")
+RANK_CODES = {
+    "k": "kingdom",
+    "d": "kingdom",
+    "p": "phylum",
+    "c": "class",
+    "o": "order",
+    "f": "family",
+    "g": "genus",
+    "s": "species",
+}
+
+
+class Lineage(NamedTuple):
+    """Parsed lineage: one name (or ``None``) per rank of :data:`RANKS`."""
+
+    names: tuple[str | None, ...]
+    last_name: str
+    last_rank: str
+
+
+@lru_cache(maxsize=None)
+def parse_lineage(taxon: str) -> Lineage:
+    """Parse a lineage string; empty names (``s__``) count as unresolved."""
+    parts = taxon.split(";") if ";" in taxon else taxon.split()
+    names: list[str | None] = [None] * len(RANKS)
+    last_name = taxon.strip()
+    last_rank = "unknown"
+    for part in parts:
+        part = part.strip()
+        if "__" not in part:
+            continue
+        code, name = part.split("__", 1)
+        name = name.strip()
+        if not name:
+            continue
+        rank = RANK_CODES.get(code, code)
+        if rank in RANKS:
+            names[RANKS.index(rank)] = name
+        last_name, last_rank = name, rank
+    return Lineage(tuple(names), last_name, last_rank)
+
+
+def format_label(lineage: Lineage, rank: str = "species") -> str:
+    """Return the display label of ``lineage`` aggregated at ``rank``.
+
+    Resolved genera and species are italicised (``*Escherichia coli*``).
+    Lineages not resolved down to ``rank`` are labelled with their deepest
+    resolved ancestor and its rank, e.g. ``*Bacillus* (genus)`` or
+    ``Bacillaceae (family)``.
+    """
+    level = RANKS.index(rank)
+    names = lineage.names
+    genus, species = names[5], names[6]
+    if rank == "species" and genus and species:
+        return f"*{genus.capitalize()} {species.lower()}*"
+    if names[level]:
+        return f"*{names[level].capitalize()}*" if rank == "genus" else names[level]
+    for above in range(level - 1, -1, -1):
+        name = names[above]
+        if name:
+            if RANKS[above] == "genus":
+                return f"*{name.capitalize()}* (genus)"
+            return f"{name} ({RANKS[above]})"
+    if rank == "species" or not any(names):
+        return f"{lineage.last_name} ({lineage.last_rank})"
+    return f"Unassigned ({rank})"
+
+
+class LineageTable:
+    """Integer-keyed table of distinct lineage strings."""
+
+    def __init__(self) -> None:
+        self.ids: dict[str, int] = {}
+        self.lineages: list[Lineage] = []
+        self._labels: dict[str, tuple[list[str], np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.lineages)
+
+    def intern(self, taxon: str) -> int:
+        """Return the id of ``taxon``, adding it to the table if new."""
+        lineage_id = self.ids.get(taxon)
+        if lineage_id is None:
+            lineage_id = self.ids[taxon] = len(self.lineages)
+            self.lineages.append(parse_lineage(taxon))
+            self._labels.clear()
+        return lineage_id
+
+    def labels(self, rank: str) -> tuple[list[str], np.ndarray]:
+        """Return the distinct labels at ``rank`` and the label index of each lineage."""
+        if rank not in RANKS:
+            raise ValueError(f"Unknown rank {rank!r}; expected one of {', '.join(RANKS)}")
+        cached = self._labels.get(rank)
+        if cached is None:
+            index: dict[str, int] = {}
+            codes = np.fromiter(
+                (
+                    index.setdefault(format_label(lineage, rank), len(index))
+                    for lineage in self.lineages
+                ),
+                dtype=np.int64,
+                count=len(self.lineages),
+            )
+            cached = self._labels[rank] = (list(index), codes)
+        return cached
+
+    def rollup(
+        self, lineage_ids: np.ndarray, counts: np.ndarray, rank: str
+    ) -> tuple[list[str], np.ndarray]:
+        """Sum ``counts`` of rows with ``lineage_ids`` per label at ``rank``."""
+        labels, codes = self.labels(rank)
+        totals = np.bincount(
+            codes[np.asarray(lineage_ids, dtype=np.int64)],
+            weights=counts,
+            minlength=len(labels),
+        )
+        return labels, totals.astype(np.asarray(counts).dtype, copy=False)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Unify NGSpeciesID consensus sequences and deduplicate them across samples.
+
+Replaces the ``awk``/``cat`` unification of
+``De2.5_A3_NGSpecies_Unificar_Clusters.sh``. Every folder of ``<base_dir>`` is
+a sample; its ``consensus_reference_*.fasta`` headers receive the folder name
+as suffix, as before, and are written to::
+
+    <output_dir>/consensos_<sample>.fasta   consensus sequences of one sample
+    <output_dir>/consensos_todos.fasta      every consensus of every sample
+
+The same consensus often appears in many samples, so sequences are also
+indexed by a hash of their bases and each distinct sequence is written once::
+
+    <output_dir>/consensos_unicos.fasta     >consensus_<hash> per sequence
+    <output_dir>/consensus_map.tsv          unique_id, feature_id, sample, reads
+
+Classifying ``consensos_unicos.fasta`` instead of ``consensos_todos.fasta``
+runs BLAST once per distinct sequence; ``add_reads_and_sample.py
+--consensus-map consensus_map.tsv`` turns the classification back into one
+row per sample and consensus.
+
+Usage:
+    python scripts/unify_consensus.py <dir_base> <dir_salida>
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import glob
+import hashlib
+import os
+import re
+
+ALL_NAME = "consensos_todos.fasta"
+UNIQUE_NAME = "consensos_unicos.fasta"
+MAP_NAME = "consensus_map.tsv"
+HEADER_RE = re.compile(r"^(.*?)_total_supporting_reads_(\d+)")
+
+
+def read_fasta(path: str):
+    """Yield ``(header, sequence)`` pairs, without ``>`` and line breaks."""
+    header, seq = None, []
+    with open(path) as fh:
+        for line in fh:
+            line = line.rstrip("\n")
+            if line.startswith(">"):
+                if header is not None:
+                    yield header, "".join(seq)
+                header, seq = line[1:], []
+            elif line.strip():
+                seq.append(line.strip())
+    if header is not None:
+        yield header, "".join(seq)
+
+
+def unique_id(sequence: str) -> str:
+    """Identifier of a consensus derived from its bases (case-insensitive)."""
+    return "consensus_" + hashlib.sha1(sequence.upper().encode()).hexdigest()[:16]
+
+
+def unify(base_dir: str, output_dir: str) -> tuple[int, int]:
+    """Write the unified and deduplicated consensus files.
+
+    Returns the number of consensus sequences and of distinct sequences.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    unique: dict[str, str] = {}
+    rows = []
+    total = 0
+    with open(os.path.join(output_dir, ALL_NAME), "w") as all_fh:
+        for folder in sorted(glob.glob(os.path.join(base_dir, "*"))):
+            if not os.path.isdir(folder):
+                continue
+            sample = os.path.basename(folder)
+            records = [
+                record
+                for fasta in sorted(glob.glob(os.path.join(folder, "consensus_reference_*.fasta")))
+                for record in read_fasta(fasta)
+            ]
+            sample_path = os.path.join(output_dir, f"consensos_{sample}.fasta")
+            if not records:
+                print(f"No se encontraron secuencias en la carpeta: {folder}")
+                if os.path.exists(sample_path):
+                    os.remove(sample_path)
+                continue
+            text = "".join(f">{header}_{sample}\n{seq}\n" for header, seq in records)
+            with open(sample_path, "w") as fh:
+                fh.write(text)
+            all_fh.write(text)
+            print(f"Se creó el archivo: {sample_path}")
+
+            for header, seq in records:
+                total += 1
+                uid = unique_id(seq)
+                unique.setdefault(uid, seq)
+                m = HEADER_RE.match(header)
+                feature_id, reads = m.groups() if m else (header.split()[0], "")
+                rows.append([uid, feature_id, sample, reads])
+
+    with open(os.path.join(output_dir, UNIQUE_NAME), "w") as fh:
+        for uid, seq in unique.items():
+            fh.write(f">{uid}\n{seq}\n")
+    with open(os.path.join(output_dir, MAP_NAME), "w", newline="") as fh:
+        writer = csv.writer(fh, delimiter="\t")
+        writer.writerow(["unique_id", "feature_id", "sample", "reads"])
+        writer.writerows(rows)
+    return total, len(unique)
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("base_dir", help="Directory with one NGSpeciesID folder per sample.")
+    parser.add_argument("output_dir", help="Directory for the unified FASTA files.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Entry point for command-line execution."""
+    args = parse_args()
+    total, distinct = unify(args.base_dir, args.output_dir)
+    if not total:
+        print("No se encontraron secuencias en ninguna carpeta. No se creó el archivo maestro.")
+        return
+    print(f"Se creó el archivo maestro con todas las secuencias: "
+          f"{os.path.join(args.output_dir, ALL_NAME)}")
+    print(f"{total} consensos, {distinct} secuencias únicas para clasificar: "
+          f"{os.path.join(args.output_dir, UNIQUE_NAME)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""Parameter sweep of the VSearch workflow that shares common stages.
+
+Running ``De2_A4__VSearch_Procesonuevo2.6.1.sh`` once per combination of
+``cluster_identity``, ``blast_identity`` and ``maxaccepts`` imports the
+manifest and dereplicates the reads every time. Each stage here only depends
+on the parameters it uses, so the sweep runs::
+
+    import, derep                      once
+    cluster.<cid>, table.<cid>         once per cluster identity
+    classify.<cid>.<bid>.<max>         once per combination
+
+with the orchestrator's scheduler (``clipon_orchestrator.Scheduler``): tasks
+start as soon as their dependencies finish and fit in ``--cpus``, and the
+step cache skips tasks whose inputs and parameters did not change, so adding
+a value to the grid only runs the new stages. Classification uses
+``classify_sharded.py``. Outputs::
+
+    <output_dir>/sequences.qza, table_derep.qza, rep_seqs.qza
+    <output_dir>/cluster_<cid>/table_clust.qza, rep_seqs_clust.qza,
+                               feature-table.tsv
+    <output_dir>/cluster_<cid>/blast_<bid>_max_<max>/taxonomy.qza,
+                               search_results.qza, taxonomy.tsv
+    <output_dir>/sweep_comparison.tsv
+    <output_dir>/logs/<task>.log
+
+``sweep_comparison.tsv`` has one row per combination with the number of
+features, features classified to species, distinct species and reads of the
+features classified to species.
+
+Combinations are the product of ``--cluster-id``, ``--blast-id`` and
+``--maxaccepts``, or explicit ``--combination CID BID MAX`` triples.
+
+Usage:
+    python scripts/vsearch_sweep.py <manifest.csv> <dir_salida> \
+        --cluster-id 0.97 0.98 --blast-id 0.5 0.8 --maxaccepts 1 5 [--cpus N]
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import itertools
+import os
+import shutil
+import sys
+from pathlib import Path
+
+from clipon_metrics import MetricsLog
+from clipon_orchestrator import SCRIPT_DIR, Scheduler, Task
+from step_cache import CACHE_NAME, StepCache
+from taxonomy import parse_lineage
+
+COMPARISON_NAME = "sweep_comparison.tsv"
+COMPARISON_HEADER = [
+    "cluster_identity", "blast_identity", "maxaccepts",
+    "features", "species_features", "species", "species_reads",
+]
+
+
+def cluster_dir(output_dir: Path, cid: str) -> Path:
+    return output_dir / f"cluster_{cid}"
+
+
+def classify_dir(output_dir: Path, cid: str, bid: str, maxaccepts: str) -> Path:
+    return cluster_dir(output_dir, cid) / f"blast_{bid}_max_{maxaccepts}"
+
+
+def sweep_tasks(
+    manifest: str,
+    output_dir: Path,
+    combinations: list[tuple[str, str, str]],
+    cpus: int,
+    blast_db: str,
+    taxonomy_db: str,
+) -> list[Task]:
+    """Tasks of the sweep; shared stages appear once."""
+    threads = max(1, cpus // max(1, min(len(combinations), cpus)))
+    sequences = output_dir / "sequences.qza"
+    table_derep, rep_seqs = output_dir / "table_derep.qza", output_dir / "rep_seqs.qza"
+    tasks = [
+        Task(
+            "import",
+            [
+                "qiime", "tools", "import",
+                "--type", "SampleData[SequencesWithQuality]",
+                "--input-path", manifest,
+                "--input-format", "SingleEndFastqManifestPhred33V2",
+                "--output-path", str(sequences),
+            ],
+            conda_env="clipon-qiime",
+            inputs=(manifest,),
+            outputs=(str(sequences),),
+        ),
+        Task(
+            "derep",
+            [
+                "qiime", "vsearch", "dereplicate-sequences",
+                "--i-sequences", str(sequences),
+                "--o-dereplicated-table", str(table_derep),
+                "--o-dereplicated-sequences", str(rep_seqs),
+            ],
+            ("import",),
+            "clipon-qiime",
+            inputs=(str(sequences),),
+            outputs=(str(table_derep), str(rep_seqs)),
+        ),
+    ]
+    for cid in dict.fromkeys(cid for cid, _bid, _max in combinations):
+        out = cluster_dir(output_dir, cid)
+        table, rep_clust = out / "table_clust.qza", out / "rep_seqs_clust.qza"
+        tasks += [
+            Task(
+                f"cluster.{cid}",
+                [
+                    "qiime", "vsearch", "cluster-features-de-novo",
+                    "--i-sequences", str(rep_seqs),
+                    "--i-table", str(table_derep),
+                    "--p-perc-identity", cid,
+                    "--p-threads", str(threads),
+                    "--o-clustered-table", str(table),
+                    "--o-clustered-sequences", str(rep_clust),
+                ],
+                ("derep",),
+                "clipon-qiime",
+                cpus=threads,
+                inputs=(str(rep_seqs), str(table_derep)),
+                outputs=(str(table), str(rep_clust)),
+                params={"CLUSTER_IDENTITY": cid},
+            ),
+            Task(
+                f"table.{cid}",
+                [
+                    "bash", "-c",
+                    'qiime tools export --input-path "$1" --output-path "$2" && '
+                    'biom convert -i "$2/feature-table.biom" -o "$2/feature-table.tsv" --to-tsv',
+                    "_", str(table), str(out),
+                ],
+                (f"cluster.{cid}",),
+                "clipon-qiime",
+                inputs=(str(table),),
+                outputs=(str(out / "feature-table.tsv"),),
+            ),
+        ]
+    for cid, bid, maxaccepts in combinations:
+        out = classify_dir(output_dir, cid, bid, maxaccepts)
+        rep_clust = cluster_dir(output_dir, cid) / "rep_seqs_clust.qza"
+        tasks.append(
+            Task(
+                f"classify.{cid}.{bid}.{maxaccepts}",
+                [
+                    sys.executable, str(SCRIPT_DIR / "classify_sharded.py"),
+                    str(rep_clust), str(out),
+                    "--blast-db", blast_db, "--taxonomy-db", taxonomy_db,
+                    "--perc-identity", bid, "--maxaccepts", maxaccepts,
+                    "--query-cov", "0.8", "--min-consensus", "0.51",
+                    "--cpus", str(threads), "--import-qza",
+                ],
+                (f"cluster.{cid}",),
+                "clipon-qiime",
+                cpus=threads,
+                inputs=(str(rep_clust), blast_db, taxonomy_db),
+                outputs=tuple(
+                    str(out / name)
+                    for name in ("taxonomy.tsv", "taxonomy.qza", "search_results.qza")
+                ),
+                params={"CLUSTER_IDENTITY": cid, "BLAST_IDENTITY": bid, "MAXACCEPTS": maxaccepts},
+            )
+        )
+    return tasks
+
+
+def species_name(taxon: str) -> str | None:
+    """``Genus species`` of a ``k__...;g__...;s__...`` string, if resolved."""
+    genus, species = parse_lineage(taxon).names[-2:]
+    if not species:
+        return None
+    return f"{genus or ''} {species}".strip()
+
+
+def feature_reads(path: Path) -> dict[str, float]:
+    """Total reads of every feature in a ``biom convert --to-tsv`` table."""
+    reads: dict[str, float] = {}
+    if not path.exists():
+        return reads
+    with open(path) as fh:
+        for line in fh:
+            if line.startswith("#"):
+                continue
+            row = line.rstrip("\n").split("\t")
+            reads[row[0]] = sum(float(value) for value in row[1:] if value)
+    return reads
+
+
+def compare(output_dir: Path, combinations: list[tuple[str, str, str]]) -> list[list]:
+    """Write ``sweep_comparison.tsv`` and return its rows."""
+    rows = []
+    for cid, bid, maxaccepts in combinations:
+        taxonomy = classify_dir(output_dir, cid, bid, maxaccepts) / "taxonomy.tsv"
+        if not taxonomy.exists():
+            continue
+        reads = feature_reads(cluster_dir(output_dir, cid) / "feature-table.tsv")
+        features = species_features = 0
+        species: set[str] = set()
+        species_reads = 0.0
+        with open(taxonomy) as fh:
+            for row in csv.DictReader(fh, delimiter="\t"):
+                features += 1
+                name = species_name(row["Taxon"])
+                if name:
+                    species_features += 1
+                    species.add(name)
+                    species_reads += reads.get(row["Feature ID"], 0.0)
+        rows.append([cid, bid, maxaccepts, features, species_features, len(species),
+                     f"{species_reads:g}"])
+    with open(output_dir / COMPARISON_NAME, "w", newline="") as fh:
+        writer = csv.writer(fh, delimiter="\t")
+        writer.writerow(COMPARISON_HEADER)
+        writer.writerows(rows)
+    return rows
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("manifest", help="QIIME2 manifest (generate_manifest.sh).")
+    parser.add_argument("output_dir")
+    parser.add_argument("--cluster-id", nargs="+", default=[], help="Cluster identities.")
+    parser.add_argument("--blast-id", nargs="+", default=[], help="BLAST identities.")
+    parser.add_argument("--maxaccepts", nargs="+", default=[], help="BLAST maxaccepts.")
+    parser.add_argument(
+        "--combination",
+        nargs=3,
+        action="append",
+        default=[],
+        metavar=("CID", "BID", "MAX"),
+        help="Explicit combination; may be repeated.",
+    )
+    parser.add_argument("--blast-db", default=os.environ.get("BLAST_DB"))
+    parser.add_argument("--taxonomy-db", default=os.environ.get("TAXONOMY_DB"))
+    parser.add_argument(
+        "--cpus",
+        type=int,
+        default=int(os.environ.get("CLIPON_CPUS", 0)) or os.cpu_count() or 1,
+        help="Cores shared by all stages (default: $CLIPON_CPUS or all).",
+    )
+    parser.add_argument(
+        "--memory-gb",
+        type=float,
+        default=float(os.environ.get("CLIPON_MEMORY_GB", 0)) or 64.0,
+        help="Memory budget of the scheduler.",
+    )
+    parser.add_argument(
+        "--no-conda",
+        action="store_true",
+        help="Run commands in the current environment instead of 'conda run'.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Run every stage even if its inputs and parameters are unchanged.",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Print the tasks without running them."
+    )
+    args = parser.parse_args(argv)
+    grid = [args.cluster_id, args.blast_id, args.maxaccepts]
+    if any(grid) and not all(grid):
+        parser.error("--cluster-id, --blast-id y --maxaccepts deben usarse juntos")
+    args.combinations = list(dict.fromkeys(
+        [tuple(c) for c in args.combination] + list(itertools.product(*grid))
+        if all(grid) else [tuple(c) for c in args.combination]
+    ))
+    if not args.combinations:
+        parser.error("Indique al menos una combinación de parámetros")
+    if not (args.blast_db and args.taxonomy_db):
+        parser.error("--blast-db y --taxonomy-db (o BLAST_DB y TAXONOMY_DB) son obligatorios")
+    return args
+
+
+def main(argv=None) -> None:
+    """Entry point for command-line execution."""
+    args = parse_args(argv)
+    output_dir = Path(args.output_dir).resolve()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tasks = sweep_tasks(
+        str(Path(args.manifest).resolve()), output_dir, args.combinations, args.cpus,
+        args.blast_db, args.taxonomy_db,
+    )
+    if args.dry_run:
+        for task in tasks:
+            deps = ",".join(task.deps) or "-"
+            print(f"{task.name}\t{task.cpus}\t{deps}\t{' '.join(task.cmd)}")
+        return
+
+    conda = not args.no_conda and shutil.which("conda") is not None
+    cache = None if args.force else StepCache(output_dir / CACHE_NAME)
+    metrics = MetricsLog(os.environ.get("CLIPON_METRICS") or output_dir / "metrics.jsonl")
+    results = Scheduler(
+        tasks, args.cpus, args.memory_gb, output_dir / "logs", conda, cache, metrics
+    ).run()
+
+    rows = compare(output_dir, args.combinations)
+    print("\t".join(COMPARISON_HEADER))
+    for row in rows:
+        print("\t".join(map(str, row)))
+    failed = [r.name for r in results.values() if r.status not in ("ok", "cached")]
+    if failed:
+        print(f"Tareas fallidas u omitidas: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Comparación guardada en {output_dir / COMPARISON_NAME}")
+
+
+if __name__ == "__main__":
+    main()
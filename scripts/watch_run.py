@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""Process MinKNOW FASTQ batches while the sequencing run is in progress.
+
+MinKNOW writes a new FASTQ every few thousand reads, usually under one
+directory per barcode (``fastq_pass/barcode01/*.fastq``, or ``*.fastq.gz``
+when compression is on). The watcher polls
+``input_dir`` every ``--interval`` seconds and sends each new file, once it
+has not been modified for ``--settle`` seconds, through the clean/trim/filter
+stages of ``clean_trim_filter.py`` (same ``TRIM_*``, ``MIN_LEN``,
+``MAX_LEN``, ``MIN_QUAL`` variables). Files in a subdirectory belong to the
+sample named after it. Files directly in ``input_dir`` (a run without
+barcodes) belong to their stem without MinKNOW's trailing ``_<batch>``
+index, so ``<flowcell>_pass_<run>_0.fastq``, ``..._1.fastq``, ... add up to
+one sample.
+
+Everything is updated in place under ``work_dir``::
+
+    3_filtered/<sample>.fastq          filtered reads, appended batch by batch
+    stats/<sample>_<stage>.json        raw/processed/filtered ReadStatsSketch
+    watch_summary.tsv                  running counts, N50 and median quality
+    watch_state.json                   files ingested, sketches, triggers run
+    triggers/<sample>/<reads>/         snapshot and log of each trigger
+
+Read counts are additive and the sketches of ``read_sketches.py`` are
+mergeable, so each batch is read once and merged into the running totals.
+``watch_state.json`` is the commit point of a batch: it holds the sketches
+and the size of every filtered FASTQ, which is truncated back to that size
+on start, so a batch interrupted half way is ingested again from scratch.
+
+When the filtered reads of a sample reach the next value of
+``--thresholds``, the ``--on-threshold`` command runs in the background on a
+snapshot of its filtered reads, e.g. to cluster and classify it for a
+preliminary species list. ``{sample}``, ``{fastq}``, ``{reads}`` and
+``{output_dir}`` are replaced in the command. A sample has at most one
+trigger running; a threshold crossed meanwhile starts as soon as it ends.
+
+Usage:
+    python scripts/watch_run.py <fastq_pass> <dir_trabajo> \
+        [--thresholds 1000 5000 20000] [--on-threshold "CMD"] \
+        [--interval 30] [--settle 10] [--idle-exit 3600 | --once]
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from clean_trim_filter import PrepSettings, format_records, run_stages
+from collect_read_stats import FASTQ_SUFFIXES, iter_fastq_blocks
+from fastq_io import fastq_stem, open_fastq
+from read_sketches import ReadStatsSketch
+
+STATE_NAME = "watch_state.json"
+SUMMARY_NAME = "watch_summary.tsv"
+STAGES = ("raw", "processed", "filtered")
+DEFAULT_THRESHOLDS = (1000, 5000, 20000)
+BATCH_INDEX_RE = re.compile(r"_\d+$")
+
+
+@dataclass
+class SampleState:
+    """Persistent progress of one sample."""
+
+    files: int = 0
+    triggered: list[int] = field(default_factory=list)
+    filtered_bytes: int = 0
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+class RunWatcher:
+    """Incremental ingestion of the FASTQ files appearing in ``input_dir``."""
+
+    def __init__(
+        self,
+        input_dir: Path,
+        work_dir: Path,
+        settings: PrepSettings,
+        thresholds=DEFAULT_THRESHOLDS,
+        command: str | None = None,
+        settle: float = 10.0,
+    ) -> None:
+        self.input_dir = Path(input_dir)
+        self.work_dir = Path(work_dir)
+        self.settings = settings
+        self.thresholds = sorted(thresholds)
+        self.command = command
+        self.settle = settle
+        self.filtered_dir = self.work_dir / "3_filtered"
+        self.stats_dir = self.work_dir / "stats"
+        for directory in (self.filtered_dir, self.stats_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+        self.files: dict[str, int] = {}
+        self.samples: dict[str, SampleState] = {}
+        self.sketches: dict[str, dict[str, ReadStatsSketch]] = {}
+        self.running: dict[str, tuple[subprocess.Popen, int]] = {}
+        self._load_state()
+
+    # -- persistence -------------------------------------------------------
+
+    def _load_state(self) -> None:
+        path = self.work_dir / STATE_NAME
+        if path.exists():
+            data = json.loads(path.read_text())
+            self.files = data["files"]
+            self.samples = {
+                name: SampleState(**state) for name, state in data["samples"].items()
+            }
+            for name in self.samples:
+                self.sketches[name] = {
+                    stage: ReadStatsSketch.from_dict(sketch)
+                    for stage, sketch in data["sketches"][name].items()
+                }
+        # Drop the reads of a batch appended after the last commit, including
+        # the first batch of a sample not yet in the state
+        for filtered in self.filtered_dir.glob("*.fastq"):
+            state = self.samples.get(filtered.stem)
+            committed = state.filtered_bytes if state else 0
+            if filtered.stat().st_size > committed:
+                os.truncate(filtered, committed)
+
+    def _save_state(self) -> None:
+        data = {
+            "files": self.files,
+            "samples": {name: asdict(state) for name, state in self.samples.items()},
+            "sketches": {
+                name: {stage: sketch.to_dict() for stage, sketch in stages.items()}
+                for name, stages in self.sketches.items()
+            },
+        }
+        _write_atomic(self.work_dir / STATE_NAME, json.dumps(data, indent=2) + "\n")
+
+    def _sketch_path(self, sample: str, stage: str) -> Path:
+        return self.stats_dir / f"{sample}_{stage}.json"
+
+    def filtered_path(self, sample: str) -> Path:
+        return self.filtered_dir / f"{sample}.fastq"
+
+    # -- ingestion ---------------------------------------------------------
+
+    def sample_name(self, path: Path) -> str:
+        """Subdirectory of ``input_dir`` holding ``path``, or the stem without batch index."""
+        relative = path.relative_to(self.input_dir)
+        if len(relative.parts) > 1:
+            return relative.parts[0]
+        stem = fastq_stem(path)
+        return BATCH_INDEX_RE.sub("", stem) or stem
+
+    def pending_files(self, now: float | None = None) -> list[Path]:
+        """New FASTQ files not modified during the last ``settle`` seconds."""
+        now = time.time() if now is None else now
+        pending = []
+        for path in sorted(self.input_dir.rglob("*")):
+            if not path.name.endswith(FASTQ_SUFFIXES) or not path.is_file():
+                continue
+            key = str(path.relative_to(self.input_dir))
+            if key in self.files:
+                continue
+            if now - path.stat().st_mtime < self.settle:
+                continue
+            pending.append(path)
+        return pending
+
+    def ingest(self, path: Path) -> None:
+        """Run the stages on one batch and merge it into its sample.
+
+        The batch only counts once ``watch_state.json`` is saved; until then
+        its reads are past the ``filtered_bytes`` recorded for the sample.
+        """
+        sample = self.sample_name(path)
+        state = self.samples.setdefault(sample, SampleState())
+        sketches = self.sketches.setdefault(
+            sample, {stage: ReadStatsSketch() for stage in STAGES}
+        )
+        batch = {stage: ReadStatsSketch() for stage in STAGES}
+        with open_fastq(path) as fh, open(self.filtered_path(sample), "ab") as out:
+            for block in iter_fastq_blocks(fh):
+                cleaned, _, filtered = run_stages(block, self.settings)
+                for stage, reads in zip(STAGES, (block, cleaned, filtered)):
+                    reads.update_sketch(batch[stage])
+                out.write(format_records(filtered))
+            size = out.tell()
+        for stage in STAGES:
+            sketches[stage].merge(batch[stage])
+        state.files += 1
+        state.filtered_bytes = size
+        self.files[str(path.relative_to(self.input_dir))] = path.stat().st_size
+        self._save_state()
+        for stage in STAGES:
+            sketches[stage].write_json(str(self._sketch_path(sample, stage)))
+
+    # -- triggers ----------------------------------------------------------
+
+    def due_threshold(self, sample: str) -> int | None:
+        """Highest threshold reached by ``sample`` that has not triggered yet."""
+        reads = self.sketches[sample]["filtered"].reads
+        done = self.samples[sample].triggered
+        reached = [t for t in self.thresholds if t <= reads and t not in done]
+        return reached[-1] if reached else None
+
+    def check_triggers(self) -> None:
+        """Reap finished triggers and start the ones that became due."""
+        for sample, (process, reads) in list(self.running.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            del self.running[sample]
+            status = "terminado" if code == 0 else f"falló (código {code})"
+            print(f"[{sample}] disparador de {reads} lecturas {status}", flush=True)
+        if not self.command:
+            for sample in self.samples:
+                threshold = self.due_threshold(sample)
+                if threshold is not None:
+                    self._mark(sample, threshold)
+            return
+        for sample in self.samples:
+            threshold = self.due_threshold(sample)
+            if threshold is None or sample in self.running:
+                continue
+            self.running[sample] = (self._start(sample, threshold), threshold)
+
+    def _mark(self, sample: str, threshold: int) -> None:
+        """Record ``threshold`` and the lower ones it supersedes as done."""
+        triggered = self.samples[sample].triggered
+        triggered += [t for t in self.thresholds if t <= threshold and t not in triggered]
+        self._save_state()
+
+    def _start(self, sample: str, threshold: int) -> subprocess.Popen:
+        reads = self.sketches[sample]["filtered"].reads
+        output_dir = self.work_dir / "triggers" / sample / str(threshold)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        snapshot = output_dir / f"{sample}.fastq"
+        shutil.copyfile(self.filtered_path(sample), snapshot)
+        command = self.command.format(
+            sample=shlex.quote(sample),
+            fastq=shlex.quote(str(snapshot)),
+            reads=reads,
+            output_dir=shlex.quote(str(output_dir)),
+        )
+        print(f"[{sample}] {reads} lecturas filtradas: ejecutando {command}", flush=True)
+        log = open(output_dir / "trigger.log", "w")
+        process = subprocess.Popen(
+            command, shell=True, stdout=log, stderr=subprocess.STDOUT
+        )
+        log.close()
+        self._mark(sample, threshold)
+        return process
+
+    # -- reporting and main loop ------------------------------------------
+
+    def write_summary(self) -> Path:
+        """Rewrite ``watch_summary.tsv`` from the running sketches."""
+        columns = [
+            "sample", "files", "raw", "processed", "filtered", "filtered_bases",
+            "filtered_n50", "filtered_median_quality", "last_trigger",
+        ]
+        rows = []
+        for sample in sorted(self.samples):
+            filtered = self.sketches[sample]["filtered"].summary()
+            triggered = self.samples[sample].triggered
+            rows.append([
+                sample,
+                self.samples[sample].files,
+                *(self.sketches[sample][stage].reads for stage in STAGES),
+                filtered["bases"],
+                filtered["n50"],
+                f"{filtered['mean_quality']['median']:.2f}" if filtered["reads"] else "",
+                max(triggered) if triggered else "",
+            ])
+        path = self.work_dir / SUMMARY_NAME
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("w", newline="") as fh:
+            writer = csv.writer(fh, delimiter="\t", lineterminator="\n")
+            writer.writerow(columns)
+            writer.writerows(rows)
+        os.replace(tmp, path)
+        return path
+
+    def poll(self, now: float | None = None) -> int:
+        """Ingest every pending file and update triggers; return files ingested."""
+        pending = self.pending_files(now)
+        for path in pending:
+            self.ingest(path)
+        self.check_triggers()
+        if pending:
+            self.write_summary()
+        return len(pending)
+
+    def wait(self) -> None:
+        """Wait for the running triggers, starting any threshold still due."""
+        while self.running:
+            time.sleep(1)
+            self.check_triggers()
+
+    def run(self, interval: float = 30.0, idle_exit: float | None = None) -> None:
+        """Poll until no file has appeared for ``idle_exit`` seconds."""
+        last_new = time.monotonic()
+        while True:
+            if self.poll():
+                last_new = time.monotonic()
+            elif idle_exit is not None and time.monotonic() - last_new >= idle_exit:
+                break
+            time.sleep(interval)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("input_dir", type=Path, help="MinKNOW fastq_pass directory")
+    parser.add_argument("work_dir", type=Path)
+    parser.add_argument(
+        "--thresholds", type=int, nargs="+", default=list(DEFAULT_THRESHOLDS),
+        help="Filtered read counts that trigger --on-threshold (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--on-threshold", default=os.environ.get("WATCH_ON_THRESHOLD"),
+        help="Shell command run per sample and threshold (default: $WATCH_ON_THRESHOLD)",
+    )
+    parser.add_argument("--interval", type=float, default=30.0, help="Seconds between polls")
+    parser.add_argument(
+        "--settle", type=float, default=10.0,
+        help="Seconds a file must stay unmodified before it is ingested",
+    )
+    stop = parser.add_mutually_exclusive_group()
+    stop.add_argument(
+        "--idle-exit", type=float,
+        help="Stop after this many seconds without new files (default: run forever)",
+    )
+    stop.add_argument(
+        "--once", action="store_true", help="Ingest the files present now and exit"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    """Entry point for command-line execution."""
+    args = parse_args(argv)
+    if not args.input_dir.is_dir():
+        print(f"El directorio de entrada no existe: {args.input_dir}", file=sys.stderr)
+        sys.exit(1)
+    watcher = RunWatcher(
+        args.input_dir,
+        args.work_dir,
+        PrepSettings.from_env(),
+        args.thresholds,
+        args.on_threshold,
+        0.0 if args.once else args.settle,
+    )
+    try:
+        if args.once:
+            watcher.poll()
+        else:
+            watcher.run(args.interval, args.idle_exit)
+        watcher.wait()
+    except KeyboardInterrupt:
+        print("Interrumpido; el estado se reanuda en la próxima ejecución.", file=sys.stderr)
+    print(watcher.write_summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -42,3 +42,53 @@ def test_metadata_replacement(tmp_path):
     samples = read_samples(out_file)
     assert samples == ["Exp1"]
 
+
+def test_scale_table_restores_original_depth(tmp_path):
+    table = (
+        "Feature ID\tTaxon\tConsensus\n"
+        "foo_total_supporting_reads_10_cleaned_S1_trimmed\tSp1\t1\n"
+        "bar_total_supporting_reads_10_cleaned_S2_trimmed\tSp2\t1\n"
+    )
+    fractions = tmp_path / "subsample_fractions.tsv"
+    fractions.write_text(
+        "sample\treads\tsampled\tfraction\ncleaned_S1_trimmed\t4000\t1000\t0.250000\n"
+    )
+    in_file = tmp_path / "taxonomy.tsv"
+    in_file.write_text(table)
+    script = Path(__file__).resolve().parents[1] / "scripts" / "add_reads_and_sample.py"
+    subprocess.run(
+        [sys.executable, str(script), str(in_file), "--scale-table", str(fractions)],
+        check=True,
+    )
+    with in_file.with_name("taxonomy_with_sample.tsv").open() as fh:
+        reads = {row["Sample"]: row["Reads"] for row in csv.DictReader(fh, delimiter="\t")}
+    assert reads == {"S1": "40", "S2": "10"}
+
+
+def test_consensus_map_fans_out_classification(tmp_path):
+    table = (
+        "Feature ID\tTaxon\tConsensus\n"
+        "consensus_abc\tSp1\t1\n"
+    )
+    consensus_map = tmp_path / "consensus_map.tsv"
+    consensus_map.write_text(
+        "unique_id\tfeature_id\tsample\treads\n"
+        "consensus_abc\tconsensus_cl_id_0\tcleaned_S1_trimmed\t10\n"
+        "consensus_abc\tconsensus_cl_id_3\tcleaned_S2_trimmed\t4\n"
+    )
+    in_file = tmp_path / "taxonomy.tsv"
+    in_file.write_text(table)
+    script = Path(__file__).resolve().parents[1] / "scripts" / "add_reads_and_sample.py"
+    subprocess.run(
+        [sys.executable, str(script), str(in_file), "--consensus-map", str(consensus_map)],
+        check=True,
+    )
+    with in_file.with_name("taxonomy_with_sample.tsv").open() as fh:
+        rows = [
+            (row["Feature ID"], row["Taxon"], row["Reads"], row["Sample"])
+            for row in csv.DictReader(fh, delimiter="\t")
+        ]
+    assert rows == [
+        ("consensus_cl_id_0", "Sp1", "10", "S1"),
+        ("consensus_cl_id_3", "Sp1", "4", "S2"),
+    ]
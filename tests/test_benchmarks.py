@@ -0,0 +1,50 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import synthetic_data
+from add_reads_and_sample import parse_feature_id
+from collapse_reads_by_species import collapse_by_species
+from collect_read_stats import iter_fastq_blocks
+from plot_taxon_bar import read_collapsed_table
+from run_benchmarks import compare, run_suite
+
+
+def test_generators_produce_parseable_inputs(tmp_path):
+    fastq = tmp_path / "reads.fastq"
+    synthetic_data.write_fastq(fastq, 500, seed=3)
+    with fastq.open("rb") as fh:
+        blocks = list(iter_fastq_blocks(fh))
+    assert sum(len(block) for block in blocks) == 500
+    synthetic_data.write_fastq(tmp_path / "again.fastq", 500, seed=3)
+    assert fastq.read_bytes() == (tmp_path / "again.fastq").read_bytes()
+
+    taxonomy = tmp_path / "taxonomy.tsv"
+    synthetic_data.write_taxonomy(taxonomy, 200)
+    rows = taxonomy.read_text().splitlines()[1:]
+    assert len(rows) == 200
+    base, reads, sample = parse_feature_id(rows[0].split("\t")[0])
+    assert base.startswith("consensus_cl_id_0") and int(reads) >= 10
+    assert sample.startswith("cleaned_barcode")
+
+    with_sample = tmp_path / "taxonomy_with_sample.tsv"
+    synthetic_data.write_taxonomy_with_sample(with_sample, 200)
+    data = collapse_by_species(with_sample)
+    assert sum(sum(counts.values()) for counts in data.values()) > 200 * 9
+
+    collapsed = tmp_path / "collapsed.tsv"
+    synthetic_data.write_collapsed_table(collapsed, 100, samples=3)
+    assert len(read_collapsed_table(collapsed)) == 100
+
+
+def test_suite_and_compare(tmp_path):
+    document = run_suite(["format_taxon", "summarize_counts"], [200], tmp_path, repeat=1)
+    assert [r["case"] for r in document["results"]] == ["format_taxon", "summarize_counts"]
+    assert all(r["records"] == 200 and r["seconds"] > 0 for r in document["results"])
+
+    slower = {"results": [dict(r, seconds=r["seconds"] * 3) for r in document["results"]]}
+    assert compare(document, slower, min_seconds=0) == []
+    assert len(compare(slower, document, min_seconds=0)) == 2
@@ -0,0 +1,103 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from classification_cache import (  # type: ignore
+    ClassificationCache,
+    lookup_fasta,
+    sequence_hash,
+    store_results,
+)
+
+PARAMS = {"PERC_ID": "0.8", "QUERY_COV": "0.8", "MAX_ACCEPTS": "1", "MIN_CONSENSUS": "0.51"}
+
+
+def make_dbs(tmp_path: Path) -> tuple[str, str]:
+    blast, taxonomy = tmp_path / "blast.qza", tmp_path / "tax.qza"
+    blast.write_bytes(b"blast")
+    taxonomy.write_bytes(b"taxonomy")
+    return str(blast), str(taxonomy)
+
+
+def classify(work: Path, rows: dict[str, str]) -> tuple[Path, Path]:
+    """Fake QIIME2 output for the misses of ``work``."""
+    new = work / "new"
+    new.mkdir(exist_ok=True)
+    taxonomy, search = new / "taxonomy.tsv", new / "blast6.tsv"
+    taxonomy.write_text(
+        "Feature ID\tTaxon\tConsensus\n"
+        + "".join(f"{fid}\t{taxon}\t1.0\n" for fid, taxon in rows.items())
+    )
+    search.write_text("".join(f"{fid}\tref_{taxon}\t99.0\n" for fid, taxon in rows.items()))
+    return taxonomy, search
+
+
+def test_second_run_only_sends_new_sequences(tmp_path: Path) -> None:
+    blast, taxonomy_db = make_dbs(tmp_path)
+    cache = ClassificationCache(str(tmp_path / "cache" / "classifications.sqlite"))
+    context = cache.context(blast, taxonomy_db, PARAMS)
+
+    first = tmp_path / "run1"
+    fasta = tmp_path / "run1.fasta"
+    fasta.write_text(">a\nACGT\n>b\nTTTT\n")
+    assert lookup_fasta(cache, str(fasta), str(first), context) == (2, 0)
+    assert (first / "cache" / "misses.fasta").read_text().count(">") == 2
+    store_results(cache, str(first), *map(str, classify(first, {"a": "Fish", "b": "Crab"})))
+
+    second = tmp_path / "run2"
+    fasta.write_text(">x\nacgt\n>y\nGGGG\n")
+    assert lookup_fasta(cache, str(fasta), str(second), context) == (2, 1)
+    assert (second / "cache" / "misses.fasta").read_text() == ">y\nGGGG\n"
+    store_results(cache, str(second), *map(str, classify(second, {"y": "Eel"})))
+
+    merged = second / "cache" / "merged"
+    assert (merged / "taxonomy.tsv").read_text().splitlines() == [
+        "Feature ID\tTaxon\tConsensus",
+        "x\tFish\t1.0",
+        "y\tEel\t1.0",
+    ]
+    assert (merged / "blast6.tsv").read_text().splitlines() == [
+        "x\tref_Fish\t99.0",
+        "y\tref_Eel\t99.0",
+    ]
+    stats = cache.stats()
+    assert (stats["entries"], stats["lookups"], stats["hits"]) == (3, 4, 1)
+
+
+def test_all_hits_need_no_classification(tmp_path: Path) -> None:
+    blast, taxonomy_db = make_dbs(tmp_path)
+    cache = ClassificationCache(str(tmp_path / "c.sqlite"))
+    context = cache.context(blast, taxonomy_db, PARAMS)
+    cache.store({sequence_hash("ACGT"): ("Fish", "1.0", [["ref", "99.0"]])}, context)
+    fasta = tmp_path / "q.fasta"
+    fasta.write_text(">q\nACGT\n")
+    assert lookup_fasta(cache, str(fasta), str(tmp_path / "w"), context) == (1, 1)
+    assert (tmp_path / "w" / "cache" / "misses.fasta").read_text() == ""
+    store_results(cache, str(tmp_path / "w"))
+    merged = tmp_path / "w" / "cache" / "merged"
+    assert (merged / "taxonomy.tsv").read_text().splitlines()[1] == "q\tFish\t1.0"
+    assert (merged / "blast6.tsv").read_text() == "q\tref\t99.0\n"
+
+
+def test_context_changes_with_database_and_parameters(tmp_path: Path) -> None:
+    blast, taxonomy_db = make_dbs(tmp_path)
+    cache = ClassificationCache(str(tmp_path / "c.sqlite"))
+    context = cache.context(blast, taxonomy_db, PARAMS)
+    assert cache.context(blast, taxonomy_db, {**PARAMS, "PERC_ID": "0.9"}) != context
+    Path(blast).write_bytes(b"blast v2")
+    assert cache.context(blast, taxonomy_db, PARAMS) != context
+
+
+def test_eviction_removes_least_recently_used(tmp_path: Path) -> None:
+    cache = ClassificationCache(str(tmp_path / "c.sqlite"))
+    for name in ("old", "mid", "new"):
+        cache.store({name: ("Taxon", "1.0", [])}, "ctx")
+    cache.db.execute("UPDATE classifications SET last_used = 1 WHERE seq_hash = 'old'")
+    cache.db.execute("UPDATE classifications SET last_used = 2 WHERE seq_hash = 'mid'")
+    cache.db.commit()
+    cache.lookup(["old"], "ctx")  # refreshes "old"
+
+    size = cache.db.execute("SELECT bytes FROM classifications LIMIT 1").fetchone()[0]
+    assert cache.evict(2 * size) == 1
+    remaining = {row[0] for row in cache.db.execute("SELECT seq_hash FROM classifications")}
+    assert remaining == {"old", "new"}
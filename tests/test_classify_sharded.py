@@ -0,0 +1,68 @@
+import subprocess
+import sys
+from pathlib import Path
+
+SCRIPTS = Path(__file__).resolve().parents[1] / "scripts"
+sys.path.insert(0, str(SCRIPTS))
+from classify_sharded import plan_shards, split_fasta  # type: ignore
+
+STUB = '''
+import sys
+fasta, taxonomy, search, threads = sys.argv[1:]
+ids = [line[1:].split()[0] for line in open(fasta) if line.startswith(">")]
+if "bad" in ids:
+    sys.exit(3)
+with open(taxonomy, "w") as fh:
+    fh.write("Feature ID\\tTaxon\\tConsensus\\n")
+    fh.writelines(f"{i}\\tTaxon_{i}\\t1.0\\n" for i in ids)
+with open(search, "w") as fh:
+    fh.writelines(f"{i}\\tref_{i}_{n}\\t99.0\\t{threads}\\n" for i in ids for n in (1, 2))
+'''
+
+
+def run(tmp_path: Path, fasta: Path, out: str, *extra: str) -> subprocess.CompletedProcess:
+    stub = tmp_path / "stub.py"
+    stub.write_text(STUB)
+    return subprocess.run(
+        [sys.executable, str(SCRIPTS / "classify_sharded.py"), str(fasta), str(tmp_path / out),
+         "--classifier-cmd", f"{sys.executable} {stub} {{fasta}} {{taxonomy}} {{search}} {{threads}}",
+         *extra],
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_plan_and_split() -> None:
+    assert plan_shards(16, 100) == (8, 2)
+    assert plan_shards(16, 3) == (3, 5)
+    assert plan_shards(1, 10, threads=4) == (1, 1)
+    assert plan_shards(8, 10, shards=4) == (4, 2)
+    records = [("a", "A" * 10), ("b", "A" * 2), ("c", "A" * 5), ("d", "A" * 4)]
+    assert split_fasta(records, 2) == [[0], [1, 2, 3]]
+
+
+def test_merged_tables_do_not_depend_on_shards(tmp_path: Path) -> None:
+    fasta = tmp_path / "consensos.fasta"
+    fasta.write_text("".join(f">seq{i} reads={i}\n{'ACGT' * (i % 5 + 1)}\n" for i in range(9)))
+    one = run(tmp_path, fasta, "one", "--cpus", "2", "--shards", "1")
+    many = run(tmp_path, fasta, "many", "--cpus", "8", "--threads-per-shard", "2")
+    assert one.returncode == 0, one.stderr
+    assert many.returncode == 0, many.stderr
+    assert len(list((tmp_path / "many").glob("shard_*"))) == 4
+
+    taxonomy = (tmp_path / "many" / "taxonomy.tsv").read_text().splitlines()
+    assert taxonomy[0] == "Feature ID\tTaxon\tConsensus"
+    assert [row.split("\t")[0] for row in taxonomy[1:]] == [f"seq{i}" for i in range(9)]
+    assert taxonomy == (tmp_path / "one" / "taxonomy.tsv").read_text().splitlines()
+    hits = [row.split("\t") for row in (tmp_path / "many" / "blast6.tsv").read_text().splitlines()]
+    assert [row[1] for row in hits[:3]] == ["ref_seq0_1", "ref_seq0_2", "ref_seq1_1"]
+    assert {row[3] for row in hits} == {"2"}
+
+
+def test_failed_shard_is_reported(tmp_path: Path) -> None:
+    fasta = tmp_path / "q.fasta"
+    fasta.write_text(">ok\nACGT\n>bad\nACGTACGT\n")
+    result = run(tmp_path, fasta, "out", "--cpus", "2", "--threads-per-shard", "1")
+    assert result.returncode == 1
+    assert "classify.log" in result.stderr
+    assert not (tmp_path / "out" / "taxonomy.tsv").exists()
@@ -0,0 +1,113 @@
+import csv
+import gzip
+import math
+import os
+import random
+import subprocess
+import sys
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parents[1] / "scripts" / "clean_trim_filter.py"
+
+
+def nanofilt_quality(qual: str) -> float:
+    errors = [10 ** ((ord(c) - 33) / -10) for c in qual]
+    return -10 * math.log10(sum(errors) / len(errors))
+
+
+def write_reads(path: Path, seed: int = 3) -> list[tuple[str, str, str]]:
+    rng = random.Random(seed)
+    reads = []
+    with path.open("w") as fh:
+        for i in range(200):
+            length = rng.randint(5, 40)
+            seq = "".join(rng.choices("ACGT", k=length))
+            qual = "".join(chr(33 + rng.randint(2, 30)) for _ in range(length))
+            if i % 17 == 0:
+                qual = qual[:-1]  # malformed: dropped by the sanity check
+            reads.append((f"r{i}", seq, qual))
+            fh.write(f"@r{i} info\n{seq}\n+\n{qual}\n")
+    return reads
+
+
+def run(tmp_path: Path, env_extra: dict[str, str], *args: str) -> Path:
+    work = tmp_path / "work"
+    env = os.environ.copy()
+    env.update(env_extra)
+    subprocess.run(
+        [sys.executable, str(SCRIPT), str(tmp_path / "in"), str(work), *args],
+        check=True,
+        env=env,
+        capture_output=True,
+    )
+    return work
+
+
+def read_fastq(path: Path) -> list[tuple[str, str, str]]:
+    lines = path.read_text().splitlines()
+    return [
+        (lines[i][1:].split()[0], lines[i + 1], lines[i + 3])
+        for i in range(0, len(lines), 4)
+    ]
+
+
+def test_fused_stage_matches_sequential_semantics(tmp_path):
+    (tmp_path / "in").mkdir()
+    reads = write_reads(tmp_path / "in" / "S1.fastq")
+    env = {"TRIM_FRONT": "3", "TRIM_BACK": "2", "MIN_LEN": "10", "MAX_LEN": "30", "MIN_QUAL": "12"}
+
+    work = run(tmp_path, env, "--keep-intermediates")
+
+    cleaned = [r for r in reads if len(r[1]) == len(r[2])]
+    trimmed = [(rid, s[3 : len(s) - 2], q[3 : len(q) - 2]) for rid, s, q in cleaned]
+    expected = [
+        r for r in trimmed if 10 <= len(r[1]) <= 30 and nanofilt_quality(r[2]) > 12
+    ]
+
+    filtered = work / "3_filtered" / "cleaned_S1_trimmed_Filt10_30_Q12.fastq"
+    assert read_fastq(filtered) == expected
+    assert read_fastq(work / "1_processed" / "cleaned_S1.fastq") == cleaned
+    assert read_fastq(work / "2_trimmed" / "cleaned_S1_trimmed.fastq") == [
+        (rid, s, q) for rid, s, q in trimmed
+    ]
+
+    def n_rows(path: Path) -> int:
+        with path.open() as fh:
+            return len(list(csv.reader(fh, delimiter="\t"))) - 1
+
+    assert n_rows(work / "1_processed" / "S1_raw_stats.tsv") == len(reads)
+    assert n_rows(work / "1_processed" / "S1_processed_stats.tsv") == len(cleaned)
+    assert (
+        n_rows(work / "3_filtered" / "cleaned_S1_trimmed_filtered_stats.tsv")
+        == len(expected)
+    )
+
+
+def test_fused_stage_skip_trim_and_summary(tmp_path):
+    (tmp_path / "in").mkdir()
+    write_reads(tmp_path / "in" / "S2.fastq")
+    env = {"SKIP_TRIM": "1", "MIN_LEN": "1", "MAX_LEN": "100", "MIN_QUAL": "0",
+           "STATS_MODE": "summary"}
+
+    work = run(tmp_path, env)
+
+    assert (work / "3_filtered" / "cleaned_S2_Filt1_100_Q0.fastq").exists()
+    summary = work / "3_filtered" / "cleaned_S2_filtered_summary.tsv"
+    assert summary.read_text().startswith("# reads\t188\n")
+    assert not (work / "1_processed" / "cleaned_S2.fastq").exists()
+
+
+def test_fused_stage_reads_gzip_and_writes_bgzip(tmp_path):
+    (tmp_path / "in").mkdir()
+    plain = tmp_path / "S3.fastq"
+    write_reads(plain)
+    (tmp_path / "in" / "S3.fastq.gz").write_bytes(gzip.compress(plain.read_bytes()))
+    env = {"SKIP_TRIM": "1", "MIN_LEN": "1", "MAX_LEN": "100", "MIN_QUAL": "0",
+           "CLIPON_COMPRESS": "bgzip", "CLIPON_COMPRESS_LEVEL": "1"}
+
+    work = run(tmp_path, env)
+
+    filtered = work / "3_filtered" / "cleaned_S3_Filt1_100_Q0.fastq.gz"
+    records = gzip.decompress(filtered.read_bytes()).decode().splitlines()
+    assert len(records) == 188 * 4
+    assert (work / "1_processed" / "S3_raw_stats.tsv").exists()
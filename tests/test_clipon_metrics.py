@@ -0,0 +1,113 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from clipon_metrics import read_metrics, summarize  # type: ignore
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+SCRIPT = REPO_ROOT / "scripts" / "clipon_metrics.py"
+FASTQ = "@r1\nACGT\n+\nIIII\n@r2\nACGTA\n+\nIIIII\n"
+
+
+def test_run_records_usage_and_reads(tmp_path: Path) -> None:
+    src = tmp_path / "cleaned_s1_trimmed.fastq"
+    src.write_text(FASTQ)
+    dst = tmp_path / "out.fastq"
+    metrics = tmp_path / "metrics.jsonl"
+
+    subprocess.run(
+        [
+            sys.executable, str(SCRIPT), "run", "--metrics", str(metrics),
+            "--stage", "filter", "--sample", src.stem, "--inputs", str(src),
+            "--outputs", str(dst), "--param", "MIN_QUAL=10", "--count-reads",
+            "--stdin", str(src), "--stdout", str(dst), "--", "head", "-n", "4",
+        ],
+        check=True,
+    )
+
+    (record,) = read_metrics(str(metrics))
+    assert record["stage"] == "filter"
+    assert record["sample"] == "s1"
+    assert record["status"] == "ok"
+    assert record["reads_in"] == 2 and record["reads_out"] == 1
+    assert record["bytes_in"] == len(FASTQ)
+    assert record["cpu_s"] >= 0 and record["max_rss_mb"] > 0
+    assert record["params"] == {"MIN_QUAL": "10"}
+    assert record["reads_per_s"] > 0
+
+
+def test_reads_are_only_counted_on_request(tmp_path: Path) -> None:
+    src = tmp_path / "s1.fastq"
+    src.write_text(FASTQ)
+    metrics = tmp_path / "metrics.jsonl"
+    env = {k: v for k, v in os.environ.items() if k != "CLIPON_COUNT_READS"}
+
+    subprocess.run(
+        [sys.executable, str(SCRIPT), "record", "--metrics", str(metrics),
+         "--stage", "step3", "--wall", "2", "--inputs", str(src)],
+        env=env, check=True,
+    )
+    subprocess.run(
+        [sys.executable, str(SCRIPT), "record", "--metrics", str(metrics),
+         "--stage", "step3", "--wall", "2", "--inputs", str(src)],
+        env={**env, "CLIPON_COUNT_READS": "1"}, check=True,
+    )
+
+    default, counted = read_metrics(str(metrics))
+    assert default["bytes_in"] == len(FASTQ)
+    assert default["reads_in"] is None and default["reads_per_s"] is None
+    assert counted["reads_in"] == 2 and counted["reads_per_s"] == 1
+
+
+def test_run_keeps_exit_code(tmp_path: Path) -> None:
+    metrics = tmp_path / "metrics.jsonl"
+    result = subprocess.run(
+        [sys.executable, str(SCRIPT), "run", "--metrics", str(metrics),
+         "--stage", "sana", "--", "false"],
+    )
+    assert result.returncode == 1
+    assert read_metrics(str(metrics))[0]["status"] == "failed"
+
+
+def test_summary_orders_slowest_first() -> None:
+    records = [
+        {"stage": "filter", "sample": "s1", "status": "ok", "wall_s": 1.0,
+         "cpu_s": 1.0, "max_rss_mb": 10, "reads_in": 100, "reads_per_s": 100},
+        {"stage": "cluster", "sample": "s1", "status": "ok", "wall_s": 30.0,
+         "cpu_s": 120.0, "max_rss_mb": 900, "reads_in": None, "reads_per_s": None},
+        {"stage": "cluster", "sample": "s2", "status": "ok", "wall_s": 20.0,
+         "cpu_s": 80.0, "max_rss_mb": 700, "reads_in": None, "reads_per_s": None},
+    ]
+    lines = summarize(records).splitlines()
+    assert lines[1].split("\t")[:3] == ["cluster", "2", "50.0"]
+    assert lines[2].split("\t")[0] == "filter"
+    assert lines[5].split("\t")[:2] == ["s1", "cluster"]
+
+
+def test_nanofilt_stage_writes_metrics(tmp_path: Path) -> None:
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    (input_dir / "cleaned_s1_trimmed.fastq").write_text(FASTQ)
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "NanoFilt").write_text("#!/usr/bin/env bash\ncat\n")
+    (bin_dir / "NanoFilt").chmod(0o755)
+    metrics = tmp_path / "metrics.jsonl"
+
+    env = os.environ.copy()
+    env["PATH"] = f"{bin_dir}{os.pathsep}{env['PATH']}"
+    env["CLIPON_METRICS"] = str(metrics)
+    env["CLIPON_COUNT_READS"] = "1"
+    subprocess.run(
+        ["bash", "scripts/De1.5_A2_Filtrado_NanoFilt_1.1.sh",
+         str(input_dir), str(tmp_path / "out"), str(tmp_path / "nanofilt.log")],
+        cwd=REPO_ROOT, env=env, check=True, capture_output=True,
+    )
+
+    (record,) = read_metrics(str(metrics))
+    assert (record["stage"], record["sample"]) == ("filter", "s1")
+    assert record["reads_in"] == record["reads_out"] == 2
+    assert json.loads(metrics.read_text())["wall_s"] > 0
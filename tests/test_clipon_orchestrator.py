@@ -0,0 +1,209 @@
+"""Tests for the per-sample pipeline orchestrator."""
+
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from clipon_orchestrator import (  # type: ignore
+    PipelineConfig,
+    Scheduler,
+    Task,
+    build_tasks,
+    cluster_threads,
+)
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+STUBS = {
+    "seqkit": 'cp "$2" "$4"\n',
+    "cutadapt": (
+        'while [ $# -gt 1 ]; do [ "$1" = -o ] && out="$2"; shift; done\n'
+        'cp "$1" "$out"\n'
+    ),
+    "NanoFilt": "cat\n",
+    "NGSpeciesID": (
+        'echo "$@" > "$(dirname "$0")/NGSpeciesID.args"\n'
+        'while [ $# -gt 0 ]; do\n'
+        '  [ "$1" = --outfolder ] && out="$2"; [ "$1" = --fastq ] && fq="$2"; shift\n'
+        'done\n'
+        'mkdir -p "$out"\n'
+        'awk \'NR % 4 == 1 {print "0\\t" substr($1, 2)}\' "$fq" > "$out/final_clusters.tsv"\n'
+        'printf ">consensus_cl_id_0_total_supporting_reads_1\\nACGT\\n" '
+        '> "$out/consensus_reference_0.fasta"\n'
+    ),
+}
+
+
+def write_stubs(bin_dir: Path) -> None:
+    bin_dir.mkdir()
+    for name, body in STUBS.items():
+        path = bin_dir / name
+        path.write_text("#!/usr/bin/env bash\n" + body)
+        path.chmod(0o755)
+
+
+def run_orchestrator(
+    tmp_path: Path, env_overrides: dict | None = None, *extra_args: str,
+    cpus: int = 2, memory_gb: int = 8,
+) -> subprocess.CompletedProcess:
+    """Run the orchestrator on ``tmp_path/input`` with the stub tools."""
+    bin_dir = tmp_path / "bin"
+    if not bin_dir.exists():
+        write_stubs(bin_dir)
+    env = os.environ.copy()
+    env["PATH"] = f"{bin_dir}{os.pathsep}{env['PATH']}"
+    env.pop("BLAST_DB", None)
+    env.pop("TAXONOMY_DB", None)
+    env.update(env_overrides or {})
+    result = subprocess.run(
+        [
+            sys.executable, str(REPO_ROOT / "scripts" / "clipon_orchestrator.py"),
+            "--no-conda", "--cpus", str(cpus), "--memory-gb", str(memory_gb), *extra_args,
+            str(tmp_path / "input"), str(tmp_path / "work"),
+        ],
+        env=env,
+        text=True,
+        capture_output=True,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result
+
+
+def test_cluster_threads_split_cpus() -> None:
+    config = PipelineConfig(Path("in"), Path("work"), cpus=64, memory_gb=256)
+    assert cluster_threads(config, 2) == 32
+    assert cluster_threads(config, 10) == 6
+    # Memory limits the concurrent jobs to two
+    config.memory_gb = 8
+    assert cluster_threads(config, 10) == 32
+
+
+def test_scheduler_respects_cpu_budget_and_skips_dependents(tmp_path: Path) -> None:
+    tasks = [Task(f"t{i}", ["sleep", "0.2"], cpus=2) for i in range(4)]
+    tasks.append(Task("fail", ["false"]))
+    tasks.append(Task("after_fail", ["true"], ("fail",)))
+    tasks.append(Task("barrier", ["true"], ("t0", "after_fail"), barrier=True))
+
+    scheduler = Scheduler(tasks, cpus=4, memory_gb=100, log_dir=tmp_path)
+    results = scheduler.run()
+
+    assert scheduler.peak_cpus == 4
+    assert all(results[f"t{i}"].status == "ok" for i in range(4))
+    assert results["fail"].status == "failed"
+    assert results["after_fail"].status == "skipped"
+    assert results["barrier"].status == "ok"
+
+
+def test_orchestrator_runs_samples_with_stub_tools(tmp_path: Path) -> None:
+    input_dir = tmp_path / "input"
+    work_dir = tmp_path / "work"
+    input_dir.mkdir()
+    for name in ("s1", "s2"):
+        (input_dir / f"{name}.fastq").write_text("@r1\n" + "A" * 700 + "\n+\n" + "I" * 700 + "\n")
+
+    run_orchestrator(tmp_path, cpus=4, memory_gb=16)
+
+    assert (work_dir / "1_processed" / "s1_raw_stats.tsv").exists()
+    assert (
+        work_dir / "3_filtered" / "cleaned_s2_trimmed_filtered_stats.tsv"
+    ).exists()
+    consensus = (work_dir / "5_unified" / "consensos_todos.fasta").read_text()
+    assert consensus.count(">") == 2
+    # Both samples produce the same consensus, classified once
+    unique = (work_dir / "5_unified" / "consensos_unicos.fasta").read_text()
+    assert unique.count(">") == 1
+    counts = (work_dir / "read_counts.tsv").read_text().splitlines()
+    assert counts == ["sample\traw\tprocessed\tfiltered", "s1\t1\t1\t1", "s2\t1\t1\t1"]
+    metrics = [json.loads(line) for line in (work_dir / "metrics.jsonl").open()]
+    assert {(m["sample"], m["stage"]) for m in metrics} >= {("s1", "filter"), ("s2", "cluster")}
+
+    tasks = {
+        task.name: task
+        for task in build_tasks(PipelineConfig(input_dir, work_dir, cpus=4, memory_gb=16))
+    }
+    cluster = tasks["s1.cluster"]
+    assert cluster.cpus == 2
+    assert cluster.cmd[cluster.cmd.index("--t") + 1] == "2"
+
+
+def test_rerun_only_processes_new_and_changed_samples(tmp_path: Path) -> None:
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    (input_dir / "s1.fastq").write_text("@r1\nACGT\n+\nIIII\n")
+    env: dict[str, str] = {}
+
+    def run() -> list[str]:
+        result = run_orchestrator(tmp_path, env)
+        return [line for line in result.stdout.splitlines() if line.startswith("[ok]")]
+
+    assert len(run()) == 7  # five s1 tasks, summary and unify
+
+    (input_dir / "s2.fastq").write_text("@r1\nACGT\n+\nIIII\n")
+    ran = {line.split()[1] for line in run()}
+    assert ran == {
+        "s2.sana", "s2.trim", "s2.filter", "s2.stats", "s2.cluster", "summary", "unify"
+    }
+
+    env["MIN_QUAL"] = "12"
+    ran = {line.split()[1] for line in run()}
+    # Filtered names include MIN_QUAL, so everything from filtering on reruns
+    assert "s1.sana" not in ran and "s1.trim" not in ran
+    assert {"s1.filter", "s2.filter", "s1.cluster", "s2.cluster"} <= ran
+
+
+def test_dereplication_restores_supporting_reads(tmp_path: Path) -> None:
+    input_dir = tmp_path / "input"
+    work_dir = tmp_path / "work"
+    input_dir.mkdir()
+    read = "A" * 700 + "\n+\n" + "I" * 700 + "\n"
+    (input_dir / "s1.fastq").write_text("".join(f"@r{i}\n{read}" for i in range(4)))
+
+    run_orchestrator(tmp_path, {"DEREPLICATE": "1", "SUPPORT": "4", "SKIP_TRIM": "1"})
+
+    args = (tmp_path / "bin" / "NGSpeciesID.args").read_text().split()
+    assert args[args.index("--s") + 1] == "1"
+    consensus = (work_dir / "5_unified" / "consensos_todos.fasta").read_text()
+    assert "_total_supporting_reads_4_" in consensus
+
+
+def test_subsampling_caps_reads_and_scales_support(tmp_path: Path) -> None:
+    input_dir = tmp_path / "input"
+    work_dir = tmp_path / "work"
+    input_dir.mkdir()
+    read = "A" * 700 + "\n+\n" + "I" * 700 + "\n"
+    (input_dir / "s1.fastq").write_text("".join(f"@r{i}\n{read}" for i in range(8)))
+
+    run_orchestrator(
+        tmp_path, {"MAX_READS": "2", "SUPPORT": "8", "SKIP_TRIM": "1", "DEREPLICATE": "1"}
+    )
+
+    subsampled = work_dir / "3_filtered" / "subsampled"
+    assert (subsampled / "cleaned_s1_Filt650_750_Q10.fastq").read_text().count("@r") == 2
+    fractions = (subsampled / "subsample_fractions.tsv").read_text().splitlines()
+    assert fractions[1] == "cleaned_s1_Filt650_750_Q10\t8\t2\t0.250000"
+    # SUPPORT 8 -> 2 after subsampling -> 1 after dereplicating two identical reads
+    args = (tmp_path / "bin" / "NGSpeciesID.args").read_text().split()
+    assert args[args.index("--s") + 1] == "1"
+    consensus = (work_dir / "5_unified" / "consensos_todos.fasta").read_text()
+    assert "_total_supporting_reads_2_" in consensus
+
+
+def test_kmer_method_clusters_without_ngspecies(tmp_path: Path) -> None:
+    input_dir = tmp_path / "input"
+    work_dir = tmp_path / "work"
+    input_dir.mkdir()
+    read = "ACGTTGCA" * 80 + "\n+\n" + "I" * 640 + "\n"
+    (input_dir / "s1.fastq").write_text("".join(f"@r{i}\n{read}" for i in range(5)))
+
+    run_orchestrator(
+        tmp_path, {"SUPPORT": "3", "SKIP_TRIM": "1", "MIN_LEN": "600"}, "--cluster-method", "kmer"
+    )
+
+    assert not (tmp_path / "bin" / "NGSpeciesID.args").exists()
+    consensus = (work_dir / "5_unified" / "consensos_todos.fasta").read_text()
+    assert consensus.startswith(">consensus_cl_id_0_total_supporting_reads_5_")
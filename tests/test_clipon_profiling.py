@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SCRIPTS = Path(__file__).resolve().parents[1] / "scripts"
+sys.path.insert(0, str(SCRIPTS))
+
+import clipon_profiling
+from clipon_profiling import phase, profile, timed_iter
+
+
+def test_disabled_profiling_is_a_no_op(tmp_path):
+    items = [1, 2, 3]
+    with profile(tmp_path / "out", enabled=False):
+        assert phase("load") is phase("write")
+        assert timed_iter(items) is items
+    assert not list(tmp_path.iterdir())
+
+
+def test_nested_phases_are_exclusive(tmp_path):
+    with profile(tmp_path / "out", enabled=True):
+        profiler = clipon_profiling._active
+        with phase("outer"):
+            for _ in timed_iter(iter([1, 2]), "load"):
+                time.sleep(0.01)
+        with phase("outer"):
+            pass
+    assert profiler.phases["load"][0] == 3
+    assert profiler.phases["outer"][0] == 2
+    assert 0.015 < profiler.phases["outer"][1] < 0.5
+    report = (tmp_path / "out.profile.txt").read_text()
+    assert "## Phases (wall-clock)" in report and "## cProfile" in report
+    assert (tmp_path / "out.prof").exists()
+
+
+def test_env_var_profiles_script(tmp_path):
+    table = tmp_path / "taxonomy_with_sample.tsv"
+    table.write_text(
+        "Feature ID\tTaxon\tConsensus\tReads\tSample\n"
+        "id1\tk__B; g__Escherichia; s__coli\tC1\t10\tS1\n"
+    )
+    env = dict(os.environ, CLIPON_PROFILE="1")
+    subprocess.run(
+        [sys.executable, str(SCRIPTS / "collapse_reads_by_species.py"), str(table),
+         "--output-prefix", str(tmp_path / "species")],
+        check=True, capture_output=True, env=env,
+    )
+    report = (tmp_path / "species.profile.txt").read_text()
+    phases = [line.split("\t")[0] for line in report.splitlines()[4:9]]
+    assert phases == ["load", "transform", "write", "other", "total"]
@@ -35,3 +35,76 @@ def test_collapse_reads(tmp_path):
     assert lines[5] == "Species\tReads\tProportion"
     assert lines[6].startswith("Bacillaceae (family)\t20\t")
     assert lines[6].endswith("100.00")
+
+
+def test_structured_output(tmp_path):
+    import numpy as np
+
+    table = (
+        "Feature ID\tTaxon\tConsensus\tReads\tSample\n"
+        "id1\tk__Bacteria; g__Escherichia; s__coli\tC1\t10\tS1\n"
+        "id2\tk__Bacteria; g__Bacillus\tC2\t5\tS1\n"
+        "id3\tk__Bacteria f__Bacillaceae\tC3\t20\tS2\n"
+    )
+    in_file = tmp_path / "taxonomy_with_sample.tsv"
+    in_file.write_text(table)
+    prefix = tmp_path / "out" / "species_reads"
+
+    script = (
+        Path(__file__).resolve().parents[1]
+        / "scripts"
+        / "collapse_reads_by_species.py"
+    )
+    subprocess.run(
+        [sys.executable, str(script), str(in_file), "--output-prefix", str(prefix)],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+    long_lines = (tmp_path / "out" / "species_reads.long.tsv").read_text().splitlines()
+    assert long_lines[0] == "Sample\tTaxon\tReads\tFraction"
+    assert "S1\t*Bacillus* (genus)\t5\t0.3333333333333333" in long_lines
+    assert "S2\tBacillaceae (family)\t20\t1.0" in long_lines
+
+    matrix_lines = (tmp_path / "out" / "species_reads.matrix.tsv").read_text().splitlines()
+    assert matrix_lines == [
+        "Sample\t*Bacillus* (genus)\t*Escherichia coli*\tBacillaceae (family)",
+        "S1\t5\t10\t0",
+        "S2\t0\t0\t20",
+    ]
+
+    with np.load(tmp_path / "out" / "species_reads.matrix.npz") as npz:
+        assert npz["samples"].tolist() == ["S1", "S2"]
+        assert npz["counts"].tolist() == [[5, 10, 0], [0, 0, 20]]
+
+
+def test_collapse_by_rank(tmp_path):
+    table = (
+        "Feature ID\tTaxon\tConsensus\tReads\tSample\n"
+        "id1\tk__Bacteria; f__Enterobacteriaceae; g__Escherichia; s__coli\tC1\t10\tS1\n"
+        "id2\tk__Bacteria; f__Bacillaceae; g__Bacillus\tC2\t5\tS1\n"
+        "id3\tk__Bacteria; f__Enterobacteriaceae; g__Salmonella\tC3\t30\tS1\n"
+    )
+    in_file = tmp_path / "taxonomy_with_sample.tsv"
+    in_file.write_text(table)
+
+    script = (
+        Path(__file__).resolve().parents[1]
+        / "scripts"
+        / "collapse_reads_by_species.py"
+    )
+    result = subprocess.run(
+        [sys.executable, str(script), str(in_file), "--rank", "family"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+    lines = [line.strip() for line in result.stdout.strip().splitlines() if line.strip()]
+    assert lines == [
+        "Sample: S1",
+        "Family\tReads\tProportion",
+        "Enterobacteriaceae\t40\t88.89",
+        "Bacillaceae\t5\t11.11",
+    ]
@@ -1,10 +1,19 @@
 import csv
+import gzip
+import json
 import subprocess
 import sys
 from pathlib import Path
 
+import numpy as np
+
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
-from collect_read_stats import collect_read_stats  # type: ignore
+from collect_read_stats import (  # type: ignore
+    LengthQualityHistogram,
+    collect_read_stats,
+    collect_read_stats_batch,
+    collect_read_summary,
+)
 
 
 def create_fastq(tmp_path: Path) -> Path:
@@ -43,6 +52,20 @@ def test_collect_read_stats_function(tmp_path: Path) -> None:
     collect_read_stats(str(fastq), str(out_tsv))
     validate_output(out_tsv)
 
+    sidecar = json.loads((tmp_path / "stats.tsv.counts.json").read_text())
+    assert sidecar == {"reads": 2, "bases": 5, "size": out_tsv.stat().st_size}
+
+
+def test_collect_read_stats_gzip_input(tmp_path: Path) -> None:
+    """Gzip-compressed FASTQ gives the same statistics as the plain file."""
+    fastq = create_fastq(tmp_path)
+    compressed = tmp_path / "reads.fastq.gz"
+    compressed.write_bytes(gzip.compress(fastq.read_bytes()))
+    out_tsv = tmp_path / "stats.tsv"
+
+    collect_read_stats(str(compressed), str(out_tsv))
+    validate_output(out_tsv)
+
 
 def test_collect_read_stats_cli(tmp_path: Path) -> None:
     """Run the script via subprocess and validate output."""
@@ -55,3 +78,132 @@ def test_collect_read_stats_cli(tmp_path: Path) -> None:
         check=True,
     )
     validate_output(out_tsv)
+
+
+def reference_read_stats(fastq: Path) -> list[list[str]]:
+    """Line-by-line implementation used before the block engine."""
+    rows = [["read_id", "length", "mean_quality"]]
+    with fastq.open() as fh:
+        while True:
+            header = fh.readline().rstrip()
+            if not header:
+                break
+            seq = fh.readline().rstrip()
+            fh.readline()
+            qual = fh.readline().rstrip()
+            length = len(seq)
+            mean_q = sum(ord(c) - 33 for c in qual) / length if length else 0
+            rows.append([header[1:].split()[0], str(length), f"{mean_q:.2f}"])
+    return rows
+
+
+def test_block_engine_matches_reference(tmp_path: Path) -> None:
+    """Tiny blocks, CRLF endings and a truncated tail match the old reader."""
+    content = (
+        "@r1 runid=abc\r\nACGTACGTAC\r\n+\r\n!#%')+-/13\r\n"
+        "@r2\nACG  \n+\n?@A\n"
+        "@r3\n\n+\n\n"
+        "@r4 ch=7\nACGTA\n+\nIIIII\n"
+        "@r5\nAC\n+"
+    )
+    fastq = tmp_path / "edge.fastq"
+    fastq.write_text(content)
+    out_tsv = tmp_path / "stats.tsv"
+
+    for chunk_size in (1, 7, 64, 1 << 20):
+        collect_read_stats(str(fastq), str(out_tsv), chunk_size=chunk_size)
+        with out_tsv.open(newline="") as fh:
+            rows = list(csv.reader(fh, delimiter="\t"))
+        assert rows == reference_read_stats(fastq)
+
+
+def test_block_engine_stops_at_blank_header(tmp_path: Path) -> None:
+    fastq = tmp_path / "blank.fastq"
+    fastq.write_text("@r1\nAC\n+\nII\n\n@r2\nAC\n+\nII\n")
+    out_tsv = tmp_path / "stats.tsv"
+
+    collect_read_stats(str(fastq), str(out_tsv), chunk_size=5)
+    with out_tsv.open(newline="") as fh:
+        rows = list(csv.reader(fh, delimiter="\t"))
+    assert rows == reference_read_stats(fastq)
+    assert len(rows) == 2
+
+
+def test_batch_reports_failures_and_continues(tmp_path: Path) -> None:
+    """A missing FASTQ is reported without aborting the other files."""
+    fastq = create_fastq(tmp_path)
+    pairs = [
+        (str(fastq), str(tmp_path / "a_stats.tsv")),
+        (str(tmp_path / "missing.fastq"), str(tmp_path / "b_stats.tsv")),
+        (str(fastq), str(tmp_path / "c_stats.tsv")),
+    ]
+
+    results = collect_read_stats_batch(pairs, workers=2)
+
+    assert [r.ok for r in results] == [True, False, True]
+    assert "missing.fastq" in results[1].error
+    validate_output(tmp_path / "a_stats.tsv")
+    validate_output(tmp_path / "c_stats.tsv")
+
+
+def test_batch_cli_directory_mode(tmp_path: Path) -> None:
+    """--input-dir applies the naming rule and writes a status report."""
+    in_dir = tmp_path / "in"
+    out_dir = tmp_path / "out"
+    in_dir.mkdir()
+    fastq = create_fastq(in_dir)
+    fastq.rename(in_dir / "cleaned_S1.fastq")
+    report = tmp_path / "report.tsv"
+    script = Path(__file__).resolve().parents[1] / "scripts" / "collect_read_stats.py"
+
+    subprocess.run(
+        [
+            sys.executable,
+            str(script),
+            "--input-dir",
+            str(in_dir),
+            "--output-dir",
+            str(out_dir),
+            "--name-template",
+            "{stem}_processed_stats.tsv",
+            "--strip-prefix",
+            "cleaned_",
+            "--report",
+            str(report),
+        ],
+        check=True,
+    )
+    validate_output(out_dir / "S1_processed_stats.tsv")
+    assert report.read_text().splitlines()[1].split("\t")[2] == "ok"
+
+
+def test_summary_histogram(tmp_path: Path) -> None:
+    """--summary keeps totals, N50 and binned counts."""
+    fastq = create_fastq(tmp_path)
+    out = tmp_path / "reads_raw_summary.tsv"
+    script = Path(__file__).resolve().parents[1] / "scripts" / "collect_read_stats.py"
+
+    subprocess.run(
+        [sys.executable, str(script), str(fastq), str(out), "--summary"],
+        check=True,
+    )
+    lines = out.read_text().splitlines()
+    assert lines[:3] == ["# reads\t2", "# bases\t5", "# n50\t4"]
+    rows = list(csv.DictReader(lines[3:], delimiter="\t"))
+    assert [(r["length_start"], r["quality_start"], r["count"]) for r in rows] == [
+        ("0", "0", "1"),
+        ("0", "40", "1"),
+    ]
+
+
+def test_histogram_merge_and_overflow(tmp_path: Path) -> None:
+    fastq = create_fastq(tmp_path)
+    first = collect_read_summary(str(fastq), str(tmp_path / "a.tsv"), max_length=2)
+    second = LengthQualityHistogram(max_length=2)
+    second.update(np.array([10_000]), np.array([99.0]))
+    first.merge(second)
+
+    assert first.reads == 3
+    assert first.bases == 10_005
+    assert first.n50() == 10_000
+    assert first.counts[-1, -1] == 1
@@ -0,0 +1,107 @@
+import csv
+import multiprocessing
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from dereplicate_reads import (  # type: ignore
+    DerepResult,
+    dereplicate_file,
+    read_abundance,
+    rescale_consensus,
+    scaled_support,
+    write_report,
+)
+
+
+def write_fastq(path: Path, reads: list[tuple[str, str, str]]) -> None:
+    path.write_text("".join(f"@{rid} extra\n{seq}\n+\n{qual}\n" for rid, seq, qual in reads))
+
+
+def read_fastq(path: Path) -> list[tuple[str, str]]:
+    lines = path.read_text().splitlines()
+    return [(lines[i][1:].split()[0], lines[i + 1]) for i in range(0, len(lines), 4)]
+
+
+READS = [
+    ("r1", "ACGT", "!!!!"),
+    ("r2", "ACGT", "IIII"),
+    ("r3", "TTTT", "IIII"),
+    ("r4", "ACGT", "5555"),
+    ("r5", "GG", "II"),
+    ("r6", "TTTT", "IIII"),
+]
+
+
+def test_identical_reads_keep_best_quality(tmp_path: Path) -> None:
+    fastq = tmp_path / "s1.fastq"
+    write_fastq(fastq, READS)
+    out = tmp_path / "derep"
+    out.mkdir()
+
+    result = dereplicate_file(str(fastq), str(out))
+
+    assert (result.reads, result.unique, result.partitions) == (6, 3, 1)
+    assert result.reduction == 0.5
+    assert read_fastq(out / "s1.fastq") == [("r2", "ACGT"), ("r3", "TTTT"), ("r5", "GG")]
+    assert read_abundance(str(out / "s1.abundance.tsv")) == {"r2": 3, "r3": 2, "r5": 1}
+    assert scaled_support(str(out / "s1.abundance.tsv"), 150) == 75
+
+
+def test_partitioned_dereplication_matches_in_memory(tmp_path: Path) -> None:
+    fastq = tmp_path / "s1.fastq"
+    write_fastq(fastq, READS * 50)
+    memory, spilled = tmp_path / "memory", tmp_path / "spilled"
+    memory.mkdir()
+    spilled.mkdir()
+
+    dereplicate_file(str(fastq), str(memory))
+    result = dereplicate_file(str(fastq), str(spilled), memory_mb=0.001)
+
+    assert result.partitions > 1
+    assert result.unique == 3
+    assert read_abundance(str(spilled / "s1.abundance.tsv")) == read_abundance(
+        str(memory / "s1.abundance.tsv")
+    )
+    assert sorted(read_fastq(spilled / "s1.fastq")) == sorted(read_fastq(memory / "s1.fastq"))
+    assert [p.name for p in spilled.iterdir() if p.name.startswith(".")] == []
+
+
+def test_rescale_uses_cluster_abundance(tmp_path: Path) -> None:
+    outfolder = tmp_path / "s1"
+    outfolder.mkdir()
+    (outfolder / "final_clusters.tsv").write_text("0\tr2\n0\tr5\n1\tr3\n")
+    (outfolder / "consensus_reference_0.fasta").write_text(
+        ">consensus_cl_id_0_total_supporting_reads_2\nACGT\n"
+    )
+    (outfolder / "consensus_reference_1.fasta").write_text(
+        ">consensus_cl_id_1_total_supporting_reads_1\nTTTT\n"
+    )
+    abundance = tmp_path / "s1.abundance.tsv"
+    with abundance.open("w", newline="") as fh:
+        writer = csv.writer(fh, delimiter="\t")
+        writer.writerows([["read_id", "size"], ["r2", 3], ["r3", 2], ["r5", 1]])
+
+    kept = rescale_consensus(str(outfolder), str(abundance), min_support=3)
+
+    assert kept == 1
+    assert (outfolder / "consensus_reference_0.fasta").read_text().startswith(
+        ">consensus_cl_id_0_total_supporting_reads_4\n"
+    )
+    assert not (outfolder / "consensus_reference_1.fasta").exists()
+
+
+def _report_sample(args: tuple[int, str]) -> None:
+    i, path = args
+    write_report([DerepResult(f"s{i:02d}", 100 + i, 10, 1)], path)
+
+
+def test_concurrent_reports_keep_every_sample(tmp_path: Path) -> None:
+    report = tmp_path / "dereplication_report.tsv"
+    with multiprocessing.Pool(8) as pool:
+        pool.map(_report_sample, [(i, str(report)) for i in range(32)])
+
+    with report.open(newline="") as fh:
+        rows = list(csv.DictReader(fh, delimiter="\t"))
+    assert [row["sample"] for row in rows] == [f"s{i:02d}" for i in range(32)]
+    assert rows[5]["reads"] == "105"
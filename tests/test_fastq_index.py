@@ -0,0 +1,62 @@
+import json
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from clean_trim_filter import PrepSettings, process_fastq
+from collect_read_stats import collect_file, collect_file_chunked
+from fastq_index import INDEX_SUFFIX, chunk_ranges, load_index
+
+
+def write_reads(path: Path, n: int = 3000) -> None:
+    rng = random.Random(5)
+    with path.open("w") as fh:
+        for i in range(n):
+            length = rng.randint(0, 120)
+            seq = "".join(rng.choices("ACGT", k=length))
+            # Quality lines may start with '@' or '+'
+            qual = "".join(rng.choices("@+#5?I", k=length))
+            fh.write(f"@r{i} run=1\n{seq}\n+\n{qual}\n")
+
+
+def test_chunks_start_on_records(tmp_path):
+    fastq = tmp_path / "reads.fastq"
+    write_reads(fastq)
+    data = fastq.read_bytes()
+    ranges = chunk_ranges(fastq, 4096)
+    assert len(ranges) > 10
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    headers = 0
+    for start, end in ranges:
+        lines = data[start:end].splitlines()
+        assert len(lines) % 4 == 0
+        assert all(line.startswith(b"@r") for line in lines[::4])
+        headers += len(lines) // 4
+    assert headers == 3000
+
+    index = json.loads((tmp_path / ("reads.fastq" + INDEX_SUFFIX)).read_text())
+    assert index["offsets"] == load_index(fastq, 4096)
+
+
+def test_chunked_outputs_match_serial(tmp_path):
+    fastq = tmp_path / "reads.fastq"
+    write_reads(fastq)
+    collect_file(str(fastq), str(tmp_path / "serial.tsv"))
+    collect_file_chunked(str(fastq), str(tmp_path / "chunked.tsv"), workers=3, chunk_size=8192)
+    assert (tmp_path / "serial.tsv").read_text() == (tmp_path / "chunked.tsv").read_text()
+
+    settings = PrepSettings(trim_front=2, trim_back=2, min_len=20, max_len=100, min_qual=5)
+    outputs = {}
+    for workers in (1, 3):
+        dirs = [tmp_path / f"w{workers}" / stage for stage in ("1", "2", "3")]
+        for directory in dirs:
+            directory.mkdir(parents=True)
+        counts = process_fastq(
+            fastq, *dirs, settings, keep_intermediates=True, workers=workers,
+            index_chunk=8192,
+        )
+        files = sorted(p for d in dirs for p in d.iterdir())
+        outputs[workers] = (counts, {p.name: p.read_bytes() for p in files})
+    assert outputs[1] == outputs[3]
@@ -0,0 +1,63 @@
+import gzip
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+import fastq_io  # type: ignore
+from fastq_io import (  # type: ignore
+    BgzfWriter,
+    fastq_stem,
+    input_pipe,
+    is_bgzf,
+    open_fastq,
+    open_output,
+    output_pipe,
+)
+
+READS = b"".join(b"@r%d\n%s\n+\n%s\n" % (i, b"ACGT" * (i % 50), b"I" * 4 * (i % 50))
+                 for i in range(20000))
+
+
+def test_bgzf_writer_is_readable_gzip(tmp_path):
+    path = tmp_path / "reads.fastq.gz"
+    with BgzfWriter(path, level=1) as out:
+        for i in range(0, len(READS), 70001):
+            out.write(READS[i : i + 70001])
+    assert is_bgzf(path)
+    assert gzip.decompress(path.read_bytes()) == READS
+    assert path.read_bytes().endswith(fastq_io.BGZF_EOF)
+
+
+def test_open_fastq_inflates_in_thread_without_tools(tmp_path, monkeypatch):
+    monkeypatch.setattr(fastq_io.shutil, "which", lambda name: None)
+    path = tmp_path / "reads.fastq.gz"
+    with open_output(path) as out:
+        out.write(READS)
+    with open_fastq(path) as fh:
+        assert isinstance(fh, fastq_io._ThreadReader)
+        pieces = iter(lambda: fh.read(100_000), b"")
+        assert b"".join(pieces) == READS
+    # Stopping early does not hang the background thread
+    with open_fastq(path) as fh:
+        assert fh.read(4) == b"@r0\n"
+    plain = tmp_path / "reads.fastq"
+    plain.write_bytes(READS)
+    with open_fastq(plain) as fh:
+        assert fh.read() == READS
+
+
+def test_pipes_connect_external_commands(tmp_path):
+    source = tmp_path / "in.fastq.gz"
+    source.write_bytes(gzip.compress(READS))
+    target = tmp_path / "out.fastq.gz"
+    with input_pipe(source) as stdin, output_pipe(target, level=1) as stdout:
+        subprocess.run(["cat"], stdin=stdin, stdout=stdout, check=True)
+    assert gzip.decompress(target.read_bytes()) == READS
+
+
+def test_fastq_stem():
+    assert fastq_stem("dir/barcode01.fastq.gz") == "barcode01"
+    assert fastq_stem("barcode01.fq") == "barcode01"
+    assert fastq_stem("cleaned_s1_trimmed.fastq") == "cleaned_s1_trimmed"
@@ -0,0 +1,57 @@
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from kmer_cluster import align_columns, cluster_file, consensus, revcomp  # type: ignore
+
+RNG = random.Random(11)
+
+
+def mutate(seq: str, rate: float) -> str:
+    """Substitutions, insertions and deletions at ``rate`` per base."""
+    out = []
+    for base in seq:
+        roll = RNG.random()
+        if roll < rate / 3:
+            continue
+        if roll < 2 * rate / 3:
+            out.append(RNG.choice("ACGT"))
+        out.append(RNG.choice("ACGT") if rate * 2 / 3 <= roll < rate else base)
+    return "".join(out)
+
+
+def test_alignment_columns_and_consensus() -> None:
+    columns, inserts = align_columns("ACGTACGT", "ACTTACGGT")
+    assert "".join(columns) == "ACTTACGT"
+    assert "".join(inserts) == "G" and inserts.index("G") in (6, 7)
+    assert consensus("ACGTTCGT", ["ACGTACGT", "ACGTACGT", "ACGAACGT"]) == "ACGTACGT"
+
+
+def test_noisy_reads_give_one_consensus_per_species(tmp_path: Path) -> None:
+    species = {
+        "a": "".join(RNG.choice("ACGT") for _ in range(300)),
+        "b": "".join(RNG.choice("ACGT") for _ in range(300)),
+    }
+    reads = [(name, mutate(seq, 0.03)) for name, seq in species.items() for _ in range(20)]
+    reads += [("noise", "".join(RNG.choice("ACGT") for _ in range(300)))]
+    fastq = tmp_path / "sample.fastq"
+    with open(fastq, "w") as fh:
+        for i, (name, seq) in enumerate(reads):
+            seq = revcomp(seq) if i % 2 else seq
+            fh.write(f"@{name}_{i}\n{seq}\n+\n{'5' * len(seq)}\n")
+
+    assert cluster_file(str(fastq), str(tmp_path / "out"), support=10) == ("sample", 41, 3, 2)
+    out = tmp_path / "out" / "sample"
+    found = {}
+    for path in sorted(out.glob("consensus_reference_*.fasta")):
+        header, seq = path.read_text().split()
+        assert header.startswith(">consensus_cl_id_") and header.endswith("_reads_20")
+        found[seq if seq in species.values() else revcomp(seq)] = header
+    assert set(found) == set(species.values())
+    clusters = [line.split("\t") for line in (out / "final_clusters.tsv").read_text().splitlines()]
+    assert len(clusters) == 41
+    by_cluster = {}
+    for cid, read_id in clusters:
+        by_cluster.setdefault(cid, set()).add(read_id.split("_")[0])
+    assert sorted(map(sorted, by_cluster.values())) == [["a"], ["b"], ["noise"]]
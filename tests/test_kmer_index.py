@@ -0,0 +1,103 @@
+import random
+import subprocess
+import sys
+import zipfile
+from pathlib import Path
+
+SCRIPTS = Path(__file__).resolve().parents[1] / "scripts"
+sys.path.insert(0, str(SCRIPTS))
+from kmer_index import KmerIndex, build_index, classify_fasta, edit_distance  # type: ignore
+
+RNG = random.Random(7)
+REFS = {f"ref{i}": "".join(RNG.choice("ACGT") for _ in range(650)) for i in range(4)}
+REFS["twin"] = REFS["ref3"]  # same sequence, another species
+TAXA = {
+    "ref0": "k__Metazoa;g__Hoplias;s__malabaricus",
+    "ref1": "k__Metazoa;g__Megaleporinus;s__obtusidens",
+    "ref2": "k__Metazoa;g__Hoplias;s__lacerdae",
+    "ref3": "k__Metazoa;g__Astyanax;s__lacustris",
+    "twin": "k__Metazoa;g__Astyanax;s__fasciatus",
+}
+
+
+def make_index(tmp_path: Path) -> Path:
+    fasta = tmp_path / "refs.fasta"
+    fasta.write_text("".join(f">{name} desc\n{seq[:300]}\n{seq[300:]}\n" for name, seq in REFS.items()))
+    taxonomy = tmp_path / "tax.qza"
+    with zipfile.ZipFile(taxonomy, "w") as archive:
+        archive.writestr(
+            "uuid/data/taxonomy.tsv",
+            "Feature ID\tTaxon\n" + "".join(f"{k}\t{v}\n" for k, v in TAXA.items()),
+        )
+    index = tmp_path / "index"
+    assert build_index(str(fasta), str(taxonomy), str(index))
+    assert not build_index(str(fasta), str(taxonomy), str(index))
+    return index
+
+
+def revcomp(seq: str) -> str:
+    return seq.translate(str.maketrans("ACGT", "TGCA"))[::-1]
+
+
+def test_edit_distance_is_semiglobal() -> None:
+    assert edit_distance("ACGT", "TTACGTTT") == 0
+    assert edit_distance("ACGT", "TTACTTT") == 1
+    assert edit_distance("AAAA", "CCCC") == 4
+
+
+def test_near_exact_queries_skip_blast(tmp_path: Path) -> None:
+    index = KmerIndex(str(make_index(tmp_path)))
+    assert index.meta["references"] == 5
+    mutated = REFS["ref1"][:200] + ("A" if REFS["ref1"][200] != "A" else "C") + REFS["ref1"][201:]
+    queries = {
+        "exact": REFS["ref0"][20:630],
+        "mismatch": mutated,
+        "reverse": revcomp(REFS["ref2"]),
+        "novel": "".join(RNG.choice("ACGT") for _ in range(650)),
+        "ambiguous": REFS["ref3"],
+    }
+    fasta = tmp_path / "q.fasta"
+    fasta.write_text("".join(f">{name}\n{seq}\n" for name, seq in queries.items()))
+
+    assert classify_fasta(index, str(fasta), str(tmp_path / "out")) == (5, 3)
+    taxonomy = (tmp_path / "out" / "taxonomy.tsv").read_text().splitlines()
+    assert taxonomy == [
+        "Feature ID\tTaxon\tConsensus",
+        f"exact\t{TAXA['ref0']}\t1.0",
+        f"mismatch\t{TAXA['ref1']}\t1.0",
+        f"reverse\t{TAXA['ref2']}\t1.0",
+    ]
+    hits = [row.split("\t") for row in (tmp_path / "out" / "blast6.tsv").read_text().splitlines()]
+    assert hits[1][:5] == ["mismatch", "ref1", f"{100 * 649 / 650:.3f}", "650", "1"]
+    unassigned = (tmp_path / "out" / "unassigned.fasta").read_text()
+    assert [line for line in unassigned.splitlines() if line.startswith(">")] == [">novel", ">ambiguous"]
+    # Stricter thresholds send the mismatch to BLAST too
+    assert classify_fasta(index, str(fasta), str(tmp_path / "strict"), min_identity=1.0)[1] == 2
+
+
+def test_sharded_classification_uses_index(tmp_path: Path) -> None:
+    index = make_index(tmp_path)
+    fasta = tmp_path / "q.fasta"
+    fasta.write_text(f">novel\n{'ACGT' * 100}\n>known\n{REFS['ref0']}\n")
+    stub = tmp_path / "stub.py"
+    stub.write_text(
+        "import sys\n"
+        "fasta, taxonomy = sys.argv[1:3]\n"
+        "ids = [l[1:].split()[0] for l in open(fasta) if l.startswith('>')]\n"
+        "open(taxonomy, 'w').write('Feature ID\\tTaxon\\tConsensus\\n'"
+        " + ''.join(f'{i}\\tUnassigned\\t1.0\\n' for i in ids))\n"
+        "open(sys.argv[3], 'w').close()\n"
+    )
+    result = subprocess.run(
+        [sys.executable, str(SCRIPTS / "classify_sharded.py"), str(fasta), str(tmp_path / "out"),
+         "--kmer-index", str(index), "--cpus", "2",
+         "--classifier-cmd", f"{sys.executable} {stub} {{fasta}} {{taxonomy}} {{search}}"],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert (tmp_path / "out" / "taxonomy.tsv").read_text().splitlines()[1:] == [
+        "novel\tUnassigned\t1.0",
+        f"known\t{TAXA['ref0']}\t1.0",
+    ]
+    assert (tmp_path / "out" / "shard_0" / "query.fasta").read_text().startswith(">novel\n")
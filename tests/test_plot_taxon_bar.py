@@ -167,3 +167,46 @@ def test_taxon_formatting(tmp_path):
     content = map_file.read_text().strip().splitlines()
     assert content[0] == "code\ttaxon"
     assert content[1] == "T1\t*Hoplias malabaricus*"
+
+
+def test_structured_inputs_match_text_table(tmp_path):
+    import numpy as np
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+    from plot_taxon_bar import read_counts
+
+    text = tmp_path / "collapsed.tsv"
+    text.write_text(
+        "Sample: A\nSpecies\tReads\tProportion\nSp1\t10\t66.67\nSp2\t5\t33.33\n\n"
+        "Sample: B\nSpecies\tReads\tProportion\nSp2\t5\t100.00\n"
+    )
+    matrix = tmp_path / "counts.matrix.tsv"
+    matrix.write_text("Sample\tSp1\tSp2\nA\t10\t5\nB\t0\t5\n")
+    long = tmp_path / "counts.long.tsv"
+    long.write_text(
+        "Sample\tTaxon\tReads\tFraction\nA\tSp1\t10\t0.66\nA\tSp2\t5\t0.33\nB\tSp2\t5\t1.0\n"
+    )
+    npz = tmp_path / "counts.matrix.npz"
+    np.savez(
+        npz, counts=np.array([[10, 5], [0, 5]]), samples=np.array(["A", "B"]),
+        taxa=np.array(["Sp1", "Sp2"]),
+    )
+
+    expected = read_counts(text)
+    assert expected.loc["A"].tolist() == [10, 5]
+    for path in (matrix, long, npz):
+        counts = read_counts(path)
+        assert counts.index.tolist() == ["A", "B"]
+        assert counts.columns.tolist() == ["Sp1", "Sp2"]
+        assert counts.to_numpy().tolist() == expected.to_numpy().tolist()
+
+    out_file = tmp_path / "plot.png"
+    env = os.environ.copy()
+    env["MPLBACKEND"] = "Agg"
+    script = Path(__file__).resolve().parents[1] / "scripts" / "plot_taxon_bar.py"
+    subprocess.run(
+        [sys.executable, str(script), str(npz), str(out_file)], check=True, env=env
+    )
+    assert out_file.exists()
+    taxon_map = (tmp_path / "plot.png.taxon_map.tsv").read_text().splitlines()
+    assert taxon_map == ["code\ttaxon", "T1\tSp1", "T2\tSp2"]
@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+SCRIPTS = Path(__file__).resolve().parents[1] / "scripts"
+sys.path.insert(0, str(SCRIPTS))
+
+from rarefaction import alpha_diversity, depth_grid, rarefy, rarefaction_table
+
+
+def test_rarefy_and_indices():
+    rng = np.random.default_rng(0)
+    draws = rarefy(np.array([50, 30, 20]), np.array([10, 100]), 25, rng)
+    assert draws.shape == (2, 25, 3)
+    assert (draws.sum(axis=-1) == np.array([[10], [100]])).all()
+    # At full depth every replicate is the sample itself
+    assert (draws[1] == [50, 30, 20]).all()
+
+    indices = alpha_diversity(np.array([[5, 5, 0], [10, 0, 0]]))
+    assert indices["richness"].tolist() == [2, 1]
+    assert np.allclose(indices["shannon"], [np.log(2), 0])
+    assert np.allclose(indices["simpson"], [0.5, 0])
+    assert depth_grid([40, 100], steps=4).tolist() == [25, 50, 75, 100]
+
+
+def test_table_is_independent_of_jobs():
+    data = {"A": {"x": 60, "y": 30, "z": 10}, "B": {"x": 5, "y": 5}}
+    serial = rarefaction_table(data, [5, 10, 50], replicates=20, seed=1)
+    parallel = rarefaction_table(data, [5, 10, 50], replicates=20, seed=1, jobs=2)
+    assert serial == parallel
+    assert [(row["sample"], row["depth"]) for row in serial] == [
+        ("A", 5), ("A", 10), ("A", 50), ("B", 5), ("B", 10),
+    ]
+    assert serial[4]["richness_mean"] == 2.0
+
+
+def test_cli(tmp_path):
+    table = tmp_path / "taxonomy_with_sample.tsv"
+    table.write_text(
+        "Feature ID\tTaxon\tConsensus\tReads\tSample\n"
+        "id1\tk__B; g__Escherichia; s__coli\tC1\t40\tS1\n"
+        "id2\tk__B; g__Bacillus; s__subtilis\tC2\t20\tS1\n"
+        "id3\tk__B; g__Bacillus; s__cereus\tC3\t30\tS2\n"
+    )
+    env = os.environ.copy()
+    env["MPLBACKEND"] = "Agg"
+    subprocess.run(
+        [
+            sys.executable, str(SCRIPTS / "rarefaction.py"), str(table),
+            "--output-dir", str(tmp_path / "out"), "--steps", "3", "--replicates", "10",
+        ],
+        check=True, env=env, capture_output=True,
+    )
+    lines = (tmp_path / "out" / "rarefaction.tsv").read_text().splitlines()
+    assert lines[0].split("\t")[:4] == ["sample", "depth", "replicates", "richness_mean"]
+    assert [line.split("\t")[:2] for line in lines[1:]] == [
+        ["S1", "20"], ["S1", "40"], ["S1", "60"], ["S2", "20"],
+    ]
+    assert (tmp_path / "out" / "rarefaction.png").exists()
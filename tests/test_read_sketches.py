@@ -0,0 +1,81 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from read_sketches import ReadStatsSketch  # type: ignore
+
+
+def random_reads(rng: np.random.Generator, n: int):
+    lengths = rng.integers(50, 1500, n)
+    quals = rng.uniform(5, 40, n)
+    errors = lengths * 10 ** (-quals / 10)
+    return lengths, quals, errors, lengths
+
+
+def test_merged_chunks_match_single_pass():
+    rng = np.random.default_rng(0)
+    lengths, quals, errors, qlens = random_reads(rng, 10_000)
+
+    whole = ReadStatsSketch()
+    whole.update(lengths, quals, errors, qlens)
+    merged = ReadStatsSketch()
+    for idx in np.array_split(np.arange(len(lengths)), 7):
+        part = ReadStatsSketch()
+        part.update(lengths[idx], quals[idx], errors[idx], qlens[idx])
+        merged.merge(ReadStatsSketch.from_dict(json.loads(json.dumps(part.to_dict()))))
+
+    assert merged.summary()["length"] == whole.summary()["length"]
+    assert merged.summary()["n50"] == whole.summary()["n50"]
+    assert np.isclose(
+        merged.summary()["mean_error_probability"],
+        whole.summary()["mean_error_probability"],
+    )
+
+
+def test_quantiles_are_exact_or_within_bound():
+    rng = np.random.default_rng(1)
+    lengths, quals, errors, qlens = random_reads(rng, 5_001)
+    sketch = ReadStatsSketch()
+    sketch.update(lengths, quals, errors, qlens)
+    summary = sketch.summary()
+
+    assert summary["length"]["median"] == int(np.median(lengths))
+    bound = summary["mean_quality"]["error_bound"]
+    for name, q in (("p5", 0.05), ("median", 0.5), ("p95", 0.95)):
+        exact = np.quantile(quals, q, method="inverted_cdf")
+        assert abs(summary["mean_quality"][name] - exact) <= bound
+
+    ordered = np.sort(lengths)[::-1]
+    n50 = ordered[np.searchsorted(np.cumsum(ordered), lengths.sum() / 2)]
+    assert summary["n50"] == n50
+
+
+def test_collect_read_stats_summary_json(tmp_path):
+    fastq = tmp_path / "reads.fastq"
+    fastq.write_text("@r1\nACGT\n+\n++++\n@r2\nAC\n+\n5I\n")
+    out_json = tmp_path / "reads.json"
+    script = Path(__file__).resolve().parents[1] / "scripts" / "collect_read_stats.py"
+
+    subprocess.run(
+        [
+            sys.executable,
+            str(script),
+            str(fastq),
+            str(tmp_path / "stats.tsv"),
+            "--summary-json",
+            str(out_json),
+        ],
+        check=True,
+    )
+    summary = json.loads(out_json.read_text())["summary"]
+
+    assert summary["reads"] == 2
+    assert summary["bases"] == 6
+    assert summary["n50"] == 4
+    assert summary["length"]["median"] == 2
+    # Q10 x4, Q20 and Q40: (4 * 0.1 + 0.01 + 0.0001) / 6
+    assert np.isclose(summary["mean_error_probability"], 0.4101 / 6, rtol=1e-6)
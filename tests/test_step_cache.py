@@ -0,0 +1,58 @@
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from step_cache import StepCache, fingerprint  # type: ignore
+
+SCRIPT = Path(__file__).resolve().parents[1] / "scripts" / "step_cache.py"
+
+
+def test_fingerprint_tracks_inputs_and_params(tmp_path: Path) -> None:
+    reads = tmp_path / "reads.fastq"
+    reads.write_text("@r1\nACGT\n+\nIIII\n")
+    base = fingerprint([reads], {"MIN_LEN": 650})
+
+    assert fingerprint([reads], {"MIN_LEN": "650"}) == base
+    assert fingerprint([reads], {"MIN_LEN": 700}) != base
+    assert fingerprint([reads, tmp_path / "missing.fastq"], {"MIN_LEN": 650}) != base
+
+    reads.write_text("@r1\nACGTA\n+\nIIIII\n")
+    assert fingerprint([reads], {"MIN_LEN": 650}) != base
+
+
+def test_content_fingerprint_ignores_mtime(tmp_path: Path) -> None:
+    reads = tmp_path / "reads.fastq"
+    reads.write_text("@r1\nACGT\n+\nIIII\n")
+    before = fingerprint([tmp_path], content=True)
+    reads.write_text("@r1\nACGT\n+\nIIII\n")
+    assert fingerprint([tmp_path], content=True) == before
+
+
+def test_cache_requires_outputs(tmp_path: Path) -> None:
+    out = tmp_path / "out.fastq"
+    out.write_text("x")
+    cache = StepCache(tmp_path / "cache.json")
+    digest = cache.digest([], {"q": 10})
+    cache.record("s1.filter", digest, [out])
+
+    reloaded = StepCache(tmp_path / "cache.json")
+    assert reloaded.is_fresh("s1.filter", digest)
+    assert not reloaded.is_fresh("s1.filter", cache.digest([], {"q": 12}))
+    out.unlink()
+    assert not reloaded.is_fresh("s1.filter", digest)
+
+
+def test_cli_check_and_record(tmp_path: Path) -> None:
+    reads = tmp_path / "reads.fastq"
+    reads.write_text("@r1\nACGT\n+\nIIII\n")
+    cache = tmp_path / "cache.json"
+    args = [str(cache), "step1", "--inputs", str(reads), "--param", "MIN_QUAL=10"]
+
+    def check(*extra: str) -> int:
+        return subprocess.run([sys.executable, str(SCRIPT), "check", *args, *extra]).returncode
+
+    assert check() == 1
+    subprocess.run([sys.executable, str(SCRIPT), "record", *args], check=True)
+    assert check() == 0
+    assert check("--param", "MIN_LEN=700") == 1
@@ -0,0 +1,79 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from subsample_reads import (  # type: ignore
+    FRACTIONS_NAME,
+    read_fractions,
+    scaled_support,
+    subsample_file,
+    write_fractions,
+)
+
+
+def write_fastq(path: Path, reads: list[tuple[str, str]]) -> None:
+    path.write_text(
+        "".join(f"@{rid} extra\n{seq}\n+\n{'I' * len(seq)}\n" for rid, seq in reads)
+    )
+
+
+def read_ids(path: Path) -> list[str]:
+    lines = path.read_text().splitlines()
+    return [lines[i][1:].split()[0] for i in range(0, len(lines), 4)]
+
+
+def test_subsample_is_capped_deterministic_and_ordered(tmp_path: Path) -> None:
+    fastq = tmp_path / "s1.fastq"
+    write_fastq(fastq, [(f"r{i}", "ACGT") for i in range(1000)])
+    runs = []
+    for name in ("a", "b"):
+        out = tmp_path / name
+        out.mkdir()
+        result = subsample_file(str(fastq), str(out), 100, seed=7)
+        runs.append(read_ids(out / "s1.fastq"))
+    assert result.reads == 1000 and result.sampled == 100
+    assert result.fraction == 0.1
+    assert runs[0] == runs[1]
+    assert runs[0] == sorted(runs[0], key=lambda rid: int(rid[1:]))
+    assert len(set(runs[0])) == 100
+
+    other = tmp_path / "c"
+    other.mkdir()
+    subsample_file(str(fastq), str(other), 100, seed=8)
+    assert read_ids(other / "s1.fastq") != runs[0]
+
+
+def test_small_samples_are_kept_whole(tmp_path: Path) -> None:
+    fastq = tmp_path / "s1.fastq"
+    write_fastq(fastq, [("r1", "ACGT"), ("r2", "TTTT")])
+    result = subsample_file(str(fastq), str(tmp_path / "."), 10, stratify=True)
+    assert (result.reads, result.sampled, result.fraction) == (2, 2, 1.0)
+    assert read_ids(tmp_path / "s1.fastq") == ["r1", "r2"]
+
+
+def test_stratified_subsample_keeps_length_proportions(tmp_path: Path) -> None:
+    fastq = tmp_path / "s1.fastq"
+    reads = [(f"short{i}", "A" * 100) for i in range(900)]
+    reads += [(f"long{i}", "A" * 700) for i in range(100)]
+    write_fastq(fastq, reads)
+    out = tmp_path / "out"
+    out.mkdir()
+
+    subsample_file(str(fastq), str(out), 50, seed=1, stratify=True)
+
+    ids = read_ids(out / "s1.fastq")
+    assert len(ids) == 50
+    assert sum(rid.startswith("long") for rid in ids) == 5
+
+
+def test_fraction_table_and_support(tmp_path: Path) -> None:
+    fastq = tmp_path / "s1.fastq"
+    write_fastq(fastq, [(f"r{i}", "ACGT") for i in range(40)])
+    table = tmp_path / FRACTIONS_NAME
+    write_fractions([subsample_file(str(fastq), str(tmp_path / "."), 10)], str(table))
+    write_fractions([], str(table))
+
+    assert read_fractions(str(table)) == {"s1": 0.25}
+    assert scaled_support(str(table), "s1", 150) == 37
+    assert scaled_support(str(table), "s1", 2) == 1
+    assert scaled_support(str(table), "other", 150) == 150
@@ -1,3 +1,4 @@
+import json
 import sys
 from pathlib import Path
 
@@ -52,3 +53,51 @@ def test_metadata_mapping(tmp_path):
     assert "ExpA" in counts
     assert counts["ExpA"]["filtered"] == 3
     assert "s1" not in counts
+
+
+def test_summary_files_use_header_counts(tmp_path):
+    write_stats(tmp_path / "s1_raw_stats.tsv", 2)
+    (tmp_path / "cleaned_s1_trimmed_filtered_summary.tsv").write_text(
+        "# reads\t7\n# bases\t4900\n# n50\t700\n"
+        "length_start\tlength_end\tquality_start\tquality_end\tcount\n"
+        "700\t710\t12\t12.5\t7\n"
+    )
+
+    counts = summarize_counts(str(tmp_path), {})
+
+    assert counts["s1"]["raw"] == 2
+    assert counts["s1"]["filtered"] == 7
+
+
+def test_counts_sidecar_is_preferred(tmp_path):
+    stats = tmp_path / "s1_raw_stats.tsv"
+    write_stats(stats, 2)
+    sidecar = tmp_path / "s1_raw_stats.tsv.counts.json"
+    sidecar.write_text(
+        json.dumps({"reads": 40, "bases": 28000, "size": stats.stat().st_size})
+    )
+
+    assert summarize_counts(str(tmp_path), {})["s1"]["raw"] == 40
+
+    # A sidecar left over from a different stats file is ignored
+    write_stats(stats, 3)
+    assert summarize_counts(str(tmp_path), {})["s1"]["raw"] == 3
+
+
+def test_line_counts_are_cached(tmp_path):
+    stats = tmp_path / "s1_raw_stats.tsv"
+    write_stats(stats, 2)
+
+    assert summarize_counts(str(tmp_path), {})["s1"]["raw"] == 2
+    cache = json.loads((tmp_path / ".read_counts_cache.json").read_text())
+    entry = cache[str(stats)]
+    assert entry["reads"] == 2
+
+    # Cached entries are trusted while mtime and size match ...
+    entry["reads"] = 99
+    (tmp_path / ".read_counts_cache.json").write_text(json.dumps(cache))
+    assert summarize_counts(str(tmp_path), {})["s1"]["raw"] == 99
+
+    # ... and recounted once the file changes
+    write_stats(stats, 5)
+    assert summarize_counts(str(tmp_path), {})["s1"]["raw"] == 5
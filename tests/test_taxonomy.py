@@ -0,0 +1,36 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from taxonomy import LineageTable, format_label, parse_lineage
+
+
+def test_parse_lineage_ranks():
+    lineage = parse_lineage("d__Bacteria; p__Firmicutes; f__Bacillaceae; g__Bacillus; s__")
+    assert lineage.names == ("Bacteria", "Firmicutes", None, None, "Bacillaceae", "Bacillus", None)
+    assert format_label(lineage, "species") == "*Bacillus* (genus)"
+    assert format_label(lineage, "genus") == "*Bacillus*"
+    assert format_label(lineage, "order") == "Firmicutes (phylum)"
+    assert format_label(parse_lineage("Unassigned"), "family") == "Unassigned (unknown)"
+    assert parse_lineage("k__A g__B s__c") is parse_lineage("k__A g__B s__c")
+
+
+def test_rollup_to_rank():
+    table = LineageTable()
+    taxa = [
+        "k__Bacteria; f__Enterobacteriaceae; g__Escherichia; s__coli",
+        "k__Bacteria; f__Bacillaceae; g__Bacillus; s__subtilis",
+        "k__Bacteria; f__Enterobacteriaceae; g__Salmonella; s__enterica",
+        "k__Bacteria; f__Bacillaceae; g__Bacillus; s__subtilis",
+    ]
+    ids = np.array([table.intern(taxon) for taxon in taxa])
+    assert ids.tolist() == [0, 1, 2, 1]
+    assert len(table) == 3
+
+    labels, totals = table.rollup(ids, np.array([10, 5, 3, 2]), "family")
+    assert dict(zip(labels, totals.tolist())) == {"Enterobacteriaceae": 13, "Bacillaceae": 7}
+    labels, totals = table.rollup(ids, np.array([10, 5, 3, 2]), "species")
+    assert dict(zip(labels, totals.tolist()))["*Bacillus subtilis*"] == 7
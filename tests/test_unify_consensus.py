@@ -0,0 +1,44 @@
+import csv
+import subprocess
+import sys
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parents[1] / "scripts" / "unify_consensus.py"
+
+
+def write_consensus(folder: Path, index: int, reads: int, seq: str) -> None:
+    folder.mkdir(exist_ok=True)
+    (folder / f"consensus_reference_{index}.fasta").write_text(
+        f">consensus_cl_id_{index}_total_supporting_reads_{reads}\n{seq[:4]}\n{seq[4:]}\n"
+    )
+
+
+def test_unify_writes_unique_sequences_and_map(tmp_path: Path) -> None:
+    clustered = tmp_path / "clustered"
+    clustered.mkdir()
+    write_consensus(clustered / "s1", 0, 10, "ACGTACGT")
+    write_consensus(clustered / "s1", 1, 5, "TTTTGGGG")
+    write_consensus(clustered / "s2", 0, 7, "acgtacgt")
+    (clustered / "empty").mkdir()
+    out = tmp_path / "unified"
+
+    subprocess.run([sys.executable, str(SCRIPT), str(clustered), str(out)], check=True)
+
+    everything = (out / "consensos_todos.fasta").read_text().splitlines()
+    assert everything[0] == ">consensus_cl_id_0_total_supporting_reads_10_s1"
+    assert everything[1] == "ACGTACGT"
+    assert len(everything) == 6
+    assert (out / "consensos_s2.fasta").exists()
+    assert not (out / "consensos_empty.fasta").exists()
+
+    unique = (out / "consensos_unicos.fasta").read_text().splitlines()
+    assert len(unique) == 4
+    with (out / "consensus_map.tsv").open() as fh:
+        rows = list(csv.DictReader(fh, delimiter="\t"))
+    assert [(r["feature_id"], r["sample"], r["reads"]) for r in rows] == [
+        ("consensus_cl_id_0", "s1", "10"),
+        ("consensus_cl_id_1", "s1", "5"),
+        ("consensus_cl_id_0", "s2", "7"),
+    ]
+    assert rows[0]["unique_id"] == rows[2]["unique_id"] == unique[0][1:]
+    assert rows[1]["unique_id"] != rows[0]["unique_id"]
@@ -0,0 +1,63 @@
+import subprocess
+import sys
+from pathlib import Path
+
+SCRIPTS = Path(__file__).resolve().parents[1] / "scripts"
+sys.path.insert(0, str(SCRIPTS))
+from vsearch_sweep import classify_dir, cluster_dir, compare, species_name  # type: ignore
+
+
+def test_shared_stages_run_once(tmp_path: Path) -> None:
+    result = subprocess.run(
+        [
+            sys.executable, str(SCRIPTS / "vsearch_sweep.py"), "manifest.csv", str(tmp_path),
+            "--cluster-id", "0.97", "0.98", "--blast-id", "0.5", "0.8", "--maxaccepts", "5",
+            "--combination", "0.98", "0.5", "5", "--blast-db", "b.qza", "--taxonomy-db", "t.qza",
+            "--cpus", "8", "--dry-run",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    tasks = {line.split("\t")[0]: line.split("\t") for line in result.stdout.splitlines()}
+    assert sorted(tasks) == [
+        "classify.0.97.0.5.5", "classify.0.97.0.8.5", "classify.0.98.0.5.5",
+        "classify.0.98.0.8.5", "cluster.0.97", "cluster.0.98", "derep", "import",
+        "table.0.97", "table.0.98",
+    ]
+    assert tasks["classify.0.98.0.8.5"][1:3] == ["2", "cluster.0.98"]
+    assert "--p-perc-identity 0.97" in tasks["cluster.0.97"][3]
+
+
+def test_comparison_counts_species(tmp_path: Path) -> None:
+    combos = [("0.98", "0.5", "5"), ("0.98", "0.8", "5"), ("0.97", "0.5", "5")]
+    (cluster_dir(tmp_path, "0.98")).mkdir()
+    (cluster_dir(tmp_path, "0.98") / "feature-table.tsv").write_text(
+        "# Constructed from biom file\n#OTU ID\ts1\ts2\n"
+        "f1\t10.0\t5.0\nf2\t3.0\t0.0\nf3\t1.0\t1.0\n"
+    )
+    taxa = {
+        ("0.5", "5"): [
+            "k__Metazoa;g__Hoplias;s__malabaricus",
+            "k__Metazoa;g__Hoplias;s__malabaricus",
+            "k__Metazoa;g__Astyanax;s__",
+        ],
+        ("0.8", "5"): ["k__Metazoa;g__Hoplias;s__malabaricus", "Unassigned", "Unassigned"],
+    }
+    for (bid, maxaccepts), rows in taxa.items():
+        out = classify_dir(tmp_path, "0.98", bid, maxaccepts)
+        out.mkdir()
+        (out / "taxonomy.tsv").write_text(
+            "Feature ID\tTaxon\tConsensus\n"
+            + "".join(f"f{i}\t{taxon}\t1.0\n" for i, taxon in enumerate(rows, 1))
+        )
+
+    assert compare(tmp_path, combos) == [
+        ["0.98", "0.5", "5", 3, 2, 1, "18"],
+        ["0.98", "0.8", "5", 3, 1, 1, "15"],
+    ]
+    assert (tmp_path / "sweep_comparison.tsv").read_text().splitlines()[0].startswith(
+        "cluster_identity\tblast_identity"
+    )
+    assert species_name("k__Metazoa;g__Hoplias;s__malabaricus") == "Hoplias malabaricus"
+    assert species_name("Unassigned") is None
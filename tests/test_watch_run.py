@@ -0,0 +1,124 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from clean_trim_filter import PrepSettings
+from watch_run import RunWatcher
+
+
+def write_batch(path: Path, start: int, n: int, length: int = 30) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w") as fh:
+        for i in range(start, start + n):
+            # Every third read is too short to pass the filter
+            size = 10 if i % 3 == 0 else length
+            fh.write(f"@r{i}\n{'A' * size}\n+\n{'I' * size}\n")
+
+
+def test_batches_are_merged_and_trigger_once(tmp_path):
+    run = tmp_path / "fastq_pass"
+    work = tmp_path / "work"
+    settings = PrepSettings(min_len=20, max_len=50, min_qual=10)
+    command = "wc -l < {fastq} > {output_dir}/lines.txt"
+
+    write_batch(run / "barcode01" / "batch_0.fastq", 0, 30)
+    write_batch(run / "barcode02" / "batch_0.fastq", 0, 3)
+    watcher = RunWatcher(run, work, settings, thresholds=[20, 40], command=command, settle=0)
+    assert watcher.poll() == 2
+    watcher.wait()
+    assert watcher.poll() == 0
+
+    write_batch(run / "barcode01" / "batch_1.fastq", 30, 30)
+    # A new watcher resumes from the saved state and ingests only the new file
+    watcher = RunWatcher(run, work, settings, thresholds=[20, 40], command=command, settle=0)
+    assert watcher.poll() == 1
+    watcher.wait()
+
+    summary = (work / "watch_summary.tsv").read_text().splitlines()
+    assert summary[0].split("\t")[:5] == ["sample", "files", "raw", "processed", "filtered"]
+    assert summary[1].split("\t")[:5] == ["barcode01", "2", "60", "60", "40"]
+    assert summary[1].split("\t")[-1] == "40"
+    assert summary[2].split("\t")[:5] == ["barcode02", "1", "3", "3", "2"]
+
+    assert (work / "3_filtered" / "barcode01.fastq").read_text().count("\n") == 160
+    assert (work / "triggers" / "barcode01" / "20" / "lines.txt").read_text().strip() == "80"
+    assert (work / "triggers" / "barcode01" / "40" / "lines.txt").read_text().strip() == "160"
+    assert not (work / "triggers" / "barcode02").exists()
+    state = json.loads((work / "watch_state.json").read_text())
+    assert state["samples"]["barcode01"]["triggered"] == [20, 40]
+
+
+def test_recent_files_wait_to_settle(tmp_path):
+    run = tmp_path / "fastq_pass"
+    write_batch(run / "s1.fastq", 0, 3)
+    watcher = RunWatcher(run, tmp_path / "work", PrepSettings(), settle=60)
+    assert watcher.pending_files() == []
+    assert watcher.pending_files(now=(run / "s1.fastq").stat().st_mtime + 61) == [
+        run / "s1.fastq"
+    ]
+    assert watcher.sample_name(run / "s1.fastq") == "s1"
+
+
+def test_interrupted_ingest_is_redone_on_resume(tmp_path, monkeypatch):
+    run = tmp_path / "fastq_pass"
+    work = tmp_path / "work"
+    settings = PrepSettings(min_len=20, max_len=50, min_qual=10)
+    write_batch(run / "barcode01" / "batch_0.fastq", 0, 30)
+    RunWatcher(run, work, settings, settle=0).poll()
+
+    write_batch(run / "barcode01" / "batch_1.fastq", 30, 30)
+    watcher = RunWatcher(run, work, settings, settle=0)
+
+    def interrupt():
+        raise KeyboardInterrupt
+
+    # Stopped after the reads were appended but before the state was saved
+    monkeypatch.setattr(watcher, "_save_state", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        watcher.poll()
+    assert (work / "3_filtered" / "barcode01.fastq").read_text().count("\n") == 160
+
+    watcher = RunWatcher(run, work, settings, settle=0)
+    assert (work / "3_filtered" / "barcode01.fastq").read_text().count("\n") == 80
+    assert watcher.poll() == 1
+    assert (work / "3_filtered" / "barcode01.fastq").read_text().count("\n") == 160
+    assert watcher.sketches["barcode01"]["raw"].reads == 60
+    assert watcher.sketches["barcode01"]["filtered"].reads == 40
+
+
+def test_flat_run_batches_add_up_to_one_sample(tmp_path):
+    run = tmp_path / "fastq_pass"
+    for i in range(3):
+        write_batch(run / f"FAQ12345_pass_8f5a1b2c_{i}.fastq", 30 * i, 30)
+    watcher = RunWatcher(run, tmp_path / "work", PrepSettings(min_len=20), settle=0)
+    assert watcher.poll() == 3
+    assert list(watcher.samples) == ["FAQ12345_pass_8f5a1b2c"]
+    assert watcher.samples["FAQ12345_pass_8f5a1b2c"].files == 3
+    assert watcher.sketches["FAQ12345_pass_8f5a1b2c"]["raw"].reads == 90
+
+
+def test_interrupted_first_batch_is_redone_on_resume(tmp_path, monkeypatch):
+    run = tmp_path / "fastq_pass"
+    work = tmp_path / "work"
+    settings = PrepSettings(min_len=20, max_len=50, min_qual=10)
+    write_batch(run / "barcode01" / "batch_0.fastq", 0, 30)
+    watcher = RunWatcher(run, work, settings, settle=0)
+
+    def interrupt():
+        raise KeyboardInterrupt
+
+    # No watch_state.json exists yet when the first batch is interrupted
+    monkeypatch.setattr(watcher, "_save_state", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        watcher.poll()
+    assert (work / "3_filtered" / "barcode01.fastq").read_text().count("\n") == 80
+
+    watcher = RunWatcher(run, work, settings, settle=0)
+    assert (work / "3_filtered" / "barcode01.fastq").stat().st_size == 0
+    assert watcher.poll() == 1
+    assert (work / "3_filtered" / "barcode01.fastq").read_text().count("\n") == 80
+    assert watcher.sketches["barcode01"]["filtered"].reads == 20